@@ -0,0 +1,98 @@
+"""CSV loading (idsw.datafetch.pipes.load_pandas_dataframe).
+
+For historian-like CSV exports (timestamp, tag, value) with an increasing number of rows, it measures
+the rows/s of:
+  - parsing the text with the default engine, as the reference (use_parquet_cache = False);
+  - parsing the text with the pyarrow engine;
+  - the first load with the Parquet cache (parsing plus writing '{file}.cache.parquet');
+  - the next loads of the unchanged file, which read the cache.
+
+Run from the repository root:
+
+    python benchmarks/bench_csv.py --rows 100000 1000000 10000000
+"""
+
+import os
+import io
+import sys
+import time
+import argparse
+import tempfile
+import contextlib
+
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY_ROOT)
+
+import numpy as np
+import pandas as pd
+
+
+ROW_COUNTS = [100000, 1000000]
+TAGS = 10
+
+
+def make_csv(file_path, rows, tags = TAGS):
+  """Historian-like export: one sample per minute for each tag, starting at 2020-01-01."""
+
+  timestamps = pd.date_range('2020-01-01', periods = -(-rows//tags), freq = 'min')
+  pd.DataFrame({'timestamp': np.repeat(timestamps.values, tags)[:rows],
+                'tag': np.tile([f"TAG{i:03d}" for i in range(tags)], len(timestamps))[:rows],
+                'value': np.random.default_rng(0).random(rows)}).to_csv(file_path, index = False)
+
+
+def measure_load(directory, file_name, rows, **options):
+
+  from digitaltwin.idsw.datafetch.pipes import load_pandas_dataframe
+
+  with contextlib.redirect_stdout(io.StringIO()):
+    start = time.perf_counter()
+    dataset = load_pandas_dataframe(directory, file_name, parse_dates = ['timestamp'], dtype = {'tag': 'category'}, **options)
+    elapsed_time = time.perf_counter() - start
+
+  assert (len(dataset) == rows)
+
+  return {'median_s': elapsed_time, 'rows': rows, 'rows_per_s': rows/elapsed_time}
+
+
+def run_csv_benchmark(row_counts = ROW_COUNTS):
+  """Run the benchmarks, returning a dictionary with one entry per measurement."""
+
+  from digitaltwin.idsw import ControlVars
+
+  show_results = ControlVars.show_results
+  ControlVars.show_results = False
+  results = {}
+
+  try:
+    with tempfile.TemporaryDirectory() as directory:
+      for rows in row_counts:
+        file_name = f"history_{rows}.csv"
+        make_csv(os.path.join(directory, file_name), rows)
+
+        results[f"csv_{rows}_rows_parse_default"] = measure_load(directory, file_name, rows, use_parquet_cache = False)
+        results[f"csv_{rows}_rows_parse_pyarrow"] = measure_load(directory, file_name, rows, csv_engine = 'pyarrow', use_parquet_cache = False)
+        results[f"csv_{rows}_rows_first_load_cache"] = measure_load(directory, file_name, rows, csv_engine = 'pyarrow')
+        results[f"csv_{rows}_rows_cached_load"] = measure_load(directory, file_name, rows, csv_engine = 'pyarrow')
+
+  finally:
+    ControlVars.show_results = show_results
+
+  return results
+
+
+def main(argv = None):
+
+  parser = argparse.ArgumentParser(description = "CSV loading benchmark.")
+  parser.add_argument('--rows', type = int, nargs = '+', default = ROW_COUNTS, help = "Rows of the CSV files (default: %(default)s).")
+  args = parser.parse_args(argv)
+
+  results = run_csv_benchmark(row_counts = args.rows)
+
+  for name, result in results.items():
+    print(f"{name:<45}{result['median_s']:>10.4f} s{result['rows']:>11} rows{result['rows_per_s']:>14.0f} rows/s")
+
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
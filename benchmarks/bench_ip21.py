@@ -0,0 +1,197 @@
+"""IP21 extraction against the local mock server (idsw.datafetch.mock.MockIP21Server).
+
+For extractions of one tag with an increasing number of pages, it measures the wall time, the time
+per page and the peak memory (tracemalloc) of IP21Extractor, keeping the pages in memory and
+writing them to a Parquet sink. With linear page accumulation, the time per page stays constant
+when the number of pages grows. The accumulation alone is also compared with the previous strategy
+(pd.concat of all the previous data on every page), and the conversion of the IP21 timescale to
+timestamps is compared with the previous per-element conversion (one pd.Timedelta per sample).
+
+Run from the repository root:
+
+    python benchmarks/bench_ip21.py --pages 10 20 40 80 --page-size 5000
+"""
+
+import os
+import io
+import sys
+import time
+import argparse
+import tempfile
+import tracemalloc
+import contextlib
+
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY_ROOT)
+
+import numpy as np
+import pandas as pd
+
+
+PAGE_COUNTS = [10, 20, 40, 80]
+CONVERSION_SIZES = [10000, 100000, 1000000]
+# The per-element conversion is only measured up to this size:
+MAX_LOOP_CONVERSION_SIZE = 100000
+PAGE_SIZE = 5000
+# Interval between the samples of the mock server (ms):
+SAMPLE_INTERVAL_MS = 60000
+# Start of the extractions in the IP21 timescale (2023-01-01):
+START_IP21_SCALE = 1672542000000
+
+
+def extract(server_address, total_pages, page_size, sink_path = None):
+  """Extract one tag with {total_pages} pages. Returns the number of rows."""
+
+  from digitaltwin.idsw.datafetch.core import ConcurrentIP21Extractor
+
+  extractor = ConcurrentIP21Extractor(server_address, use_ntlm = False, max_workers = 1)
+  stop_ip21_scale = START_IP21_SCALE + total_pages*page_size*SAMPLE_INTERVAL_MS - 1
+
+  with contextlib.redirect_stdout(io.StringIO()):
+    dataset, api_calls, rows = extractor.fetch_window('BENCH_TAG', 'bench_tag', START_IP21_SCALE, stop_ip21_scale, sink_path = sink_path)
+  extractor.close()
+
+  return rows
+
+
+def measure_extraction(server_address, total_pages, page_size, sink_path = None):
+  """Wall time of one extraction, and its peak memory in a second run with tracemalloc."""
+
+  start = time.perf_counter()
+  rows = extract(server_address, total_pages, page_size, sink_path = sink_path)
+  wall_time = time.perf_counter() - start
+
+  tracemalloc.start()
+  extract(server_address, total_pages, page_size, sink_path = sink_path)
+  current, peak = tracemalloc.get_traced_memory()
+  tracemalloc.stop()
+
+  return {'pages': total_pages, 'rows': rows, 'median_s': wall_time, 'time_per_page_s': wall_time/total_pages,
+          'rows_per_s': rows/wall_time, 'peak_memory_bytes': peak}
+
+
+def measure_accumulation(total_pages, page_size):
+  """Accumulation of synthetic pages: concatenation on every page vs a single final concatenation."""
+
+  pages = [pd.DataFrame({'timestamp': pd.date_range('2023-01-01', periods = page_size, freq = 'min') + pd.Timedelta(minutes = i*page_size),
+                        'bench_tag': np.random.default_rng(i).random(page_size)}) for i in range(total_pages)]
+
+  start = time.perf_counter()
+  dataset = None
+  for page in pages:
+    dataset = page if (dataset is None) else pd.concat([dataset, page], axis = 0, join = "inner").reset_index(drop = True)
+  concat_per_page = time.perf_counter() - start
+
+  start = time.perf_counter()
+  chunks = []
+  for page in pages:
+    chunks.append(page)
+  dataset = pd.concat(chunks, axis = 0, join = "inner").reset_index(drop = True)
+  single_concat = time.perf_counter() - start
+
+  return {'concat_per_page_s': concat_per_page, 'single_concat_s': single_concat}
+
+
+def convert_with_loop(ip21time_array):
+  """Previous conversion of IP21Extractor.convert_ip21_timescale_array_to_timestamp (one
+  pd.Timedelta per sample), kept as the reference of the benchmark. The reference timestamps are
+  written here, as in the previous code, so the benchmark does not depend on IP21_REFERENCE_TIMESTAMPS."""
+
+  ip21time_window = pd.Series(ip21time_array)
+  start_ip21_scale = ip21time_window[0]
+  ip21time_window = ip21time_window.sort_values(ascending = True)
+
+  if (start_ip21_scale >= 1655780400001):
+    reference, reference_ip21 = pd.Timestamp('06-21-2022 0:00:00.001', unit = 'ns'), 1655780400001
+  elif (start_ip21_scale >= 1655780400000):
+    reference, reference_ip21 = pd.Timestamp('06-21-2022', unit = 'd'), 1655780400000
+  elif (start_ip21_scale >= 1655694000000):
+    reference, reference_ip21 = pd.Timestamp('06-20-2022', unit = 'd'), 1655694000000
+  elif (start_ip21_scale >= 1514772000000):
+    reference, reference_ip21 = pd.Timestamp('01-01-2018', unit = 'd'), 1514772000000
+  elif (start_ip21_scale >= 946692000000):
+    reference, reference_ip21 = pd.Timestamp('01-01-2000', unit = 'd'), 946692000000
+  elif (start_ip21_scale >= 10800000):
+    reference, reference_ip21 = pd.Timestamp('01-01-1970', unit = 'd'), 10800000
+  else:
+    reference, reference_ip21 = pd.Timestamp('01-01-1960', unit = 'd'), -315608400000
+
+  new_timestamps = [reference + pd.Timedelta((ip21_timestamp - reference_ip21), 'ms') for ip21_timestamp in ip21time_window]
+
+  return pd.Series(new_timestamps, name = "timestamps")
+
+
+def measure_conversion(size):
+  """Rows per second of the conversion of {size} IP21 timestamps, vectorized and per-element."""
+
+  from digitaltwin.idsw.datafetch.core import IP21Extractor
+
+  ip21time_array = START_IP21_SCALE + SAMPLE_INTERVAL_MS*np.arange(size, dtype = np.int64)
+  extractor = IP21Extractor.__new__(IP21Extractor)
+  extractor.ip21time_array = ip21time_array
+
+  start = time.perf_counter()
+  timestamp_series = extractor.convert_ip21_timescale_array_to_timestamp().timestamp_series
+  vectorized = time.perf_counter() - start
+  results = {'vectorized': {'median_s': vectorized, 'rows': size, 'rows_per_s': size/vectorized}}
+
+  if (size <= MAX_LOOP_CONVERSION_SIZE):
+    start = time.perf_counter()
+    loop_series = convert_with_loop(ip21time_array)
+    loop = time.perf_counter() - start
+    # Both conversions must return the same timestamps:
+    assert (timestamp_series.values == loop_series.values.astype('datetime64[ns]')).all()
+    results['loop'] = {'median_s': loop, 'rows': size, 'rows_per_s': size/loop}
+
+  return results
+
+
+def run_ip21_benchmark(page_counts = PAGE_COUNTS, page_size = PAGE_SIZE, conversion_sizes = CONVERSION_SIZES):
+  """Run the benchmarks, returning a dictionary with one entry per measurement."""
+
+  from digitaltwin.idsw.datafetch.mock import MockIP21Server
+
+  results = {}
+
+  with MockIP21Server(sample_interval_ms = SAMPLE_INTERVAL_MS, page_size = page_size) as server, tempfile.TemporaryDirectory() as directory:
+    # Warm-up (imports and connection):
+    extract(server.address, 1, page_size)
+
+    for total_pages in page_counts:
+      results[f"ip21_extract_{total_pages}_pages_memory"] = measure_extraction(server.address, total_pages, page_size)
+      results[f"ip21_extract_{total_pages}_pages_parquet"] = measure_extraction(server.address, total_pages, page_size, sink_path = os.path.join(directory, f"bench_{total_pages}.parquet"))
+
+  for total_pages in page_counts:
+    accumulation = measure_accumulation(total_pages, page_size)
+    results[f"ip21_accumulate_{total_pages}_pages_concat_per_page"] = {'median_s': accumulation['concat_per_page_s'], 'pages': total_pages}
+    results[f"ip21_accumulate_{total_pages}_pages_single_concat"] = {'median_s': accumulation['single_concat_s'], 'pages': total_pages}
+
+  for size in conversion_sizes:
+    for method, result in measure_conversion(size).items():
+      results[f"ip21_convert_{size}_rows_{method}"] = result
+
+  return results
+
+
+def main(argv = None):
+
+  parser = argparse.ArgumentParser(description = "IP21 extraction benchmark against the local mock server.")
+  parser.add_argument('--pages', type = int, nargs = '+', default = PAGE_COUNTS, help = "Numbers of pages of the extractions (default: %(default)s).")
+  parser.add_argument('--page-size', type = int, default = PAGE_SIZE, help = "Samples per page (default: %(default)s).")
+  args = parser.parse_args(argv)
+
+  results = run_ip21_benchmark(page_counts = args.pages, page_size = args.page_size)
+
+  for name, result in results.items():
+    line = f"{name:<50}{result['median_s']:>10.4f} s"
+    if ('time_per_page_s' in result):
+      line = line + f"{1000*result['time_per_page_s']:>10.2f} ms/page{result['rows_per_s']:>12.0f} rows/s{result['peak_memory_bytes']/2**20:>10.1f} MiB peak"
+    elif ('rows_per_s' in result):
+      line = line + f"{result['rows_per_s']:>22.0f} rows/s"
+    print(line)
+
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
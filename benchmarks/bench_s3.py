@@ -0,0 +1,166 @@
+"""S3 transfers (idsw.datafetch.core.AWSS3Connection) against a local S3 stand-in.
+
+It uploads (export_files) and downloads (copy_bucket_files) a set of many small files and a few
+large files, and reports the bytes/s of:
+  - one file at a time, in a single stream (the previous transfers), as the reference;
+  - the parallel transfers (max_workers files at a time, multipart transfers of the large files);
+  - a second sync of the same files, which skips all of them by their ETags.
+
+It requires boto3 and moto (pip install "moto[server]"), which starts the S3 server locally. To use
+a MinIO container instead, pass its URL and credentials:
+
+    python benchmarks/bench_s3.py --small-files 200 --large-files 2
+    python benchmarks/bench_s3.py --endpoint-url http://127.0.0.1:9000 --access-key minioadmin --secret-key minioadmin
+"""
+
+import os
+import io
+import sys
+import socket
+import argparse
+import tempfile
+import contextlib
+
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY_ROOT)
+
+import numpy as np
+
+
+SMALL_FILES = 200
+SMALL_FILE_SIZE = 128*1024
+LARGE_FILES = 2
+LARGE_FILE_SIZE = 64*1024*1024
+BUCKET_NAME = 'digitaltwin-benchmark'
+
+
+def make_files(directory, small_files = SMALL_FILES, large_files = LARGE_FILES):
+  """Write the files of the benchmark (random content) and return their names."""
+
+  random_generator = np.random.default_rng(0)
+  file_names = []
+  for i in range(small_files + large_files):
+    file_name = f"export_{i:05d}.bin"
+    with open(os.path.join(directory, file_name), 'wb') as file:
+      file.write(random_generator.bytes(LARGE_FILE_SIZE if (i < large_files) else SMALL_FILE_SIZE))
+    file_names.append(file_name)
+
+  return file_names
+
+
+def get_connector(endpoint_url, access_key, secret_key, s3_obj_prefix, path_to_store_imported_s3_bucket = ''):
+  """Connector to the bucket, without the interactive input of the credentials."""
+
+  from digitaltwin.idsw.datafetch.core import AWSS3Connection
+
+  with contextlib.redirect_stdout(io.StringIO()):
+    connector = AWSS3Connection(path_to_store_imported_s3_bucket, BUCKET_NAME, s3_obj_prefix)
+    connector.ACCESS_KEY, connector.SECRET_KEY = access_key, secret_key
+    connector = connector.get_bucket_info().connect_to_s3(endpoint_url = endpoint_url).connect_to_bucket()
+
+  return connector
+
+
+def get_result(connector):
+
+  summary = connector.transfer_summary
+  return {'median_s': summary['elapsed_time_s'], 'files': summary['files'], 'skipped_files': summary['skipped_files'],
+          'bytes': summary['bytes_transferred'], 'bytes_per_s': summary['bytes_per_s']}
+
+
+def measure_transfers(endpoint_url, access_key, secret_key, file_names, max_workers):
+  """Upload and download the files one at a time and in parallel, then sync them again.
+  AWSS3Connection removes the initial slash of the workspace paths, so they are relative to the
+  current directory."""
+
+  results = {}
+  # (name, parameters of the transfers): the sequential transfers never use multipart:
+  modes = [('sequential', {'max_workers': 1, 'max_concurrency': 1, 'multipart_threshold_mb': 2**20}),
+           ('parallel', {'max_workers': max_workers})]
+
+  for mode, parameters in modes:
+    connector = get_connector(endpoint_url, access_key, secret_key, f"{mode}/", path_to_store_imported_s3_bucket = f"download_{mode}")
+
+    with contextlib.redirect_stdout(io.StringIO()):
+      connector = connector.set_directory_to_export('upload').set_files_to_export(file_names)
+      connector = connector.export_files(**parameters)
+    results[f"s3_upload_{mode}"] = get_result(connector)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+      connector = connector.map_bucket_contents().copy_bucket_files(**parameters)
+    results[f"s3_download_{mode}"] = get_result(connector)
+
+  # Second sync: all the files are unchanged, so nothing is transferred:
+  with contextlib.redirect_stdout(io.StringIO()):
+    connector = connector.export_files(max_workers = max_workers)
+  results['s3_upload_unchanged'] = get_result(connector)
+  assert (connector.transfer_summary['skipped_files'] == len(file_names))
+
+  with contextlib.redirect_stdout(io.StringIO()):
+    connector = connector.copy_bucket_files(max_workers = max_workers)
+  results['s3_download_unchanged'] = get_result(connector)
+  assert (connector.transfer_summary['skipped_files'] == len(file_names))
+
+  return results
+
+
+def run_s3_benchmark(small_files = SMALL_FILES, large_files = LARGE_FILES, max_workers = 8, endpoint_url = None, access_key = 'testing', secret_key = 'testing'):
+  """Run the benchmarks, returning a dictionary with one entry per measurement.
+  If endpoint_url is None, a moto S3 server is started in a background thread."""
+
+  import boto3
+
+  os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+  working_directory = os.getcwd()
+  server = None
+
+  if (endpoint_url is None):
+    from moto.server import ThreadedMotoServer
+
+    with socket.socket() as free_socket:
+      free_socket.bind(('127.0.0.1', 0))
+      port = free_socket.getsockname()[1]
+
+    server = ThreadedMotoServer(ip_address = '127.0.0.1', port = port, verbose = False)
+    server.start()
+    endpoint_url = f"http://127.0.0.1:{port}"
+
+  try:
+    boto3.client('s3', endpoint_url = endpoint_url, aws_access_key_id = access_key, aws_secret_access_key = secret_key).create_bucket(Bucket = BUCKET_NAME)
+
+    with tempfile.TemporaryDirectory() as directory:
+      os.chdir(directory)
+      os.makedirs('upload')
+      file_names = make_files('upload', small_files = small_files, large_files = large_files)
+      results = measure_transfers(endpoint_url, access_key, secret_key, file_names, max_workers)
+      os.chdir(working_directory)
+
+  finally:
+    os.chdir(working_directory)
+    if (server is not None):
+      server.stop()
+
+  return results
+
+
+def main(argv = None):
+
+  parser = argparse.ArgumentParser(description = "S3 transfers benchmark against a local S3 stand-in.")
+  parser.add_argument('--small-files', type = int, default = SMALL_FILES, help = "Files of 128 KB (default: %(default)s).")
+  parser.add_argument('--large-files', type = int, default = LARGE_FILES, help = "Files of 64 MB (default: %(default)s).")
+  parser.add_argument('--max-workers', type = int, default = 8, help = "Files transferred at the same time (default: %(default)s).")
+  parser.add_argument('--endpoint-url', default = None, help = "URL of an S3 compatible server. If not set, a moto server is started.")
+  parser.add_argument('--access-key', default = 'testing')
+  parser.add_argument('--secret-key', default = 'testing')
+  args = parser.parse_args(argv)
+
+  results = run_s3_benchmark(small_files = args.small_files, large_files = args.large_files, max_workers = args.max_workers, endpoint_url = args.endpoint_url, access_key = args.access_key, secret_key = args.secret_key)
+
+  for name, result in results.items():
+    print(f"{name:<30}{result['median_s']:>10.4f} s{result['files']:>7} files{result['skipped_files']:>7} skipped{(result['bytes_per_s'] or 0)/2**20:>12.2f} MB/s")
+
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,131 @@
+"""SQLite persistence (idsw.datafetch.core.SQLiteConnection).
+
+For tables with an increasing number of rows (timestamp, tag, value), it measures the rows/s of:
+  - pandas to_sql (the previous update_or_create_table), as the reference;
+  - update_or_create_table with if_exists = 'append' (batched executemany in a single transaction,
+    WAL mode, index on the timestamp created after the inserts);
+  - update_or_create_table with if_exists = 'upsert' of 1% of the rows (half of them already in the
+    table, with new values), on the key (timestamp, tag);
+and the time of fetch_table for a window with 1% of the rows, compared with reading the full table
+(up to 10^6 rows: a full table of 10^7 rows does not fit in the memory of most notebooks).
+
+Run from the repository root:
+
+    python benchmarks/bench_sqlite.py --rows 100000 1000000 10000000
+"""
+
+import os
+import io
+import sys
+import time
+import argparse
+import tempfile
+import contextlib
+
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY_ROOT)
+
+import numpy as np
+import pandas as pd
+
+
+ROW_COUNTS = [100000, 1000000]
+TAGS = 10
+# pandas to_sql and the read of the full table are only measured up to this size:
+MAX_TO_SQL_ROWS = 1000000
+MAX_FULL_READ_ROWS = 1000000
+
+
+def make_table(rows, tags = TAGS, random_state = 0, first_minute = 0):
+  """Historian-like table: one sample per minute for each tag, starting {first_minute} minutes after 2020-01-01."""
+
+  timestamps = pd.date_range(pd.Timestamp('2020-01-01') + pd.Timedelta(minutes = first_minute), periods = -(-rows//tags), freq = 'min')
+  return pd.DataFrame({'timestamp': np.repeat(timestamps.values, tags)[:rows],
+                       'tag': np.tile([f"TAG{i:03d}" for i in range(tags)], len(timestamps))[:rows],
+                       'value': np.random.default_rng(random_state).random(rows)})
+
+
+def get_connector(file_path):
+
+  from sqlalchemy import create_engine
+  from digitaltwin.idsw.datafetch.core import SQLiteConnection
+
+  return SQLiteConnection(file_path, pre_created_engine = create_engine('sqlite:///' + file_path))
+
+
+def measure_sqlite(rows, directory):
+  """Rows/s of the writes and time of the reads of a table with {rows} rows."""
+
+  results = {}
+  df = make_table(rows)
+
+  if (rows <= MAX_TO_SQL_ROWS):
+    connector = get_connector(os.path.join(directory, f"to_sql_{rows}.db"))
+    start = time.perf_counter()
+    df.to_sql('history', con = connector.engine, if_exists = 'replace', index = False)
+    elapsed_time = time.perf_counter() - start
+    results['to_sql'] = {'median_s': elapsed_time, 'rows': rows, 'rows_per_s': rows/elapsed_time}
+
+  connector = get_connector(os.path.join(directory, f"append_{rows}.db"))
+  with contextlib.redirect_stdout(io.StringIO()):
+    connector.update_or_create_table('history', df = df, if_exists = 'append', key_columns = ['timestamp', 'tag'])
+  results['append'] = {'median_s': connector.write_summary['elapsed_time_s'], 'rows': rows, 'rows_per_s': connector.write_summary['rows_per_s']}
+
+  # 1% of the rows: half at the end of the table (new values), half after it:
+  update_rows = max(rows//100, 2*TAGS)
+  update = make_table(update_rows, random_state = 1, first_minute = (rows - update_rows//2)//TAGS)
+  with contextlib.redirect_stdout(io.StringIO()):
+    connector.update_or_create_table('history', df = update, if_exists = 'upsert', key_columns = ['timestamp', 'tag'])
+  results['upsert_1pct'] = {'median_s': connector.write_summary['elapsed_time_s'], 'rows': update_rows, 'rows_per_s': connector.write_summary['rows_per_s']}
+
+  timestamps = df['timestamp'].iloc[[rows//2, rows//2 + rows//100]]
+  with contextlib.redirect_stdout(io.StringIO()):
+    start = time.perf_counter()
+    window, engine = connector.fetch_table('history', start_timestamp = timestamps.iloc[0], stop_timestamp = timestamps.iloc[1])
+    window_time = time.perf_counter() - start
+
+  results['read_window_1pct'] = {'median_s': window_time, 'rows': len(window), 'rows_per_s': len(window)/window_time}
+
+  if (rows <= MAX_FULL_READ_ROWS):
+    with contextlib.redirect_stdout(io.StringIO()):
+      start = time.perf_counter()
+      full, engine = connector.fetch_table('history')
+      full_time = time.perf_counter() - start
+    results['read_full'] = {'median_s': full_time, 'rows': len(full), 'rows_per_s': len(full)/full_time}
+
+  # The table must have the original rows plus the new half of the upsert, without duplicates:
+  with connector.engine.connect() as connection:
+    assert (connection.exec_driver_sql("SELECT COUNT(*) FROM history").scalar() == rows + update_rows//2)
+
+  return results
+
+
+def run_sqlite_benchmark(row_counts = ROW_COUNTS):
+  """Run the benchmarks, returning a dictionary with one entry per measurement."""
+
+  results = {}
+
+  with tempfile.TemporaryDirectory() as directory:
+    for rows in row_counts:
+      for name, result in measure_sqlite(rows, directory).items():
+        results[f"sqlite_{rows}_rows_{name}"] = result
+
+  return results
+
+
+def main(argv = None):
+
+  parser = argparse.ArgumentParser(description = "SQLite persistence benchmark.")
+  parser.add_argument('--rows', type = int, nargs = '+', default = ROW_COUNTS, help = "Rows of the tables (default: %(default)s).")
+  args = parser.parse_args(argv)
+
+  results = run_sqlite_benchmark(row_counts = args.rows)
+
+  for name, result in results.items():
+    print(f"{name:<45}{result['median_s']:>10.4f} s{result['rows']:>11} rows{result['rows_per_s']:>14.0f} rows/s")
+
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
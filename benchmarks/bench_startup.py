@@ -0,0 +1,114 @@
+"""Cold vs warm start of the Steel Industry Digital Twin.
+
+Each measurement runs in a fresh Python process, like a new notebook kernel:
+  - cold: import the package, start_global_vars() (models, original dataset, random start and
+    default simulation) and serve the first simulation;
+  - warm: import the package, restore_snapshot() and serve the first simulation.
+
+Run from the repository root:
+
+    python benchmarks/bench_startup.py --repeat 3
+"""
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+import tempfile
+import statistics
+
+
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FIRST_SIMULATION = "('2024-02-21', 1, 0, 37.1, 13.8, 0.029, 73.29, 'Light_Load')"
+
+CHILD_CODE = """
+import io, json, time, contextlib
+start = time.perf_counter()
+from digitaltwin.core import (GlobalVars, start_global_vars, run_simulation)
+from digitaltwin.snapshot import (save_snapshot, restore_snapshot)
+imported = time.perf_counter()
+with contextlib.redirect_stdout(io.StringIO()):
+    {start_command}
+    started = time.perf_counter()
+    run_simulation{first_simulation}
+    finished = time.perf_counter()
+print(json.dumps({{'import_s': imported - start, 'start_s': started - imported,
+                  'first_simulation_s': finished - started, 'total_s': finished - start}}))
+"""
+
+
+def run_child(start_command):
+  """Run CHILD_CODE in a new process and return the dictionary of timings it prints."""
+
+  code = CHILD_CODE.format(start_command = start_command, first_simulation = FIRST_SIMULATION)
+  environment = dict(os.environ, PYTHONPATH = os.pathsep.join([REPOSITORY_ROOT, os.environ.get('PYTHONPATH', '')]))
+  completed = subprocess.run([sys.executable, '-c', code], capture_output = True, text = True, env = environment, check = True)
+
+  # The timings are the last line printed by the child process:
+  return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def measure_cold_start():
+  """Timings of a process that starts the simulator from the data directory."""
+
+  return run_child("start_global_vars()")
+
+
+def measure_warm_start(snapshot_path):
+  """Timings of a process that restores the simulator from a snapshot."""
+
+  return run_child(f"restore_snapshot({snapshot_path!r})")
+
+
+def create_snapshot(snapshot_path):
+  """Create the snapshot used by the warm starts, in a separate process."""
+
+  run_child(f"start_global_vars(); save_snapshot({snapshot_path!r})")
+
+
+def run_startup_benchmark(repeat = 3, snapshot_path = None):
+  """Measure cold and warm starts {repeat} times each and return the median of each timing."""
+
+  temporary_directory = None
+  if snapshot_path is None:
+    temporary_directory = tempfile.TemporaryDirectory()
+    snapshot_path = os.path.join(temporary_directory.name, 'snapshot')
+
+  create_snapshot(snapshot_path)
+
+  cold = [measure_cold_start() for i in range(repeat)]
+  warm = [measure_warm_start(snapshot_path) for i in range(repeat)]
+
+  if temporary_directory is not None:
+    temporary_directory.cleanup()
+
+  def medians(list_of_timings):
+    return {key: statistics.median(timings[key] for timings in list_of_timings) for key in list_of_timings[0].keys()}
+
+  return {'cold': medians(cold), 'warm': medians(warm), 'repeat': repeat}
+
+
+def main(argv = None):
+
+  parser = argparse.ArgumentParser(description = "Measure cold vs warm (snapshot) starts of the digital twin.")
+  parser.add_argument('--repeat', type = int, default = 3, help = "Number of processes started for each mode (default: %(default)s).")
+  parser.add_argument('--snapshot', default = None, help = "Directory for the snapshot (default: temporary directory).")
+  parser.add_argument('--output', default = None, help = "Save the results as JSON in this file.")
+  args = parser.parse_args(argv)
+
+  results = run_startup_benchmark(repeat = args.repeat, snapshot_path = args.snapshot)
+
+  print(f"{'mode':<6}{'import (s)':>12}{'start (s)':>12}{'1st sim (s)':>13}{'total (s)':>12}")
+  for mode in ['cold', 'warm']:
+    timings = results[mode]
+    print(f"{mode:<6}{timings['import_s']:>12.3f}{timings['start_s']:>12.3f}{timings['first_simulation_s']:>13.3f}{timings['total_s']:>12.3f}")
+
+  if args.output is not None:
+    with open(args.output, 'w') as file:
+      json.dump(results, file, indent = 2)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,321 @@
+"""Benchmark suite of the Steel Industry Digital Twin.
+
+It runs fully offline, against the artifacts in digitaltwin/data, and covers:
+  - single simulations (run_simulation) with horizons of 1 day, 1 month, 1 year and 10 years;
+  - the time of each pipeline stage in the 1 year simulation (profiling module), which also
+    covers the vendored idsw helpers used by the pipeline;
+  - batched sweeps (batch.run_batch_simulation) with several batch sizes;
+  - export of the results of a 1 year simulation as CSV, JSON and Excel;
+  - IP21 extraction against the local mock server (bench_ip21.py);
+  - SQLite persistence: appends, upserts and windowed reads (bench_sqlite.py);
+  - CSV loading: default and pyarrow parsers, and the Parquet cache (bench_csv.py);
+  - cold vs warm start (bench_startup.py).
+
+Run from the repository root:
+
+    python benchmarks/suite.py run --output results.json
+    python benchmarks/suite.py compare baseline.json results.json --threshold 0.10
+
+compare exits with code 1 when any benchmark is slower than the baseline by more than the threshold.
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+import contextlib
+from datetime import datetime
+
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY_ROOT)
+
+import numpy as np
+import pandas as pd
+
+
+# (name, total_days, total_hours) of the single simulations:
+HORIZONS = [('1_day', 1, 0), ('1_month', 30, 0), ('1_year', 365, 0), ('10_years', 3650, 0)]
+QUICK_HORIZONS = HORIZONS[:2]
+
+BATCH_SIZES = [1, 10, 100]
+QUICK_BATCH_SIZES = [1, 10]
+
+SIMULATION_INPUTS = {'start_date': '2024-02-21', 'lagging_current_reactive_power': 37.1,
+                    'leading_current_reactive_power': 13.8, 'co2_tco2': 0.029,
+                    'lagging_current_power_factor': 73.29, 'load_type': 'Light_Load'}
+
+
+def get_machine_info():
+  """Information about the machine and the versions of the main packages."""
+
+  import tensorflow as tf
+  import sklearn
+
+  try:
+    commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd = REPOSITORY_ROOT, capture_output = True, text = True, check = True).stdout.strip()
+  except (OSError, subprocess.CalledProcessError):
+    commit = None
+
+  return {'platform': platform.platform(), 'machine': platform.machine(),
+          'processor': platform.processor(), 'cpu_count': os.cpu_count(),
+          'python': platform.python_version(), 'numpy': np.__version__,
+          'pandas': pd.__version__, 'tensorflow': tf.__version__,
+          'scikit-learn': sklearn.__version__, 'commit': commit}
+
+
+def measure(function, repeat):
+  """Run function {repeat} times and return the statistics of the wall times (s)."""
+
+  times = []
+  for i in range(repeat):
+    start = time.perf_counter()
+    function()
+    times.append(time.perf_counter() - start)
+
+  return {'median_s': statistics.median(times), 'min_s': min(times), 'max_s': max(times), 'repeat': repeat}
+
+
+def benchmark_single_simulations(horizons, repeat):
+  """Benchmark run_simulation for each horizon. The output printed by run_simulation is discarded."""
+
+  from digitaltwin.core import (GlobalVars, run_simulation)
+  from digitaltwin import profiling
+
+  results = {}
+
+  for name, total_days, total_hours in horizons:
+    def simulate():
+      with contextlib.redirect_stdout(io.StringIO()):
+        run_simulation(SIMULATION_INPUTS['start_date'], total_days, total_hours, SIMULATION_INPUTS['lagging_current_reactive_power'], SIMULATION_INPUTS['leading_current_reactive_power'], SIMULATION_INPUTS['co2_tco2'], SIMULATION_INPUTS['lagging_current_power_factor'], SIMULATION_INPUTS['load_type'])
+      # Do not accumulate the results of the benchmark:
+      GlobalVars.exported_tables = []
+      # Force update_with_inputs to create the simulation dataframe again in the next call:
+      GlobalVars.total_hours = -1
+
+    # Warm-up (TensorFlow graph creation for this batch shape):
+    simulate()
+    results[f"single_{name}"] = measure(simulate, repeat)
+    results[f"single_{name}"]['rows'] = total_days*24 + total_hours + 1
+
+    if (name == '1_year'):
+      # Time of each stage, for locating regressions:
+      profiling.reset_profiling()
+      profiling.enable_profiling(track_memory = False)
+      for i in range(repeat):
+        simulate()
+      profiling.disable_profiling()
+      for index, row in profiling.profiling_summary().iterrows():
+        results[f"stage_1_year_{row['stage']}"] = {'median_s': row['wall_time_s_p50'], 'p95_s': row['wall_time_s_p95'], 'repeat': int(row['calls'])}
+      profiling.reset_profiling()
+
+  return results
+
+
+def benchmark_batched_sweeps(batch_sizes, repeat):
+  """Benchmark the batched engine for sweeps of 1 day scenarios, with several batch sizes."""
+
+  from digitaltwin.core import GlobalVars
+  from digitaltwin.batch import run_batch_simulation
+
+  results = {}
+
+  for batch_size in batch_sizes:
+    # Sweep of the lagging current reactive power over the allowed range:
+    ranges = GlobalVars.possible_ranges['lagging_current_reactive_power_kvarh']
+    scenarios = pd.DataFrame([dict(SIMULATION_INPUTS, total_days = 1, total_hours = 0, lagging_current_reactive_power = value) for value in np.linspace(ranges['min'], ranges['max'], batch_size)])
+
+    def simulate():
+      with contextlib.redirect_stdout(io.StringIO()):
+        run_batch_simulation(scenarios, GlobalVars.possible_ranges, GlobalVars.kmeans_model, GlobalVars.encoder_decoder_tf_model, engine = 'batched')
+
+    simulate()
+    results[f"batched_{batch_size}_scenarios"] = measure(simulate, repeat)
+    results[f"batched_{batch_size}_scenarios"]['scenarios_per_s'] = batch_size/results[f"batched_{batch_size}_scenarios"]['median_s']
+
+  return results
+
+
+def benchmark_export(repeat):
+  """Benchmark the export of the results of a 1 year simulation."""
+
+  from digitaltwin.core import GlobalVars
+  from digitaltwin.batch import (run_batch_simulation, export_batch_results)
+
+  scenarios = pd.DataFrame([dict(SIMULATION_INPUTS, total_days = 365, total_hours = 0)])
+  with contextlib.redirect_stdout(io.StringIO()):
+    results_df, summary = run_batch_simulation(scenarios, GlobalVars.possible_ranges, GlobalVars.kmeans_model, GlobalVars.encoder_decoder_tf_model)
+
+  results = {}
+  with tempfile.TemporaryDirectory() as directory:
+    for output_format, extension in [('csv', '.csv'), ('json', '.json'), ('excel', '.xlsx')]:
+      output_path = os.path.join(directory, ('export' + extension))
+      def export():
+        if os.path.exists(output_path):
+          os.remove(output_path)
+        with contextlib.redirect_stdout(io.StringIO()):
+          export_batch_results(results_df, output_path, output_format = output_format)
+
+      results[f"export_1_year_{output_format}"] = measure(export, repeat)
+
+  return results
+
+
+def benchmark_ip21_extraction(quick):
+  """Benchmark the IP21 extraction (pages in memory and Parquet sink) against the mock server."""
+
+  from bench_ip21 import (run_ip21_benchmark, PAGE_COUNTS)
+
+  return run_ip21_benchmark(page_counts = (PAGE_COUNTS[:2] if quick else PAGE_COUNTS))
+
+
+def benchmark_sqlite_persistence(quick):
+  """Benchmark the SQLite writes (append, upsert) and reads (time window, full table)."""
+
+  from bench_sqlite import (run_sqlite_benchmark, ROW_COUNTS)
+
+  return run_sqlite_benchmark(row_counts = (ROW_COUNTS[:1] if quick else ROW_COUNTS))
+
+
+def benchmark_csv_loading(quick):
+  """Benchmark load_pandas_dataframe for CSV files (parsers and Parquet cache)."""
+
+  from bench_csv import (run_csv_benchmark, ROW_COUNTS)
+
+  return run_csv_benchmark(row_counts = (ROW_COUNTS[:1] if quick else ROW_COUNTS))
+
+
+def benchmark_cold_start(repeat):
+  """Benchmark cold and warm starts, in fresh processes."""
+
+  from bench_startup import run_startup_benchmark
+
+  startup = run_startup_benchmark(repeat = repeat)
+  results = {}
+  for mode in ['cold', 'warm']:
+    for key, value in startup[mode].items():
+      results[f"{mode}_start_{key}"] = {'median_s': value, 'repeat': repeat}
+
+  return results
+
+
+def run_suite(repeat = 3, quick = False, skip_start = False, data_dir = None):
+  """Run all the benchmarks and return the dictionary saved as JSON."""
+
+  from digitaltwin.idsw import ControlVars
+  from digitaltwin.core import start_global_vars
+
+  if data_dir is not None:
+    # Also used by the processes of the start benchmarks:
+    os.environ['DIGITALTWIN_DATA_DIR'] = os.path.abspath(data_dir)
+
+  # Reproducible random start and input variation:
+  random.seed(0)
+  np.random.seed(0)
+
+  with contextlib.redirect_stdout(io.StringIO()):
+    start_global_vars()
+  ControlVars.show_results = False
+  ControlVars.show_plots = False
+
+  results = {}
+  results.update(benchmark_single_simulations((QUICK_HORIZONS if quick else HORIZONS), repeat))
+  results.update(benchmark_batched_sweeps((QUICK_BATCH_SIZES if quick else BATCH_SIZES), repeat))
+  results.update(benchmark_export(repeat))
+  results.update(benchmark_ip21_extraction(quick))
+  results.update(benchmark_sqlite_persistence(quick))
+  results.update(benchmark_csv_loading(quick))
+  if not skip_start:
+    results.update(benchmark_cold_start(repeat))
+
+  return {'created_at': datetime.now().isoformat(), 'machine': get_machine_info(),
+          'settings': {'repeat': repeat, 'quick': quick}, 'results': results}
+
+
+def compare_results(baseline, current, threshold = 0.10):
+  """Compare the median times of two runs of the suite.
+  : param: baseline, current (dict): contents of the JSON files saved by run_suite.
+  : param: threshold (float): relative change flagged as regression (slower) or improvement (faster).
+  Returns a dataframe with one row per benchmark present in both runs (empty, with the same columns,
+  if the runs have no benchmark in common).
+  """
+
+  rows = []
+  for name, baseline_result in baseline['results'].items():
+    if name not in current['results']:
+      continue
+    baseline_time = baseline_result['median_s']
+    current_time = current['results'][name]['median_s']
+    change = (current_time - baseline_time)/baseline_time if (baseline_time > 0) else 0.0
+
+    if (change > threshold):
+      status = 'REGRESSION'
+    elif (change < -threshold):
+      status = 'improvement'
+    else:
+      status = 'ok'
+
+    rows.append({'benchmark': name, 'baseline_s': baseline_time, 'current_s': current_time, 'change_pct': 100*change, 'status': status})
+
+  return pd.DataFrame(rows, columns = ['benchmark', 'baseline_s', 'current_s', 'change_pct', 'status'])
+
+
+def main(argv = None):
+
+  parser = argparse.ArgumentParser(description = "Benchmark suite of the Steel Industry Digital Twin.")
+  subparsers = parser.add_subparsers(dest = 'command', required = True)
+
+  run_parser = subparsers.add_parser('run', help = "Run the benchmarks and save the results as JSON.")
+  run_parser.add_argument('--output', default = 'benchmark_results.json', help = "JSON file with the results (default: %(default)s).")
+  run_parser.add_argument('--repeat', type = int, default = 3, help = "Repetitions of each benchmark (default: %(default)s).")
+  run_parser.add_argument('--quick', action = 'store_true', help = "Only the 1 day and 1 month horizons and batch sizes 1 and 10.")
+  run_parser.add_argument('--skip-start', action = 'store_true', help = "Skip the cold/warm start benchmarks.")
+  run_parser.add_argument('--data-dir', default = None, help = "Artifact root (default: digitaltwin/data).")
+
+  compare_parser = subparsers.add_parser('compare', help = "Compare two JSON files saved by 'run'.")
+  compare_parser.add_argument('baseline')
+  compare_parser.add_argument('current')
+  compare_parser.add_argument('--threshold', type = float, default = 0.10, help = "Relative slowdown flagged as regression (default: %(default)s).")
+
+  args = parser.parse_args(argv)
+
+  if (args.command == 'run'):
+    suite_results = run_suite(repeat = args.repeat, quick = args.quick, skip_start = args.skip_start, data_dir = args.data_dir)
+    with open(args.output, 'w') as file:
+      json.dump(suite_results, file, indent = 2)
+
+    for name, result in suite_results['results'].items():
+      print(f"{name:<45}{result['median_s']:>12.4f} s")
+    print(f"\nResults saved in {args.output}.")
+    return 0
+
+  with open(args.baseline, 'r') as file:
+    baseline = json.load(file)
+  with open(args.current, 'r') as file:
+    current = json.load(file)
+
+  comparison = compare_results(baseline, current, threshold = args.threshold)
+  if (len(comparison) == 0):
+    print(f"No benchmark in common between {args.baseline} and {args.current}: nothing to compare.")
+    return 2
+
+  with pd.option_context('display.max_rows', None, 'display.width', 200):
+    print(comparison.to_string(index = False, float_format = lambda x: f"{x:.4f}"))
+
+  regressions = comparison[comparison['status'] == 'REGRESSION']
+  if (len(regressions) > 0):
+    print(f"\n{len(regressions)} regression(s) above {100*args.threshold:.0f}%.")
+    return 1
+
+  print("\nNo regressions.")
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,11 @@
+"""Command line interface for batch simulations:
+
+    python -m digitaltwin scenarios.csv --data-dir digitaltwin/data --output results.csv
+"""
+
+import sys
+
+from .cli import main
+
+
+sys.exit(main())
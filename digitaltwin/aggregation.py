@@ -0,0 +1,297 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+
+from .idsw import InvalidInputsError
+from .idsw.datafetch.pipes import export_pd_dataframe_as_excel
+
+from .utils import (get_time_step, DEFAULT_TIME_STEP)
+
+
+# As in raw_data_by_hour.csv, usage_kwh is the energy of one 15-minute reading, whatever the time step
+# of the simulation. So, the energy of a row is usage_kwh*(time step)/(reading interval):
+READING_INTERVAL = '15min'
+
+# Example time-of-use tariff, with the structure of the industrial tariffs from the Korea Electric Power
+# Corporation (light, medium and maximum load periods, with seasonal prices). The prices are only
+# illustrative: use load_tariff or a dictionary with the prices of the supply contract.
+DEFAULT_TARIFF = {
+  'currency': 'KRW',
+  # Period of each hour of the day (0 to 23):
+  'weekday_schedule': (['off_peak']*8 + ['mid_peak']*3 + ['on_peak'] + ['mid_peak'] + ['on_peak']*4 + ['mid_peak']*5 + ['off_peak']*2),
+  'weekend_schedule': ['off_peak']*24,
+  # Price per kWh of each period. Seasons replace these prices in their months:
+  'prices': {'off_peak': 85.0, 'mid_peak': 110.0, 'on_peak': 140.0},
+  'seasons': [{'name': 'summer', 'months': [6, 7, 8], 'prices': {'off_peak': 85.0, 'mid_peak': 140.0, 'on_peak': 220.0}},
+              {'name': 'winter', 'months': [11, 12, 1, 2], 'prices': {'off_peak': 95.0, 'mid_peak': 140.0, 'on_peak': 195.0}}],
+  # Periods counted as peak hours (peak_period_kwh):
+  'peak_periods': ['on_peak']
+}
+
+
+def load_tariff(file_path):
+  """Read a time-of-use tariff from a JSON file with the keys of DEFAULT_TARIFF, and validate it."""
+
+  with open(file_path, 'r') as file:
+    tariff = json.load(file)
+
+  compile_tariff(tariff)
+
+  return tariff
+
+
+def compile_tariff(tariff):
+  """Validate a time-of-use tariff and convert it to lookup arrays.
+  Returns a tuple (period_names, schedule, prices, peak_mask):
+  - schedule: int array (2, 24) with the index of the period of each hour, for weekdays (row 0)
+    and weekends (row 1);
+  - prices: float array (12, periods) with the price per kWh of each period in each month;
+  - peak_mask: bool array (periods,) indicating the peak periods.
+  """
+
+  for key in ['weekday_schedule', 'prices']:
+    if key not in tariff:
+      raise InvalidInputsError(f"The tariff must define '{key}'.")
+
+  period_names = list(tariff['prices'].keys())
+  weekend_schedule = tariff.get('weekend_schedule', tariff['weekday_schedule'])
+
+  for schedule in [tariff['weekday_schedule'], weekend_schedule]:
+    if (len(schedule) != 24):
+      raise InvalidInputsError("The tariff schedules must define the period of each one of the 24 hours.")
+    unknown_periods = set(schedule) - set(period_names)
+    if (len(unknown_periods) > 0):
+      raise InvalidInputsError(f"The tariff schedules use periods without price: {sorted(unknown_periods)}.")
+
+  schedule = np.array([[period_names.index(period) for period in tariff['weekday_schedule']],
+                      [period_names.index(period) for period in weekend_schedule]], dtype = np.int64)
+
+  prices = np.tile(np.array([tariff['prices'][period] for period in period_names], dtype = np.float64), (12, 1))
+  for season in tariff.get('seasons', []):
+    missing_periods = set(period_names) - set(season['prices'].keys())
+    if (len(missing_periods) > 0):
+      raise InvalidInputsError(f"Season '{season.get('name')}' does not define the prices of {sorted(missing_periods)}.")
+    for month in season['months']:
+      prices[(int(month) - 1)] = [season['prices'][period] for period in period_names]
+
+  unknown_periods = set(tariff.get('peak_periods', [])) - set(period_names)
+  if (len(unknown_periods) > 0):
+    raise InvalidInputsError(f"Unknown peak periods: {sorted(unknown_periods)}.")
+  peak_mask = np.array([(period in tariff.get('peak_periods', [])) for period in period_names])
+
+  return period_names, schedule, prices, peak_mask
+
+
+class EnergyAggregator:
+  """Energy and cost totals of simulation results, updated chunk by chunk.
+
+  Each call of update receives a chunk of results (e.g., one batch from batch.run_batch_simulation)
+  and adds it to totals per group (column 'scenario') and day. Only these daily totals, the peak hour
+  of each day and the last (possibly incomplete) hour of each group are kept, so the memory does not
+  depend on the number of rows already aggregated. Weekly and monthly totals are obtained from the
+  daily ones.
+
+  For each row, energy_kwh = usage_kwh*(time step)/(reading_interval), and its cost is energy_kwh
+  times the price of the tariff period of its timestamp.
+  """
+
+  def __init__(self, tariff = None, time_step = None, reading_interval = READING_INTERVAL, group_column = 'scenario'):
+    """
+    : param: tariff (dict): time-of-use tariff, with the keys of DEFAULT_TARIFF. If None,
+      DEFAULT_TARIFF is used.
+    : param: time_step (str): time step of the results. If None, it is obtained from the
+      timestamps of each group (the default time step is used for groups with a single row).
+    : param: reading_interval (str): interval of the energy reported by usage_kwh.
+    : param: group_column (str): column identifying independent simulations. If it is missing
+      from the chunks, all rows belong to a single group named 'simulation'.
+    """
+
+    self.tariff = DEFAULT_TARIFF if (tariff is None) else tariff
+    self.period_names, self.schedule, self.prices, self.peak_mask = compile_tariff(self.tariff)
+    self.time_step = None if (time_step is None) else get_time_step(time_step)
+    self.reading_interval = pd.Timedelta(reading_interval)
+    self.group_column = group_column
+
+    self.energy_columns = ['energy_kwh', 'cost'] + [f"{period}_kwh" for period in self.period_names]
+    # Totals indexed by (group, day):
+    self.daily_ = None
+    # Highest hourly energy of each (group, day), with the hour:
+    self.peaks_ = None
+    # Energy of the last hour of each group, which may continue in the next chunk:
+    self.pending_hours_ = None
+    # Time step (ns) and last timestamp of each group:
+    self.time_steps_ = {}
+    self.last_timestamps_ = {}
+    self.rows = 0
+    self.chunks = 0
+
+
+  def get_row_steps(self, groups, timestamps):
+    """Time step (ns) of each row of a chunk."""
+
+    if self.time_step is not None:
+      return np.full(len(timestamps), self.time_step.value, dtype = np.int64)
+
+    times = pd.Series(timestamps.asi8)
+    diffs = times.groupby(groups, sort = False).diff()
+    positive = (diffs > 0).to_numpy()
+    chunk_steps = diffs[positive].groupby(groups[positive], sort = False).min()
+    first_times = times.groupby(groups, sort = False).first()
+
+    for group in first_times.index:
+      if group in self.time_steps_:
+        continue
+      if group in chunk_steps.index:
+        self.time_steps_[group] = int(chunk_steps[group])
+      elif ((group in self.last_timestamps_) and (first_times[group] > self.last_timestamps_[group])):
+        self.time_steps_[group] = int(first_times[group] - self.last_timestamps_[group])
+
+    self.last_timestamps_.update(times.groupby(groups, sort = False).last().to_dict())
+    default_step = get_time_step(DEFAULT_TIME_STEP).value
+
+    return np.array(pd.Series(groups).map(self.time_steps_).fillna(default_step), dtype = np.int64)
+
+
+  def update(self, chunk):
+    """Add a chunk of simulation results (columns timestamp and usage_kwh, and optionally
+    group_column) to the totals. Returns the aggregator."""
+
+    if (len(chunk) == 0):
+      return self
+
+    timestamps = pd.DatetimeIndex(chunk['timestamp'])
+    if self.group_column in chunk.columns:
+      groups = np.array(chunk[self.group_column], dtype = object)
+    else:
+      groups = np.full(len(chunk), 'simulation', dtype = object)
+
+    steps = self.get_row_steps(groups, timestamps)
+    energy = np.array(chunk['usage_kwh'], dtype = np.float64)*(steps/self.reading_interval.value)
+
+    # Tariff period and price of each row, by array lookups:
+    periods = self.schedule[(np.array(timestamps.dayofweek) >= 5).astype(np.int64), np.array(timestamps.hour)]
+    prices = self.prices[(np.array(timestamps.month) - 1), periods]
+
+    frame = pd.DataFrame({'group': groups, 'day': timestamps.floor('D'), 'hour': timestamps.floor('h'),
+                          'energy_kwh': energy, 'cost': energy*prices})
+    for index, period in enumerate(self.period_names):
+      frame[f"{period}_kwh"] = np.where((periods == index), energy, 0.0)
+
+    daily = frame.groupby(['group', 'day'], sort = False)[self.energy_columns].sum()
+    self.daily_ = daily if (self.daily_ is None) else self.daily_.add(daily, fill_value = 0.0)
+
+    hourly = frame.groupby(['group', 'hour'], sort = False)['energy_kwh'].sum()
+    if self.pending_hours_ is not None:
+      hourly = pd.concat([self.pending_hours_, hourly]).groupby(level = [0, 1], sort = False).sum()
+    # The last hour of each group may continue in the next chunk:
+    self.pending_hours_ = hourly.groupby(level = 0, sort = False).tail(1)
+    self.peaks_ = self.combine_peaks(self.peaks_, hourly.drop(self.pending_hours_.index))
+
+    self.rows = self.rows + len(chunk)
+    self.chunks = self.chunks + 1
+
+    return self
+
+
+  def combine_peaks(self, peaks, hourly):
+    """Keep the hour with the highest energy of each (group, day)."""
+
+    new_peaks = hourly.rename('peak_hour_kwh').reset_index()
+    new_peaks['day'] = new_peaks['hour'].dt.floor('D')
+    if peaks is not None:
+      new_peaks = pd.concat([peaks, new_peaks], ignore_index = True)
+
+    new_peaks = new_peaks.sort_values(by = 'peak_hour_kwh', ascending = False, kind = 'stable').drop_duplicates(subset = ['group', 'day'])
+
+    return new_peaks[['group', 'day', 'hour', 'peak_hour_kwh']].reset_index(drop = True)
+
+
+  def daily_totals(self):
+    """Dataframe with one row per group and day: energy, cost, energy of each tariff period,
+    peak-period energy, highest hourly energy (and its hour) and the rolling sums of the energy in
+    the last 7 and 30 days."""
+
+    if self.daily_ is None:
+      raise InvalidInputsError("No results were aggregated yet. Call update with the simulation results.")
+
+    daily_df = self.daily_.reset_index()
+    peak_columns = [f"{period}_kwh" for period, is_peak in zip(self.period_names, self.peak_mask) if is_peak]
+    daily_df['peak_period_kwh'] = daily_df[peak_columns].sum(axis = 1)
+
+    peaks = self.combine_peaks(self.peaks_, self.pending_hours_).rename(columns = {'hour': 'peak_hour'})
+    daily_df = daily_df.merge(peaks, on = ['group', 'day'], how = 'left')
+    daily_df = daily_df.sort_values(by = ['group', 'day'], kind = 'stable').reset_index(drop = True)
+
+    for window in [7, 30]:
+      rolling = daily_df.set_index('day').groupby('group', sort = False)['energy_kwh'].rolling(f"{window}D").sum()
+      daily_df[f"rolling_{window}d_kwh"] = rolling.to_numpy()
+
+    return daily_df.rename(columns = {'group': self.group_column})
+
+
+  def period_totals(self, frequency = 'W'):
+    """Totals per group and week ('W', starting on Mondays) or month ('M'), from the daily totals."""
+
+    if frequency not in ['W', 'M']:
+      raise InvalidInputsError("frequency must be 'W' (weeks) or 'M' (months).")
+
+    daily_df = self.daily_totals()
+    days = pd.DatetimeIndex(daily_df['day'])
+    if (frequency == 'W'):
+      daily_df['period_start'] = days - pd.to_timedelta(days.dayofweek, unit = 'D')
+    else:
+      daily_df['period_start'] = days.to_period('M').start_time
+
+    keys = [self.group_column, 'period_start']
+    grouped = daily_df.groupby(keys, sort = False)
+    totals = grouped[self.energy_columns + ['peak_period_kwh']].sum()
+    # Highest hourly energy of the period:
+    peaks = daily_df.loc[grouped['peak_hour_kwh'].idxmax(), keys + ['peak_hour', 'peak_hour_kwh']].set_index(keys)
+
+    return pd.concat([totals, peaks], axis = 1).reset_index()
+
+
+  def weekly_totals(self):
+    """Totals per group and week (see period_totals)."""
+
+    return self.period_totals('W')
+
+
+  def monthly_totals(self):
+    """Totals per group and month (see period_totals)."""
+
+    return self.period_totals('M')
+
+
+  def summary(self):
+    """Dataframe with one row per group: total energy and cost, energy of each tariff period,
+    peak-period energy, average price and the highest hourly energy, with its hour."""
+
+    daily_df = self.daily_totals()
+    grouped = daily_df.groupby(self.group_column, sort = False)
+
+    summary_df = grouped[self.energy_columns + ['peak_period_kwh']].sum()
+    summary_df['average_price'] = summary_df['cost']/summary_df['energy_kwh'].where(summary_df['energy_kwh'] != 0)
+    peaks = daily_df.loc[grouped['peak_hour_kwh'].idxmax(), [self.group_column, 'peak_hour', 'peak_hour_kwh']].set_index(self.group_column)
+    summary_df = pd.concat([summary_df, peaks.rename(columns = {'peak_hour': 'max_hourly_at', 'peak_hour_kwh': 'max_hourly_kwh'})], axis = 1)
+    summary_df['currency'] = self.tariff.get('currency')
+
+    return summary_df.reset_index()
+
+
+def export_aggregates(aggregator, output_path):
+  """Save the summary and the daily, weekly and monthly totals of an EnergyAggregator as the sheets
+  of an Excel file. Returns the path of the file."""
+
+  directory, file_name = os.path.split(output_path)
+  file_name_without_extension = os.path.splitext(file_name)[0]
+
+  exported_tables = [{'dataframe_obj_to_be_exported': aggregator.summary(), 'excel_sheet_name': 'summary'},
+                    {'dataframe_obj_to_be_exported': aggregator.daily_totals(), 'excel_sheet_name': 'daily'},
+                    {'dataframe_obj_to_be_exported': aggregator.weekly_totals(), 'excel_sheet_name': 'weekly'},
+                    {'dataframe_obj_to_be_exported': aggregator.monthly_totals(), 'excel_sheet_name': 'monthly'}]
+
+  export_pd_dataframe_as_excel(file_name_without_extension = file_name_without_extension, exported_tables = exported_tables, file_directory_path = directory)
+
+  return output_path
@@ -0,0 +1,265 @@
+import time
+import threading
+from collections import deque
+from concurrent.futures import (ThreadPoolExecutor, CancelledError, TimeoutError as FutureTimeoutError)
+from dataclasses import dataclass
+
+from .idsw import ControlVars
+
+from .progress import (ProgressReporter, SimulationCancelled, reporting, report_progress)
+
+
+@dataclass
+class BackgroundVars:
+  """
+    Store the executor of the background tasks as Global variables.
+    The simulations share the state in GlobalVars, so by default the tasks run one at a time
+    (in the order they are submitted), in a thread that does not block the notebook kernel.
+  """
+  max_workers = 1
+  executor = None
+  # Last tasks submitted (the oldest ones are discarded after 100 tasks):
+  tasks = deque(maxlen = 100)
+  task_counter = 0
+  lock = threading.Lock()
+
+
+class BackgroundTask:
+  """Future of a task running in the background executor, with its progress and cancellation.
+
+  It has the methods of concurrent.futures.Future (result, exception, done, running,
+  add_done_callback). Method cancel stops the task at its next cancellation point (between
+  stages of a simulation, or between batches of a sweep); then, result raises SimulationCancelled.
+  """
+
+  def __init__(self, name, future, reporter):
+    self.name = name
+    self.future = future
+    self.reporter = reporter
+
+
+  @property
+  def progress(self):
+    """Last ProgressEvent of the task."""
+    return self.reporter.latest
+
+
+  def cancel(self):
+    """Request the cancellation of the task. Returns False if it has already finished."""
+
+    if self.future.done():
+      return False
+
+    self.reporter.cancel_event.set()
+    # If the task was not started yet, it is removed from the queue:
+    self.future.cancel()
+
+    return True
+
+
+  def cancelled(self):
+    return (self.future.cancelled()) or ((self.future.done()) and (isinstance(self.future.exception(), SimulationCancelled)))
+
+
+  def result(self, timeout = None):
+    return self.future.result(timeout = timeout)
+
+
+  def exception(self, timeout = None):
+    return self.future.exception(timeout = timeout)
+
+
+  def done(self):
+    return self.future.done()
+
+
+  def running(self):
+    return self.future.running()
+
+
+  def add_done_callback(self, function):
+    """Call function(task) when the task finishes, is cancelled or fails."""
+    self.future.add_done_callback(lambda future: function(self))
+
+
+  def __repr__(self):
+    state = 'cancelled' if self.cancelled() else ('finished' if self.done() else ('running' if self.running() else 'pending'))
+    return f"<BackgroundTask '{self.name}' {state}: stage '{self.progress.stage}', {self.progress.rows_done} rows>"
+
+
+def get_executor():
+  """Return the executor of the background tasks, creating it on the first call."""
+
+  with BackgroundVars.lock:
+    if BackgroundVars.executor is None:
+      BackgroundVars.executor = ThreadPoolExecutor(max_workers = BackgroundVars.max_workers, thread_name_prefix = 'digitaltwin')
+
+    return BackgroundVars.executor
+
+
+def shutdown_executor(cancel_tasks = True):
+  """Stop the background executor. If cancel_tasks, the pending and running tasks are cancelled.
+  A new executor is created by the next task."""
+
+  if (cancel_tasks):
+    for task in list(BackgroundVars.tasks):
+      task.cancel()
+
+  with BackgroundVars.lock:
+    executor = BackgroundVars.executor
+    BackgroundVars.executor = None
+
+  if executor is not None:
+    executor.shutdown(wait = True)
+
+
+def submit_task(function, *args, task_name = None, callback = None, min_interval_s = 0.2, **kwargs):
+  """Run function(*args, **kwargs) in the background executor, and return a BackgroundTask.
+  : param: task_name (str): name of the task in the progress events.
+  : param: callback: function called with a progress.ProgressEvent whenever the task reports its
+    progress (e.g., the function returned by progress_widget). It runs in the background thread.
+  : param: min_interval_s (float): minimum interval between callbacks of a same stage.
+  """
+
+  with BackgroundVars.lock:
+    BackgroundVars.task_counter = BackgroundVars.task_counter + 1
+    if task_name is None:
+      task_name = f"{function.__name__}_{BackgroundVars.task_counter}"
+
+  reporter = ProgressReporter(task_name, callback = callback, min_interval_s = min_interval_s)
+
+  def run_task():
+    with reporting(reporter):
+      report_progress('started')
+      result = function(*args, **kwargs)
+      reporter.report('finished', rows_done = reporter.latest.rows_done, done = True)
+
+    return result
+
+  task = BackgroundTask(task_name, get_executor().submit(run_task), reporter)
+  BackgroundVars.tasks.append(task)
+
+  return task
+
+
+def run_simulation_async(var1, var2, var3, var4, var5, var6, var7, var8, callback = None, task_name = None):
+  """Non-blocking version of core.run_simulation. The simulation runs in the background executor,
+  and the report is printed when it finishes. Returns a BackgroundTask.
+  : param: callback: function receiving the progress (see submit_task).
+  """
+
+  from .core import run_simulation
+
+  def simulation(*inputs):
+    try:
+      run_simulation(*inputs)
+    except SimulationCancelled:
+      # The simulation disables the messages while running:
+      ControlVars.show_results = True
+      ControlVars.show_plots = True
+      raise
+
+  return submit_task(simulation, var1, var2, var3, var4, var5, var6, var7, var8, task_name = task_name, callback = callback)
+
+
+def run_batch_simulation_async(scenarios, possible_ranges, callback = None, task_name = None, **kwargs):
+  """Non-blocking version of batch.run_batch_simulation (same arguments). The progress is reported
+  after each batch, with the rows simulated and the estimated time to finish, and the sweep can be
+  cancelled between batches. Returns a BackgroundTask whose result is the tuple (results, summary).
+  """
+
+  from .batch import run_batch_simulation
+
+  return submit_task(run_batch_simulation, scenarios, possible_ranges, task_name = task_name, callback = callback, **kwargs)
+
+
+def export_batch_results_async(results, output_path, output_format = None, callback = None, task_name = None):
+  """Non-blocking version of batch.export_batch_results. Returns a BackgroundTask."""
+
+  from .batch import export_batch_results
+
+  def export_results(results, output_path, output_format):
+    report_progress('export', rows_done = 0, rows_total = len(results))
+    export_batch_results(results, output_path, output_format = output_format)
+    report_progress('export', rows_done = len(results))
+
+  return submit_task(export_results, results, output_path, output_format, task_name = task_name, callback = callback)
+
+
+def download_excel_with_data_async(callback = None, task_name = None):
+  """Non-blocking version of core.download_excel_with_data. The tables are the ones stored when
+  the task starts. Returns a BackgroundTask."""
+
+  from .core import download_excel_with_data
+
+  def export_excel():
+    report_progress('export')
+    download_excel_with_data()
+
+  return submit_task(export_excel, task_name = task_name, callback = callback)
+
+
+def format_progress(event):
+  """Text with the stage, rows, elapsed time and ETA of a progress.ProgressEvent."""
+
+  text = f"{event.task}: {event.stage}"
+  if event.rows_total is not None:
+    text = text + f" - {event.rows_done}/{event.rows_total} rows ({100*(event.fraction or 0):.0f}%)"
+  text = text + f" - elapsed {event.elapsed_s:.1f} s"
+  if ((event.eta_s is not None) and (not event.done)):
+    text = text + f" - ETA {event.eta_s:.1f} s"
+
+  return text
+
+
+def progress_widget(description = 'Simulation'):
+  """Return a progress callback for the tasks of this module.
+
+  In notebooks with ipywidgets, it displays a progress bar with the stage, rows and ETA, updated
+  by the callback. Otherwise, the callback prints one line per event.
+  """
+
+  try:
+    import ipywidgets as widgets
+    from IPython.display import display
+
+  except ModuleNotFoundError:
+    def print_progress(event):
+      print(format_progress(event))
+
+    return print_progress
+
+  bar = widgets.FloatProgress(value = 0.0, min = 0.0, max = 1.0, description = description)
+  label = widgets.Label(value = 'queued')
+  display(widgets.HBox([bar, label]))
+
+  def update_widget(event):
+    if event.fraction is not None:
+      bar.value = event.fraction
+    if (event.done):
+      bar.bar_style = 'success'
+    label.value = format_progress(event)
+
+  return update_widget
+
+
+def wait_for_tasks(tasks = None, timeout = None):
+  """Wait until the tasks (default: all the tasks submitted) finish. Returns the list of tasks
+  that did not finish before the timeout (s)."""
+
+  if tasks is None:
+    tasks = list(BackgroundVars.tasks)
+
+  deadline = (time.perf_counter() + timeout) if timeout is not None else None
+  pending = []
+  for task in tasks:
+    remaining = max(deadline - time.perf_counter(), 0) if deadline is not None else None
+    try:
+      task.exception(timeout = remaining)
+    except FutureTimeoutError:
+      pending.append(task)
+    except CancelledError:
+      # Task cancelled before it started:
+      pass
+
+  return pending
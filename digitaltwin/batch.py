@@ -0,0 +1,384 @@
+import os
+import json
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+
+from .idsw import (InvalidInputsError, ControlVars)
+from .idsw.datafetch.pipes import export_pd_dataframe_as_excel
+
+from .models import load_models
+from .transformvariables import simulation_pipeline
+from .progress import (report_progress, SimulationCancelled)
+from .utils import (load_df_and_ranges,
+                    create_timestamp_array,
+                    create_dayofweek_weekstatus,
+                    calculate_nsm,
+                    convert_input_vars_to_arrays,
+                    obtain_simulation_df,
+                    add_variation_to_features,
+                    calculate_leading_current_power_factor,
+                    get_time_step,
+                    DEFAULT_TIME_STEP
+                    )
+
+
+# Columns that each scenario must define. They are the same inputs of run_simulation (var1 to var8).
+SCENARIO_COLUMNS = ['start_date', 'total_days', 'total_hours',
+                    'lagging_current_reactive_power', 'leading_current_reactive_power',
+                    'co2_tco2', 'lagging_current_power_factor', 'load_type']
+
+LOAD_TYPES = ['Light_Load', 'Medium_Load', 'Maximum_Load']
+
+
+@dataclass
+class WorkerVars:
+  """
+    Store the models and ranges loaded by each worker process of the parallel engine.
+    Each process loads its own copy once, when it is started.
+  """
+  kmeans_model = None
+  encoder_decoder_tf_model = None
+  possible_ranges = None
+
+
+def load_scenarios(file_path):
+  """Read the scenarios for a batch simulation from a CSV or JSON file.
+  : param: file_path (str): path of a .csv file with one scenario per row, or of a .json
+    file containing a list of objects (one per scenario).
+    Each scenario must define the columns in SCENARIO_COLUMNS:
+      start_date, total_days, total_hours, lagging_current_reactive_power,
+      leading_current_reactive_power, co2_tco2, lagging_current_power_factor, load_type.
+    An optional column 'scenario' may be used for naming the scenarios. If it is missing,
+    scenarios are named as 'scenario_1', 'scenario_2', ...
+    An optional column 'time_step' (e.g., '15min') defines the time step of each scenario.
+
+  Returns a dataframe with one row per scenario.
+  """
+
+  extension = os.path.splitext(file_path)[1].lower()
+
+  if (extension == '.csv'):
+    scenarios = pd.read_csv(file_path)
+
+  elif (extension == '.json'):
+    with open(file_path, 'r') as file:
+      scenarios = pd.DataFrame(json.load(file))
+
+  else:
+    raise InvalidInputsError(f"Scenarios file must be a .csv or a .json file, not '{extension}'.")
+
+  return validate_scenarios(scenarios)
+
+
+def validate_scenarios(scenarios):
+  """Check if a dataframe of scenarios has all the required inputs, with valid values.
+  : param: scenarios (pd.DataFrame): one row per scenario, with the columns in SCENARIO_COLUMNS.
+  """
+
+  scenarios = scenarios.copy(deep = True)
+
+  missing_columns = [column for column in SCENARIO_COLUMNS if column not in scenarios.columns]
+  if (len(missing_columns) > 0):
+    raise InvalidInputsError(f"Scenarios are missing the columns {missing_columns}.")
+
+  if (len(scenarios) == 0):
+    raise InvalidInputsError("No scenario was provided.")
+
+  invalid_loads = set(scenarios['load_type']) - set(LOAD_TYPES)
+  if (len(invalid_loads) > 0):
+    raise InvalidInputsError(f"Invalid load types {sorted(invalid_loads)}. Use one of {LOAD_TYPES}.")
+
+  if (((scenarios['total_days'] < 0) | (scenarios['total_hours'] < 0)).any()):
+    raise InvalidInputsError("total_days and total_hours must be non-negative integers.")
+
+  if 'scenario' not in scenarios.columns:
+    scenarios['scenario'] = [f"scenario_{i}" for i in range(1, (len(scenarios) + 1))]
+
+  if 'time_step' in scenarios.columns:
+    # Check each different time step only once:
+    for time_step in pd.unique(scenarios['time_step'].dropna()):
+      get_time_step(time_step)
+
+  scenarios['scenario'] = scenarios['scenario'].astype(str)
+  if (scenarios['scenario'].duplicated().any()):
+    raise InvalidInputsError("Scenario names must be unique.")
+
+  return scenarios.reset_index(drop = True)
+
+
+def count_scenario_rows(scenarios, time_step = DEFAULT_TIME_STEP):
+  """Number of rows simulated for each scenario (see utils.create_timestamp_array), without
+  creating them.
+  : param: scenarios (pd.DataFrame): validated scenarios (see validate_scenarios).
+  : param: time_step (str): time step of the scenarios without the column 'time_step'.
+  """
+
+  if 'time_step' in scenarios.columns:
+    time_steps = scenarios['time_step'].where(scenarios['time_step'].notna(), time_step)
+  else:
+    time_steps = pd.Series(time_step, index = scenarios.index)
+
+  steps_per_hour = time_steps.map(lambda step: pd.Timedelta(hours = 1)//get_time_step(step))
+  total_hours = scenarios['total_days'].astype(int)*24 + scenarios['total_hours'].astype(int)
+
+  return total_hours*steps_per_hour + 1
+
+
+def build_scenario_df(scenario, possible_ranges, add_variation = True, time_step = DEFAULT_TIME_STEP):
+  """Create the dataframe with the inputs of a single scenario, the same way update_with_inputs does
+  for the user interface.
+  : param: scenario (dict or pd.Series): scenario with the keys in SCENARIO_COLUMNS.
+  : param: possible_ranges (dict): allowed ranges for each variable, from load_df_and_ranges.
+  : param: add_variation (bool): if False, the random noise is not added to the inputs.
+  : param: time_step (str): time step used if the scenario does not define 'time_step'.
+  """
+
+  if ('time_step' in scenario) and (pd.notna(scenario['time_step'])):
+    time_step = scenario['time_step']
+
+  start_date = pd.Timestamp(scenario['start_date'])
+  timestamps, total_entries = create_timestamp_array(start_date, int(scenario['total_days']), int(scenario['total_hours']), time_step = time_step)
+  day_of_week, weekstatus = create_dayofweek_weekstatus(timestamps)
+  nsm = calculate_nsm(start_date, timestamps)
+
+  lagging_current_reactive_power, leading_current_reactive_power, co2_tco2, lagging_current_power_factor, load_type = convert_input_vars_to_arrays(total_entries, scenario['lagging_current_reactive_power'], scenario['leading_current_reactive_power'], scenario['co2_tco2'], scenario['lagging_current_power_factor'], scenario['load_type'])
+
+  sim_df = obtain_simulation_df(timestamps, lagging_current_reactive_power, leading_current_reactive_power, co2_tco2, lagging_current_power_factor, nsm, weekstatus, day_of_week, load_type)
+
+  if (add_variation):
+    sim_df = add_variation_to_features(sim_df, possible_ranges)
+  else:
+    # Only apply the linear correlation for the leading current power factor:
+    sim_df['leading_current_power_factor'] = calculate_leading_current_power_factor(sim_df['leading_current_reactive_power_kvarh'], possible_ranges, add_noise = False)
+
+  return sim_df
+
+
+def iter_batches(scenario_dfs, rows_per_batch):
+  """Yield the batches of split_in_batches one at a time. scenario_dfs may be a generator, so
+  the scenarios of a batch are only created when the batch is requested."""
+
+  current_batch = []
+  current_rows = 0
+
+  for scenario_name, sim_df in scenario_dfs:
+    if ((current_rows + len(sim_df) > rows_per_batch) & (len(current_batch) > 0)):
+      yield current_batch
+      current_batch = []
+      current_rows = 0
+
+    current_batch.append((scenario_name, sim_df))
+    current_rows = current_rows + len(sim_df)
+
+  if (len(current_batch) > 0):
+    yield current_batch
+
+
+def split_in_batches(scenario_dfs, rows_per_batch):
+  """Group the scenario dataframes in batches with up to rows_per_batch rows, so that
+  each batch runs through the simulation pipeline as a single dataframe.
+  A scenario is never split between batches, so a single scenario longer than rows_per_batch
+  forms its own batch.
+  : param: scenario_dfs: list of tuples (scenario_name, sim_df).
+  """
+
+  return list(iter_batches(scenario_dfs, rows_per_batch))
+
+
+def simulate_batch(batch, possible_ranges, kmeans_model, encoder_decoder_tf_model, full_precision = False):
+  """Run a batch of scenarios through the simulation pipeline in a single pass.
+  The scenario dataframes are concatenated, so the clusters and the encoder-decoder predictions
+  are obtained with one call for the whole batch. A column 'scenario' identifies each row.
+  : param: batch: list of tuples (scenario_name, sim_df).
+  : param: full_precision (bool): if True, the physical quantities are kept as float64.
+  """
+
+  scenario_names = np.concatenate([np.full(len(sim_df), scenario_name, dtype = object) for scenario_name, sim_df in batch])
+  batch_df = pd.concat([sim_df for scenario_name, sim_df in batch], ignore_index = True)
+
+  results = simulation_pipeline(batch_df, possible_ranges, kmeans_model, encoder_decoder_tf_model, full_precision = full_precision, scenarios = scenario_names)
+  results.insert(0, 'scenario', scenario_names)
+
+  return results
+
+
+def start_worker(directory_path, model_version = None, registry_path = None):
+  """Initializer of the worker processes from the parallel engine: load the models only once per process.
+  If model_version is not None, the models are loaded from the model registry (see registry.load_model_version)."""
+
+  ControlVars.show_results = False
+  ControlVars.show_plots = False
+
+  if model_version is None:
+    WorkerVars.kmeans_model, WorkerVars.encoder_decoder_tf_model = load_models(directory_path)
+  else:
+    from .registry import load_model_version
+    WorkerVars.kmeans_model, WorkerVars.encoder_decoder_tf_model, metadata = load_model_version(model_version, registry_path = registry_path)
+  df, WorkerVars.possible_ranges = load_df_and_ranges(directory_path)
+
+
+def simulate_batch_in_worker(batch, full_precision = False):
+  """Run simulate_batch with the models loaded by the worker process."""
+
+  return simulate_batch(batch, WorkerVars.possible_ranges, WorkerVars.kmeans_model, WorkerVars.encoder_decoder_tf_model, full_precision = full_precision)
+
+
+def run_batch_simulation(scenarios, possible_ranges, kmeans_model = None, encoder_decoder_tf_model = None, engine = 'batched', rows_per_batch = 50000, workers = None, directory_path = None, add_variation = True, full_precision = False, model_version = None, registry_path = None, time_step = DEFAULT_TIME_STEP, aggregator = None, keep_results = True):
+  """Simulate several scenarios without any user interface.
+  : param: scenarios (pd.DataFrame): one row per scenario (see load_scenarios and validate_scenarios).
+  : param: possible_ranges (dict): allowed ranges for each variable, from load_df_and_ranges.
+  : param: kmeans_model, encoder_decoder_tf_model: models from load_models. Required for the
+    'batched' engine. The 'parallel' engine loads them in each worker from directory_path.
+  : param: engine (str): 'batched' runs the batches sequentially in this process, each one as a
+    single pass through the pipeline; 'parallel' distributes the batches to worker processes.
+  : param: rows_per_batch (int): maximum number of rows (timestamps) per batch.
+  : param: workers (int): number of worker processes for the 'parallel' engine. If None, the
+    number of CPUs is used.
+  : param: directory_path (str): directory with the models, used by the 'parallel' engine.
+    If None, each worker uses utils.get_data_directory.
+  : param: add_variation (bool): if False, the random noise is not added to the inputs.
+  : param: full_precision (bool): if False (default), the results are compacted: categorical
+    string columns (including 'scenario') and float32 physical quantities. If True, the physical
+    quantities are kept as float64.
+  : param: model_version (str): name of the registered version of the models, recorded in the column
+    'model_version' of the results and in the summary. The 'parallel' engine loads this version
+    from the model registry in registry_path (see registry.load_model_version), instead of
+    directory_path.
+  : param: registry_path (str): directory of the model registry, used by the 'parallel' engine.
+  : param: time_step (str): time step of the scenarios without the column 'time_step' (see
+    utils.get_time_step). Sub-hourly results are reconciled with the hourly predictions (see
+    transformvariables.simulation_pipeline).
+  : param: aggregator (aggregation.EnergyAggregator): if not None, each batch of results is added
+    to it as soon as it is simulated.
+  : param: keep_results (bool): if False, the results of each batch are discarded after being
+    passed to the aggregator, so the memory does not grow with the number of simulated rows
+    (streaming mode). With the 'batched' engine, the inputs of each batch are also only created
+    when the batch is simulated.
+
+  Returns a tuple (results, summary): results is a dataframe with the simulated rows of all
+  scenarios, identified by column 'scenario' (None if keep_results = False); summary is a
+  dictionary with the throughput.
+  """
+
+  if engine not in ['batched', 'parallel']:
+    raise InvalidInputsError(f"engine must be 'batched' or 'parallel', not '{engine}'.")
+
+  if ((engine == 'batched') & ((kmeans_model is None) | (encoder_decoder_tf_model is None))):
+    raise InvalidInputsError("The 'batched' engine requires kmeans_model and encoder_decoder_tf_model.")
+
+  if ((not keep_results) & (aggregator is None)):
+    raise InvalidInputsError("keep_results = False requires an aggregator, or no result would be returned.")
+
+  start_time = time.perf_counter()
+
+  if ((engine == 'parallel') & (model_version is not None)):
+    from .registry import (get_registry_directory, resolve_version_name)
+    # The workers do not share GlobalVars, so they receive the registry directory of this process:
+    registry_path = get_registry_directory(registry_path)
+    # All workers load the same version, even if a new one is registered meanwhile:
+    model_version = resolve_version_name(model_version, registry_path)
+
+  scenarios = validate_scenarios(scenarios)
+  get_time_step(time_step)
+  # The inputs (and their random variation) are always created in this process, so the same
+  # seed gives the same inputs for both engines.
+  # Generator: each scenario is created when its batch is requested.
+  scenario_dfs = ((scenario['scenario'], build_scenario_df(scenario, possible_ranges, add_variation = add_variation, time_step = time_step)) for index, scenario in scenarios.iterrows())
+  batches = iter_batches(scenario_dfs, rows_per_batch)
+  scenario_categories = pd.unique(scenarios['scenario'])
+  # Progress of background tasks (see background.run_batch_simulation_async). Each batch is also
+  # a cancellation point:
+  report_progress('batch_simulation', rows_done = 0, rows_total = count_scenario_rows(scenarios, time_step).sum())
+
+  def process_results(batch_results):
+    # Consume the results of each batch as they are produced:
+    list_of_results = []
+    total_batches, total_rows = 0, 0
+    for results in batch_results:
+      # Each scenario name is stored only once:
+      results['scenario'] = pd.Categorical(results['scenario'], categories = scenario_categories)
+      if model_version is not None:
+        results['model_version'] = pd.Categorical(np.full(len(results), model_version, dtype = object))
+      if aggregator is not None:
+        aggregator.update(results)
+      if (keep_results):
+        list_of_results.append(results)
+      total_batches, total_rows = (total_batches + 1), (total_rows + len(results))
+      report_progress('batch_simulation', rows_done = total_rows)
+
+    return list_of_results, total_batches, total_rows
+
+  if (engine == 'batched'):
+    list_of_results, total_batches, total_rows = process_results(simulate_batch(batch, possible_ranges, kmeans_model, encoder_decoder_tf_model, full_precision = full_precision) for batch in batches)
+
+  else:
+    if workers is None:
+      workers = os.cpu_count()
+    batches = list(batches)
+    # TensorFlow is not fork-safe, so the workers are always spawned:
+    with ProcessPoolExecutor(max_workers = min(workers, len(batches)), mp_context = multiprocessing.get_context('spawn'), initializer = start_worker, initargs = (directory_path, model_version, registry_path)) as executor:
+      try:
+        list_of_results, total_batches, total_rows = process_results(executor.map(simulate_batch_in_worker, batches, [full_precision]*len(batches)))
+      except SimulationCancelled:
+        # Do not wait for the batches that were not started:
+        executor.shutdown(wait = True, cancel_futures = True)
+        raise
+
+  results = pd.concat(list_of_results, ignore_index = True) if (keep_results) else None
+  elapsed_time = time.perf_counter() - start_time
+
+  summary = {'engine': engine,
+            'scenarios': len(scenarios),
+            'batches': total_batches,
+            'rows': total_rows,
+            'elapsed_time_s': elapsed_time,
+            'scenarios_per_s': len(scenarios)/elapsed_time,
+            'rows_per_s': total_rows/elapsed_time,
+            'model_version': model_version}
+
+  return results, summary
+
+
+def export_batch_results(results, output_path, output_format = None):
+  """Save the results of run_batch_simulation.
+  : param: results (pd.DataFrame): dataframe returned by run_batch_simulation.
+  : param: output_path (str): path of the output file.
+  : param: output_format (str): 'csv', 'json', 'excel' or 'parquet'. If None, the format is
+    inferred from the extension of output_path.
+    - 'json' writes one JSON object per line (records).
+    - 'excel' writes one sheet per scenario, as the Excel file from download_excel_with_data.
+    - 'parquet' requires pyarrow or fastparquet.
+  """
+
+  extensions = {'.csv': 'csv', '.json': 'json', '.jsonl': 'json', '.xlsx': 'excel', '.parquet': 'parquet'}
+
+  if output_format is None:
+    extension = os.path.splitext(output_path)[1].lower()
+    if extension not in extensions.keys():
+      raise InvalidInputsError(f"Cannot infer the output format from '{output_path}'. Use one of {list(extensions.keys())}.")
+    output_format = extensions[extension]
+
+  if (output_format == 'csv'):
+    results.to_csv(output_path, index = False)
+
+  elif (output_format == 'json'):
+    results.to_json(output_path, orient = 'records', lines = True, date_format = 'iso')
+
+  elif (output_format == 'excel'):
+    directory, file_name = os.path.split(output_path)
+    file_name_without_extension = os.path.splitext(file_name)[0]
+    # Excel sheet names are limited to 31 characters:
+    exported_tables = [{'dataframe_obj_to_be_exported': scenario_df.drop(columns = ['scenario']), 'excel_sheet_name': str(scenario_name)[:31]} for scenario_name, scenario_df in results.groupby('scenario', sort = False, observed = True)]
+    export_pd_dataframe_as_excel(file_name_without_extension = file_name_without_extension, exported_tables = exported_tables, file_directory_path = directory)
+
+  elif (output_format == 'parquet'):
+    results.to_parquet(output_path, index = False)
+
+  else:
+    raise InvalidInputsError(f"output_format must be 'csv', 'json', 'excel' or 'parquet', not '{output_format}'.")
+
+  return output_path
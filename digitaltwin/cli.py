@@ -0,0 +1,120 @@
+import argparse
+import sys
+import numpy as np
+
+from .idsw import (InvalidInputsError, ControlVars)
+
+from .models import load_models
+from .utils import load_df_and_ranges
+from .batch import (load_scenarios, run_batch_simulation, export_batch_results)
+from .registry import (get_registry_directory, resolve_version_name, load_model_version)
+from .aggregation import (EnergyAggregator, load_tariff, export_aggregates)
+
+
+def get_parser():
+  """Create the parser for the arguments of the command line interface."""
+
+  parser = argparse.ArgumentParser(
+    prog = 'python -m digitaltwin',
+    description = "Run the Steel Industry Digital Twin in batch mode, from a file of scenarios, without any notebook or network dependency.")
+
+  parser.add_argument('scenarios', help = "CSV or JSON file with one scenario per row/object. Required fields: start_date, total_days, total_hours, lagging_current_reactive_power, leading_current_reactive_power, co2_tco2, lagging_current_power_factor, load_type. Optional field: scenario (name).")
+  parser.add_argument('--data-dir', default = None, help = "Directory with kmeans_model.pkl, encoder_decoder_tf_model/saved_model and raw_data_by_hour.csv (default: environment variable DIGITALTWIN_DATA_DIR, or the 'data' directory of the package).")
+  parser.add_argument('--cache-dir', default = None, help = "Directory for the binary cache of the original dataset (default: environment variable DIGITALTWIN_CACHE_DIR, or the subdirectory 'cache' of the data directory).")
+  parser.add_argument('--no-cache', action = 'store_true', help = "Always parse raw_data_by_hour.csv, without reading or writing the binary cache.")
+  parser.add_argument('--output', '-o', default = 'steelindustrysimulations.csv', help = "Path of the output file (default: %(default)s).")
+  parser.add_argument('--format', dest = 'output_format', choices = ['csv', 'json', 'excel', 'parquet'], default = None, help = "Output format. If omitted, it is inferred from the extension of --output.")
+  parser.add_argument('--engine', choices = ['batched', 'parallel'], default = 'batched', help = "'batched' runs the batches in this process; 'parallel' distributes them to worker processes (default: %(default)s).")
+  parser.add_argument('--workers', type = int, default = None, help = "Number of worker processes for the parallel engine (default: number of CPUs).")
+  parser.add_argument('--rows-per-batch', type = int, default = 50000, help = "Maximum number of simulated rows per batch (default: %(default)s).")
+  parser.add_argument('--seed', type = int, default = None, help = "Seed for the random variation added to the inputs.")
+  parser.add_argument('--no-variation', action = 'store_true', help = "Do not add random variation to the inputs (deterministic simulations).")
+  parser.add_argument('--time-step', default = '1h', help = "Interval between simulated timestamps, dividing one hour, e.g. '15min' (default: %(default)s). Scenarios may override it with a 'time_step' column.")
+  parser.add_argument('--model-version', default = None, help = "Name of a version from the model registry (or 'latest') used instead of the models from the data directory.")
+  parser.add_argument('--registry-dir', default = None, help = "Directory of the model registry (default: the subdirectory 'registry' of the data directory).")
+  parser.add_argument('--aggregates', default = None, help = "Excel file (.xlsx) for the energy and cost totals: summary, daily, weekly and monthly sheets.")
+  parser.add_argument('--tariff', default = None, help = "JSON file with the time-of-use tariff used for --aggregates (default: the example tariff aggregation.DEFAULT_TARIFF).")
+  parser.add_argument('--skip-results', action = 'store_true', help = "Do not keep nor save the simulated rows, only the --aggregates totals (streaming mode, constant memory).")
+  parser.add_argument('--full-precision', action = 'store_true', help = "Keep the physical quantities as float64 (default: float32).")
+  parser.add_argument('--verbose', action = 'store_true', help = "Show the messages from the idsw functions.")
+
+  return parser
+
+
+def throughput_summary(summary, output_path, aggregates_path = None):
+  """Format the summary returned by run_batch_simulation."""
+
+  saved_files = f"RESULTS SAVED AS '{output_path}'" if (output_path is not None) else "RESULTS NOT SAVED (--skip-results)"
+  if aggregates_path is not None:
+    saved_files = saved_files + f"\n    ENERGY AND COST TOTALS SAVED AS '{aggregates_path}'"
+
+  return f"""
+    -------------------------------------------------------------------------------
+                      STEEL INDUSTRY DIGITAL TWIN - BATCH SIMULATION
+
+    ENGINE = {summary['engine']}
+    SCENARIOS = {summary['scenarios']} ({summary['batches']} BATCHES)
+    SIMULATED ROWS = {summary['rows']}
+    ELAPSED TIME = {summary['elapsed_time_s']:.3f} s
+    THROUGHPUT = {summary['scenarios_per_s']:.3f} scenarios/s; {summary['rows_per_s']:.1f} rows/s
+    MODEL VERSION = {summary['model_version'] if (summary['model_version'] is not None) else 'unregistered'}
+    {saved_files}
+    -------------------------------------------------------------------------------
+    """
+
+
+def main(argv = None):
+  """Entry point of the command line interface. Returns the exit code."""
+
+  args = get_parser().parse_args(argv)
+
+  ControlVars.show_results = args.verbose
+  ControlVars.show_plots = False
+
+  if args.seed is not None:
+    # random_noise uses the global NumPy generator:
+    np.random.seed(args.seed)
+
+  try:
+    if ((args.skip_results) & (args.aggregates is None)):
+      raise InvalidInputsError("--skip-results requires --aggregates.")
+
+    scenarios = load_scenarios(args.scenarios)
+
+    aggregator = None
+    if args.aggregates is not None:
+      tariff = load_tariff(args.tariff) if (args.tariff is not None) else None
+      # Scenarios with their own 'time_step' have it obtained from their timestamps:
+      scenario_time_steps = ('time_step' in scenarios.columns) and (scenarios['time_step'].notna().any())
+      aggregator = EnergyAggregator(tariff = tariff, time_step = (None if scenario_time_steps else args.time_step))
+    df, possible_ranges = load_df_and_ranges(args.data_dir, use_cache = (not args.no_cache), cache_directory = args.cache_dir)
+
+    model_version = args.model_version
+    registry_path = args.registry_dir
+    if ((model_version is not None) & (registry_path is None)):
+      registry_path = get_registry_directory(directory_path = args.data_dir)
+
+    if ((args.engine == 'batched') & (model_version is not None)):
+      model_version = resolve_version_name(model_version, registry_path)
+      kmeans_model, encoder_decoder_tf_model, metadata = load_model_version(model_version, registry_path = registry_path)
+    elif (args.engine == 'batched'):
+      kmeans_model, encoder_decoder_tf_model = load_models(args.data_dir)
+    else:
+      # Each worker process loads its own models
+      kmeans_model, encoder_decoder_tf_model = None, None
+
+    results, summary = run_batch_simulation(scenarios, possible_ranges, kmeans_model = kmeans_model, encoder_decoder_tf_model = encoder_decoder_tf_model, engine = args.engine, rows_per_batch = args.rows_per_batch, workers = args.workers, directory_path = args.data_dir, add_variation = (not args.no_variation), full_precision = args.full_precision, model_version = model_version, registry_path = registry_path, time_step = args.time_step, aggregator = aggregator, keep_results = (not args.skip_results))
+
+    output_path = None
+    if results is not None:
+      output_path = export_batch_results(results, args.output, output_format = args.output_format)
+    if aggregator is not None:
+      export_aggregates(aggregator, args.aggregates)
+
+  except (InvalidInputsError, FileNotFoundError) as error:
+    print(f"Error: {error}", file = sys.stderr)
+    return 1
+
+  print(throughput_summary(summary, output_path, aggregates_path = args.aggregates))
+
+  return 0
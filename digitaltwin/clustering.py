@@ -0,0 +1,173 @@
+from collections import deque
+import numpy as np
+import pandas as pd
+
+from .idsw import (InvalidInputsError, ControlVars)
+
+from .utils import RAW_COLUMNS_MAP
+
+
+# Features used for assigning the electric clusters, in the order of models.create_clusters:
+CLUSTERING_FEATURES_COLUMNS = ['lagging_current_reactive_power_kvarh',
+                              'leading_current_reactive_power_kvarh',
+                              'lagging_current_power_factor',
+                              'leading_current_power_factor']
+
+
+class OnlineElectricClusterer:
+  """Electric state clustering updated incrementally with new readings.
+
+  It starts from the centroids of the frozen K-Means model (kmeans_model.pkl). Each centroid has a
+  weight, initially the number of training readings of its cluster (or prior_weight), and each
+  update moves it to the weighted running mean of the readings already counted and the new readings
+  assigned to it. So a few new readings only slightly move a centroid trained with hundreds of them,
+  and any number of readings (even a single one) can be processed at a time. Only the centroids, the
+  weights and the last {max_history} drift records are kept, so the memory does not depend on the
+  number of readings already processed.
+
+  The encoder-decoder model was trained with the labels of the original clusters. After each update,
+  the new centroids are matched to the previous ones (minimum total distance, Hungarian algorithm),
+  so each label keeps identifying the same electric state even if two centroids cross each other.
+
+  The predict method and the cluster_centers_ attribute have the same format as the K-Means model,
+  so this object can replace kmeans_model in the simulation pipeline, in the batch engine and in
+  snapshot.save_snapshot.
+  """
+
+  def __init__(self, kmeans_model, batch_size = 1024, prior_weight = None, max_history = 1000):
+    """
+    : param: kmeans_model: fitted K-Means model (or any object with cluster_centers_) from load_models.
+    : param: batch_size (int): rows of each partial fit in update.
+    : param: prior_weight (int, float or array): number of readings that each original centroid is
+      worth. If None, the training readings of each cluster (labels_ of the K-Means model) are used.
+      Clusters with weight 0 jump to the mean of the first readings assigned to them.
+    : param: max_history (int): maximum number of drift records kept.
+    """
+
+    self.reference_centers_ = np.array(kmeans_model.cluster_centers_, dtype = np.float64)
+    self.cluster_centers_ = self.reference_centers_.copy()
+    self.n_clusters = len(self.reference_centers_)
+    self.batch_size = batch_size
+
+    if prior_weight is None:
+      if not hasattr(kmeans_model, 'labels_'):
+        raise InvalidInputsError("The K-Means model does not have labels_: set prior_weight.")
+      prior_weight = np.bincount(np.array(kmeans_model.labels_), minlength = self.n_clusters)
+
+    # Weight of each centroid in the running mean (readings already counted):
+    self.weights_ = np.broadcast_to(np.array(prior_weight, dtype = np.float64), (self.n_clusters,)).copy()
+    if (self.weights_ < 0).any():
+      raise InvalidInputsError("prior_weight must not be negative.")
+
+    self.counts_ = np.zeros(self.n_clusters, dtype = np.int64)
+    self.samples_seen_ = 0
+    self.total_updates = 0
+    self.drift_history = deque(maxlen = max_history)
+
+
+  def predict(self, X):
+    """Stable label of the nearest centroid for each row of X (rows, 4)."""
+
+    X = np.array(X, dtype = np.float64).reshape(-1, self.cluster_centers_.shape[1])
+    # Squared distances between each row and each centroid, with shape (rows, clusters):
+    distances = ((X[:, np.newaxis, :] - self.cluster_centers_[np.newaxis, :, :])**2).sum(axis = 2)
+
+    return np.argmin(distances, axis = 1).astype(np.int32)
+
+
+  def match_centers(self, new_centers):
+    """Return, for each stable label, the index of the new center closest to its previous centroid,
+    with a one-to-one assignment of minimum total distance."""
+
+    from scipy.optimize import linear_sum_assignment
+
+    costs = np.sqrt(((self.cluster_centers_[:, np.newaxis, :] - new_centers[np.newaxis, :, :])**2).sum(axis = 2))
+    labels, center_indices = linear_sum_assignment(costs)
+
+    return center_indices[np.argsort(labels)]
+
+
+  def partial_fit(self, X):
+    """Update the centroids with one batch of readings X (rows, 4) and record the drift."""
+
+    X = np.array(X, dtype = np.float64).reshape(-1, self.cluster_centers_.shape[1])
+    if (len(X) == 0):
+      return self
+
+    previous_centers = self.cluster_centers_
+    labels = self.predict(X)
+    batch_counts = np.bincount(labels, minlength = self.n_clusters)
+    batch_sums = np.zeros_like(self.cluster_centers_)
+    np.add.at(batch_sums, labels, X)
+
+    # Weighted running mean of each centroid (the clusters without new readings are not moved):
+    new_weights = self.weights_ + batch_counts
+    updated = (batch_counts > 0)
+    new_centers = previous_centers.copy()
+    new_centers[updated] = (self.weights_[updated, np.newaxis]*previous_centers[updated] + batch_sums[updated])/new_weights[updated, np.newaxis]
+
+    center_index_of_label = self.match_centers(new_centers)
+    relabeled = int((center_index_of_label != np.arange(self.n_clusters)).sum())
+    self.cluster_centers_ = new_centers[center_index_of_label]
+    self.weights_ = new_weights[center_index_of_label]
+
+    self.counts_ = self.counts_ + batch_counts[center_index_of_label]
+    self.samples_seen_ = self.samples_seen_ + len(X)
+    self.total_updates = self.total_updates + 1
+
+    labels = self.predict(X)
+    shifts = np.sqrt(((self.cluster_centers_ - previous_centers)**2).sum(axis = 1))
+    drifts = np.sqrt(((self.cluster_centers_ - self.reference_centers_)**2).sum(axis = 1))
+    inertia = ((X - self.cluster_centers_[labels])**2).sum(axis = 1).mean()
+
+    self.drift_history.append({'update': self.total_updates,
+                              'samples_seen': self.samples_seen_,
+                              'rows': len(X),
+                              'mean_squared_distance': float(inertia),
+                              'max_centroid_shift': float(shifts.max()),
+                              'mean_centroid_shift': float(shifts.mean()),
+                              'max_drift_from_reference': float(drifts.max()),
+                              'relabeled_centers': relabeled})
+
+    return self
+
+
+  def update(self, readings):
+    """Update the centroids with new readings, in batches of {batch_size} rows.
+    : param: readings: pd.DataFrame with the columns from CLUSTERING_FEATURES_COLUMNS (or the
+      columns of raw_data_by_hour.csv), or array with shape (rows, 4) in that order.
+    """
+
+    if isinstance(readings, pd.DataFrame):
+      readings = readings.rename(columns = RAW_COLUMNS_MAP)
+      missing_columns = [column for column in CLUSTERING_FEATURES_COLUMNS if column not in readings.columns]
+      if (len(missing_columns) > 0):
+        raise InvalidInputsError(f"The readings do not have the columns {missing_columns}.")
+      readings = readings[CLUSTERING_FEATURES_COLUMNS].dropna()
+
+    X = np.array(readings, dtype = np.float64)
+    for start in range(0, len(X), self.batch_size):
+      self.partial_fit(X[start:(start + self.batch_size)])
+
+    if ControlVars.show_results:
+      print(f"Electric clusters updated with {len(X)} readings ({self.samples_seen_} since the start). Maximum drift from the original centroids = {self.drift_report()['drift_from_reference'].max():.4f}.")
+
+    return self
+
+
+  def drift_report(self):
+    """Dataframe with one row per cluster: readings assigned since the start, current centroid and
+    distance from the centroid of the original K-Means model."""
+
+    report_df = pd.DataFrame(self.cluster_centers_, columns = CLUSTERING_FEATURES_COLUMNS)
+    report_df.insert(0, 'electric_cluster', np.arange(self.n_clusters))
+    report_df.insert(1, 'readings', self.counts_)
+    report_df['drift_from_reference'] = np.sqrt(((self.cluster_centers_ - self.reference_centers_)**2).sum(axis = 1))
+
+    return report_df
+
+
+  def drift_history_df(self):
+    """Dataframe with the drift records of the last partial fits."""
+
+    return pd.DataFrame(list(self.drift_history))
@@ -0,0 +1,281 @@
+import numpy as np
+import pandas as pd
+
+from .idsw import (InvalidInputsError, ControlVars)
+
+from .core import GlobalVars
+
+
+# Keys derived from the timestamps. Any other key must be a column of the results (e.g., load_type):
+TIME_KEYS = {'hour': lambda timestamps: timestamps.dt.hour,
+            'day': lambda timestamps: timestamps.dt.floor('D'),
+            'day_of_week': lambda timestamps: timestamps.dt.day_name()}
+CORRECTION_METHODS = ['holm', 'bonferroni', 'fdr_bh', None]
+
+
+def stack_simulations(simulations = None, scenario_column = 'scenario'):
+  """Concatenate simulations in a single dataframe, with their names in column {scenario_column}.
+  : param: simulations: dictionary {name: dataframe}, list of (name, dataframe) tuples, or list of
+    table dictionaries from GlobalVars.exported_tables. If None, the simulations stored in
+    GlobalVars.exported_tables are used (report tables are ignored).
+  """
+
+  if simulations is None:
+    simulations = GlobalVars.exported_tables
+
+  if isinstance(simulations, dict):
+    simulations = list(simulations.items())
+
+  names, dfs = [], []
+  for simulation in simulations:
+    if isinstance(simulation, dict):
+      if (simulation['excel_sheet_name'][:4] == "REP_"):
+        continue
+      name, df = simulation['excel_sheet_name'], simulation['dataframe_obj_to_be_exported']
+    else:
+      name, df = simulation
+    names.append(str(name))
+    dfs.append(df)
+
+  if (len(dfs) == 0):
+    raise InvalidInputsError("There are no simulations to compare.")
+
+  if (len(set(names)) != len(names)):
+    raise InvalidInputsError("The simulations to compare must have unique names.")
+
+  stacked_df = pd.concat(dfs, ignore_index = True)
+  stacked_df[scenario_column] = pd.Categorical(np.repeat(names, [len(df) for df in dfs]), categories = names)
+
+  return stacked_df
+
+
+def adjust_p_values(p_values, correction = 'holm'):
+  """Correct p-values for multiple comparisons, in a vectorized way.
+  : param: correction (str): 'holm' (Holm-Bonferroni, controls the family-wise error rate),
+    'bonferroni', 'fdr_bh' (Benjamini-Hochberg, controls the false discovery rate) or None.
+  """
+
+  if correction not in CORRECTION_METHODS:
+    raise InvalidInputsError(f"Correction must be one of {CORRECTION_METHODS}.")
+
+  p_values = np.asarray(p_values, dtype = np.float64)
+  total_tests = len(p_values)
+  if ((correction is None) or (total_tests == 0)):
+    return p_values.copy()
+
+  if (correction == 'bonferroni'):
+    return np.minimum(p_values*total_tests, 1.0)
+
+  order = np.argsort(p_values, kind = 'stable')
+  sorted_p = p_values[order]
+  ranks = np.arange(1, total_tests + 1)
+
+  if (correction == 'holm'):
+    # The i-th smallest p-value is multiplied by (m - i + 1), keeping the sequence non-decreasing:
+    sorted_adjusted = np.maximum.accumulate(sorted_p*(total_tests - ranks + 1))
+  else:
+    # The i-th smallest p-value is multiplied by m/i, keeping the sequence non-decreasing from the end:
+    sorted_adjusted = np.minimum.accumulate((sorted_p*total_tests/ranks)[::-1])[::-1]
+
+  adjusted = np.empty(total_tests, dtype = np.float64)
+  adjusted[order] = np.minimum(sorted_adjusted, 1.0)
+
+  return adjusted
+
+
+def get_group_statistics(results, value_column = 'usage_kwh', scenario_column = 'scenario', by = None, replicate_column = None, timestamp_column = 'timestamp'):
+  """Number of observations, mean and variance (ddof = 1) of {value_column} for each scenario, and
+  for each value of the comparison key {by}, in a single groupby.
+
+  If replicate_column is given (Monte Carlo ensembles), each replicate is reduced to its mean, so
+  the observations are the replicates instead of the simulated rows.
+  """
+
+  for column in [value_column, scenario_column] + ([replicate_column] if replicate_column is not None else []):
+    if column not in results.columns:
+      raise InvalidInputsError(f"The results do not have the column '{column}'.")
+
+  data = pd.DataFrame({scenario_column: results[scenario_column], value_column: results[value_column].astype(np.float64)})
+  keys = [scenario_column]
+
+  if by is not None:
+    if by in results.columns:
+      data[by] = results[by]
+    elif by in TIME_KEYS:
+      data[by] = TIME_KEYS[by](pd.to_datetime(results[timestamp_column]))
+    else:
+      raise InvalidInputsError(f"'{by}' is not a column of the results, nor one of {list(TIME_KEYS)}.")
+    keys = [by, scenario_column]
+
+  if replicate_column is not None:
+    data[replicate_column] = results[replicate_column]
+    data = data.groupby(keys + [replicate_column], observed = True, sort = False)[value_column].mean().reset_index()
+
+  statistics_df = data.groupby(keys, observed = True)[value_column].agg(['count', 'mean', 'var']).reset_index()
+  statistics_df = statistics_df.rename(columns = {'count': 'n', 'mean': 'mean_kwh', 'var': 'var_kwh'})
+
+  return statistics_df
+
+
+def welch_tests(statistics_df, scenario_column = 'scenario', by = None, baseline = None, confidence_level_pct = 95, correction = 'holm'):
+  """Welch t-tests between the scenarios of statistics_df (from get_group_statistics), for all
+  the pairs at once, with the same statistics of idsw AB_testing.
+
+  The scenarios are arranged in arrays with shape (comparison keys, scenarios), and the pairs are
+  taken by index, so all the tests are evaluated with array operations. Pairs with less than 2
+  observations in one of the scenarios are skipped. The p-values are corrected over all the tests
+  (pairs and comparison keys) with adjust_p_values.
+  """
+
+  from scipy import stats
+
+  if ((confidence_level_pct <= 0) or (confidence_level_pct >= 100)):
+    raise InvalidInputsError("confidence_level_pct must be between 0 and 100.")
+
+  alpha = 1 - confidence_level_pct/100
+
+  scenario_codes, scenarios = pd.factorize(statistics_df[scenario_column], sort = False)
+  if by is not None:
+    key_codes, keys = pd.factorize(statistics_df[by], sort = True)
+  else:
+    key_codes, keys = np.zeros(len(statistics_df), dtype = np.int64), pd.Index([None])
+
+  shape = (len(keys), len(scenarios))
+  n = np.zeros(shape)
+  mean = np.full(shape, np.nan)
+  var = np.full(shape, np.nan)
+  n[key_codes, scenario_codes] = statistics_df['n']
+  mean[key_codes, scenario_codes] = statistics_df['mean_kwh']
+  var[key_codes, scenario_codes] = statistics_df['var_kwh']
+
+  if baseline is not None:
+    if baseline not in scenarios:
+      raise InvalidInputsError(f"Baseline scenario '{baseline}' is not in the results.")
+    index_b = np.flatnonzero(scenarios == baseline)
+    index_a = np.setdiff1d(np.arange(len(scenarios)), index_b)
+    index_b = np.full(len(index_a), index_b[0])
+  else:
+    index_a, index_b = np.triu_indices(len(scenarios), k = 1)
+
+  # Arrays with shape (comparison keys, pairs):
+  n_a, n_b = n[:, index_a], n[:, index_b]
+  mean_a, mean_b = mean[:, index_a], mean[:, index_b]
+  var_a, var_b = var[:, index_a], var[:, index_b]
+
+  valid = (n_a >= 2) & (n_b >= 2)
+  key_index, pair_index = np.nonzero(valid)
+  n_a, n_b = n_a[valid], n_b[valid]
+  mean_a, mean_b = mean_a[valid], mean_b[valid]
+  var_a, var_b = var_a[valid], var_b[valid]
+
+  with np.errstate(divide = 'ignore', invalid = 'ignore'):
+    se_a, se_b = var_a/n_a, var_b/n_b
+    standard_error = np.sqrt(se_a + se_b)
+    delta = mean_a - mean_b
+    # Welch-Satterthwaite degrees of freedom:
+    dof = (se_a + se_b)**2/((se_a**2)/(n_a - 1) + (se_b**2)/(n_b - 1))
+    t_statistic = delta/standard_error
+    p_value = 2*stats.t.sf(np.abs(t_statistic), dof)
+    t_critical = stats.t.ppf(1 - alpha/2, dof)
+    delta_pct = np.where(mean_b != 0, 100*delta/np.abs(mean_b), np.nan)
+
+  # Constant series with the same mean are not different. With different means, the difference is exact:
+  constant = (standard_error == 0)
+  p_value = np.where(constant, np.where(delta == 0, 1.0, 0.0), p_value)
+  t_critical = np.where(constant, 0.0, t_critical)
+
+  adjusted_p_value = adjust_p_values(p_value, correction)
+
+  comparison_df = pd.DataFrame({
+    'scenario_a': scenarios[index_a[pair_index]],
+    'scenario_b': scenarios[index_b[pair_index]],
+    'n_a': n_a.astype(np.int64),
+    'n_b': n_b.astype(np.int64),
+    'mean_kwh_a': mean_a,
+    'mean_kwh_b': mean_b,
+    'delta_kwh': delta,
+    'delta_pct': delta_pct,
+    'delta_kwh_lower_ci': delta - t_critical*standard_error,
+    'delta_kwh_upper_ci': delta + t_critical*standard_error,
+    't_statistic': t_statistic,
+    'degrees_of_freedom': dof,
+    'p_value': p_value,
+    'adjusted_p_value': adjusted_p_value,
+    'reject_H0': (adjusted_p_value < alpha)
+  })
+
+  if by is not None:
+    comparison_df.insert(0, by, np.asarray(keys)[key_index])
+
+  return comparison_df
+
+
+def compare_scenarios(results = None, value_column = 'usage_kwh', scenario_column = 'scenario', by = None, baseline = None, replicate_column = None, confidence_level_pct = 95, correction = 'holm', timestamp_column = 'timestamp'):
+  """Compare the energy consume of simulated scenarios, testing the differences of means for all the
+  pairs of scenarios in a single vectorized pass.
+
+  The test is the Welch t-test from idsw AB_testing (H0: the mean kWh of both scenarios is the same),
+  and the p-values are corrected for multiple comparisons.
+
+  : param: results: dataframe with a column {scenario_column}, like the results of
+    batch.run_batch_simulation; or simulations accepted by stack_simulations (dictionary, list of
+    tuples, or GlobalVars.exported_tables). If None, the simulations of GlobalVars.exported_tables
+    are compared.
+  : param: value_column (str): compared variable.
+  : param: by (str): comparison key. The scenarios are compared separately for each value of the key.
+    'hour' (hour of the day), 'day' (date), 'day_of_week', or a column of the results, like
+    'load_type'. If None, all the rows of each scenario are compared.
+  : param: baseline (str): if not None, each scenario is compared only with the baseline scenario,
+    instead of all the pairs.
+  : param: replicate_column (str): column identifying the Monte Carlo replicates of each scenario.
+    If not None, the mean of each replicate is one observation of the test.
+  : param: confidence_level_pct (float): confidence level of the tests and of the intervals of the
+    deltas, as in AB_testing. H0 is rejected when the adjusted p-value is lower than
+    1 - confidence_level_pct/100.
+  : param: correction (str): 'holm' (default), 'bonferroni', 'fdr_bh' or None (see adjust_p_values).
+
+  Returns:
+    comparison_df: one row per pair of scenarios (and value of the key), with the mean kWh of the
+      scenarios, delta_kwh = mean_kwh_a - mean_kwh_b with its confidence interval, the test statistics,
+      and the raw and adjusted p-values. Sorted from the most to the least significant difference.
+    ranking_df: one row per scenario, sorted from the lowest to the highest mean kWh (all the rows,
+      regardless of {by}), with the number of scenarios it consumes significantly less and more than.
+  """
+
+  if ((results is None) or (not isinstance(results, pd.DataFrame))):
+    results = stack_simulations(results, scenario_column = scenario_column)
+
+  statistics_df = get_group_statistics(results, value_column = value_column, scenario_column = scenario_column, by = by, replicate_column = replicate_column, timestamp_column = timestamp_column)
+  comparison_df = welch_tests(statistics_df, scenario_column = scenario_column, by = by, baseline = baseline, confidence_level_pct = confidence_level_pct, correction = correction)
+
+  comparison_df['abs_delta_kwh'] = comparison_df['delta_kwh'].abs()
+  comparison_df = comparison_df.sort_values(by = ['adjusted_p_value', 'abs_delta_kwh'], ascending = [True, False], kind = 'stable')
+  comparison_df = comparison_df.drop(columns = ['abs_delta_kwh']).reset_index(drop = True)
+
+  # The ranking uses all the rows of each scenario:
+  if by is not None:
+    overall_statistics_df = get_group_statistics(results, value_column = value_column, scenario_column = scenario_column, replicate_column = replicate_column, timestamp_column = timestamp_column)
+    overall_df = welch_tests(overall_statistics_df, scenario_column = scenario_column, baseline = baseline, confidence_level_pct = confidence_level_pct, correction = correction)
+  else:
+    overall_statistics_df, overall_df = statistics_df, comparison_df
+
+  significant_df = overall_df[overall_df['reject_H0']]
+  lower_a = significant_df['scenario_a'][significant_df['delta_kwh'] < 0]
+  lower_b = significant_df['scenario_b'][significant_df['delta_kwh'] > 0]
+  higher_a = significant_df['scenario_a'][significant_df['delta_kwh'] > 0]
+  higher_b = significant_df['scenario_b'][significant_df['delta_kwh'] < 0]
+
+  ranking_df = overall_statistics_df.rename(columns = {'var_kwh': 'std_kwh'})
+  ranking_df[scenario_column] = ranking_df[scenario_column].astype(str)
+  ranking_df['std_kwh'] = np.sqrt(ranking_df['std_kwh'])
+  lower_counts = pd.concat([lower_a, lower_b]).astype(str).value_counts()
+  higher_counts = pd.concat([higher_a, higher_b]).astype(str).value_counts()
+  ranking_df['significantly_lower_than'] = ranking_df[scenario_column].map(lower_counts).fillna(0).astype(np.int64)
+  ranking_df['significantly_higher_than'] = ranking_df[scenario_column].map(higher_counts).fillna(0).astype(np.int64)
+  ranking_df = ranking_df.sort_values(by = ['mean_kwh', 'significantly_lower_than'], ascending = [True, False], kind = 'stable').reset_index(drop = True)
+  ranking_df.insert(0, 'rank', np.arange(1, len(ranking_df) + 1))
+
+  if ControlVars.show_results:
+    print(f"{len(comparison_df)} comparisons between {len(ranking_df)} scenarios. H0 rejected in {int(comparison_df['reject_H0'].sum())} of them ({correction} correction, {confidence_level_pct}% confidence).")
+
+  return comparison_df, ranking_df
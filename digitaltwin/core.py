@@ -1,3 +1,4 @@
+import threading
 from dataclasses import dataclass
 from datetime import datetime
 import numpy as np
@@ -10,6 +11,9 @@ from .idsw.etl.characterize import time_series_vis
 from .models import load_models
 
 from .transformvariables import simulation_pipeline
+from .aggregation import EnergyAggregator
+from .profiling import (profile_simulation, profile_stage)
+from .progress import report_progress
 from .utils import (load_df_and_ranges,
                     random_start,
                     create_timestamp_array,
@@ -17,7 +21,9 @@ from .utils import (load_df_and_ranges,
                     calculate_nsm,
                     convert_input_vars_to_arrays,
                     obtain_simulation_df,
-                    add_variation_to_features
+                    add_variation_to_features,
+                    get_time_step,
+                    DEFAULT_TIME_STEP
                     )
 
 
@@ -26,6 +32,10 @@ class GlobalVars:
   """
     Store Global variables to use on simulation for the model.
     The variables are stored on a higher context so that they are not lost
+
+    Models, reference dataset and default simulation are only loaded when the simulator
+    is started by function start_global_vars, so the package can be imported without
+    the data directory (e.g., by the command line interface).
   """
   
   # Counter of simulations:
@@ -33,34 +43,111 @@ class GlobalVars:
   # Start a list of exported tables:
   exported_tables = []
 
+  # Directory from which models and original dataframe are loaded. If None, it is obtained
+  # from utils.get_data_directory (environment variable DIGITALTWIN_DATA_DIR or package 'data'):
+  directory_path = None
+
+  # Models, original dataframe and allowed ranges. None while simulator is not started:
+  kmeans_model = None
+  encoder_decoder_tf_model = None
+  df = None
+  possible_ranges = None
+
+  # If False (default), the results stored for each simulation use categorical columns and float32
+  # physical quantities (see utils.compact_simulation_df). Set True for keeping float64 values:
+  full_precision = False
+
+  # Interval between the simulated timestamps (see utils.get_time_step), e.g. '1h' or '15min'.
+  # Changing it takes effect in the next simulation:
+  time_step = DEFAULT_TIME_STEP
+  # Time step (pd.Timedelta) of the timestamps in GlobalVars.sim_df:
+  sim_time_step = None
+
+  # Time-of-use tariff used for the energy cost of each simulation (see aggregation.DEFAULT_TARIFF).
+  # If None, aggregation.DEFAULT_TARIFF is used:
+  tariff = None
+
+  # Name of the registered version of the models in use (see registry.activate_model_version).
+  # 'unregistered' for the models loaded directly from the data directory:
+  model_version = None
+  # Lock for reading or replacing the models and their version at once:
+  models_lock = threading.Lock()
+
+
+def get_active_models():
+  """Return a tuple (model_version, kmeans_model, encoder_decoder_tf_model) with the models in use.
+  The three values are read at once, so a hot swap (set_active_models) running in another thread
+  never mixes two versions.
+  """
+
+  with GlobalVars.models_lock:
+    return GlobalVars.model_version, GlobalVars.kmeans_model, GlobalVars.encoder_decoder_tf_model
+
+
+def set_active_models(kmeans_model, encoder_decoder_tf_model, model_version = 'unregistered'):
+  """Replace the models in use and their version at once. The simulations that already read the
+  models with get_active_models keep using the previous ones until they finish.
+  Returns the name of the previous version.
+  """
+
+  with GlobalVars.models_lock:
+    previous_version = GlobalVars.model_version
+    GlobalVars.kmeans_model = kmeans_model
+    GlobalVars.encoder_decoder_tf_model = encoder_decoder_tf_model
+    GlobalVars.model_version = model_version
+
+  return previous_version
+
+
+def start_global_vars(directory_path = None, model_version = None, registry_path = None):
+  """Load the models and the original dataframe, and create the default simulation,
+  storing everything in GlobalVars.
+  : param: directory_path (str): directory containing the models and raw_data_by_hour.csv.
+    If None, GlobalVars.directory_path is used (see utils.get_data_directory).
+  : param: model_version (str): name of a version from the model registry (or 'latest'). If None,
+    the models are loaded from directory_path.
+  : param: registry_path (str): directory of the model registry (see registry.get_registry_directory).
+  """
+
+  if directory_path is not None:
+    GlobalVars.directory_path = directory_path
+
   # load models and store them
-  kmeans_model, encoder_decoder_tf_model = load_models()
+  if model_version is None:
+    kmeans_model, encoder_decoder_tf_model = load_models(GlobalVars.directory_path)
+    set_active_models(kmeans_model, encoder_decoder_tf_model, model_version = 'unregistered')
+  else:
+    from .registry import (load_model_version, resolve_version_name)
+    model_version = resolve_version_name(model_version, registry_path)
+    kmeans_model, encoder_decoder_tf_model, metadata = load_model_version(model_version, registry_path = registry_path)
+    set_active_models(kmeans_model, encoder_decoder_tf_model, model_version = model_version)
 
   # Load original dataframe and allowed ranges for the variables:
-  df, possible_ranges = load_df_and_ranges()
+  GlobalVars.df, GlobalVars.possible_ranges = load_df_and_ranges(GlobalVars.directory_path)
 
   # Start variables with random values:
-  lagging_current_reactive_power, leading_current_reactive_power, co2_tco2, lagging_current_power_factor, load_type = random_start(df)
+  lagging_current_reactive_power, leading_current_reactive_power, co2_tco2, lagging_current_power_factor, load_type = random_start(GlobalVars.df)
   
   """DEFAULT PARAMETERS - USER MAY RUN SIMULATION WITHOUT UPDATING DATA"""
   # default value of start date will be the instant:
-  server_start_time = pd.Timestamp(datetime.now())
-  start_date = server_start_time
-  total_days = 1
-  total_hours = 0
+  GlobalVars.server_start_time = pd.Timestamp(datetime.now())
+  GlobalVars.start_date = GlobalVars.server_start_time
+  GlobalVars.total_days = 1
+  GlobalVars.total_hours = 0
 
   # Obtain arrays related to the timestamps:
-  timestamps, total_entries = create_timestamp_array(start_date, total_days, total_hours)
-  day_of_week, weekstatus = create_dayofweek_weekstatus(timestamps)
-  nsm = calculate_nsm(start_date, timestamps)
+  GlobalVars.sim_time_step = get_time_step(GlobalVars.time_step)
+  GlobalVars.timestamps, GlobalVars.total_entries = create_timestamp_array(GlobalVars.start_date, GlobalVars.total_days, GlobalVars.total_hours, time_step = GlobalVars.time_step)
+  GlobalVars.day_of_week, GlobalVars.weekstatus = create_dayofweek_weekstatus(GlobalVars.timestamps)
+  GlobalVars.nsm = calculate_nsm(GlobalVars.start_date, GlobalVars.timestamps)
 
   # Convert the input variables to arrays (one value for each timestamp)
-  lagging_current_reactive_power, leading_current_reactive_power, co2_tco2, lagging_current_power_factor, load_type = convert_input_vars_to_arrays(total_entries, lagging_current_reactive_power, leading_current_reactive_power, co2_tco2, lagging_current_power_factor, load_type)
+  GlobalVars.lagging_current_reactive_power, GlobalVars.leading_current_reactive_power, GlobalVars.co2_tco2, GlobalVars.lagging_current_power_factor, GlobalVars.load_type = convert_input_vars_to_arrays(GlobalVars.total_entries, lagging_current_reactive_power, leading_current_reactive_power, co2_tco2, lagging_current_power_factor, load_type)
   
   # Now, create a dataframe for the simulations:
-  sim_df = obtain_simulation_df(timestamps, lagging_current_reactive_power, leading_current_reactive_power, co2_tco2, lagging_current_power_factor, nsm, weekstatus, day_of_week, load_type)
+  sim_df = obtain_simulation_df(GlobalVars.timestamps, GlobalVars.lagging_current_reactive_power, GlobalVars.leading_current_reactive_power, GlobalVars.co2_tco2, GlobalVars.lagging_current_power_factor, GlobalVars.nsm, GlobalVars.weekstatus, GlobalVars.day_of_week, GlobalVars.load_type)
   # Finally, add variation to this dataframe:
-  sim_df = add_variation_to_features(sim_df, possible_ranges)
+  GlobalVars.sim_df = add_variation_to_features(sim_df, GlobalVars.possible_ranges)
 
 
 def update_with_inputs(var1, var2, var3, var4, var5, var6, var7, var8):
@@ -79,29 +166,36 @@ def update_with_inputs(var1, var2, var3, var4, var5, var6, var7, var8):
   var8: load_type (str): selected on the dropdown.
   """
 
+  # Start the simulator on the first call:
+  if GlobalVars.encoder_decoder_tf_model is None:
+    start_global_vars()
+
   # Run only if one of the inputs is different from the stored in memory.
   start_date = pd.Timestamp(var1)
   total_days = int(var2)
   total_hours = int(var3)
+  time_step = get_time_step(GlobalVars.time_step)
 
   # Several global variables are arrays with constant values. Since we cannot compare the full
   # array with a value, due to ambiguity, let's compare only its 1st value.
   boolean_check = ((GlobalVars.start_date != start_date) | (GlobalVars.total_days != total_days) | 
       (GlobalVars.total_hours != total_hours) | (GlobalVars.lagging_current_reactive_power[0] != var4) | 
       (GlobalVars.leading_current_reactive_power[0] != var5) | (GlobalVars.co2_tco2[0] != var6) | 
-      (GlobalVars.lagging_current_power_factor[0] != var7) | (GlobalVars.load_type[0] != var8))
+      (GlobalVars.lagging_current_power_factor[0] != var7) | (GlobalVars.load_type[0] != var8) |
+      (GlobalVars.sim_time_step != time_step))
 
   if (boolean_check):
     # Update values on GlobalVars:
     GlobalVars.start_date = start_date
     GlobalVars.total_days = total_days
     GlobalVars.total_hours = total_hours
+    GlobalVars.sim_time_step = time_step
 
     # Store user inputs for the final report, before transforming them:
     GlobalVars.user_inputs = [var4, var5, var6, var7, var8]
 
     # Obtain arrays related to the timestamps:
-    timestamps, total_entries = create_timestamp_array(start_date, total_days, total_hours)
+    timestamps, total_entries = create_timestamp_array(start_date, total_days, total_hours, time_step = time_step)
     day_of_week, weekstatus = create_dayofweek_weekstatus(timestamps)
     nsm = calculate_nsm(start_date, timestamps)
     # Update values on GlobalVars:
@@ -147,40 +241,68 @@ def run_simulation(var1, var2, var3, var4, var5, var6, var7, var8):
   """
 
   
+  # When profiling is enabled (profiling.enable_profiling), each stage is recorded:
+  with profile_simulation(name = f"simulation_{GlobalVars.simulation_counter + 1}"):
+    run_simulation_stages(var1, var2, var3, var4, var5, var6, var7, var8)
+
+
+def run_simulation_stages(var1, var2, var3, var4, var5, var6, var7, var8):
+  """Stages of run_simulation: update inputs, run the pipeline, create the report and display it."""
+
   ControlVars.show_results = False
   ControlVars.show_plots = False
   
-  # Get initial dataframe with user defined inputs:
-  sim_df = update_with_inputs(var1, var2, var3, var4, var5, var6, var7, var8)
+  # Get initial dataframe with user defined inputs.
+  # report_progress only acts in background tasks (see background.run_simulation_async):
+  report_progress('update_with_inputs')
+  with profile_stage('update_with_inputs') as stage:
+    sim_df = update_with_inputs(var1, var2, var3, var4, var5, var6, var7, var8)
+    if stage is not None:
+      stage.rows = len(sim_df)
+  # Read the models once, so the whole simulation uses the same version even if they are swapped:
+  model_version, kmeans_model, encoder_decoder_tf_model = get_active_models()
   # Run simulation pipeline:
-  sim_df = simulation_pipeline(sim_df, GlobalVars.possible_ranges, GlobalVars.kmeans_model, GlobalVars.encoder_decoder_tf_model)
+  report_progress('simulation_pipeline', rows_done = 0, rows_total = len(sim_df))
+  with profile_stage('simulation_pipeline', rows = len(sim_df)):
+    sim_df = simulation_pipeline(sim_df, GlobalVars.possible_ranges, kmeans_model, encoder_decoder_tf_model, full_precision = GlobalVars.full_precision)
   # Update on GlobalVars:
   GlobalVars.sim_df = sim_df
 
-  # Get the simulation counting:
-  simulation_counter = GlobalVars.simulation_counter
-  # Get list exported_tables:
-  exported_tables = GlobalVars.exported_tables
-  # Get a date now to differentiate from others
-  conclusion_time = pd.Timestamp(datetime.now())
-
-  # Obtain sheet name:
-  # Apply timestamp() method to convert the timestamp to POSIX timestamp as float
-  # https://pandas.pydata.org/docs/reference/api/pandas.Timestamp.timestamp.html#pandas.Timestamp.timestamp
-  # It will guarantee that each sheet is unique. Also, hours in 00:00:00 format cannot
-  # be used as sheet names, due to the ":" non-allowed character.
-  sheet_name = "sim" + str(simulation_counter) + "_" + str(conclusion_time.timestamp())
-  
-  # Get a dictionary for exporting the table:
-  table_dict = {'dataframe_obj_to_be_exported': sim_df, 
-                    'excel_sheet_name': sheet_name,
-                    'conclusion_time': conclusion_time}
+  # Energy and cost totals (daily, weekly and monthly totals are available from the aggregator):
+  report_progress('aggregation', rows_done = len(sim_df))
+  with profile_stage('aggregation', rows = len(sim_df)):
+    energy_aggregator = EnergyAggregator(tariff = GlobalVars.tariff, time_step = GlobalVars.sim_time_step).update(sim_df)
+    energy_summary = energy_aggregator.summary().iloc[0]
+
+  report_progress('report')
+  with profile_stage('report', rows = len(sim_df)):
+
+    # Get the simulation counting:
+    simulation_counter = GlobalVars.simulation_counter
+    # Get list exported_tables:
+    exported_tables = GlobalVars.exported_tables
+    # Get a date now to differentiate from others
+    conclusion_time = pd.Timestamp(datetime.now())
+
+    # Obtain sheet name:
+    # Apply timestamp() method to convert the timestamp to POSIX timestamp as float
+    # https://pandas.pydata.org/docs/reference/api/pandas.Timestamp.timestamp.html#pandas.Timestamp.timestamp
+    # It will guarantee that each sheet is unique. Also, hours in 00:00:00 format cannot
+    # be used as sheet names, due to the ":" non-allowed character.
+    sheet_name = "sim" + str(simulation_counter) + "_" + str(conclusion_time.timestamp())
 
-  # Append the dictionary on the list of exported tables:
-  exported_tables.append(table_dict)
+    # Get a dictionary for exporting the table:
+    table_dict = {'dataframe_obj_to_be_exported': sim_df, 
+                      'excel_sheet_name': sheet_name,
+                      'conclusion_time': conclusion_time,
+                      'model_version': model_version,
+                      'energy_aggregator': energy_aggregator}
 
+    # Append the dictionary on the list of exported tables:
+    exported_tables.append(table_dict)
 
-  completion_msg = f"""
+
+    completion_msg = f"""
 
 
 
@@ -202,6 +324,7 @@ def run_simulation(var1, var2, var3, var4, var5, var6, var7, var8):
     SIMULATION #{simulation_counter}: IDENTIFIER {conclusion_time.timestamp()} 
     - STARTED SIMULATION AT (SERVER TIME) = {GlobalVars.server_start_time}
     - FINISHED SIMULATION AT (SERVER TIME) = {conclusion_time}
+    - MODEL VERSION = {model_version}
 
 
     ## USER INPUT PARAMETERS
@@ -209,6 +332,7 @@ def run_simulation(var1, var2, var3, var4, var5, var6, var7, var8):
     START DATE = {GlobalVars.start_date}
     TOTAL DAYS SIMULATED = {GlobalVars.total_days} DAYS
       + TOTAL HOURS SIMULATED = {GlobalVars.total_hours} HOURS
+    TIME STEP = {GlobalVars.sim_time_step}
     
     LAGGING CURRENT REACTIVE POWER = {(GlobalVars.user_inputs)[0]} kVArh
     LEADING CURRENT REACTIVE POWER = {(GlobalVars.user_inputs)[1]} kVArh
@@ -216,49 +340,101 @@ def run_simulation(var1, var2, var3, var4, var5, var6, var7, var8):
     LAGGING CURRENT POWER FACTOR = {(GlobalVars.user_inputs)[3]} %
     LOAD TYPE = '{(GlobalVars.user_inputs)[4]}'
 
+
+    ## ENERGY AND COST
+
+    TOTAL ENERGY = {energy_summary['energy_kwh']:.2f} kWh
+    PEAK-PERIOD ENERGY = {energy_summary['peak_period_kwh']:.2f} kWh
+    HIGHEST HOURLY ENERGY = {energy_summary['max_hourly_kwh']:.2f} kWh (AT {energy_summary['max_hourly_at']})
+    ENERGY COST = {energy_summary['cost']:.2f} {energy_summary['currency']}
+
     -------------------------------------------------------------------------------
 
     """
 
-  # CREATE A DATAFRAME WITH THE SIMULATION REPORT:
+    # CREATE A DATAFRAME WITH THE SIMULATION REPORT:
 
-  parameters = ['IDENTIFIER', 'STARTED SIMULATION AT (SERVER TIME)',
-                'FINISHED SIMULATION AT (SERVER TIME)', 'START DATE',
-                'TOTAL DAYS SIMULATED', '  + TOTAL HOURS SIMULATED',
-                'LAGGING CURRENT REACTIVE POWER', 'LEADING CURRENT REACTIVE POWER',
-                'tCO2(CO2)', 'LAGGING CURRENT POWER FACTOR', 'LOAD TYPE']
-  
-  user_input_params = [f"SIMULATION #{simulation_counter}: IDENTIFIER {conclusion_time.timestamp()}", 
-            f"{GlobalVars.server_start_time}", f"{conclusion_time}", f"{GlobalVars.start_date}",
-            f"{GlobalVars.total_days} DAYS", f"{GlobalVars.total_hours} HOURS",
-            f"{(GlobalVars.user_inputs)[0]} kVArh", f"{(GlobalVars.user_inputs)[1]} kVArh",
-            f"{(GlobalVars.user_inputs)[2]} ppm", f"{(GlobalVars.user_inputs)[3]} %",
-            f"'{(GlobalVars.user_inputs)[4]}'"]
-  
-  sim_rep = pd.DataFrame(data = {'SIMULATION_REPORT': parameters, 'USER_INPUT': user_input_params})
+    parameters = ['IDENTIFIER', 'STARTED SIMULATION AT (SERVER TIME)',
+                  'FINISHED SIMULATION AT (SERVER TIME)', 'MODEL VERSION', 'START DATE',
+                  'TOTAL DAYS SIMULATED', '  + TOTAL HOURS SIMULATED', 'TIME STEP',
+                  'LAGGING CURRENT REACTIVE POWER', 'LEADING CURRENT REACTIVE POWER',
+                  'tCO2(CO2)', 'LAGGING CURRENT POWER FACTOR', 'LOAD TYPE',
+                  'TOTAL ENERGY', 'PEAK-PERIOD ENERGY', 'HIGHEST HOURLY ENERGY', 'ENERGY COST']
 
-  # Get a dictionary for exporting the table:
-  table_dict = {'dataframe_obj_to_be_exported': sim_rep, 
-                    'excel_sheet_name': ("REP_" + sheet_name)}
+    user_input_params = [f"SIMULATION #{simulation_counter}: IDENTIFIER {conclusion_time.timestamp()}", 
+              f"{GlobalVars.server_start_time}", f"{conclusion_time}", f"{model_version}", f"{GlobalVars.start_date}",
+              f"{GlobalVars.total_days} DAYS", f"{GlobalVars.total_hours} HOURS", f"{GlobalVars.sim_time_step}",
+              f"{(GlobalVars.user_inputs)[0]} kVArh", f"{(GlobalVars.user_inputs)[1]} kVArh",
+              f"{(GlobalVars.user_inputs)[2]} ppm", f"{(GlobalVars.user_inputs)[3]} %",
+              f"'{(GlobalVars.user_inputs)[4]}'",
+              f"{energy_summary['energy_kwh']:.2f} kWh", f"{energy_summary['peak_period_kwh']:.2f} kWh",
+              f"{energy_summary['max_hourly_kwh']:.2f} kWh AT {energy_summary['max_hourly_at']}",
+              f"{energy_summary['cost']:.2f} {energy_summary['currency']}"]
 
-  # Append the dictionary on the list of exported tables:
-  exported_tables.append(table_dict)
+    sim_rep = pd.DataFrame(data = {'SIMULATION_REPORT': parameters, 'USER_INPUT': user_input_params})
 
-  # Finally, update the list:
-  GlobalVars.exported_tables = exported_tables
-  
-  ControlVars.show_results = True
-  ControlVars.show_plots = True
+    # Get a dictionary for exporting the table:
+    table_dict = {'dataframe_obj_to_be_exported': sim_rep, 
+                      'excel_sheet_name': ("REP_" + sheet_name)}
+
+    # Append the dictionary on the list of exported tables:
+    exported_tables.append(table_dict)
+
+    # Finally, update the list:
+    GlobalVars.exported_tables = exported_tables
+
+    ControlVars.show_results = True
+    ControlVars.show_plots = True
   
 
-  print(completion_msg)
-  try:
-        # only works in Jupyter Notebook:
-        from IPython.display import display
-        display(sim_df)
-            
-  except: # regular mode
-        print(sim_df)
+  report_progress('display')
+  with profile_stage('display', rows = len(sim_df)):
+    print(completion_msg)
+    try:
+          # only works in Jupyter Notebook:
+          from IPython.display import display
+          display(sim_df)
+
+    except: # regular mode
+          print(sim_df)
+
+
+def memory_report():
+  """Return a dataframe with the memory used by each simulation stored in GlobalVars.exported_tables.
+  Each row is one simulation: the bytes of its results dataframe, of its report table and the total,
+  measured by pd.DataFrame.memory_usage(deep = True). The last row ('TOTAL') sums all simulations.
+  """
+
+  report_prefix = "REP_"
+  simulations = {}
+
+  for table_dict in GlobalVars.exported_tables:
+    sheet_name = table_dict['excel_sheet_name']
+    df = table_dict['dataframe_obj_to_be_exported']
+    nbytes = int(df.memory_usage(index = True, deep = True).sum())
+
+    if sheet_name.startswith(report_prefix):
+      # Report table from the simulation {sheet_name without the prefix}:
+      simulation = simulations.setdefault(sheet_name[len(report_prefix):], {'rows': 0, 'simulation_bytes': 0, 'report_bytes': 0})
+      simulation['report_bytes'] = simulation['report_bytes'] + nbytes
+
+    else:
+      simulation = simulations.setdefault(sheet_name, {'rows': 0, 'simulation_bytes': 0, 'report_bytes': 0})
+      simulation['rows'] = simulation['rows'] + len(df)
+      simulation['simulation_bytes'] = simulation['simulation_bytes'] + nbytes
+
+  report_df = pd.DataFrame([dict({'simulation': sheet_name}, **simulation) for sheet_name, simulation in simulations.items()],
+                          columns = ['simulation', 'rows', 'simulation_bytes', 'report_bytes'])
+
+  total = {'simulation': 'TOTAL', 'rows': report_df['rows'].sum(),
+          'simulation_bytes': report_df['simulation_bytes'].sum(), 'report_bytes': report_df['report_bytes'].sum()}
+  report_df = pd.concat([report_df, pd.DataFrame([total])], ignore_index = True)
+
+  report_df['total_bytes'] = report_df['simulation_bytes'] + report_df['report_bytes']
+  # Bytes per simulated timestamp:
+  report_df['bytes_per_row'] = report_df['total_bytes']/report_df['rows'].where(report_df['rows'] > 0)
+
+  return report_df
 
 
 def visualize_usage_kwh(export_images = True):
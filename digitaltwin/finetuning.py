@@ -0,0 +1,263 @@
+import os
+import json
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+
+from .idsw import (InvalidInputsError, ControlVars)
+
+from .models import RESPONSE_SCALING_PARAMS
+from .transformvariables import get_model_tensor
+from .surrogate import (error_metrics, predict_scaled_response, scaled_response_to_kwh)
+from .utils import (get_data_directory, RAW_COLUMNS_MAP, PLANT_DATA_COLUMNS)
+
+
+def prepare_plant_data(df):
+  """Select and rename the columns of newly collected plant data.
+  : param: df (pd.DataFrame): data in the format of raw_data_by_hour.csv, or with the columns of
+    the simulation results (PLANT_DATA_COLUMNS). Rows with missing values are removed.
+  """
+
+  df = df.rename(columns = RAW_COLUMNS_MAP)
+  missing_columns = [column for column in PLANT_DATA_COLUMNS if column not in df.columns]
+
+  if (len(missing_columns) > 0):
+    raise InvalidInputsError(f"The plant data does not have the columns {missing_columns}.")
+
+  df = df[PLANT_DATA_COLUMNS].dropna()
+  df['timestamp'] = pd.to_datetime(df['timestamp'])
+
+  return df.reset_index(drop = True)
+
+
+def iter_plant_data(new_data, chunksize = 50000):
+  """Yield the plant data in chunks of {chunksize} rows, prepared by prepare_plant_data.
+  : param: new_data: pd.DataFrame or path of a CSV file, which is read in chunks.
+  """
+
+  if isinstance(new_data, pd.DataFrame):
+    for start in range(0, len(new_data), chunksize):
+      yield prepare_plant_data(new_data.iloc[start:(start + chunksize)])
+
+  else:
+    for chunk in pd.read_csv(new_data, chunksize = chunksize):
+      yield prepare_plant_data(chunk)
+
+
+def get_split_boundaries(new_data, validation_fraction = 0.1, holdout_fraction = 0.2):
+  """Chronological split of the plant data: the last {holdout_fraction} of the period is the
+  held-out window, used for comparing the models; the {validation_fraction} before it is used
+  for early stopping; the rest is used for training.
+  Only the timestamps are read. Returns the tuple (validation_start, holdout_start).
+  """
+
+  if isinstance(new_data, pd.DataFrame):
+    timestamps = prepare_plant_data(new_data)['timestamp']
+  else:
+    timestamps = pd.concat([chunk['timestamp'] for chunk in iter_plant_data(new_data)])
+
+  timestamps = np.sort(np.array(timestamps, dtype = 'datetime64[ns]'))
+
+  if (len(timestamps) < 3):
+    raise InvalidInputsError("The plant data must have at least 3 valid rows.")
+
+  validation_start = timestamps[int(len(timestamps)*(1 - holdout_fraction - validation_fraction))]
+  holdout_start = timestamps[int(len(timestamps)*(1 - holdout_fraction))]
+
+  return validation_start, holdout_start
+
+
+def get_plant_dataset(new_data, kmeans_model, start = None, end = None, chunksize = 50000):
+  """tf.data.Dataset with the tensors (X, y) of the rows with start <= timestamp < end.
+  The chunks are read and passed through the feature transforms of the simulation pipeline
+  (transformvariables.get_model_tensor) only when the dataset is iterated. X has shape (21, 1)
+  and y is the standard scaled usage_kwh, with shape (1,).
+  """
+
+  mu = RESPONSE_SCALING_PARAMS['usage_kwh']['mu']
+  sigma = RESPONSE_SCALING_PARAMS['usage_kwh']['sigma']
+
+  def generator():
+    for chunk in iter_plant_data(new_data, chunksize = chunksize):
+      if start is not None:
+        chunk = chunk[chunk['timestamp'] >= start]
+      if end is not None:
+        chunk = chunk[chunk['timestamp'] < end]
+      if (len(chunk) == 0):
+        continue
+      X = get_model_tensor(chunk, kmeans_model)
+      y = ((np.array(chunk['usage_kwh'], dtype = np.float32) - mu)/sigma).reshape(-1, 1)
+      yield X, y
+
+  dataset = tf.data.Dataset.from_generator(generator, output_signature = (tf.TensorSpec(shape = (None, 21, 1), dtype = tf.float32), tf.TensorSpec(shape = (None, 1), dtype = tf.float32)))
+
+  return dataset.unbatch()
+
+
+def first_step_mean_squared_error(y_true, y_pred):
+  """Mean squared error of the first output of the decoder, the one used by the simulations
+  (see make_model_predictions). The other outputs are not constrained by the new data."""
+
+  y_true = tf.reshape(tf.cast(y_true, y_pred.dtype), [-1])
+
+  return tf.reduce_mean(tf.square(y_true - tf.reshape(y_pred[:, 0], [-1])))
+
+
+def evaluate_on_dataset(model, dataset):
+  """Error metrics (kWh) of the model on a dataset from get_plant_dataset."""
+
+  X, y = [], []
+  for X_batch, y_batch in dataset.batch(50000):
+    X.append(X_batch.numpy())
+    y.append(y_batch.numpy())
+
+  X, y = np.concatenate(X), np.concatenate(y).reshape(-1)
+
+  metrics = error_metrics(scaled_response_to_kwh(y), scaled_response_to_kwh(predict_scaled_response(model, X)))
+  metrics['rows'] = len(y)
+
+  return metrics
+
+
+def fit_model(model, train_dataset, validation_dataset, epochs, batch_size, learning_rate, patience):
+  """Compile and fit the model with early stopping on the validation dataset. The weights of
+  the best epoch are restored. Returns the number of epochs run."""
+
+  model.compile(optimizer = tf.keras.optimizers.Adam(learning_rate = learning_rate), loss = first_step_mean_squared_error)
+  early_stopping = tf.keras.callbacks.EarlyStopping(monitor = 'val_loss', patience = patience, restore_best_weights = True)
+
+  history = model.fit(train_dataset.shuffle(10000).batch(batch_size).prefetch(tf.data.AUTOTUNE),
+                      validation_data = validation_dataset.batch(batch_size).prefetch(tf.data.AUTOTUNE),
+                      epochs = epochs, callbacks = [early_stopping], verbose = (1 if ControlVars.show_results else 0))
+
+  return len(history.history['loss'])
+
+
+def get_finetuned_models_directory(directory_path = None):
+  """Directory with the versioned fine-tuned models: 'encoder_decoder_tf_model/finetuned' in the
+  data directory (see utils.get_data_directory)."""
+
+  return os.path.join(get_data_directory(directory_path), "encoder_decoder_tf_model", "finetuned")
+
+
+def save_finetuned_model(model, report, directory_path = None):
+  """Save the model as a new version 'v<number>' in get_finetuned_models_directory, with its
+  SavedModel in the subdirectory 'saved_model' (the same format read by models.load_models) and
+  the report in 'metrics.json'. Returns the path of the version directory."""
+
+  models_directory = get_finetuned_models_directory(directory_path)
+  os.makedirs(models_directory, exist_ok = True)
+
+  versions = [int(name[1:]) for name in os.listdir(models_directory) if ((name.startswith('v')) and (name[1:].isdigit()))]
+  version_path = os.path.join(models_directory, f"v{(max(versions) + 1) if (len(versions) > 0) else 1:04d}")
+  # Save to a temporary directory first, so an interrupted process does not leave an incomplete version:
+  temporary_path = version_path + f".tmp{os.getpid()}"
+
+  model.save(os.path.join(temporary_path, "saved_model"))
+  with open(os.path.join(temporary_path, "metrics.json"), 'w') as file:
+    json.dump(report, file, indent = 2, default = str)
+
+  os.rename(temporary_path, version_path)
+
+  return version_path
+
+
+def finetune_encoder_decoder(new_data, kmeans_model, encoder_decoder_tf_model, directory_path = None, validation_fraction = 0.1, holdout_fraction = 0.2, epochs = 50, batch_size = 256, learning_rate = 1e-4, patience = 5, min_improvement = 0.0, chunksize = 50000, compare_with_full_retraining = False, full_retraining_epochs = None, save = True):
+  """Recalibrate the encoder-decoder model with newly collected plant data, starting from its current weights.
+
+  The data is split chronologically (see get_split_boundaries) and streamed through the feature
+  transforms of the simulation pipeline into tf.data pipelines, which are cached after the first
+  epoch. A copy of the model is fine-tuned with early stopping on the validation window, and both
+  models are compared on the held-out window. The fine-tuned model is saved as a new version
+  (see save_finetuned_model) only if its RMSE on the held-out window is lower than the RMSE of the
+  current model by more than {min_improvement} (fraction).
+
+  : param: new_data: pd.DataFrame or path of a CSV file, in the format of raw_data_by_hour.csv
+    or with the columns of the simulation results.
+  : param: kmeans_model, encoder_decoder_tf_model: models from load_models. The Keras model is
+    not modified.
+  : param: directory_path (str): data directory where the versions are saved.
+  : param: epochs (int): maximum number of epochs.
+  : param: learning_rate (float): learning rate of the Adam optimizer. Lower than the one used for
+    the full training, so the current weights are adjusted, not replaced.
+  : param: patience (int): epochs without improvement of the validation loss before stopping.
+  : param: compare_with_full_retraining (bool): if True, a model with the same architecture and
+    new random weights is also trained on the same data, for reporting the wall time and the
+    metrics of the full retraining.
+  : param: full_retraining_epochs (int): maximum number of epochs of the full retraining. If None,
+    {epochs} is used.
+  : param: save (bool): if False, no version is saved even if the metrics improve.
+
+  Returns a tuple (model, report): model is the fine-tuned Keras model; report is a dictionary with
+  the metrics of both models on the held-out window, the wall times and the saved version (None if
+  no version was saved).
+  """
+
+  if not isinstance(encoder_decoder_tf_model, tf.keras.Model):
+    raise InvalidInputsError("Fine-tuning requires the Keras model from load_models, not a snapshot or surrogate model.")
+
+  if not ((0 < validation_fraction < 1) and (0 < holdout_fraction < 1) and ((validation_fraction + holdout_fraction) < 1)):
+    raise InvalidInputsError("validation_fraction and holdout_fraction must be between 0 and 1, with a sum lower than 1.")
+
+  validation_start, holdout_start = get_split_boundaries(new_data, validation_fraction = validation_fraction, holdout_fraction = holdout_fraction)
+
+  # The transforms run only in the first epoch; the next ones read the cached tensors:
+  train_dataset = get_plant_dataset(new_data, kmeans_model, end = validation_start, chunksize = chunksize).cache()
+  validation_dataset = get_plant_dataset(new_data, kmeans_model, start = validation_start, end = holdout_start, chunksize = chunksize).cache()
+  holdout_dataset = get_plant_dataset(new_data, kmeans_model, start = holdout_start, chunksize = chunksize).cache()
+
+  current_metrics = evaluate_on_dataset(encoder_decoder_tf_model, holdout_dataset)
+
+  # Fine-tune a copy, so the model in use is not modified:
+  finetuned_model = tf.keras.models.clone_model(encoder_decoder_tf_model)
+  finetuned_model.set_weights(encoder_decoder_tf_model.get_weights())
+
+  start_time = time.perf_counter()
+  finetuning_epochs = fit_model(finetuned_model, train_dataset, validation_dataset, epochs, batch_size, learning_rate, patience)
+  finetuning_time = time.perf_counter() - start_time
+
+  finetuned_metrics = evaluate_on_dataset(finetuned_model, holdout_dataset)
+  improved = bool(finetuned_metrics['rmse_kwh'] < current_metrics['rmse_kwh']*(1 - min_improvement))
+
+  report = {'created_at': datetime.now().isoformat(),
+            'validation_start': str(pd.Timestamp(validation_start)),
+            'holdout_start': str(pd.Timestamp(holdout_start)),
+            'current_model': current_metrics,
+            'finetuned_model': finetuned_metrics,
+            'improved': improved,
+            'finetuning_epochs': finetuning_epochs,
+            'finetuning_time_s': finetuning_time,
+            'learning_rate': learning_rate}
+
+  if (compare_with_full_retraining):
+    # Same architecture, new random weights and the usual learning rate of Adam:
+    retrained_model = tf.keras.models.clone_model(encoder_decoder_tf_model)
+    start_time = time.perf_counter()
+    retraining_epochs = fit_model(retrained_model, train_dataset, validation_dataset, (full_retraining_epochs if full_retraining_epochs is not None else epochs), batch_size, 1e-3, patience)
+    retraining_time = time.perf_counter() - start_time
+
+    report['full_retraining'] = evaluate_on_dataset(retrained_model, holdout_dataset)
+    report['full_retraining_epochs'] = retraining_epochs
+    report['full_retraining_time_s'] = retraining_time
+    report['speedup'] = retraining_time/finetuning_time
+
+  # Compile with the loss of the current model, so models.load_models can load the saved version
+  # without the custom loss function:
+  finetuned_model.compile(optimizer = finetuned_model.optimizer, loss = (encoder_decoder_tf_model.loss if (encoder_decoder_tf_model.loss is not None) else 'mean_squared_error'))
+
+  report['version_path'] = None
+  if ((improved) and (save)):
+    report['version_path'] = save_finetuned_model(finetuned_model, report, directory_path = directory_path)
+
+  if ControlVars.show_results:
+    print(f"Held-out RMSE: current model = {current_metrics['rmse_kwh']:.4f} kWh; fine-tuned model = {finetuned_metrics['rmse_kwh']:.4f} kWh ({finetuning_epochs} epochs, {finetuning_time:.1f} s).")
+    if (compare_with_full_retraining):
+      print(f"Full retraining: RMSE = {report['full_retraining']['rmse_kwh']:.4f} kWh ({retraining_epochs} epochs, {retraining_time:.1f} s).")
+    if report['version_path'] is not None:
+      print(f"Fine-tuned model saved in {report['version_path']}.")
+    else:
+      print("The fine-tuned model was not saved.")
+
+  return finetuned_model, report
@@ -18,7 +18,7 @@ import seaborn as sns
 import openpyxl
 
 from dataclasses import dataclass
-from steelindustrysimulator.digitaltwin.idsw import (InvalidInputsError, ControlVars)
+from .. import (InvalidInputsError, ControlVars)
 
 
 @dataclass
@@ -145,8 +145,6 @@ class AWSS3Connection:
     
     def __init__ (self, path_to_store_imported_s3_bucket = '', s3_bucket_name = None, s3_obj_prefix = None):
 
-        from getpass import getpass
-
         self.s3_bucket_name = s3_bucket_name
         self.s3_obj_prefix = s3_obj_prefix
 
@@ -168,6 +166,7 @@ class AWSS3Connection:
         else:
             # Use the str attribute to guarantee that the path was read as a string:
             path_to_store_imported_s3_bucket = str(path_to_store_imported_s3_bucket)
+            self.path_to_store_imported_s3_bucket = path_to_store_imported_s3_bucket
             
             if(path_to_store_imported_s3_bucket[0] == "/"):
                 # the first character is the slash. Let's remove it
@@ -191,6 +190,8 @@ class AWSS3Connection:
 
 
     def get_credentials(self):
+
+        from getpass import getpass
             
         # Ask the user to provide the credentials:
         ACCESS_KEY = input("Enter your AWS Access Key ID here (in the right). It is the value stored in the field \'Access key ID\' from your AWS user credentials CSV file.")
@@ -271,7 +272,7 @@ class AWSS3Connection:
             # s3_path: path that the file should have in S3:
             self.s3_path = "" # empty string for the root directory
         
-        elif ((s3_obj_prefix == "/") | (s3_obj_prefix == '')):
+        elif ((self.s3_obj_prefix == "/") | (self.s3_obj_prefix == '')):
             
             self.s3_obj_prefix = None
             # The root directory in the bucket must not be specified starting with the slash
@@ -313,13 +314,19 @@ class AWSS3Connection:
             
             print("AWS Access Credentials, and bucket\'s prefix, object or subdirectory provided.\n")
 
-            return self
+        return self
     
 
-    def connect_to_s3(self):
+    def connect_to_s3(self, max_pool_connections = 50, endpoint_url = None):
+        """
+        : param: max_pool_connections (int): maximum connections opened by the parallel transfers.
+        : param: endpoint_url (str): URL of an S3 compatible storage (e.g., a MinIO server, or a local
+          stand-in of S3 such as moto). If None, AWS S3 is used.
+        """
 
         import os
         import boto3
+        from botocore.config import Config
         # boto3 is AWS S3 Python SDK
         # sagemaker and boto3 libraries must be imported only in case 
         # they are going to be used, for avoiding 
@@ -329,7 +336,9 @@ class AWSS3Connection:
         
         try:
             # Start S3 client as the object 's3_client'
-            self.s3_client = boto3.resource('s3', aws_access_key_id = self.ACCESS_KEY, aws_secret_access_key = self.SECRET_KEY)
+            # The connection pool must hold the connections of all the threads of the parallel
+            # transfers (max_workers files, with max_concurrency parts each):
+            self.s3_client = boto3.resource('s3', aws_access_key_id = self.ACCESS_KEY, aws_secret_access_key = self.SECRET_KEY, endpoint_url = endpoint_url, config = Config(max_pool_connections = max_pool_connections))
         
             print(f"Credentials accepted by AWS. S3 client successfully started.\n")
             # An object 'data_table.xlsx' in the main (root) directory of the s3_bucket is stored in Python environment as:
@@ -351,7 +360,7 @@ class AWSS3Connection:
             # Connect to the bucket specified as 'bucket_name'.
             # The bucket is started as the object 's3_bucket':
             self.s3_bucket = self.s3_client.Bucket(self.s3_bucket_name)
-            print(f"Connection with bucket \'{s3_bucket_name}\' stablished.\n")
+            print(f"Connection with bucket \'{self.s3_bucket_name}\' stablished.\n")
             
         except:
             
@@ -367,7 +376,11 @@ class AWSS3Connection:
 
          # Then, let's obtain a list of all objects in the bucket (list bucket_objects):
         
-        bucket_objects_list = [str(stored_obj.key) for stored_obj in self.s3_bucket.objects.all()]
+        bucket_objects = list(self.s3_bucket.objects.all())
+        bucket_objects_list = [str(stored_obj.key) for stored_obj in bucket_objects]
+        # The listing also returns the size and the ETag of each object. They are used by copy_bucket_files
+        # for skipping the files that are already in the workspace, without any other request:
+        self.bucket_objects_metadata = {str(stored_obj.key): {'size': stored_obj.size, 'e_tag': stored_obj.e_tag} for stored_obj in bucket_objects}
 
         # Now get a list to store only the elements from bucket_objects_list that are not folders or directories
         # (objects with extensions).
@@ -399,7 +412,7 @@ class AWSS3Connection:
             # Slice the string stored_obj from position 0 (1st character) to position prefix_len - 1,
             # The position that the prefix should end: obj_name_first_part = (stored_obj)[0:(self.prefix_len)]
             # If this first part is the prefix, then append the object to list:
-            self.bucket_objects_list = [stored_obj for stored_obj in bucket_objects_list if ((stored_obj)[0:(self.prefix_len)] == (self.s3_obj_prefix))]
+            self.bucket_objects_list = [stored_obj for stored_obj in self.bucket_objects_list if ((stored_obj)[0:(self.prefix_len)] == (self.s3_obj_prefix))]
            
         # Now, bucket_objects_list contains the names of all objects from the bucket that must be copied.
 
@@ -410,41 +423,239 @@ class AWSS3Connection:
         return self
 
 
-    def copy_bucket_files(self):
+    def set_transfer_config(self, multipart_threshold_mb = 64, multipart_chunksize_mb = 16, max_concurrency = 4):
+        """
+        Set the boto3 TransferConfig of the transfers (attribute transfer_config).
+        : param: multipart_threshold_mb (float): objects with this size or larger are uploaded and
+          downloaded in parts, instead of a single stream.
+        : param: multipart_chunksize_mb (float): size of the parts. It also defines the ETags of the
+          multipart uploads, used for skipping the unchanged files.
+        : param: max_concurrency (int): threads transferring the parts of each object.
+        """
+
+        from boto3.s3.transfer import TransferConfig
+
+        self.multipart_threshold = int(multipart_threshold_mb*1024*1024)
+        self.multipart_chunksize = int(multipart_chunksize_mb*1024*1024)
+        self.transfer_config = TransferConfig(multipart_threshold = self.multipart_threshold, multipart_chunksize = self.multipart_chunksize, max_concurrency = max_concurrency, use_threads = (max_concurrency > 1))
+
+        return self
+
+
+    def get_file_etag(self, file_path, part_size = None):
+        """
+        Return the ETag that S3 gives to the file content (without quotes).
+        : param: part_size (int): if None, the ETag of a single part upload (MD5 of the content).
+          Otherwise, the ETag of a multipart upload with parts of part_size bytes: the MD5 of the
+          concatenated MD5s of the parts, followed by '-' and the number of parts.
+        """
+
+        import hashlib
+
+        # Files are read in blocks of 1 MB, so the memory does not depend on the file size:
+        block_size = 1024*1024
+        if (part_size is None):
+            file_md5 = hashlib.md5()
+            with open(file_path, 'rb') as file:
+                for block in iter(lambda: file.read(block_size), b''):
+                    file_md5.update(block)
+
+            return file_md5.hexdigest()
+
+        part_digests = []
+        with open(file_path, 'rb') as file:
+            while True:
+                part_md5 = hashlib.md5()
+                part_length = 0
+                while (part_length < part_size):
+                    block = file.read(min(block_size, part_size - part_length))
+                    if (len(block) == 0):
+                        break
+                    part_md5.update(block)
+                    part_length = part_length + len(block)
+
+                if (part_length == 0):
+                    break
+                part_digests.append(part_md5.digest())
+
+        return f"{hashlib.md5(b''.join(part_digests)).hexdigest()}-{len(part_digests)}"
+
+
+    def file_matches_etag(self, file_path, e_tag, size):
+        """
+        Check if the file in the workspace has the same content of an S3 object with ETag e_tag and
+        size (bytes), so it does not have to be transferred again.
+        The part size of a multipart upload is not stored in its ETag, so the chunk size of this
+        connection, the 8 MB default of boto3 and of the AWS CLI, and the smallest sizes in whole MB
+        that give the number of parts of the ETag are tried. ETags that are not MD5
+        (e.g., of objects encrypted with SSE-KMS) never match, so these objects are always transferred.
+        """
+
+        import os
+
+        if ((e_tag is None) or (size is None) or (not os.path.isfile(file_path)) or (os.path.getsize(file_path) != size)):
+            return False
+
+        e_tag = str(e_tag).strip('"')
+
+        if ('-' not in e_tag):
+            return (self.get_file_etag(file_path) == e_tag)
+
+        total_parts = int(e_tag.split('-')[1])
+        megabyte = 1024*1024
+        smallest_part_size_mb = -(-(-(-size//total_parts))//megabyte)
+        # Part sizes compatible with the number of parts of the ETag:
+        part_sizes = [self.multipart_chunksize, 8*megabyte] + [megabyte*part_size_mb for part_size_mb in range(smallest_part_size_mb, smallest_part_size_mb + 4)]
+        part_sizes = [part_size for part_size in dict.fromkeys(part_sizes) if (-(-size//part_size) == total_parts)]
+
+        return any((self.get_file_etag(file_path, part_size) == e_tag) for part_size in part_sizes)
+
+
+    def transfer_files(self, transfers, direction = 'download', max_workers = 8, skip_unchanged = True):
+        """
+        Transfer the files in a pool of max_workers threads, and store the summary in the attribute
+        transfer_summary (files transferred and skipped, bytes, and bytes/s).
+        : param: transfers: list of tuples (S3 key, file path in the workspace, name shown in the messages).
+        : param: direction: 'download' (from S3 to the workspace) or 'upload' (from the workspace to S3).
+        : param: skip_unchanged (bool): do not transfer the files whose content is the same in both
+          sides (same size and ETag).
+        """
+
+        import os
+        import time
+        from concurrent.futures import (ThreadPoolExecutor, as_completed)
+        from botocore.exceptions import ClientError
+
+        # boto3 clients are thread-safe (the resources, such as s3_bucket, are not). So, all the threads
+        # share the low-level client of the resource:
+        client = self.s3_client.meta.client
+
+        def transfer(s3_key, file_path):
+
+            if (direction == 'upload'):
+                size = os.path.getsize(file_path)
+                if (skip_unchanged):
+                    try:
+                        head = client.head_object(Bucket = self.s3_bucket_name, Key = s3_key)
+                        e_tag, s3_size = head['ETag'], head['ContentLength']
+                    except ClientError as error:
+                        # The object does not exist in the bucket yet:
+                        if (str(error.response.get('Error', {}).get('Code')) not in ('404', 'NoSuchKey', 'NotFound')):
+                            raise
+                        e_tag, s3_size = None, None
+
+                    if (self.file_matches_etag(file_path, e_tag, s3_size)):
+                        return 'skipped', size
+
+                client.upload_file(Filename = file_path, Bucket = self.s3_bucket_name, Key = s3_key, Config = self.transfer_config)
+
+            else:
+                metadata = self.bucket_objects_metadata.get(s3_key, {})
+                size = metadata.get('size')
+                if ((skip_unchanged) and (self.file_matches_etag(file_path, metadata.get('e_tag'), size))):
+                    return 'skipped', size
+
+                directory = os.path.dirname(file_path)
+                if (directory != ''):
+                    os.makedirs(directory, exist_ok = True)
+                client.download_file(Bucket = self.s3_bucket_name, Key = s3_key, Filename = file_path, Config = self.transfer_config)
+                if (size is None):
+                    size = os.path.getsize(file_path)
+
+            return 'transferred', size
+
+        summary = {'direction': direction, 'files': len(transfers), 'transferred_files': 0, 'skipped_files': 0,
+                   'failed_files': {}, 'bytes_transferred': 0, 'bytes_skipped': 0, 'max_workers': max_workers}
+        errors = []
+        start = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers = max(int(max_workers), 1), thread_name_prefix = 's3_transfer') as executor:
+            futures = {executor.submit(transfer, s3_key, file_path): name for s3_key, file_path, name in transfers}
+
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    status, size = future.result()
+                except Exception as error:
+                    summary['failed_files'][name] = repr(error)
+                    errors.append(error)
+                    print(f"The file \'{name}\' could not be transferred: {error}\n")
+                    continue
+
+                if (status == 'skipped'):
+                    summary['skipped_files'] = summary['skipped_files'] + 1
+                    summary['bytes_skipped'] = summary['bytes_skipped'] + size
+                    print(f"The file \'{name}\' was not modified, so it was not transferred again.\n")
+
+                else:
+                    summary['transferred_files'] = summary['transferred_files'] + 1
+                    summary['bytes_transferred'] = summary['bytes_transferred'] + size
+                    if (direction == 'upload'):
+                        print(f"The file \'{name}\' was successfully exported from notebook\'s workspace to AWS Simple Storage Service (S3).\n")
+                    else:
+                        print(f"The file \'{name}\' was successfully copied to notebook\'s workspace.\n")
+
+        summary['elapsed_time_s'] = time.perf_counter() - start
+        summary['bytes_per_s'] = summary['bytes_transferred']/summary['elapsed_time_s'] if (summary['elapsed_time_s'] > 0) else None
+        self.transfer_summary = summary
+
+        print(f"{summary['transferred_files']} files transferred ({summary['bytes_transferred']/2**20:.1f} MB in {summary['elapsed_time_s']:.2f} s, {(summary['bytes_per_s'] or 0)/2**20:.2f} MB/s); {summary['skipped_files']} unchanged files skipped; {len(summary['failed_files'])} files failed.\n")
+
+        if (len(errors) > 0):
+            # Raise the first error, so the caller shows how to fix the permissions:
+            raise errors[0]
+
+        return self
+
+
+    def get_relative_object_path(self, s3_key):
+        """
+        Return the path of the object s3_key relative to the prefix of the connection, e.g., 'dir1/file_name.ext'
+        for the key 'prefix/dir1/file_name.ext'. If the prefix ends in the middle of a name (e.g., prefix = 'dir1/table_'),
+        the path is relative to the last directory of the prefix ('table_1.csv').
+        """
+
+        prefix = self.s3_obj_prefix if (self.s3_obj_prefix is not None) else ''
+        
+        if not ((prefix.endswith('/')) or (s3_key[len(prefix):(len(prefix) + 1)] == '/')):
+            prefix = prefix[:(prefix.rfind('/') + 1)]
+        
+        return s3_key[len(prefix):].lstrip('/')
+
+
+    def copy_bucket_files(self, max_workers = 8, skip_unchanged = True, multipart_threshold_mb = 64, multipart_chunksize_mb = 16, max_concurrency = 4):
+        """
+        Copy the objects mapped by map_bucket_contents to the workspace, max_workers files at a time.
+        Each object keeps its path relative to the prefix (see get_relative_object_path), inside
+        path_to_store_imported_s3_bucket.
+        Objects of multipart_threshold_mb or more are downloaded in parts of multipart_chunksize_mb,
+        max_concurrency parts at a time. If skip_unchanged, the files already in the workspace with
+        the same size and ETag of the object are not downloaded again.
+        The summary of the transfers (including the bytes/s) is stored in the attribute transfer_summary.
+        """
 
         import os
         # Now, let's try copying the files:
             
         try:
             
-            self.objects_to_copy = [self.s3_bucket.Object(copied_object) for copied_object in self.bucket_objects_list]
+            self = self.set_transfer_config(multipart_threshold_mb, multipart_chunksize_mb, max_concurrency)
 
             # Now, copy objects to the workspace:
             # Set the new file_path. Notice that by now, copied_object may be a string like:
-            # 'dir1/.../dirN/file_name.ext', where dirN is the n-th directory and ext is the file extension.
-            # We want only the file_name to joing with the path to store the imported bucket. So, we can use the
-            # str.split method specifying the separator sep = '/' to break the string into a list of substrings.
-            # The last element from this list will be 'file_name.ext'
-            # https://www.w3schools.com/python/ref_string_split.asp?msclkid=135399b6c63111ecada75d7d91add056
-
-            # 1. Break the copied_object full path into the list object_path_list, using the .split method:
-            objects_paths_lists = [copied_object.split(sep = "/") for copied_object in self.bucket_objects_list]
-            # each element in objects_paths_lists is a list of splitted strings containing information on the paths.
-            # 2. Get the last element from this list. Since it has length len(object_path_list) and indexing starts from
-            # zero, the index of the last element is (len(object_path_list) - 1):
-            self.fetched_objects = [object_path_list[(len(object_path_list) - 1)] for object_path_list in objects_paths_lists]
-            # 3. Finally, join the string fetched_object with the new path (path on the notebook's workspace) to finish
+            # 'prefix/dir1/.../dirN/file_name.ext', where dirN is the n-th directory and ext is the file extension.
+            # The path relative to the prefix ('dir1/.../dirN/file_name.ext') is joined with the path to store the
+            # imported bucket. Keeping the directories avoids that objects with the same file name in different
+            # directories are copied to the same file (and overwrite each other, since they are copied in parallel):
+            self.fetched_objects = [self.get_relative_object_path(copied_object) for copied_object in self.bucket_objects_list]
+            # Finally, join the string fetched_object with the new path (path on the notebook's workspace) to finish
             # The new object's file_path:
-            self.file_paths = [os.path.join(self.path_to_store_imported_s3_bucket, fetched_object) for fetched_object in fetched_objects]
+            self.file_paths = [os.path.join(self.path_to_store_imported_s3_bucket, *fetched_object.split("/")) for fetched_object in self.fetched_objects]
 
-            # Now, loop through the correspondents objects and paths to download them:
-            for selected_object, fetched_object, file_path in zip(self.objects_to_copy, self.fetched_objects, self.file_paths):
-                # Download the selected object to the workspace in the specified file_path
-                # The parameter Filename must be input with the path of the copied file, including its name and
-                # extension. Example Filename = "/my_table.xlsx" copies a xlsx file named 'my_table' to the notebook's main (root)
-                # directory
-                selected_object.download_file(Filename = file_path)
-                print(f"The file \'{fetched_object}\' was successfully copied to notebook\'s workspace.\n")
+            # Now, download the objects in parallel. Each object is downloaded to the workspace in the
+            # specified file_path, which includes the file name and its extension. Example: file_path = "my_table.xlsx"
+            # copies a xlsx file named 'my_table' to the notebook's main (root) directory
+            self = self.transfer_files(list(zip(self.bucket_objects_list, self.file_paths, self.fetched_objects)), direction = 'download', max_workers = max_workers, skip_unchanged = skip_unchanged)
 
             print("Finished copying the files from the bucket to the notebook\'s workspace. It may take a couple of minutes untill they be shown in SageMaker environment.\n") 
             print("Do not forget to delete these copies after finishing the analysis. They will remain stored in the bucket.\n")
@@ -540,10 +751,10 @@ class AWSS3Connection:
         return self
     
 
-    def fetch_s3_files_pipeline (self):
+    def fetch_s3_files_pipeline (self, max_workers = 8, skip_unchanged = True, multipart_threshold_mb = 64, multipart_chunksize_mb = 16):
 
         self = self.map_bucket_contents()
-        self = self.copy_bucket_files()
+        self = self.copy_bucket_files(max_workers = max_workers, skip_unchanged = skip_unchanged, multipart_threshold_mb = multipart_threshold_mb, multipart_chunksize_mb = multipart_chunksize_mb)
 
         return self
     
@@ -617,27 +828,25 @@ class AWSS3Connection:
         return self
     
 
-    def export_files(self):
-        
-        # Now, loop through all elements i from the lists.
-        # The first elements of the lists have index 0; the last elements have index
-        # total_of_files - 1, since there are 'total_of_files' elements:
+    def export_files(self, max_workers = 8, skip_unchanged = True, multipart_threshold_mb = 64, multipart_chunksize_mb = 16, max_concurrency = 4):
+        """
+        Export the files set by set_files_to_export to S3, max_workers files at a time.
+        Files of multipart_threshold_mb or more are uploaded in parts of multipart_chunksize_mb,
+        max_concurrency parts at a time. If skip_unchanged, the files whose object in S3 has the same
+        size and ETag are not uploaded again.
+        The summary of the transfers (including the bytes/s) is stored in the attribute transfer_summary.
+        """
         
-        # Then, export the correspondent element to S3:
+        # Now, export each element i from the lists to the correspondent S3 path.
+        # Element i of workspace_full_paths has the path in the workspace, and element i of
+        # s3_full_paths has the path that the file should have in S3:
         
         try:
 
-            s3_objects = [self.s3_bucket.Object(S3_FILE_PATH) for S3_FILE_PATH in s3_full_paths]
+            self = self.set_transfer_config(multipart_threshold_mb, multipart_chunksize_mb, max_concurrency)
 
-            # Now, loop through the correspondents objects and paths to download them:
-            for new_s3_object, uploaded_object, PATH_IN_WORKSPACE in zip(self.s3_objects, self.list_of_file_names_with_extensions, self.workspace_full_paths):
-                # Upload the selected object from the workspace path PATH_IN_WORKSPACE
-                # to the S3 path specified as S3_FILE_PATH.
-                # The parameter Filename must be input with the path of the copied file, including its name and
-                # extension. Example Filename = "/my_table.xlsx" exports a xlsx file named 'my_table' to the notebook's main (root)
-                # directory
-                new_s3_object.upload_file(Filename = PATH_IN_WORKSPACE)
-                print(f"The file \'{uploaded_object}\' was successfully exported from notebook\'s workspace to AWS Simple Storage Service (S3).\n")
+            # Upload the files in parallel, from the workspace path to the S3 path:
+            self = self.transfer_files(list(zip(self.s3_full_paths, self.workspace_full_paths, self.list_of_file_names_with_extensions)), direction = 'upload', max_workers = max_workers, skip_unchanged = skip_unchanged)
                 
             print("Finished exporting the files from the the notebook\'s workspace to S3 bucket. It may take a couple of minutes untill they be shown in S3 environment.\n") 
             print("Do not forget to delete these copies after finishing the analysis. They will remain stored in the bucket.\n")
@@ -726,15 +935,26 @@ class AWSS3Connection:
         return self
 
 
-    def export_to_s3_pipeline(self, list_of_file_names_with_extensions, directory_of_notebook_workspace_storing_files_to_export = None):
+    def export_to_s3_pipeline(self, list_of_file_names_with_extensions, directory_of_notebook_workspace_storing_files_to_export = None, max_workers = 8, skip_unchanged = True, multipart_threshold_mb = 64, multipart_chunksize_mb = 16):
 
         self = self.set_directory_to_export(directory_of_notebook_workspace_storing_files_to_export)
         self = self.set_files_to_export(list_of_file_names_with_extensions)
-        self = self.export_files()
+        self = self.export_files(max_workers = max_workers, skip_unchanged = skip_unchanged, multipart_threshold_mb = multipart_threshold_mb, multipart_chunksize_mb = multipart_chunksize_mb)
 
         return self
 
 
+# Reference timestamps for converting the IP21 timescale (milliseconds) to timestamps, from the latest
+# to the earliest: tuples (reference timestamp in IP21 scale, reference timestamp).
+IP21_REFERENCE_TIMESTAMPS = [(1655780400001, '2022-06-21 00:00:00.001'),
+                            (1655780400000, '2022-06-21 00:00:00'),
+                            (1655694000000, '2022-06-20 00:00:00'),
+                            (1514772000000, '2018-01-01 00:00:00'),
+                            (946692000000, '2000-01-01 00:00:00'),
+                            (10800000, '1970-01-01 00:00:00'),
+                            (-315608400000, '1960-01-01 00:00:00')]
+
+
 class IP21Extractor:
     """
     Class for extracting information from Aspentech IP21 database.
@@ -756,11 +976,95 @@ class IP21Extractor:
         
         # Check if there is a previous dataset for concatenating with new data:
         self.dataset = previous_df_for_concatenation
+        # Parquet file receiving the pages, instead of the memory (see set_parquet_sink):
+        self.sink_path = None
+        self.sink_writer = None
+        self.rows_written = 0
                 
     # Define the class methods.
     # All methods must take an object from the class (self) as one of the parameters
 
 
+    @property
+    def dataset (self):
+        """Dataframe with all the pages retrieved so far. The pages are kept in a list by
+        retrieve_pd_dataframe, and concatenated only once, when the dataset is read."""
+        
+        if (len(self.pages) > 0):
+            dfs = self.pages if (self.previous_dataset is None) else ([self.previous_dataset] + self.pages)
+            self.previous_dataset = pd.concat(dfs, axis = 0, join = "inner").reset_index(drop = True)
+            self.pages = []
+        
+        return self.previous_dataset
+    
+    
+    @dataset.setter
+    def dataset (self, dataset):
+        
+        self.previous_dataset = dataset
+        self.pages = []
+        # Last timestamp retrieved, for detecting the end of the database:
+        self.last_timestamp = None
+        if ((dataset is not None) and ('timestamp' in dataset.columns) and (len(dataset) > 0)):
+            self.last_timestamp = dataset['timestamp'].iloc[-1]
+
+
+    def set_parquet_sink (self, file_path):
+        """
+        set_parquet_sink (file_path)
+        
+        Write the next pages retrieved by retrieve_pd_dataframe to the Parquet file file_path (one
+        row group per page), instead of keeping them in memory. So the memory used by long extractions
+        does not grow with the number of pages. Call close_parquet_sink after the last page, and read the
+        file with pd.read_parquet. Requires pyarrow.
+        """
+        
+        import os
+        
+        self.close_parquet_sink()
+        
+        directory = os.path.dirname(file_path)
+        if (directory != ''):
+            os.makedirs(directory, exist_ok = True)
+        
+        self.sink_path = file_path
+        self.rows_written = 0
+        
+        return self
+    
+    
+    def write_page_to_sink (self, dataset):
+        
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        
+        table = pa.Table.from_pandas(dataset, preserve_index = False)
+        
+        if (self.sink_writer is None):
+            # The schema is defined by the first page:
+            self.sink_writer = pq.ParquetWriter(self.sink_path, table.schema)
+        
+        self.sink_writer.write_table(table)
+        self.rows_written = self.rows_written + len(dataset)
+        
+        return self
+    
+    
+    def close_parquet_sink (self):
+        """Close the Parquet file opened by set_parquet_sink. Returns its path, or None if no page was written."""
+        
+        file_path = None
+        
+        if (self.sink_writer is not None):
+            self.sink_writer.close()
+            file_path = self.sink_path
+        
+        self.sink_writer = None
+        self.sink_path = None
+        
+        return file_path
+
+
     def get_credentials (self, server, data_source, username, password):
      
         from getpass import getpass
@@ -782,11 +1086,14 @@ class IP21Extractor:
         
         # Attention: do not include http:// in the server, only the server name
         # (what appears after http://)
-        self.server = ip21_server
+        self.server = server
         
         # If no specific data source is provided, use 'localhost'
         self.data_source = data_source
         
+        self.username = username
+        self.password = password
+        
         # Create an attribute that checks if another API call is needed:
         self.need_next_call = True
        
@@ -904,76 +1211,32 @@ class IP21Extractor:
         
         # Convert to Pandas series:
         ip21time_window = pd.Series(self.ip21time_array)
+        # Get the first ip21 time from the series:
+        start_ip21_scale = ip21time_window[0]
         # Guarantee that the series is sorted ascendingly:
         #https://pandas.pydata.org/pandas-docs/stable/reference/api/pandas.Series.sort_values.html
         ip21time_window = ip21time_window.sort_values(ascending = True)
-        # Get the first ip21 time from the series:
-        start_ip21_scale = ip21time_window[0]
         
-        # Pick the closest reference timestamp:
-        if (start_ip21_scale >= 1655780400001):
-            
-            reference = pd.Timestamp('06-21-2022 0:00:00.001', unit = 'ns')
-            # reference timestamp in IP21 scale:
-            reference_ip21 = 1655780400001
-        
-        elif (start_ip21_scale >= 1655780400000):
-            
-            reference = pd.Timestamp('06-21-2022', unit = 'd')
-            # reference timestamp in IP21 scale:
-            reference_ip21 = 1655780400000
-        
-        elif (start_ip21_scale >= 1655694000000):
-            
-            reference = pd.Timestamp('06-20-2022', unit = 'd')
-            # reference timestamp in IP21 scale:
-            reference_ip21 = 1655694000000
-        
-        elif (start_ip21_scale >= 1514772000000):
-            
-            reference = pd.Timestamp('01-01-2018', unit = 'd')
-            # reference timestamp in IP21 scale:
-            reference_ip21 = 1514772000000
+        # Pick the closest reference timestamp. IP21_REFERENCE_TIMESTAMPS has the tuples
+        # (reference timestamp in IP21 scale, reference timestamp), from the latest to the earliest:
+        for reference_ip21, reference in IP21_REFERENCE_TIMESTAMPS:
+            if (start_ip21_scale >= reference_ip21):
+                break
+        # If no reference was found, the loop finishes with the lowest timestamp.
         
-        elif (start_ip21_scale >= 946692000000):
-            
-            reference = pd.Timestamp('01-01-2000', unit = 'd')
-            # reference timestamp in IP21 scale:
-            reference_ip21 = 946692000000
+        # Get the IP21 timedeltas (in milliseconds) as an array:
+        ip21time_timedeltas = np.asarray(ip21time_window) - reference_ip21
         
-        elif (start_ip21_scale >= 10800000):
-            
-            reference = pd.Timestamp('01-01-1970', unit = 'd')
-            # reference timestamp in IP21 scale:
-            reference_ip21 = 10800000
+        if (np.issubdtype(ip21time_timedeltas.dtype, np.integer)):
+            # Integer arithmetic in nanoseconds (1 ms = 10^6 ns), converted at once to datetime64[ns]:
+            new_timestamps = (pd.Timestamp(reference).value + ip21time_timedeltas.astype(np.int64)*(10**6)).view('datetime64[ns]')
         
         else:
-            # Use the lowest timestamp:
-            reference = pd.Timestamp('01-01-1960', unit = 'd')
-            # reference timestamp in IP21 scale:
-            reference_ip21 = -315608400000
+            # Floats may have fractions of milliseconds or missing values (converted to NaT):
+            new_timestamps = pd.Timestamp(reference) + pd.to_timedelta(ip21time_timedeltas, unit = 'ms')
         
-        # Get the IP21 timedelta series:
-        ip21time_timedeltas = ip21time_window - reference_ip21
-        
-        # Start a list for the new timestamps:
-        new_timestamps = []
-        
-        # Now, loop through each element from the series ip21time_timedeltas:
-        for ip21time_timedelta in ip21time_timedeltas:
-            
-            # Create a pandas timedelta object, in ms:
-            timedelta_obj = pd.Timedelta(ip21time_timedelta, 'ms')
-            # Sum this timedelta to reference to obtain the new timestamp:
-            new_timestamp = reference + timedelta_obj
-            # Append to the list of new_timestamps:
-            new_timestamps.append(new_timestamp)
-        
-        # Now, convert the list to Pandas series:
-        timestamp_series = pd.Series(new_timestamps)
-        # Rename this series:
-        # https://pandas.pydata.org/pandas-docs/stable/reference/api/pandas.Series.rename.html
-        timestamp_series = timestamp_series.rename("timestamps")
+        # Now, convert the array to Pandas series, named "timestamps":
+        timestamp_series = pd.Series(new_timestamps, name = "timestamps")
         
         # Save it as an attribute and return the object:
         self.timestamp_series = timestamp_series
@@ -1064,6 +1327,10 @@ class IP21Extractor:
                 delta_t = pd.Timedelta(start_time, UNIT)
                 START_TIMESTAMP = today - delta_t
 
+        elif (isinstance(start_time, (datetime, np.datetime64))):
+            # Timestamp already defined (e.g., by IncrementalExtractionStore):
+            START_TIMESTAMP = pd.Timestamp(start_time)
+
         if (type (stop_time) == dict):
 
             # STOP timestamp information:
@@ -1117,6 +1384,9 @@ class IP21Extractor:
                 delta_t = pd.Timedelta(stop_time, UNIT)
                 STOP_TIMESTAMP = today - delta_t
 
+        elif (isinstance(stop_time, (datetime, np.datetime64))):
+            STOP_TIMESTAMP = pd.Timestamp(stop_time)
+
         self.start_timestamp = START_TIMESTAMP
         self.stop_timestamp = STOP_TIMESTAMP
         
@@ -1179,9 +1449,6 @@ class IP21Extractor:
         start_ip21_scale = self.start_ip21_scale
         stop_ip21_scale = self.stop_ip21_scale
         
-        # Retrieve previous dataset in memory:
-        previous_df = self.dataset
-        
         if (json_file_path is not None):
             try:
                 # Extract the file extension
@@ -1243,19 +1510,25 @@ class IP21Extractor:
         # json_metadata_prefix_list = ['name', 'last']
         json_record_path = ['data', 'samples']
         json_field_separator = "_"
-        dataset = json_normalize(json_file, record_path = json_record_path, sep = json_field_separator)
+        try:
+            # The samples are flat records, so they are directly converted to a dataframe
+            # (json_normalize deep-copies each record):
+            dataset = pd.DataFrame([sample for data in json_file['data'] for sample in data[json_record_path[1]]])
+        
+        except (KeyError, TypeError):
+            dataset = json_normalize(json_file, record_path = json_record_path, sep = json_field_separator)
         
         if ((dataset is None) | ("er" in dataset.columns) | ("ec" in dataset.columns) | ("es" in dataset.columns) | (len(dataset) == 0)):
             
             print("There is no data available for the defined time window.\n")
             
-            # If the attribute is not None, concatenate the dataframes:
-            if (previous_df is not None):
-                # Concatenate all dataframes (append rows):
-                dataset = previous_df
+            # If data was already retrieved, keep it:
+            if ((self.last_timestamp is not None) | (self.rows_written > 0)):
                 print("Returning the previous dataset itself.\n")
-        
-            self.dataset = dataset
+            
+            else:
+                self.dataset = dataset
+            
             self.need_next_call = False
             # Interrupt the algorithm:
             return self
@@ -1277,95 +1550,765 @@ class IP21Extractor:
             # Rename these columns:
             dataset.columns = ['timestamp_ip21_scale', tag_name]
         
-        else:
-            # Substitute only the 1st column name and pick the other columns starting from
-            # the second one (index 1)
-            columns = ['timestamp_ip21_scale'] + list(dataset.columns)[1:]
+        else:
+            # Substitute only the 1st column name and pick the other columns starting from
+            # the second one (index 1)
+            columns = ['timestamp_ip21_scale'] + list(dataset.columns)[1:]
+        
+        # Isolate the time series:
+        time_series = dataset['timestamp_ip21_scale']
+        # Get the last element:
+        last_element = time_series.iloc[-1]
+        
+        if (last_element < stop_ip21_scale):
+            
+            self.need_next_call = True
+            # Update the start timestamp to be the last_element plus 1 unit (1 millisecond):
+            self.start_ip21_scale = last_element + 1
+        
+        else:
+            self.need_next_call = False
+        
+        # Save the timestamps as numpy array in the attribute ip21time_array:
+        self.ip21time_array = np.array(dataset['timestamp_ip21_scale'])
+        # Convert to timestamp using the conversion method:
+        self = self.convert_ip21_timescale_array_to_timestamp()
+        # Retrieve the timestamps:
+        dataset['timestamp'] = self.timestamp_series
+        
+        # Select only these columns:
+        dataset = dataset[['timestamp', tag_name]]
+        
+        
+        # Compare the last timestamp from dataset with the last one already retrieved:
+        last_timestamp = dataset['timestamp'].iloc[-1]
+        
+        if ((self.last_timestamp is not None) and (last_timestamp == self.last_timestamp)):
+            
+            # We already reached the end of the database. It actually never reaches the stop timestamp.
+            print(f"The last timestamp registered in the database is: {last_timestamp}\n")
+            # Now, finish the process:
+            self.need_next_call = False
+        
+        else:
+            self.last_timestamp = last_timestamp
+            
+            # Keep the page (the pages are concatenated only once, when the dataset attribute is read),
+            # or write it to the Parquet sink:
+            if (self.sink_path is not None):
+                self = self.write_page_to_sink(dataset)
+            
+            else:
+                self.pages.append(dataset)
+        
+        return self
+    
+
+    def create_session (self, max_retries = 3, backoff_factor = 0.5, pool_maxsize = 10, use_ntlm = True):
+        """
+        create_session (max_retries = 3, backoff_factor = 0.5, pool_maxsize = 10, use_ntlm = True)
+        
+        Create the requests.Session used by fetch_database. The session keeps the TCP connections
+        (and the NTLM authentication) open between API calls, instead of starting a new connection
+        for each page.
+        
+        : param: max_retries (int): number of retries of a call that fails with a connection error
+          or with the HTTP status 429, 500, 502, 503 or 504.
+        : param: backoff_factor (float): the i-th retry waits backoff_factor * 2^(i - 1) seconds.
+        : param: pool_maxsize (int): maximum number of connections kept open.
+        : param: use_ntlm (bool): if True, the NTLM authentication of IP21 is used. Set False for
+          servers without authentication (e.g., the mock server from idsw.datafetch.mock).
+        """
+        
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+        
+        session = requests.Session()
+        
+        if (use_ntlm):
+            # IP21 uses the NTLM authentication protocol
+            from requests_ntlm import HttpNtlmAuth
+            session.auth = HttpNtlmAuth(self.username, self.password)
+        
+        # The History queries only read data, so both GET and POST calls can be retried:
+        retries = Retry(total = max_retries, backoff_factor = backoff_factor, status_forcelist = [429, 500, 502, 503, 504], allowed_methods = frozenset(['GET', 'POST']))
+        adapter = HTTPAdapter(pool_connections = 1, pool_maxsize = pool_maxsize, max_retries = retries)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        
+        self.session = session
+        
+        return self
+    
+    
+    def fetch_database (self, request_type = 'get'):
+        
+        # Reuse the session of the previous calls (see create_session):
+        if (getattr(self, 'session', None) is None):
+            self = self.create_session()
+        
+        session = self.session
+        url = self.url
+        query = self.query
+        # Timeout (s) of each call. None waits indefinitely:
+        timeout = getattr(self, 'timeout', None)
+        
+        # IP21 requires the 'post' protocol
+        
+        if (request_type == 'post'):
+            
+            json_response = session.post(url, data = query, timeout = timeout)
+        
+        else: #get
+            
+            url = url + "?" + query
+            json_response = session.get(url, timeout = timeout)
+        
+        # Calls that still fail after the retries raise requests.HTTPError:
+        json_response.raise_for_status()
+        json_response = json_response.text
+        
+        self.json_response = json_response
+        
+        return self
+
+
+class ConcurrentIP21Extractor:
+    """
+    Class for extracting several tags from Aspentech IP21 concurrently.
+    ConcurrentIP21Extractor (ip21_server, data_source = 'localhost', username = None, password = None, 
+                max_workers = 8, max_retries = 3, backoff_factor = 0.5, timeout = 120, use_ntlm = True, 
+                request_type = 'get')
+    
+    Each tag (and each part of the time window, if window_length is informed to the extract method)
+    is a task. The tasks run in a pool of max_workers threads. Each thread has its own IP21Extractor,
+    with a requests.Session reused by all the API calls of the thread (see IP21Extractor.create_session),
+    so the connections and the NTLM authentication are not repeated for every page.
+    """
+
+    def __init__ (self, ip21_server, data_source = 'localhost', username = None, password = None, max_workers = 8, max_retries = 3, backoff_factor = 0.5, timeout = 120, use_ntlm = True, request_type = 'get'):
+        
+        import threading
+        
+        if (use_ntlm):
+            # Ask the credentials only once, before starting the threads:
+            reference_extractor = IP21Extractor(None).get_credentials(ip21_server, data_source, username, password)
+            username, password = reference_extractor.username, reference_extractor.password
+        
+        if (data_source is None):
+            data_source = 'localhost'
+        
+        self.server = ip21_server
+        self.data_source = data_source
+        self.username = username
+        self.password = password
+        # Maximum number of simultaneous API calls:
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.timeout = timeout
+        self.use_ntlm = use_ntlm
+        self.request_type = request_type
+        
+        # Extractor (and session) of each thread:
+        self.local = threading.local()
+        self.sessions = []
+        self.lock = threading.Lock()
+        self.summary = None
+    
+    
+    def get_worker_extractor (self):
+        """Return the IP21Extractor of the current thread, creating it (and its session) on the first call."""
+        
+        extractor = getattr(self.local, 'extractor', None)
+        
+        if (extractor is None):
+            extractor = IP21Extractor(None)
+            extractor.server = self.server
+            extractor.data_source = self.data_source
+            extractor.username = self.username
+            extractor.password = self.password
+            extractor.timeout = self.timeout
+            extractor = extractor.create_session(max_retries = self.max_retries, backoff_factor = self.backoff_factor, pool_maxsize = 1, use_ntlm = self.use_ntlm)
+            self.local.extractor = extractor
+            
+            with self.lock:
+                self.sessions.append(extractor.session)
+        
+        return extractor
+    
+    
+    def close (self):
+        """Close the sessions of all threads."""
+        
+        with self.lock:
+            for session in self.sessions:
+                session.close()
+            
+            self.sessions = []
+        
+        self.local = type(self.local)()
+        
+        return self
+    
+    
+    def fetch_window (self, tag_to_extract, actual_tag_name, start_ip21_scale, stop_ip21_scale, sink_path = None):
+        """Fetch all the pages of one tag in the window (start_ip21_scale, stop_ip21_scale), in IP21 timescale.
+        If sink_path is not None, the pages are written to this Parquet file (see IP21Extractor.set_parquet_sink).
+        Returns a tuple (dataset, number of API calls, rows). dataset is None if there is no data in
+        the window, or if the pages were written to sink_path."""
+        
+        import os
+        
+        extractor = self.get_worker_extractor()
+        extractor = extractor.set_query_parameters(tag_to_extract, actual_tag_name)
+        extractor.start_ip21_scale = start_ip21_scale
+        extractor.stop_ip21_scale = stop_ip21_scale
+        extractor.dataset = None
+        extractor.need_next_call = True
+        api_calls = 0
+        
+        if (sink_path is not None):
+            extractor = extractor.set_parquet_sink(sink_path)
+        
+        try:
+            while (extractor.need_next_call == True):
+                
+                extractor = extractor.get_rest_api_url()
+                extractor = extractor.fetch_database(request_type = self.request_type)
+                extractor = extractor.retrieve_pd_dataframe()
+                api_calls = api_calls + 1
+        
+        except Exception:
+            # Do not leave an incomplete file:
+            if ((sink_path is not None) and (extractor.close_parquet_sink() is not None)):
+                os.remove(sink_path)
+            raise
+        
+        if (sink_path is not None):
+            extractor.close_parquet_sink()
+            return None, api_calls, extractor.rows_written
+        
+        dataset = extractor.dataset
+        # Without data in the window, retrieve_pd_dataframe keeps the error returned by IP21:
+        if ((dataset is not None) and ('timestamp' not in dataset.columns)):
+            dataset = None
+        
+        # Release the pages kept by the extractor of this thread:
+        extractor.dataset = None
+        
+        return dataset, api_calls, (len(dataset) if (dataset is not None) else 0)
+    
+    
+    def get_windows (self, start_time, stop_time, start_timedelta_unit = 'day', stop_timedelta_unit = 'day', window_length = None):
+        """Return the list of windows (start, stop) in IP21 timescale covering the time window, split in
+        parts of window_length (pd.Timedelta or string like '30D') if it is not None."""
+        
+        # Convert the time window to the IP21 timescale:
+        window_extractor = IP21Extractor(None).set_query_parameters(start_timestamp = start_time, stop_timestamp = stop_time)
+        window_extractor = window_extractor.set_extracted_time_window(start_timedelta_unit = start_timedelta_unit, stop_timedelta_unit = stop_timedelta_unit)
+        start_ip21_scale, stop_ip21_scale = window_extractor.start_ip21_scale, window_extractor.stop_ip21_scale
+        
+        if (window_length is None):
+            return [(int(start_ip21_scale), int(stop_ip21_scale))]
+        
+        # Consecutive windows do not overlap (the IP21 timescale is in milliseconds):
+        step = max(int(pd.Timedelta(window_length).value//(10**6)), 1)
+        window_starts = np.arange(start_ip21_scale, stop_ip21_scale + 1, step)
+        
+        return [(int(window_start), int(min(window_start + step - 1, stop_ip21_scale))) for window_start in window_starts]
+    
+    
+    def run_tasks (self, tasks):
+        """
+        Run fetch_window for all the tasks in a single pool of max_workers threads, and close the sessions.
+        Each task is a tuple (key, tag_to_extract, actual_tag_name, start_ip21_scale, stop_ip21_scale, sink_path).
+        
+        Returns a tuple (results, failed, api_calls, rows): results is a dictionary with the dataset of each
+        successful task, by key; failed is the list of keys of the tasks that failed after all the retries.
+        """
+        
+        from concurrent.futures import (ThreadPoolExecutor, as_completed)
+        
+        results = {}
+        failed = []
+        api_calls = 0
+        total_rows = 0
+        
+        with ThreadPoolExecutor(max_workers = min(self.max_workers, len(tasks))) as executor:
+            
+            futures = {executor.submit(self.fetch_window, *task[1:]): task for task in tasks}
+            
+            for future in as_completed(futures):
+                key, tag_to_extract, actual_tag_name, start_ip21_scale, stop_ip21_scale, sink_path = futures[future]
+                
+                try:
+                    dataset, calls, rows = future.result()
+                    results[key] = dataset
+                    api_calls = api_calls + calls
+                    total_rows = total_rows + rows
+                
+                except Exception as error:
+                    print(f"Failed to extract tag {tag_to_extract} from IP21 timestamps {start_ip21_scale} to {stop_ip21_scale}: {error}\n")
+                    failed.append(key)
+        
+        self.close()
+        
+        return results, failed, api_calls, total_rows
+    
+    
+    def extract (self, list_of_tags_to_extract, start_time = 'yesterday', stop_time = 'today', start_timedelta_unit = 'day', stop_timedelta_unit = 'day', window_length = None, previous_df_for_concatenation = None, parquet_directory = None):
+        """
+        extract (list_of_tags_to_extract, start_time = 'yesterday', stop_time = 'today', start_timedelta_unit = 'day', stop_timedelta_unit = 'day', window_length = None, previous_df_for_concatenation = None, parquet_directory = None)
+        
+        : param: list_of_tags_to_extract, start_time, stop_time, start_timedelta_unit, stop_timedelta_unit,
+          previous_df_for_concatenation: as in idsw.datafetch.pipes.get_data_from_ip21.
+        : param: window_length: if not None, the time window is split in parts of this length
+          (pd.Timedelta or string like '30D'), which are fetched in parallel. Keep None to fetch each tag
+          in a single sequence of API calls.
+        : param: parquet_directory: if not None, the pages are written as they arrive to Parquet files
+          in the subdirectory of each tag, {parquet_directory}/{actual_name}/part-{window}.parquet, instead
+          of being kept in memory. Read a tag with pd.read_parquet(returned_dict['parquet_path']).
+          Requires pyarrow.
+        
+        Returns a list of dictionaries, one per tag, with the keys 'tag', 'actual_name' and 'dataset'
+        (the extracted dataframe, with columns 'timestamp' and actual_name, or None when written to
+        parquet_directory). The windows that failed after all the retries are listed in the key
+        'failed_windows'. The throughput is stored in the attribute summary.
+        """
+        
+        import os
+        import re
+        import time
+        
+        start = time.perf_counter()
+        
+        if ((parquet_directory is not None) and (previous_df_for_concatenation is not None)):
+            raise InvalidInputsError("previous_df_for_concatenation cannot be used with parquet_directory.")
+        
+        # Only the dictionaries with a tag are extracted:
+        list_of_tags_to_extract = [dict(tag_dict) for tag_dict in list_of_tags_to_extract if (tag_dict.get('tag') is not None)]
+        
+        if (len(list_of_tags_to_extract) == 0):
+            raise InvalidInputsError("There is no tag to extract.")
+        
+        for tag_dict in list_of_tags_to_extract:
+            if (tag_dict.get('actual_name') is None):
+                tag_dict['actual_name'] = tag_dict['tag']
+        
+        windows = self.get_windows(start_time, stop_time, start_timedelta_unit = start_timedelta_unit, stop_timedelta_unit = stop_timedelta_unit, window_length = window_length)
+        
+        if (parquet_directory is not None):
+            for tag_dict in list_of_tags_to_extract:
+                # Directory name without characters that are not allowed in paths:
+                tag_dict['parquet_path'] = os.path.join(parquet_directory, re.sub(r"[^\w.-]", "_", str(tag_dict['actual_name'])))
+        
+        def get_sink_path (tag_index, window_index):
+            if (parquet_directory is None):
+                return None
+            return os.path.join(list_of_tags_to_extract[tag_index]['parquet_path'], f"part-{window_index:05d}.parquet")
+        
+        tasks = [((tag_index, window_index), tag_dict['tag'], tag_dict['actual_name'], window_start, window_stop, get_sink_path(tag_index, window_index)) for tag_index, tag_dict in enumerate(list_of_tags_to_extract) for window_index, (window_start, window_stop) in enumerate(windows)]
+        results, failed_tasks, api_calls, total_rows = self.run_tasks(tasks)
+        
+        failed = {}
+        for tag_index, window_index in sorted(failed_tasks):
+            failed.setdefault(tag_index, []).append(windows[window_index])
+        
+        returned_dfs_list = []
+        
+        if (parquet_directory is None):
+            # Rows counted after removing the duplicates:
+            total_rows = 0
+        
+        for tag_index, tag_dict in enumerate(list_of_tags_to_extract):
+            
+            # Windows in chronological order, with a single concatenation:
+            dfs = [results[(tag_index, window_index)] for window_index in range(len(windows)) if (results.get((tag_index, window_index)) is not None)]
+            
+            if (previous_df_for_concatenation is not None):
+                dfs = [previous_df_for_concatenation] + dfs
+            
+            if (len(dfs) > 0):
+                dataset = pd.concat(dfs, axis = 0, join = "inner")
+                dataset = dataset.drop_duplicates(subset = ['timestamp'], keep = 'last').reset_index(drop = True)
+                total_rows = total_rows + len(dataset)
+            
+            else:
+                dataset = None
+            
+            tag_dict['dataset'] = dataset
+            tag_dict['failed_windows'] = failed.get(tag_index, [])
+            returned_dfs_list.append(tag_dict)
+        
+        elapsed_time = time.perf_counter() - start
+        
+        self.summary = {'tags': len(list_of_tags_to_extract), 'windows': len(windows), 'tasks': len(tasks), 
+                        'failed_tasks': sum(len(value) for value in failed.values()), 'api_calls': api_calls,
+                        'rows': total_rows, 'elapsed_time_s': elapsed_time, 'rows_per_s': total_rows/elapsed_time}
+        
+        if ControlVars.show_results:
+            print(f"Extracted {total_rows} rows of {len(list_of_tags_to_extract)} tags in {elapsed_time:.2f} s, with {api_calls} API calls from {min(self.max_workers, len(tasks))} threads.\n")
+        
+        return returned_dfs_list
+    
+    
+    def extract_incremental (self, list_of_tags_to_extract, store, start_time = 'yesterday', stop_time = 'today', start_timedelta_unit = 'day', stop_timedelta_unit = 'day', window_length = None):
+        """
+        extract_incremental (list_of_tags_to_extract, store, start_time = 'yesterday', stop_time = 'today', start_timedelta_unit = 'day', stop_timedelta_unit = 'day', window_length = None)
+        
+        Same as extract, but each tag is kept in the local store (an IncrementalExtractionStore, with the
+        series named by the 'actual_name' of the tag). Only the data missing in the store is fetched from
+        IP21 (see IncrementalExtractionStore.plan_fetches), and the requested window is read from the store.
+        The windows missing for all the tags (each tag usually has its own watermark) are fetched together,
+        in a single pool of max_workers threads.
+        
+        Returns the same list of dictionaries of extract, with the additional key 'rows_fetched'. When a
+        window of a tag fails, the store of that tag is not updated for the window.
+        """
+        
+        import time
+        
+        start = time.perf_counter()
+        
+        list_of_tags_to_extract = [dict(tag_dict) for tag_dict in list_of_tags_to_extract if (tag_dict.get('tag') is not None)]
+        
+        if (len(list_of_tags_to_extract) == 0):
+            raise InvalidInputsError("There is no tag to extract.")
+        
+        for tag_dict in list_of_tags_to_extract:
+            if (tag_dict.get('actual_name') is None):
+                tag_dict['actual_name'] = tag_dict['tag']
+            tag_dict['failed_windows'] = []
+            tag_dict['rows_fetched'] = 0
+        
+        # Requested window, as timestamps:
+        window_extractor = IP21Extractor(None).set_query_parameters(start_timestamp = start_time, stop_timestamp = stop_time)
+        window_extractor = window_extractor.set_extracted_time_window(start_timedelta_unit = start_timedelta_unit, stop_timedelta_unit = stop_timedelta_unit)
+        start_timestamp, stop_timestamp = window_extractor.start_timestamp, window_extractor.stop_timestamp
+        
+        # Windows missing in the store for each tag, as tuples (tag_index, fetch_start, fetch_stop, IP21 windows):
+        fetches = []
+        tasks = []
+        for tag_index, tag_dict in enumerate(list_of_tags_to_extract):
+            for fetch_start, fetch_stop in store.plan_fetches(tag_dict['actual_name'], start_timestamp, stop_timestamp):
+                windows = self.get_windows(fetch_start, fetch_stop, window_length = window_length)
+                tasks = tasks + [((len(fetches), window_index), tag_dict['tag'], tag_dict['actual_name'], window_start, window_stop, None) for window_index, (window_start, window_stop) in enumerate(windows)]
+                fetches.append((tag_index, fetch_start, fetch_stop, windows))
+        
+        results, failed_tasks, api_calls = {}, [], 0
+        if (len(tasks) > 0):
+            results, failed_tasks, api_calls, rows = self.run_tasks(tasks)
+        
+        for fetch_index, (tag_index, fetch_start, fetch_stop, windows) in enumerate(fetches):
+            tag_dict = list_of_tags_to_extract[tag_index]
+            failed_windows = [windows[window_index] for window_index in range(len(windows)) if ((fetch_index, window_index) in failed_tasks)]
+            
+            if (len(failed_windows) > 0):
+                # Keep the store as it was, so the window is fetched again in the next refresh:
+                tag_dict['failed_windows'] = tag_dict['failed_windows'] + failed_windows
+                continue
+            
+            # Windows in chronological order, with a single concatenation:
+            dfs = [results[(fetch_index, window_index)] for window_index in range(len(windows)) if (results.get((fetch_index, window_index)) is not None)]
+            dataset = pd.concat(dfs, axis = 0, join = "inner").drop_duplicates(subset = ['timestamp'], keep = 'last').reset_index(drop = True) if (len(dfs) > 0) else None
+            
+            store.write(tag_dict['actual_name'], dataset, fetch_start, fetch_stop)
+            tag_dict['rows_fetched'] = tag_dict['rows_fetched'] + (len(dataset) if (dataset is not None) else 0)
+        
+        rows_served = 0
+        
+        for tag_dict in list_of_tags_to_extract:
+            tag_dict['dataset'] = store.read(tag_dict['actual_name'], start_timestamp, stop_timestamp)
+            rows_served = rows_served + (len(tag_dict['dataset']) if (tag_dict['dataset'] is not None) else 0)
+        
+        elapsed_time = time.perf_counter() - start
+        rows_fetched = sum(tag_dict['rows_fetched'] for tag_dict in list_of_tags_to_extract)
+        
+        self.summary = {'tags': len(list_of_tags_to_extract), 'fetched_windows': len(fetches), 'tasks': len(tasks), 'api_calls': api_calls,
+                        'failed_tasks': sum(len(tag_dict['failed_windows']) for tag_dict in list_of_tags_to_extract),
+                        'rows_fetched': rows_fetched, 'rows': rows_served, 'elapsed_time_s': elapsed_time}
+        
+        if ControlVars.show_results:
+            print(f"Served {rows_served} rows of {len(list_of_tags_to_extract)} tags from the local store, after fetching {rows_fetched} new rows from IP21 with {api_calls} API calls.\n")
+        
+        return list_of_tags_to_extract
+
+
+class IncrementalExtractionStore:
+    """
+    Local store of the time series extracted from IP21 or SQL Server, for incremental extractions.
+    IncrementalExtractionStore (store_directory, overlap = '1h', max_partitions = 32)
+    
+    Each series (a tag) has a subdirectory {store_directory}/{series name}, with the data in Parquet
+    partitions (part-{number}.parquet) and a manifest.json with the time range of each partition, the
+    high-watermark (last timestamp stored) and the period already extracted. Method refresh fetches only
+    what is missing for a requested window: the data after the watermark and, if the window starts
+    before the period already extracted, the data before it. Then, the window is read from the store.
+    So a daily refresh downloads only the last hours, instead of the full window. Requires pyarrow.
+    
+    The extracted period is always contiguous: a window starting after the watermark also fetches
+    the gap between them.
+    
+    : param: overlap: the data is fetched again from (watermark - overlap), pd.Timedelta or string like
+      '1h', so samples registered late or corrected on the source replace the stored ones. The repeated
+      timestamps are removed when reading, keeping the last fetched values.
+    : param: max_partitions: each refresh writes a new partition. When a series has more than
+      max_partitions, they are merged into a single deduplicated partition (see compact).
+    """
+    
+    def __init__ (self, store_directory, overlap = '1h', max_partitions = 32):
+        
+        self.store_directory = store_directory
+        self.overlap = pd.Timedelta(overlap)
+        self.max_partitions = max_partitions
+        # Fetched windows and rows of the last refresh of each series:
+        self.refresh_summary = {}
+    
+    
+    def get_series_directory (self, series_name):
+        
+        import os
+        import re
+        
+        # Directory name without characters that are not allowed in paths:
+        return os.path.join(self.store_directory, re.sub(r"[^\w.-]", "_", str(series_name)))
+    
+    
+    def read_manifest (self, series_name):
+        """Return the manifest of the series, or None if it was never extracted."""
+        
+        import os
+        import json
+        
+        manifest_path = os.path.join(self.get_series_directory(series_name), 'manifest.json')
+        
+        if (not os.path.exists(manifest_path)):
+            return None
+        
+        with open(manifest_path, 'r') as manifest_file:
+            manifest = json.load(manifest_file)
+        
+        for key in ['watermark', 'covered_start', 'covered_stop']:
+            if (manifest[key] is not None):
+                manifest[key] = pd.Timestamp(manifest[key])
+        
+        for partition in manifest['partitions']:
+            partition['start'], partition['stop'] = pd.Timestamp(partition['start']), pd.Timestamp(partition['stop'])
+        
+        return manifest
+    
+    
+    def write_manifest (self, series_name, manifest):
+        
+        import os
+        import json
+        
+        def to_text (timestamp):
+            return timestamp.isoformat() if (timestamp is not None) else None
+        
+        manifest_to_save = dict(manifest)
+        for key in ['watermark', 'covered_start', 'covered_stop']:
+            manifest_to_save[key] = to_text(manifest[key])
+        
+        manifest_to_save['partitions'] = [dict(partition, start = to_text(partition['start']), stop = to_text(partition['stop'])) for partition in manifest['partitions']]
+        
+        series_directory = self.get_series_directory(series_name)
+        os.makedirs(series_directory, exist_ok = True)
+        manifest_path = os.path.join(series_directory, 'manifest.json')
+        
+        # Replace the manifest at once, so an interrupted write does not corrupt the store:
+        with open(manifest_path + '.tmp', 'w') as manifest_file:
+            json.dump(manifest_to_save, manifest_file, indent = 2)
+        os.replace(manifest_path + '.tmp', manifest_path)
+        
+        return self
+    
+    
+    def get_watermark (self, series_name):
+        """Last timestamp stored for the series (None if there is no data)."""
+        
+        manifest = self.read_manifest(series_name)
+        
+        return manifest['watermark'] if (manifest is not None) else None
+    
+    
+    def plan_fetches (self, series_name, start_timestamp, stop_timestamp):
+        """Return the list of windows (start, stop) that must be fetched from the source so that the
+        store covers the window (start_timestamp, stop_timestamp)."""
+        
+        start_timestamp, stop_timestamp = pd.Timestamp(start_timestamp), pd.Timestamp(stop_timestamp)
+        manifest = self.read_manifest(series_name)
+        
+        if (manifest is None):
+            return [(start_timestamp, stop_timestamp)]
+        
+        fetches = []
+        
+        if (start_timestamp < manifest['covered_start']):
+            # Data before the period already extracted:
+            fetches.append((start_timestamp, manifest['covered_start']))
+        
+        if (stop_timestamp > manifest['covered_stop']):
+            # Data after the watermark, repeating the overlap:
+            watermark = manifest['watermark'] if (manifest['watermark'] is not None) else manifest['covered_stop']
+            fetches.append((max(watermark - self.overlap, manifest['covered_start']), stop_timestamp))
+        
+        return fetches
+    
+    
+    def write (self, series_name, df, fetch_start, fetch_stop):
+        """
+        write (series_name, df, fetch_start, fetch_stop)
+        
+        Store the dataframe df fetched from the source in the window (fetch_start, fetch_stop), as a new
+        partition of the series, and update its watermark and extracted period. df must have a
+        'timestamp' column. It may be None or empty, when there is no data in the window.
+        """
+        
+        import os
+        
+        manifest = self.read_manifest(series_name)
+        
+        if (manifest is None):
+            manifest = {'series': str(series_name), 'watermark': None, 'covered_start': None, 'covered_stop': None, 'partitions': [], 'next_partition': 0}
+        
+        series_directory = self.get_series_directory(series_name)
+        os.makedirs(series_directory, exist_ok = True)
+        
+        if ((df is not None) and (len(df) > 0)):
+            
+            if ('timestamp' not in df.columns):
+                raise InvalidInputsError(f"The data of series {series_name} has no 'timestamp' column.")
+            
+            df = df.copy()
+            df['timestamp'] = pd.to_datetime(df['timestamp']).astype('datetime64[ns]')
+            df = df.sort_values(by = 'timestamp').reset_index(drop = True)
+            
+            file_name = f"part-{manifest['next_partition']:05d}.parquet"
+            df.to_parquet(os.path.join(series_directory, file_name), index = False)
+            
+            manifest['partitions'].append({'file': file_name, 'start': df['timestamp'].iloc[0], 'stop': df['timestamp'].iloc[-1], 'rows': len(df)})
+            manifest['next_partition'] = manifest['next_partition'] + 1
+            manifest['watermark'] = max(partition['stop'] for partition in manifest['partitions'])
+        
+        fetch_start, fetch_stop = pd.Timestamp(fetch_start), pd.Timestamp(fetch_stop)
+        manifest['covered_start'] = fetch_start if (manifest['covered_start'] is None) else min(manifest['covered_start'], fetch_start)
+        manifest['covered_stop'] = fetch_stop if (manifest['covered_stop'] is None) else max(manifest['covered_stop'], fetch_stop)
+        
+        self.write_manifest(series_name, manifest)
+        
+        if (len(manifest['partitions']) > self.max_partitions):
+            self.compact(series_name)
+        
+        return self
+    
+    
+    def read_partitions (self, series_name, partitions, start_timestamp = None, stop_timestamp = None):
+        
+        import os
+        
+        series_directory = self.get_series_directory(series_name)
+        # Partitions in the order they were written, so the last fetched values are kept:
+        dfs = [pd.read_parquet(os.path.join(series_directory, partition['file'])) for partition in partitions]
+        
+        if (len(dfs) == 0):
+            return None
+        
+        df = pd.concat(dfs, axis = 0, ignore_index = True) if (len(dfs) > 1) else dfs[0]
+        
+        if (start_timestamp is not None):
+            df = df[df['timestamp'] >= start_timestamp]
+        
+        if (stop_timestamp is not None):
+            df = df[df['timestamp'] <= stop_timestamp]
+        
+        df = df.drop_duplicates(subset = ['timestamp'], keep = 'last').sort_values(by = 'timestamp')
+        
+        return df.reset_index(drop = True)
+    
+    
+    def read (self, series_name, start_timestamp = None, stop_timestamp = None):
+        """Return the data of the series stored in the window (start_timestamp, stop_timestamp), without
+        repeated timestamps, or None if there is no data."""
+        
+        manifest = self.read_manifest(series_name)
+        
+        if (manifest is None):
+            return None
+        
+        start_timestamp = pd.Timestamp(start_timestamp) if (start_timestamp is not None) else None
+        stop_timestamp = pd.Timestamp(stop_timestamp) if (stop_timestamp is not None) else None
+        
+        # Only the partitions intersecting the window are read:
+        partitions = [partition for partition in manifest['partitions'] if (((start_timestamp is None) or (partition['stop'] >= start_timestamp)) and ((stop_timestamp is None) or (partition['start'] <= stop_timestamp)))]
         
-        # Isolate the time series:
-        time_series = dataset['timestamp_ip21_scale']
-        # Get the last element (convert to list to access index -1).
-        # In Pandas series, we can do [:-1] to get a single-element series:
-        last_element = list(time_series)[-1]
+        df = self.read_partitions(series_name, partitions, start_timestamp, stop_timestamp)
         
-        if (last_element < stop_ip21_scale):
-            
-            self.need_next_call = True
-            # Update the start timestamp to be the last_element plus 1 unit (1 millisecond):
-            self.start_ip21_scale = last_element + 1
+        if ((df is None) or (len(df) == 0)):
+            return None
         
-        else:
-            self.need_next_call = False
+        return df
+    
+    
+    def compact (self, series_name):
+        """Merge all the partitions of the series in a single partition, without repeated timestamps."""
         
-        # Save the timestamps as numpy array in the attribute ip21time_array:
-        self.ip21time_array = np.array(dataset['timestamp_ip21_scale'])
-        # Convert to timestamp using the conversion method:
-        self = self.convert_ip21_timescale_array_to_timestamp()
-        # Retrieve the timestamps:
-        dataset['timestamp'] = self.timestamp_series
+        import os
         
-        # Select only these columns:
-        dataset = dataset[['timestamp', tag_name]]
+        manifest = self.read_manifest(series_name)
         
+        if ((manifest is None) or (len(manifest['partitions']) <= 1)):
+            return self
         
-        # If the attribute is not None, concatenate the dataframes:
-        if (previous_df is not None):
-            
-            # Compare the last timestamp from dataset and previous_df
-            last_timestamp = list(dataset['timestamp'])[-1]
-            previous_last_timestamp = list(previous_df['timestamp'])[-1]
-            
-            if (last_timestamp == previous_last_timestamp):
-                
-                # We already reached the end of the database. It actually never reaches the stop timestamp.
-                print(f"The last timestamp registered in the database is: {last_timestamp}\n")
-                # Pick the previous dataframe, which is already concatenated with dfs from previous calls
-                dataset = previous_df
-                # Now, finish the process:
-                self.need_next_call = False
-            
-            else:
-                # Concatenate all dataframes (append rows):
-                dataset = pd.concat([previous_df, dataset], axis = 0, join = "inner")
-                # Reset previous indices so that numeration is continuous:
-                dataset = dataset.reset_index(drop = True)
-
-        # Finally, save the concatenated dataset as dataset attribute and return the object:
-        self.dataset = dataset
+        series_directory = self.get_series_directory(series_name)
+        old_partitions = manifest['partitions']
+        df = self.read_partitions(series_name, old_partitions)
+        
+        file_name = f"part-{manifest['next_partition']:05d}.parquet"
+        df.to_parquet(os.path.join(series_directory, file_name), index = False)
+        
+        manifest['partitions'] = [{'file': file_name, 'start': df['timestamp'].iloc[0], 'stop': df['timestamp'].iloc[-1], 'rows': len(df)}]
+        manifest['next_partition'] = manifest['next_partition'] + 1
+        # The old files are only removed after the manifest points to the new one:
+        self.write_manifest(series_name, manifest)
+        
+        for partition in old_partitions:
+            os.remove(os.path.join(series_directory, partition['file']))
         
         return self
     
-
-    def fetch_database (self, request_type = 'get'):
+    
+    def refresh (self, series_name, fetch_function, start_timestamp, stop_timestamp):
+        """
+        refresh (series_name, fetch_function, start_timestamp, stop_timestamp)
         
-        import requests
-        # IP21 uses the NTLM authentication protocol
-        from requests_ntlm import HttpNtlmAuth
-       
-        url = self.url
-        query = self.query
-        username = self.username
-        password = self.password
+        Fetch the data missing in the store for the window (start_timestamp, stop_timestamp), and return
+        the window read from the store (None if there is no data).
         
-        # Create the NTLM Authorization object:
-        AUTH = HttpNtlmAuth(username, password)
+        : param: fetch_function: function called as fetch_function(fetch_start, fetch_stop), with
+          pd.Timestamps, for each window planned by plan_fetches. It must return a dataframe with a
+          'timestamp' column (or None, if there is no data). If it raises an exception, the store
+          is not modified for that window.
         
-        # IP21 requires the 'post' protocol
+        The fetched windows and rows are stored in refresh_summary[series_name].
+        """
         
-        if (request_type == 'post'):
-            
-            json_response = requests.post(url, auth = AUTH, data = query)
+        start_timestamp, stop_timestamp = pd.Timestamp(start_timestamp), pd.Timestamp(stop_timestamp)
+        fetches = self.plan_fetches(series_name, start_timestamp, stop_timestamp)
+        rows_fetched = 0
         
-        else: #get
-            
-            url = url + "?" + query
-            json_response = requests.get(url, auth = AUTH)
+        for fetch_start, fetch_stop in fetches:
+            df = fetch_function(fetch_start, fetch_stop)
+            self.write(series_name, df, fetch_start, fetch_stop)
+            rows_fetched = rows_fetched + (len(df) if (df is not None) else 0)
         
-        json_response = json_response.text
+        df = self.read(series_name, start_timestamp, stop_timestamp)
         
-        self.json_response = json_response
+        self.refresh_summary[series_name] = {'fetches': fetches, 'rows_fetched': rows_fetched, 'rows_served': (len(df) if (df is not None) else 0)}
         
-        return self
+        return df
 
 
 class SQLServerConnection:
@@ -1375,9 +2318,13 @@ class SQLServerConnection:
                   database,
                   username = '', 
                   password = '',
-                  system = 'windows'):
+                  system = 'windows',
+                  pre_created_engine = None):
     
     : param: system = 'windows', 'macos' or 'linux'
+    : param: pre_created_engine = None - If None, a new pyodbc connection will be created. Otherwise, the queries
+        run on this SQLAlchemy engine or DBAPI connection (e.g., an engine for another driver, or a local
+        SQLite database with the same tables, for tests), and the credentials are not requested.
 
         If the user passes the argument, use them. Otherwise, use the standard values.
         Set the class objects' attributes.
@@ -1397,9 +2344,18 @@ class SQLServerConnection:
                   database,
                   username = '', 
                   password = '',
-                  system = 'windows'):
+                  system = 'windows',
+                  pre_created_engine = None):
 
         
+        if (pre_created_engine is not None):
+            
+            self.cnxn = pre_created_engine
+            self.cursor = None
+            self.query_counter = 0
+            
+            return
+        
         import pyodbc
         # Some other example server values are
         # server = 'localhost\sqlexpress' # for a named instance
@@ -1588,11 +2544,138 @@ class SQLServerConnection:
         return df_table
     
     
-    def query_specific_tag_ip21sqlserver (self, tag, variable_name = None, show_table = True, export_csv = False, saving_directory_path = ""):
+    def stream_sql_query (self, query, chunksize = 100000):
+        """
+        stream_sql_query (query, chunksize = 100000)
+        
+        Generator returning the result of the query as dataframes of up to chunksize rows, so the
+        memory used is bounded by the chunk size, not by the size of the result. Use it for the
+        tables too large for run_sql_query. Each chunk may be processed by the idsw.etl functions:
+            for chunk in sqlserver_connector.stream_sql_query("SELECT * FROM IP21DataNumeric", chunksize = 500000):
+                ...
+        
+        With SQLAlchemy engines, the rows are read from a server-side cursor (execution option
+        stream_results), when the driver supports it. With pyodbc connections, the rows are fetched
+        from the cursor chunksize at a time.
+        
+        : param: chunksize (int): maximum number of rows of each dataframe.
+        """
+        
+        chunksize = int(chunksize)
+        
+        if (chunksize < 1):
+            raise InvalidInputsError("chunksize must be a positive integer.")
+        
+        try:
+            from sqlalchemy.engine import Engine
+        
+        except ModuleNotFoundError:
+            Engine = None
+        
+        if ((Engine is not None) and (isinstance(self.cnxn, Engine))):
+            # The connection is closed when the generator finishes or is discarded:
+            with self.cnxn.connect().execution_options(stream_results = True) as connection:
+                for chunk in pd.read_sql(query, connection, chunksize = chunksize):
+                    yield chunk
+        
+        else:
+            for chunk in pd.read_sql(query, self.cnxn, chunksize = chunksize):
+                yield chunk
+    
+    
+    def stream_full_table (self, table, chunksize = 100000):
+        """Generator returning the full content of a table as dataframes of up to chunksize rows (see stream_sql_query).
+        : param: table (str): string containing the name of the table that will be queried.
+        """
+        
+        return self.stream_sql_query("SELECT * FROM " + str(table), chunksize = chunksize)
+    
+    
+    def export_query_to_parquet (self, query, file_path, chunksize = 100000, chunk_function = None):
+        """
+        export_query_to_parquet (query, file_path, chunksize = 100000, chunk_function = None)
+        
+        Write the result of the query to the Parquet file file_path, one row group per chunk of
+        chunksize rows (see stream_sql_query), without loading the full result in memory. Read the
+        file with pd.read_parquet(file_path). Requires pyarrow.
+        
+        : param: chunk_function: optional function applied to each chunk before it is written, which
+          must return a dataframe with the same columns for all the chunks. e.g., a cleaning step:
+          chunk_function = lambda df: df.dropna()
+        
+        Returns a dictionary with the keys 'file_path', 'rows', 'chunks', 'elapsed_time_s' and 'rows_per_s'.
+        """
+        
+        import os
+        import time
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        
+        start = time.perf_counter()
+        
+        directory = os.path.dirname(file_path)
+        if (directory != ''):
+            os.makedirs(directory, exist_ok = True)
+        
+        writer = None
+        rows = 0
+        chunks = 0
+        
+        try:
+            for chunk in self.stream_sql_query(query, chunksize = chunksize):
+                
+                if (chunk_function is not None):
+                    chunk = chunk_function(chunk)
+                
+                if (len(chunk) == 0):
+                    # pd.read_sql returns one empty chunk for an empty result:
+                    continue
+                
+                table = pa.Table.from_pandas(chunk, preserve_index = False)
+                
+                if (writer is None):
+                    # The schema is defined by the first chunk:
+                    writer = pq.ParquetWriter(file_path, table.schema)
+                
+                elif (not table.schema.equals(writer.schema)):
+                    table = table.cast(writer.schema)
+                
+                writer.write_table(table)
+                rows = rows + len(chunk)
+                chunks = chunks + 1
+        
+        except Exception:
+            # Do not leave an incomplete file:
+            if (writer is not None):
+                writer.close()
+                os.remove(file_path)
+            raise
+        
+        if (writer is not None):
+            writer.close()
+        
+        elapsed_time = time.perf_counter() - start
+        
+        summary = {'file_path': (file_path if (writer is not None) else None), 'rows': rows, 'chunks': chunks, 
+                   'elapsed_time_s': elapsed_time, 'rows_per_s': rows/elapsed_time}
+        
+        if ControlVars.show_results:
+            if (writer is None):
+                print("The query returned no rows, so no file was written.\n")
+            else:
+                print(f"Exported {rows} rows in {chunks} chunks to {file_path} in {elapsed_time:.2f} s.\n")
+        
+        return summary
+    
+    
+    def query_specific_tag_ip21sqlserver (self, tag, variable_name = None, show_table = True, export_csv = False, saving_directory_path = "", start_timestamp = None, stop_timestamp = None):
         """ : param: tag (str): string with tag as registered in IP21. e.g. tag = 'ABC00AA101-01'.
         
             : param: variable_name (str): string containing a more readable name for the tag, that will be also shown.
             e.g. variable_name = 'Temperature in C'
+            
+            : param: start_timestamp, stop_timestamp: if not None, only the values registered from start_timestamp
+            to stop_timestamp (both included) are queried. e.g. start_timestamp = '2023-01-01 00:00:00'
         """
         
         # https://www.sqlservertutorial.net/sql-server-basics/sql-server-inner-join/
@@ -1604,6 +2687,18 @@ class SQLServerConnection:
         if (variable_name is None):
             #Repeat the tag
             variable_name = tag
+        
+        # Filters of the time window, applied to both tables:
+        window_filter, latest_window_filter = "", ""
+        if (start_timestamp is not None):
+            start_text = pd.Timestamp(start_timestamp).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+            window_filter = window_filter + f" AND d.ValueTime >= '{start_text}'"
+            latest_window_filter = latest_window_filter + f" AND ValueTime >= '{start_text}'"
+        
+        if (stop_timestamp is not None):
+            stop_text = pd.Timestamp(stop_timestamp).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+            window_filter = window_filter + f" AND d.ValueTime <= '{stop_text}'"
+            latest_window_filter = latest_window_filter + f" AND ValueTime <= '{stop_text}'"
 
         query = f"""SELECT d.ValueTime AS timestamp, t.TagName AS tag,
                     CASE
@@ -1614,7 +2709,7 @@ class SQLServerConnection:
                     FROM IP21DataNumeric d
                     INNER JOIN IP21PublishConfig t
                     ON d.TagConfigID = t.ID
-                    WHERE t.TagName = '{tag}'
+                    WHERE t.TagName = '{tag}'{window_filter}
                     UNION
                     SELECT ValueTime as timestamp, TagName AS tag, 
                     CASE
@@ -1623,7 +2718,7 @@ class SQLServerConnection:
                     END AS variable,
                     Value AS value
                     FROM LatestIP21TagDataNumeric
-                    WHERE TagName = '{tag}'
+                    WHERE TagName = '{tag}'{latest_window_filter}
                     ORDER BY timestamp ASC;
                 """
         
@@ -1631,6 +2726,131 @@ class SQLServerConnection:
         
             
         return tag_df
+    
+    
+    def query_multiple_tags_ip21sqlserver (self, list_of_tags_to_extract, start_timestamp = None, stop_timestamp = None, max_tags_per_query = 1000, pivot = True, show_table = True, export_csv = False, saving_directory_path = ""):
+        """
+        query_multiple_tags_ip21sqlserver (list_of_tags_to_extract, start_timestamp = None, stop_timestamp = None, max_tags_per_query = 1000, pivot = True, show_table = True, export_csv = False, saving_directory_path = "")
+        
+        Batched version of query_specific_tag_ip21sqlserver: all the tags are queried together, with
+        parameterized IN lists, instead of one query (one round trip to the server) per tag.
+        
+        : param: list_of_tags_to_extract: list of dictionaries, as in idsw.datafetch.pipes.get_data_from_ip21,
+          with keys 'tag' (tag as registered in IP21) and 'actual_name' (a more readable name, used as column
+          name; if None, the tag is repeated). e.g. [{'tag': 'ABC00AA101-01', 'actual_name': 'temperature'}]
+        : param: start_timestamp, stop_timestamp: if not None, only the values from start_timestamp to
+          stop_timestamp (both included) are queried.
+        : param: max_tags_per_query (int): tags of each query. SQL Server accepts up to 2100 parameters
+          per query, and each tag is used twice, so more tags are split into several queries.
+        : param: pivot (bool): if True, returns a wide dataframe indexed by timestamp, with one column per tag
+          (named by the 'actual_name'), so different tags cannot have the same 'actual_name'. If False,
+          returns the long table with columns 'timestamp', 'tag', 'variable' and 'value', as
+          query_specific_tag_ip21sqlserver.
+        
+        The number of queries and of round trips saved (compared with one query per tag) are stored in
+        the attribute batch_query_summary.
+        """
+        
+        import time
+        
+        start = time.perf_counter()
+        
+        list_of_tags_to_extract = [dict(tag_dict) for tag_dict in list_of_tags_to_extract if (tag_dict.get('tag') is not None)]
+        
+        if (len(list_of_tags_to_extract) == 0):
+            raise InvalidInputsError("There is no tag to query.")
+        
+        for tag_dict in list_of_tags_to_extract:
+            if (tag_dict.get('actual_name') is None):
+                tag_dict['actual_name'] = tag_dict['tag']
+        
+        tags = list(dict.fromkeys(tag_dict['tag'] for tag_dict in list_of_tags_to_extract))
+        variable_names = {tag_dict['tag']: tag_dict['actual_name'] for tag_dict in list_of_tags_to_extract}
+        max_tags_per_query = max(int(max_tags_per_query), 1)
+        
+        if (pivot):
+            # Each column of the wide dataframe is named by the 'actual_name' of one tag:
+            duplicated_names = pd.Series(list(variable_names.values()))
+            duplicated_names = list(dict.fromkeys(duplicated_names[duplicated_names.duplicated()]))
+            
+            if (len(duplicated_names) > 0):
+                raise InvalidInputsError(f"The actual names {duplicated_names} were given to more than one tag. Use a different \'actual_name\' for each tag, or set pivot = False.")
+        
+        # Filters of the time window, with the timestamps as parameters:
+        window_filter, latest_window_filter, window_parameters = "", "", []
+        if (start_timestamp is not None):
+            window_filter = window_filter + " AND d.ValueTime >= ?"
+            latest_window_filter = latest_window_filter + " AND ValueTime >= ?"
+            window_parameters.append(pd.Timestamp(start_timestamp).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3])
+        
+        if (stop_timestamp is not None):
+            window_filter = window_filter + " AND d.ValueTime <= ?"
+            latest_window_filter = latest_window_filter + " AND ValueTime <= ?"
+            window_parameters.append(pd.Timestamp(stop_timestamp).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3])
+        
+        dfs = []
+        
+        for batch_start in range(0, len(tags), max_tags_per_query):
+            
+            batch_tags = tags[batch_start:(batch_start + max_tags_per_query)]
+            placeholders = ", ".join(["?"]*len(batch_tags))
+            
+            query = f"""SELECT d.ValueTime AS timestamp, t.TagName AS tag, d.Value AS value
+                    FROM IP21DataNumeric d
+                    INNER JOIN IP21PublishConfig t
+                    ON d.TagConfigID = t.ID
+                    WHERE t.TagName IN ({placeholders}){window_filter}
+                    UNION
+                    SELECT ValueTime AS timestamp, TagName AS tag, Value AS value
+                    FROM LatestIP21TagDataNumeric
+                    WHERE TagName IN ({placeholders}){latest_window_filter}
+                    ORDER BY timestamp ASC;
+                """
+            
+            # A tuple is accepted both by the DBAPI connections and by the SQLAlchemy engines:
+            parameters = tuple(batch_tags + window_parameters + batch_tags + window_parameters)
+            dfs.append(pd.read_sql(query, self.cnxn, params = parameters))
+        
+        round_trips = len(dfs)
+        
+        long_df = pd.concat(dfs, axis = 0, ignore_index = True) if (round_trips > 1) else dfs[0]
+        long_df['timestamp'] = pd.to_datetime(long_df['timestamp'])
+        long_df['variable'] = long_df['tag'].map(variable_names)
+        
+        if (pivot):
+            # A same timestamp may be in both tables; the single pivot requires unique pairs (timestamp, tag):
+            long_df = long_df.drop_duplicates(subset = ['timestamp', 'tag'], keep = 'last')
+            df = long_df.pivot(index = 'timestamp', columns = 'variable', values = 'value')
+            # Columns in the order of the list of tags (tags without data are filled with NaN):
+            df = df.reindex(columns = list(dict.fromkeys(variable_names[tag] for tag in tags))).sort_index()
+            df.columns.name = None
+        
+        else:
+            df = long_df[['timestamp', 'tag', 'variable', 'value']].sort_values(by = ['timestamp', 'tag']).reset_index(drop = True)
+        
+        elapsed_time = time.perf_counter() - start
+        
+        self.batch_query_summary = {'tags': len(tags), 'round_trips': round_trips, 'round_trips_saved': len(tags) - round_trips,
+                                    'rows': len(long_df), 'elapsed_time_s': elapsed_time}
+        
+        if ControlVars.show_results:
+            print(f"Queried {len(long_df)} values of {len(tags)} tags with {round_trips} queries ({len(tags) - round_trips} round trips saved) in {elapsed_time:.2f} s.\n")
+            
+            if (show_table):
+                try:
+                    from IPython.display import display
+                    display(df)
+                    
+                except:
+                    print(df)
+        
+        if (export_csv):
+            if ((saving_directory_path is None) or (saving_directory_path == '')):
+                saving_directory_path = f"table{self.query_counter}.csv"
+            
+            df.to_csv(saving_directory_path)
+        
+        return df
 
 
 class SQLiteConnection:
@@ -1694,15 +2914,76 @@ class SQLiteConnection:
         return self
     
 
-    def fetch_table(self, table_name):
+    def set_write_ahead_log(self, connection):
+        """
+        Configure the SQLite connection for fast writes: write-ahead log (WAL) journal, so the readers do
+        not block the writer and each commit appends to the log instead of rewriting the database pages,
+        and synchronous = NORMAL, which is safe in WAL mode and avoids a disk sync on every commit.
+        Runs before the transaction starts (journal_mode cannot be changed inside a transaction).
+        """
+        
+        connection.exec_driver_sql("PRAGMA journal_mode = WAL")
+        connection.exec_driver_sql("PRAGMA synchronous = NORMAL")
+        # End the transaction started by SQLAlchemy for the PRAGMA statements:
+        connection.commit()
+        
+        return self
+    
+    
+    def get_sql_values(self, series):
+        """Return the values of a column as a list of Python objects accepted by sqlite3, with missing
+        values as None. Timestamps are saved as text, in the format of SQLAlchemy (and of pandas to_sql)."""
+        
+        if (pd.api.types.is_datetime64_any_dtype(series)):
+            return series.dt.strftime('%Y-%m-%d %H:%M:%S.%f').astype(object).where(series.notna(), None).tolist()
+        
+        if ((isinstance(series.dtype, np.dtype)) and (series.dtype.kind in 'biuf')):
+            # NaN is saved by SQLite as NULL:
+            return series.tolist()
+        
+        return series.astype(object).where(series.notna(), None).tolist()
+    
+
+    def fetch_table(self, table_name, start_timestamp = None, stop_timestamp = None, timestamp_column = 'timestamp', columns = None):
+        """
+        fetch_table (table_name, start_timestamp = None, stop_timestamp = None, timestamp_column = 'timestamp', columns = None)
+        
+        : param: start_timestamp, stop_timestamp: if not None, only the rows with timestamp_column from
+          start_timestamp to stop_timestamp (both included) are read, using the index of the column (see
+          update_or_create_table), instead of reading the full table.
+        : param: columns: list of columns to read. If None, all the columns are read.
+        
+        Returns the tuple (df, engine).
+        """
         
         # If there is no engine, create one:
         if (self.engine is None):
             self = self.create_engine()
         
         try:
-            # Access the table from the database
-            df = pd.read_sql(table_name, self.engine)
+            if ((start_timestamp is None) and (stop_timestamp is None) and (columns is None)):
+                # Access the table from the database
+                df = pd.read_sql(table_name, self.engine)
+            
+            else:
+                quote = lambda name: '"' + str(name).replace('"', '""') + '"'
+                selected_columns = ", ".join(quote(column) for column in columns) if (columns is not None) else "*"
+                query = f"SELECT {selected_columns} FROM {quote(table_name)}"
+                
+                conditions, parameters = [], []
+                if (start_timestamp is not None):
+                    conditions.append(f"{quote(timestamp_column)} >= ?")
+                    parameters.append(pd.Timestamp(start_timestamp).strftime('%Y-%m-%d %H:%M:%S.%f'))
+                
+                if (stop_timestamp is not None):
+                    conditions.append(f"{quote(timestamp_column)} <= ?")
+                    parameters.append(pd.Timestamp(stop_timestamp).strftime('%Y-%m-%d %H:%M:%S.%f'))
+                
+                if (len(conditions) > 0):
+                    query = query + " WHERE " + " AND ".join(conditions) + f" ORDER BY {quote(timestamp_column)}"
+                
+                parse_dates = [timestamp_column] if ((columns is None) or (timestamp_column in columns)) else None
+                df = pd.read_sql(query, self.engine, params = tuple(parameters), parse_dates = parse_dates)
             
             if ControlVars.show_results: 
                 print(f"Successfully retrieved table {table_name} from the database.")
@@ -1722,18 +3003,103 @@ class SQLiteConnection:
             raise InvalidInputsError ("Error trying to fetch SQLite Database. If an pre-created engine was provided, check if it is correct and working.\n")
         
 
-    def update_or_create_table(self, table_name):
-    
+    def update_or_create_table(self, table_name, df = None, if_exists = 'replace', key_columns = None, index_columns = None, batch_size = 100000):
+        """
+        update_or_create_table (table_name, df = None, if_exists = 'replace', key_columns = None, index_columns = None, batch_size = 100000)
+        
+        : param: df: Pandas dataframe with the rows to write on table table_name.
+        : param: if_exists = 'replace': the table is replaced by df.
+          if_exists = 'append': the rows of df are added to the table (created if it does not exist).
+          if_exists = 'upsert': the rows of df with the same key_columns of rows already in the table
+          replace them, and the other rows are added. So the same period may be written again, e.g.
+          by an incremental extraction, without duplicating rows.
+        : param: key_columns: list of columns identifying each row, e.g. ['timestamp'] or ['timestamp', 'tag'].
+          Required by if_exists = 'upsert'. A unique index is created on them, so appending a row with a key
+          already in the table raises an error.
+        : param: index_columns: list of columns to index. If None, the key columns and the datetime columns
+          (like 'timestamp') are indexed, so the reads of fetch_table by time window do not scan the table.
+        : param: batch_size: rows of each batched insert (executemany). All the batches run in a single
+          transaction, in write-ahead log mode (see set_write_ahead_log).
+        
+        Returns the tuple (df, engine). The rows written per second are stored in the attribute write_summary.
+        """
+        
+        import time
+        from sqlalchemy import inspect
+        
+        if (df is None):
+            raise InvalidInputsError ("Input the dataframe df to write on the table.\n")
+        
+        if (if_exists not in ['replace', 'append', 'upsert']):
+            raise InvalidInputsError ("if_exists must be 'replace', 'append' or 'upsert'.\n")
+        
+        if (isinstance(key_columns, str)):
+            key_columns = [key_columns]
+        
+        if ((if_exists == 'upsert') and (not key_columns)):
+            raise InvalidInputsError ("Input the key_columns identifying the rows for if_exists = 'upsert'.\n")
+        
+        missing_columns = [column for column in (key_columns or []) if (column not in df.columns)]
+        if (len(missing_columns) > 0):
+            raise InvalidInputsError (f"The key columns {missing_columns} are not in the dataframe.\n")
+        
+        if (index_columns is None):
+            index_columns = [column for column in df.columns if ((column == 'timestamp') or (pd.api.types.is_datetime64_any_dtype(df[column])))]
+            # The key index already serves the reads by its first column:
+            index_columns = [column for column in index_columns if (column not in (key_columns or [])[:1])]
+        
         # If there is no engine, create one:
         if (self.engine is None):
             self = self.create_engine()
-            
+        
+        start = time.perf_counter()
+        quote = lambda name: '"' + str(name).replace('"', '""') + '"'
+        columns = list(df.columns)
+        table_exists = inspect(self.engine).has_table(table_name)
+        
+        insert_sql = f"INSERT INTO {quote(table_name)} ({', '.join(quote(column) for column in columns)}) VALUES ({', '.join(['?']*len(columns))})"
+        
+        if (if_exists == 'upsert'):
+            updated_columns = [column for column in columns if (column not in key_columns)]
+            conflict_action = ("DO UPDATE SET " + ", ".join(f"{quote(column)} = excluded.{quote(column)}" for column in updated_columns)) if (len(updated_columns) > 0) else "DO NOTHING"
+            insert_sql = insert_sql + f" ON CONFLICT ({', '.join(quote(column) for column in key_columns)}) {conflict_action}"
+        
         try:
-            # Set index = False not to add extra indices in the database:
-            df.to_sql(table_name, con = engine, if_exists = 'replace', index = False)
+            with self.engine.connect() as connection:
+                
+                self.set_write_ahead_log(connection)
+                
+                with connection.begin():
+                    
+                    if ((if_exists == 'replace') or (not table_exists)):
+                        # Create the table with the columns and types defined by pandas (no rows):
+                        df.head(0).to_sql(table_name, con = connection, if_exists = 'replace', index = False)
+                    
+                    if (key_columns):
+                        key_index_sql = f"CREATE UNIQUE INDEX IF NOT EXISTS {quote('ux_' + str(table_name) + '_' + '_'.join(map(str, key_columns)))} ON {quote(table_name)} ({', '.join(quote(column) for column in key_columns)})"
+                    
+                    if (if_exists == 'upsert'):
+                        # Required by ON CONFLICT, so it exists before the inserts:
+                        connection.exec_driver_sql(key_index_sql)
+                    
+                    for batch_start in range(0, len(df), batch_size):
+                        batch = df.iloc[batch_start:(batch_start + batch_size)]
+                        rows = list(zip(*[self.get_sql_values(batch[column]) for column in columns]))
+                        # A list of tuples runs as a single executemany:
+                        connection.exec_driver_sql(insert_sql, rows)
+                    
+                    # Indexes created after the inserts, faster for new tables:
+                    if (key_columns):
+                        connection.exec_driver_sql(key_index_sql)
+                    
+                    for column in index_columns:
+                        connection.exec_driver_sql(f"CREATE INDEX IF NOT EXISTS {quote('ix_' + str(table_name) + '_' + str(column))} ON {quote(table_name)} ({quote(column)})")
+            
+            elapsed_time = time.perf_counter() - start
+            self.write_summary = {'table': table_name, 'mode': if_exists, 'rows': len(df), 'elapsed_time_s': elapsed_time, 'rows_per_s': (len(df)/elapsed_time if (elapsed_time > 0) else None)}
                 
             if ControlVars.show_results: 
-                print(f"Successfully updated table {table_name} on the SQLite database.")
+                print(f"Successfully updated table {table_name} on the SQLite database ({len(df)} rows, {if_exists}, {self.write_summary['rows_per_s']:.0f} rows/s).")
                 print("Check the 10 first rows from this table:\n")
                     
                 try:
@@ -1746,8 +3112,8 @@ class SQLiteConnection:
 
             return df, self.engine
         
-        except:
-            raise InvalidInputsError ("Error trying to update SQLite Database. If an pre-created engine was provided, check if it is correct and working.\n")
+        except Exception as error:
+            raise InvalidInputsError (f"Error trying to update SQLite Database: {error}. If an pre-created engine was provided, check if it is correct and working.\n")
             
 
 class GCPBigQueryConnection:
@@ -1812,6 +3178,9 @@ class GCPBigQueryConnection:
         from google.cloud import bigquery_storage
         from google.oauth2 import service_account
         import google.auth
+
+        self.project = project
+        self.dataset = dataset
         
         if ((project is None)|(project == '')):
             # Ask the user to provide the credentials:
@@ -2584,6 +3953,162 @@ class GCPBigQueryConnection:
         self.query_counter = query_counter + 1    
             
         return df_table
+
+
+    def get_batch_merge_query (self, table, staging_table, key_columns, update_columns = None, delete_column = None):
+        """
+        Return the MERGE statement that applies all the corrections staged in staging_table to table.
+        : param: table, staging_table (str): table names. Full table names are `{self.project}.{self.dataset}.{str(table)}`
+        : param: key_columns (list): columns that identify the rows to correct. They have the same names
+            in table and in staging_table.
+        : param: update_columns: list of columns of table updated with the staged column of the same name,
+            or dictionary {column of table: column of staging_table}.
+        : param: delete_column (str): boolean column of staging_table. The rows matched by a staged row
+            with True in this column are deleted, instead of updated.
+        """
+
+        if (type(key_columns) == str):
+            key_columns = [key_columns]
+        
+        if (update_columns is None):
+            update_columns = {}
+        
+        elif (type(update_columns) == str):
+            update_columns = {update_columns: update_columns}
+        
+        elif (type(update_columns) != dict):
+            update_columns = {column: column for column in update_columns}
+
+        if (len(key_columns) == 0):
+            raise InvalidInputsError("Declare at least one key column, identifying the rows to correct.")
+        
+        if ((len(update_columns) == 0) & (delete_column is None)):
+            raise InvalidInputsError("Declare the columns to update (update_columns), or the column indicating the rows to delete (delete_column).")
+
+        on_condition = " AND ".join([f"target.`{column}` = source.`{column}`" for column in key_columns])
+
+        merge_query = f"""
+                    MERGE `{self.project}.{self.dataset}.{str(table)}` AS target
+                    USING `{self.project}.{self.dataset}.{str(staging_table)}` AS source
+                    ON {on_condition}
+                    """
+        
+        if (delete_column is not None):
+            merge_query = merge_query + f"""WHEN MATCHED AND source.`{delete_column}` THEN DELETE
+                    """
+        
+        if (len(update_columns) > 0):
+            set_clause = ", ".join([f"`{column}` = source.`{source_column}`" for column, source_column in update_columns.items()])
+            merge_query = merge_query + f"""WHEN MATCHED THEN UPDATE SET {set_clause}
+                    """
+
+        return merge_query
+
+
+    def apply_batch_corrections (self, table, corrections, key_columns, update_columns = None, delete_column = None, staging_table = None, keep_staging_table = False):
+        """
+        Apply a set of corrections (updates and deletions) to a table with two BigQuery jobs, whatever
+        the number of corrections: a load job writes the corrections to a staging table, and a single
+        MERGE applies them. The methods update_specific_value_from_column_on_table and 
+        delete_specific_values_from_column_on_table run one DML job per call, so correcting thousands of
+        values with them costs thousands of jobs and reaches the DML quotas.
+        The summary (corrections, jobs, affected rows, and the MERGE statement) is stored in the
+        attribute batch_correction_summary.
+
+        : param: table (str): name of the corrected table. Full table name is `{self.project}.{self.dataset}.{str(table)}`
+        : param: corrections (pd.DataFrame): one row per correction, with the key columns and the new values.
+            If there is more than one correction for the same key, the last one is applied.
+        : param: key_columns (list): columns that identify the rows to correct (same names in table and in corrections).
+        : param: update_columns: list of columns of table updated with the column of the same name in
+            corrections, or dictionary {column of table: column of corrections}. The dictionary allows
+            replacing a value of a key column. E.g., to replace old values of column 'tag' by the new values
+            in column 'new_tag' of corrections: key_columns = ['tag'], update_columns = {'tag': 'new_tag'}.
+            If None, all the columns of corrections that are not key columns nor delete_column are updated.
+        : param: delete_column (str): boolean column of corrections. The rows matched by a correction with
+            True in this column are deleted, instead of updated.
+        : param: staging_table (str): name of the staging table, in the same dataset. If None, it is
+            '{table}_corrections_staging_{random suffix}', so concurrent calls for the same table do not
+            overwrite each other's corrections. A declared staging_table is replaced on each call.
+        : param: keep_staging_table (bool): if False, the staging table is deleted after the MERGE.
+        """
+
+        import time
+        import uuid
+        from google.cloud import bigquery
+
+        if (type(key_columns) == str):
+            key_columns = [key_columns]
+        
+        key_columns = list(key_columns)
+        corrections = pd.DataFrame(corrections)
+
+        if (update_columns is None):
+            update_columns = [column for column in corrections.columns if ((column not in key_columns) & (column != delete_column))]
+        
+        elif (type(update_columns) == str):
+            update_columns = [update_columns]
+        
+        if (type(update_columns) != dict):
+            update_columns = {column: column for column in update_columns}
+
+        staged_columns = list(dict.fromkeys(key_columns + list(update_columns.values()) + ([delete_column] if (delete_column is not None) else [])))
+        missing_columns = [column for column in staged_columns if (column not in corrections.columns)]
+        
+        if (len(missing_columns) > 0):
+            raise InvalidInputsError(f"The columns {missing_columns} are not in the dataframe of corrections.")
+
+        if (staging_table is None):
+            staging_table = f"{str(table)}_corrections_staging_{uuid.uuid4().hex}"
+
+        table_id = f"{self.project}.{self.dataset}.{str(table)}"
+        staging_table_id = f"{self.project}.{self.dataset}.{str(staging_table)}"
+        # MERGE fails when a row of the table is matched by more than one staged row.
+        # So, only the last correction of each key is staged:
+        staged_df = corrections[staged_columns].drop_duplicates(subset = key_columns, keep = 'last')
+        merge_query = self.get_batch_merge_query(table, staging_table, key_columns, update_columns, delete_column)
+
+        if (len(staged_df) == 0):
+            print("There are no corrections to apply.\n")
+            self.batch_correction_summary = {'corrections': 0, 'staged_rows': 0, 'jobs': 0, 'affected_rows': 0, 'elapsed_time_s': 0.0, 'merge_query': merge_query}
+            return self
+
+        client = self.bqclient
+        target_table = client.get_table(table_id)
+
+        if (target_table.streaming_buffer is not None):
+            raise RuntimeError("Table contains data in a streaming buffer, which cannot be updated or deleted. Please perform this action when the streaming buffer is empty (may take up to 90 minutes from last data insertion).")
+
+        # The staged columns get the types of the columns of the table they are compared with or assigned to,
+        # so the MERGE does not depend on the types inferred from the dataframe:
+        target_types = {field.name: field.field_type for field in target_table.schema}
+        source_to_target = {column: column for column in key_columns}
+        source_to_target.update({source_column: column for column, source_column in update_columns.items()})
+        schema = [bigquery.SchemaField(source_column, target_types[column]) for source_column, column in source_to_target.items() if (column in target_types)]
+        
+        if (delete_column is not None):
+            schema.append(bigquery.SchemaField(delete_column, 'BOOL'))
+
+        job_config = bigquery.LoadJobConfig(schema = schema, write_disposition = bigquery.WriteDisposition.WRITE_TRUNCATE)
+
+        start = time.perf_counter()
+        load_job = client.load_table_from_dataframe(staged_df, staging_table_id, job_config = job_config)
+        load_job.result()
+
+        try:
+            job = client.query(merge_query)
+            job.result()
+        
+        finally:
+            if not (keep_staging_table):
+                client.delete_table(staging_table_id, not_found_ok = True)
+
+        self.batch_correction_summary = {'corrections': len(corrections), 'staged_rows': len(staged_df), 'jobs': 2, 
+                                         'affected_rows': job.num_dml_affected_rows, 'elapsed_time_s': time.perf_counter() - start, 
+                                         'merge_query': merge_query}
+
+        print(f"{len(staged_df)} corrections applied to table {table_id} with a single MERGE ({job.num_dml_affected_rows} rows affected, 2 jobs instead of {len(staged_df)}).\n")
+
+        return self
     
 
     def create_new_view (self, view_id, query, show_table = True, export_csv = False, saving_directory_path = ""):
@@ -0,0 +1,187 @@
+"""FUNCTIONS FROM INDUSTRIAL DATA SCIENCE WORKFLOW (IDSW) PACKAGE
+Local stand-ins of the data sources, for testing and benchmarking the pipelines
+without access to the plant systems.
+Mock AspenTech IP21 REST API
+
+Marco Cesar Prado Soares, Data Scientist Specialist @ Bayer Crop Science LATAM
+marcosoares.feq@gmail.com
+marco.soares@bayer.com"""
+
+import re
+import json
+import time
+import threading
+import numpy as np
+
+from urllib.parse import unquote
+from http.server import (BaseHTTPRequestHandler, ThreadingHTTPServer)
+
+
+class MockIP21Server:
+    """
+    Local HTTP server that answers the History queries of the IP21 REST API, as built by
+    IP21Extractor.get_rest_api_url, without authentication.
+    MockIP21Server (host = '127.0.0.1', port = 0, sample_interval_ms = 60000, page_size = 100000,
+                    last_sample_ip21_scale = None, latency_s = 0.0, failure_rate = 0.0, random_state = 55)
+
+    Every tag has one sample each sample_interval_ms, aligned to the IP21 timescale origin, with a
+    deterministic value (the same tag and timestamp always return the same value). Each response has
+    up to min(page_size, X) samples, where X is the maximum number of samples in the query, so long
+    windows require several API calls, as in the actual server.
+
+    : param: port (int): 0 selects a free port. The server name to use as ip21_server is in attribute address.
+    : param: last_sample_ip21_scale (int): last sample available in the database (IP21 timescale).
+      If None, there are samples up to the end of any window.
+    : param: latency_s (float): delay added to each response.
+    : param: failure_rate (float): fraction of the requests answered with HTTP status 503, for
+      testing the retries.
+
+    Use it as a context manager:
+        with MockIP21Server() as server:
+            get_data_from_ip21(server.address, ..., use_ntlm = False)
+    """
+
+    def __init__ (self, host = '127.0.0.1', port = 0, sample_interval_ms = 60000, page_size = 100000, last_sample_ip21_scale = None, latency_s = 0.0, failure_rate = 0.0, random_state = 55):
+
+        self.host = host
+        self.port = port
+        self.sample_interval_ms = int(sample_interval_ms)
+        self.page_size = int(page_size)
+        self.last_sample_ip21_scale = last_sample_ip21_scale
+        self.latency_s = latency_s
+        self.failure_rate = failure_rate
+        self.random_generator = np.random.default_rng(random_state)
+
+        # Counters, updated by the request threads:
+        self.lock = threading.Lock()
+        self.request_count = 0
+        self.failure_count = 0
+        self.samples_served = 0
+
+        self.httpd = None
+        self.thread = None
+
+
+    def get_samples (self, tag, start_ip21_scale, stop_ip21_scale, max_samples):
+        """Return the arrays (timestamps in IP21 timescale, values) of a tag in the window."""
+
+        if (self.last_sample_ip21_scale is not None):
+            stop_ip21_scale = min(stop_ip21_scale, self.last_sample_ip21_scale)
+
+        interval = self.sample_interval_ms
+        # First sample aligned to the interval, at or after the start:
+        first = -((-start_ip21_scale)//interval)*interval
+
+        if (first > stop_ip21_scale):
+            return np.array([], dtype = np.int64), np.array([], dtype = np.float64)
+
+        total_samples = min(int((stop_ip21_scale - first)//interval) + 1, max_samples, self.page_size)
+        timestamps = first + interval*np.arange(total_samples, dtype = np.int64)
+
+        # Deterministic signal: level defined by the tag name, daily cycle, and a fast component:
+        level = sum(ord(character) for character in tag) % 100
+        values = level + 10*np.sin(2*np.pi*timestamps/86400000) + np.cos(timestamps/3600000)
+
+        return timestamps, np.round(values, 4)
+
+
+    def respond (self, raw_query):
+        """Return a tuple (HTTP status, body) for a URL-encoded History query."""
+
+        with self.lock:
+            self.request_count = self.request_count + 1
+            fail = (self.failure_rate > 0) and (self.random_generator.random() < self.failure_rate)
+            if (fail):
+                self.failure_count = self.failure_count + 1
+
+        if (self.latency_s > 0):
+            time.sleep(self.latency_s)
+
+        if (fail):
+            return 503, json.dumps({'error': 'Service unavailable (simulated failure).'})
+
+        query = unquote(raw_query)
+        tag = re.search(r"<N><!\[CDATA\[(.*?)\]\]></N>", query)
+        start = re.search(r"<St>(-?\d+)</St>", query)
+        stop = re.search(r"<Et>(-?\d+)</Et>", query)
+        max_samples = re.search(r"<X>(\d+)</X>", query)
+
+        if ((tag is None) or (start is None) or (stop is None)):
+            return 400, json.dumps({'error': 'Invalid History query.'})
+
+        max_samples = int(max_samples.group(1)) if (max_samples is not None) else self.page_size
+        timestamps, values = self.get_samples(tag.group(1), int(start.group(1)), int(stop.group(1)), max_samples)
+
+        with self.lock:
+            self.samples_served = self.samples_served + len(timestamps)
+
+        if (len(timestamps) == 0):
+            # Same structure of IP21 when there is no data in the window:
+            body = {'data': [{'t': tag.group(1), 'samples': [{'er': 0, 'es': 'No data for the requested time window.'}]}]}
+
+        else:
+            samples = [{'t': int(timestamp), 'v': float(value), 's': 8, 'V': 0} for timestamp, value in zip(timestamps, values)]
+            body = {'data': [{'t': tag.group(1), 'samples': samples}]}
+
+        return 200, json.dumps(body)
+
+
+    def start (self):
+        """Start the server in a background thread."""
+
+        server = self
+
+        class Handler (BaseHTTPRequestHandler):
+            # Keep the connections open, as the IP21 server does:
+            protocol_version = 'HTTP/1.1'
+
+            def send_body (self, status, body):
+                body = body.encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET (self):
+                raw_query = self.path.split('?', 1)[1] if ('?' in self.path) else ''
+                self.send_body(*server.respond(raw_query))
+
+            def do_POST (self):
+                length = int(self.headers.get('Content-Length', 0))
+                raw_query = self.rfile.read(length).decode('utf-8')
+                self.send_body(*server.respond(raw_query))
+
+            def log_message (self, format, *args):
+                # Do not print one line per request:
+                pass
+
+        self.httpd = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+        # Server name in the format expected by IP21Extractor (without http://):
+        self.address = f"{self.host}:{self.port}"
+
+        self.thread = threading.Thread(target = self.httpd.serve_forever, daemon = True)
+        self.thread.start()
+
+        return self
+
+
+    def stop (self):
+        """Stop the server."""
+
+        if (self.httpd is not None):
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+
+        return self
+
+
+    def __enter__ (self):
+        return self.start()
+
+
+    def __exit__ (self, exc_type, exc_value, traceback):
+        self.stop()
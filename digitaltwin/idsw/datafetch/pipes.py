@@ -3,16 +3,16 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 
-from steelindustrysimulator.digitaltwin.idsw import (InvalidInputsError, ControlVars)
-from .core import (Connectors, MountGoogleDrive, AWSS3Connection, IP21Extractor, SQLServerConnection, 
-                    SQLiteConnection, GCPBigQueryConnection)
+from .. import (InvalidInputsError, ControlVars)
+from .core import (Connectors, MountGoogleDrive, AWSS3Connection, IP21Extractor, ConcurrentIP21Extractor, IncrementalExtractionStore, 
+                    SQLServerConnection, SQLiteConnection, GCPBigQueryConnection)
 
-from steelindustrysimulator.digitaltwin.idsw.modelling.core import AnomalyDetector
+from ..modelling.core import AnomalyDetector
 
 
-def mount_storage_system (source = 'aws', path_to_store_imported_s3_bucket = '', s3_bucket_name = None, s3_obj_prefix = None):
+def mount_storage_system (source = 'aws', path_to_store_imported_s3_bucket = '', s3_bucket_name = None, s3_obj_prefix = None, max_workers = 8, skip_unchanged = True, multipart_threshold_mb = 64, multipart_chunksize_mb = 16):
     """
-    mount_storage_system (source = 'aws', path_to_store_imported_s3_bucket = '', s3_bucket_name = None, s3_obj_prefix = None):
+    mount_storage_system (source = 'aws', path_to_store_imported_s3_bucket = '', s3_bucket_name = None, s3_obj_prefix = None, max_workers = 8, skip_unchanged = True, multipart_threshold_mb = 64, multipart_chunksize_mb = 16):
 
     : param: source = 'google' for mounting the google drive;
     : param: source = 'aws' for mounting an AWS S3 bucket.
@@ -55,6 +55,18 @@ def mount_storage_system (source = 'aws', path_to_store_imported_s3_bucket = '',
       S3_OBJECT_FOLDER_PREFIX = "bucket_directory1/.../bucket_directoryN/my_file.ext"
       where my_file is the file's name, and ext is its extension.
 
+      The imported files keep their paths relative to the prefix. e.g., with the prefix 'Development/',
+      the object 'Development/2024/Projects1.xls' is copied to '{path_to_store_imported_s3_bucket}/2024/Projects1.xls'.
+
+    : param: max_workers = 8: number of files transferred at the same time (threads).
+    : param: skip_unchanged = True: do not transfer again the files that have the same content
+      in the workspace and in the bucket (same size and ETag). So, running the function again only
+      transfers the new and the modified files.
+    : param: multipart_threshold_mb = 64, multipart_chunksize_mb = 16: files with 64 MB or more are
+      transferred in parts of 16 MB, several parts at a time, instead of a single stream.
+      The number of files, bytes, and bytes/s of the transfers are printed, and stored in the
+      attribute transfer_summary of the connector (Connectors.aws_s3_connector).
+
 
       Attention: after running this function for fetching AWS Simple Storage System (S3), 
       your 'AWS Access key ID' and your 'Secret access key' will be requested.
@@ -98,13 +110,13 @@ def mount_storage_system (source = 'aws', path_to_store_imported_s3_bucket = '',
                 else: # Create the connector
                     aws_s3_connector = AWSS3Connection(path_to_store_imported_s3_bucket, s3_bucket_name, s3_obj_prefix)
                     aws_s3_connector = aws_s3_connector.run_s3_connection_pipeline()
-                    aws_s3_connector = aws_s3_connector.fetch_s3_files_pipeline()
+                    aws_s3_connector = aws_s3_connector.fetch_s3_files_pipeline(max_workers = max_workers, skip_unchanged = skip_unchanged, multipart_threshold_mb = multipart_threshold_mb, multipart_chunksize_mb = multipart_chunksize_mb)
                     Connectors.aws_s3_connector = aws_s3_connector
         
         except: # Create the connector
             aws_s3_connector = AWSS3Connection(path_to_store_imported_s3_bucket, s3_bucket_name, s3_obj_prefix)
             aws_s3_connector = aws_s3_connector.run_s3_connection_pipeline()
-            aws_s3_connector = aws_s3_connector.fetch_s3_files_pipeline()
+            aws_s3_connector = aws_s3_connector.fetch_s3_files_pipeline(max_workers = max_workers, skip_unchanged = skip_unchanged, multipart_threshold_mb = multipart_threshold_mb, multipart_chunksize_mb = multipart_chunksize_mb)
             Connectors.aws_s3_connector = aws_s3_connector
 
     else:
@@ -157,9 +169,9 @@ def upload_to_or_download_file_from_colab (action = 'download', file_to_download
         raise InvalidInputsError("Please, select a valid action, \'download\' or \'upload\'.")
 
 
-def export_files_to_s3 (list_of_file_names_with_extensions, directory_of_notebook_workspace_storing_files_to_export = None, s3_bucket_name = None, s3_obj_prefix = None):
+def export_files_to_s3 (list_of_file_names_with_extensions, directory_of_notebook_workspace_storing_files_to_export = None, s3_bucket_name = None, s3_obj_prefix = None, max_workers = 8, skip_unchanged = True, multipart_threshold_mb = 64, multipart_chunksize_mb = 16):
     """
-    export_files_to_s3 (list_of_file_names_with_extensions, directory_of_notebook_workspace_storing_files_to_export = None, s3_bucket_name = None, s3_obj_prefix = None):
+    export_files_to_s3 (list_of_file_names_with_extensions, directory_of_notebook_workspace_storing_files_to_export = None, s3_bucket_name = None, s3_obj_prefix = None, max_workers = 8, skip_unchanged = True, multipart_threshold_mb = 64, multipart_chunksize_mb = 16):
     
     : param: list_of_file_names_with_extensions: list containing all the files to export to S3.
       Declare it as a list even if only a single file will be exported.
@@ -215,6 +227,15 @@ def export_files_to_s3 (list_of_file_names_with_extensions, directory_of_noteboo
       S3_OBJECT_FOLDER_PREFIX = "bucket_directory1/.../bucket_directoryN/my_file.ext"
       where my_file is the file's name, and ext is its extension.
 
+    : param: max_workers = 8: number of files transferred at the same time (threads).
+    : param: skip_unchanged = True: do not transfer again the files that have the same content
+      in the workspace and in the bucket (same size and ETag). So, running the function again only
+      transfers the new and the modified files.
+    : param: multipart_threshold_mb = 64, multipart_chunksize_mb = 16: files with 64 MB or more are
+      transferred in parts of 16 MB, several parts at a time, instead of a single stream.
+      The number of files, bytes, and bytes/s of the transfers are printed, and stored in the
+      attribute transfer_summary of the connector (Connectors.aws_s3_connector).
+
       Attention: after running this function for connecting with AWS Simple Storage System (S3), 
       your 'AWS Access key ID' and your 'Secret access key' will be requested.
       The 'Secret access key' will be hidden through dots, so it cannot be visualized or copied by
@@ -238,21 +259,108 @@ def export_files_to_s3 (list_of_file_names_with_extensions, directory_of_noteboo
                 # Run if there is a persistent connector  (if it is not None):
                 aws_s3_connector = Connectors.aws_s3_connector
             else:
-                aws_s3_connector = AWSS3Connection(path_to_store_imported_s3_bucket, s3_bucket_name, s3_obj_prefix)
+                aws_s3_connector = AWSS3Connection('', s3_bucket_name, s3_obj_prefix)
                 aws_s3_connector = aws_s3_connector.run_s3_connection_pipeline()
-                aws_s3_connector = aws_s3_connector.export_to_s3_pipeline(list_of_file_names_with_extensions, directory_of_notebook_workspace_storing_files_to_export)
+                aws_s3_connector = aws_s3_connector.export_to_s3_pipeline(list_of_file_names_with_extensions, directory_of_notebook_workspace_storing_files_to_export, max_workers = max_workers, skip_unchanged = skip_unchanged, multipart_threshold_mb = multipart_threshold_mb, multipart_chunksize_mb = multipart_chunksize_mb)
                 Connectors.aws_s3_connector = aws_s3_connector
             
     except: # Create the connector
-        aws_s3_connector = AWSS3Connection(path_to_store_imported_s3_bucket, s3_bucket_name, s3_obj_prefix)
+        aws_s3_connector = AWSS3Connection('', s3_bucket_name, s3_obj_prefix)
         aws_s3_connector = aws_s3_connector.run_s3_connection_pipeline()
-        aws_s3_connector = aws_s3_connector.export_to_s3_pipeline(list_of_file_names_with_extensions, directory_of_notebook_workspace_storing_files_to_export)
+        aws_s3_connector = aws_s3_connector.export_to_s3_pipeline(list_of_file_names_with_extensions, directory_of_notebook_workspace_storing_files_to_export, max_workers = max_workers, skip_unchanged = skip_unchanged, multipart_threshold_mb = multipart_threshold_mb, multipart_chunksize_mb = multipart_chunksize_mb)
         Connectors.aws_s3_connector = aws_s3_connector
     
 
-def load_pandas_dataframe (file_directory_path, file_name_with_extension, load_txt_file_with_json_format = False, how_missing_values_are_registered = None, has_header = True, decimal_separator = '.', txt_csv_col_sep = "comma", load_all_sheets_at_once = False, sheet_to_load = None, json_record_path = None, json_field_separator = "_", json_metadata_prefix_list = None):
+def read_parquet_cache (file_path, cache_key, chunksize = None):
     """
-    load_pandas_dataframe (file_directory_path, file_name_with_extension, load_txt_file_with_json_format = False, how_missing_values_are_registered = None, has_header = True, decimal_separator = '.', txt_csv_col_sep = "comma", load_all_sheets_at_once = False, sheet_to_load = None, json_record_path = None, json_field_separator = "_", json_metadata_prefix_list = None):
+    Return the dataframe cached by write_parquet_cache for the text file in file_path, or None if there
+    is no cache or if it was written for another version of the file or other reading options.
+    : param: cache_key (dict): version of the file (size and modification time) and reading options.
+    : param: chunksize (int): if not None, return an iterator of dataframes with up to chunksize rows.
+    """
+
+    import os
+    import json
+
+    cache_path = file_path + '.cache.parquet'
+    if not (os.path.isfile(cache_path)):
+        return None
+
+    try:
+        import pyarrow.parquet as pq
+
+        metadata = pq.read_schema(cache_path).metadata or {}
+        if (metadata.get(b'idsw_cache_key') != json.dumps(cache_key, sort_keys = True, default = str).encode('utf-8')):
+            return None
+        
+        # Parquet stores the column names as strings, so the original labels (e.g., the integers
+        # of a file without header) are restored from the metadata:
+        if (b'idsw_column_labels' not in metadata):
+            return None
+        
+        column_labels = json.loads(metadata[b'idsw_column_labels'])
+    
+    except Exception:
+        # No pyarrow, or an unreadable cache:
+        return None
+
+    if (chunksize is None):
+        dataset = pd.read_parquet(cache_path)
+        dataset.columns = column_labels
+        return dataset
+
+    def iterate_chunks():
+        # Same index of the chunks returned by pd.read_csv:
+        first_row = 0
+        for batch in pq.ParquetFile(cache_path).iter_batches(batch_size = chunksize):
+            chunk = batch.to_pandas()
+            chunk.columns = column_labels
+            chunk.index = pd.RangeIndex(first_row, first_row + len(chunk))
+            first_row = first_row + len(chunk)
+            yield chunk
+
+    return iterate_chunks()
+
+
+def write_parquet_cache (file_path, cache_key, dataset):
+    """
+    Save the dataframe parsed from the text file in file_path as the Parquet file '{file_path}.cache.parquet',
+    with the cache_key in its metadata, so the next loads of the same file version with the same options
+    read the columnar file instead of parsing the text again. If the cache cannot be written (e.g., a
+    read-only directory, or columns with mixed types), the dataframe is simply not cached. The column labels
+    must be strings or integers, which are restored by read_parquet_cache.
+    """
+
+    import os
+    import json
+
+    cache_path = file_path + '.cache.parquet'
+
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        column_labels = dataset.columns.tolist()
+        if not all(((type(label) == str) | (type(label) == int)) for label in column_labels):
+            raise TypeError("the column labels are not strings or integers")
+
+        table = pa.Table.from_pandas(dataset, preserve_index = False)
+        metadata = dict(table.schema.metadata or {})
+        metadata[b'idsw_cache_key'] = json.dumps(cache_key, sort_keys = True, default = str).encode('utf-8')
+        metadata[b'idsw_column_labels'] = json.dumps(column_labels).encode('utf-8')
+        # Replace the cache at once, so an interrupted write does not leave a corrupted cache:
+        pq.write_table(table.replace_schema_metadata(metadata), cache_path + '.tmp')
+        os.replace(cache_path + '.tmp', cache_path)
+    
+    except Exception as error:
+        if (os.path.exists(cache_path + '.tmp')):
+            os.remove(cache_path + '.tmp')
+        print(f"The dataset could not be cached as Parquet ({error}). The file will be parsed again in the next loads.\n")
+
+
+def load_pandas_dataframe (file_directory_path, file_name_with_extension, load_txt_file_with_json_format = False, how_missing_values_are_registered = None, has_header = True, decimal_separator = '.', txt_csv_col_sep = "comma", load_all_sheets_at_once = False, sheet_to_load = None, json_record_path = None, json_field_separator = "_", json_metadata_prefix_list = None, dtype = None, usecols = None, parse_dates = True, csv_engine = None, chunksize = None, use_parquet_cache = True):
+    """
+    load_pandas_dataframe (file_directory_path, file_name_with_extension, load_txt_file_with_json_format = False, how_missing_values_are_registered = None, has_header = True, decimal_separator = '.', txt_csv_col_sep = "comma", load_all_sheets_at_once = False, sheet_to_load = None, json_record_path = None, json_field_separator = "_", json_metadata_prefix_list = None, dtype = None, usecols = None, parse_dates = True, csv_engine = None, chunksize = None, use_parquet_cache = True):
     
     Pandas documentation:
      pd.read_csv: https://pandas.pydata.org/pandas-docs/stable/reference/api/pandas.read_csv.html
@@ -361,6 +469,31 @@ def load_pandas_dataframe (file_directory_path, file_name_with_extension, load_t
       are 'name' and 'last'.
       Then, json_record_path = 'books'
       json_metadata_prefix_list = ['name', 'last']
+
+    ## Parameters for loading txt or CSV files (not formatted as JSON):
+
+    : param: dtype: type of all the columns, or dictionary {column: type}, e.g., dtype = {'tag': 'category', 'value': 'float32'}.
+      Declaring the types avoids their inference and reduces the memory of large files.
+      It manipulates the argument 'dtype' from pd.read_csv.
+    
+    : param: usecols: list of the columns to load (names or positions). The other columns are not parsed.
+    
+    : param: parse_dates = True: argument 'parse_dates' from pd.read_csv. Declare a list of columns,
+      e.g., parse_dates = ['timestamp'], to parse them as datetimes.
+    
+    : param: csv_engine = None: parser of pd.read_csv: 'c', 'python' or 'pyarrow'. The 'pyarrow' engine parses
+      the file with several threads, but it does not support chunksize nor regex separators (such as whitespace).
+      None uses the pandas default ('c').
+    
+    : param: chunksize = None: if an integer, return an iterator of dataframes with up to chunksize rows each,
+      instead of a single dataframe, so files larger than the memory can be processed in chunks:
+      for chunk in load_pandas_dataframe(..., chunksize = 1000000): ...
+    
+    : param: use_parquet_cache = True: save the parsed dataframe as the Parquet file '{file}.cache.parquet',
+      next to the source file. The next loads of the same file with the same options read this columnar file
+      instead of parsing the text again. The cache is replaced whenever the size or modification time of the
+      source file changes, or the reading options change. Chunked loads read the cache when it is valid, but
+      do not create it.
     """
     
     import os
@@ -429,57 +562,60 @@ def load_pandas_dataframe (file_directory_path, file_name_with_extension, load_t
         
         else:
             # Not a JSON txt
-        
-            if (has_header == True):
+            read_csv_options = {'na_values': how_missing_values_are_registered, 'decimal': decimal_separator, 'parse_dates': parse_dates, 'dtype': dtype, 'usecols': usecols}
+            # parse_dates = True: try parsing the index.
 
-                if ((txt_csv_col_sep == "comma") | (txt_csv_col_sep == ",")):
+            if (has_header == False):
+                read_csv_options['header'] = None
 
-                    dataset = pd.read_csv(file_path, na_values = how_missing_values_are_registered, verbose = True, parse_dates = True, decimal = decimal_separator)
-                    # verbose = True for showing number of NA values placed in non-numeric columns.
-                    #  parse_dates = True: try parsing the index; infer_datetime_format = True : If True and parse_dates is enabled, pandas will attempt to infer the format of the datetime strings in 
-                    # the columns, and if it can be inferred, switch to a faster method of parsing them. In some cases this can increase the 
-                    # parsing speed by 5-10x.
-
-                elif ((txt_csv_col_sep == "whitespace") | (txt_csv_col_sep == " ")):
+            if ((txt_csv_col_sep == "comma") | (txt_csv_col_sep == ",")):
+                read_csv_options['sep'] = ","
+            
+            elif ((txt_csv_col_sep == "whitespace") | (txt_csv_col_sep == " ")):
+                # Any sequence of whitespaces separates the columns (equivalent to the argument
+                # delim_whitespace = True of previous pandas versions):
+                read_csv_options['sep'] = r"\s+"
+            
+            else:
+                read_csv_options['sep'] = txt_csv_col_sep
 
-                    dataset = pd.read_csv(file_path, delim_whitespace = True, na_values = how_missing_values_are_registered, verbose = True, parse_dates = True, decimal = decimal_separator)
-                    
+            if (csv_engine is not None):
+                if ((csv_engine == 'pyarrow') & (chunksize is not None)):
+                    raise InvalidInputsError("The \'pyarrow\' engine does not support chunksize. Set csv_engine = \'c\' or chunksize = None.")
+                
+                read_csv_options['engine'] = csv_engine
+
+            # The cache is valid only for the same version of the file, read with the same options:
+            use_parquet_cache = ((use_parquet_cache == True) & (os.path.isfile(file_path)))
+            cached_dataset = None
+            if (use_parquet_cache):
+                file_status = os.stat(file_path)
+                cache_key = dict(read_csv_options, source_size = file_status.st_size, source_mtime_ns = file_status.st_mtime_ns)
+                cached_dataset = read_parquet_cache(file_path, cache_key, chunksize = chunksize)
+
+                if (cached_dataset is not None):
+                    if ControlVars.show_results:
+                        print(f"The file {file_path} was not modified since it was cached. Loading the dataset from {file_path}.cache.parquet.\n")
                     
-                else:
+                    if (chunksize is not None):
+                        return cached_dataset
                     
-                    try:
-                        
-                        # Try using the character specified as the argument txt_csv_col_sep:
-                        dataset = pd.read_csv(file_path, sep = txt_csv_col_sep, na_values = how_missing_values_are_registered, verbose = True, parse_dates = True, decimal = decimal_separator)
-                    
-                    except:
-                        # An error was raised, the separator is not valid
-                        raise InvalidInputsError(f"Enter a valid column separator for the {file_extension} file, like: \'comma\' or \'whitespace\'.")
-
-
-            else:
-                # has_header == False
-
-                if ((txt_csv_col_sep == "comma") | (txt_csv_col_sep == ",")):
+                    dataset = cached_dataset
 
-                    dataset = pd.read_csv(file_path, header = None, na_values = how_missing_values_are_registered, verbose = True, parse_dates = True, decimal = decimal_separator)
+            if (cached_dataset is None):
+                try:
+                    # With chunksize, pd.read_csv returns an iterator of dataframes:
+                    dataset = pd.read_csv(file_path, chunksize = chunksize, **read_csv_options)
+                
+                except (TypeError, ValueError) as error:
+                    # An error was raised, the separator or the options are not valid
+                    raise InvalidInputsError(f"Enter a valid column separator for the {file_extension} file, like: \'comma\' or \'whitespace\', and valid reading options ({error}).")
 
-                    
-                elif ((txt_csv_col_sep == "whitespace") | (txt_csv_col_sep == " ")):
+                if (chunksize is not None):
+                    return dataset
 
-                    dataset = pd.read_csv(file_path, delim_whitespace = True, header = None, na_values = how_missing_values_are_registered, verbose = True, parse_dates = True, decimal = decimal_separator)
-                    
-                    
-                else:
-                    
-                    try:
-                        
-                        # Try using the character specified as the argument txt_csv_col_sep:
-                        dataset = pd.read_csv(file_path, sep = txt_csv_col_sep, header = None, na_values = how_missing_values_are_registered, verbose = True, parse_dates = True, decimal = decimal_separator)
-                    
-                    except:
-                        # An error was raised, the separator is not valid
-                        raise InvalidInputsError(f"Enter a valid column separator for the {file_extension} file, like: \'comma\' or \'whitespace\'.")
+                if (use_parquet_cache):
+                    write_parquet_cache(file_path, cache_key, dataset)
 
     elif (file_extension == 'json'):
         
@@ -1929,9 +2065,9 @@ def generateSensitivityAnalysis_datasets (df, simulated_variables, total_bins):
     return simulation_dfs_dict
 
 
-def get_data_from_ip21 (ip21_server, list_of_tags_to_extract = [{'tag': None, 'actual_name': None}], username = None, password = None, data_source = 'localhost', start_time = {'year': 2015, 'month': 1, 'day':1, 'hour': 0, 'minute': 0, 'second': 0}, stop_time = {'year': 2022, 'month': 4, 'day': 1, 'hour': 0, 'minute': 0, 'second': 0}, start_timedelta_unit = 'day', stop_timedelta_unit = 'day', ip21time_array = [], previous_df_for_concatenation = None):
+def get_data_from_ip21 (ip21_server, list_of_tags_to_extract = [{'tag': None, 'actual_name': None}], username = None, password = None, data_source = 'localhost', start_time = {'year': 2015, 'month': 1, 'day':1, 'hour': 0, 'minute': 0, 'second': 0}, stop_time = {'year': 2022, 'month': 4, 'day': 1, 'hour': 0, 'minute': 0, 'second': 0}, start_timedelta_unit = 'day', stop_timedelta_unit = 'day', ip21time_array = [], previous_df_for_concatenation = None, max_workers = 1, window_length = None, max_retries = 3, backoff_factor = 0.5, timeout = 120, use_ntlm = True, parquet_directory = None, incremental_store_directory = None, overlap = '1h'):
     """
-    get_data_from_ip21 (ip21_server, list_of_tags_to_extract = [{'tag': None, 'actual_name': None}], username = None, password = None, data_source = 'localhost', start_time = {'year': 2015, 'month': 1, 'day':1, 'hour': 0, 'minute': 0, 'second': 0}, stop_time = {'year': 2022, 'month': 4, 'day': 1, 'hour': 0, 'minute': 0, 'second': 0}, start_timedelta_unit = 'day', stop_timedelta_unit = 'day', ip21time_array = [], previous_df_for_concatenation = None):
+    get_data_from_ip21 (ip21_server, list_of_tags_to_extract = [{'tag': None, 'actual_name': None}], username = None, password = None, data_source = 'localhost', start_time = {'year': 2015, 'month': 1, 'day':1, 'hour': 0, 'minute': 0, 'second': 0}, stop_time = {'year': 2022, 'month': 4, 'day': 1, 'hour': 0, 'minute': 0, 'second': 0}, start_timedelta_unit = 'day', stop_timedelta_unit = 'day', ip21time_array = [], previous_df_for_concatenation = None, max_workers = 1, window_length = None, max_retries = 3, backoff_factor = 0.5, timeout = 120, use_ntlm = True, parquet_directory = None, incremental_store_directory = None, overlap = '1h'):
     
     : param: ip21_server is a string informing the server name for the IP21 REST API.
       If you check ASPEN ONE or ASPEN IP21 REST API URL, it will have a format like:
@@ -1983,120 +2119,109 @@ def get_data_from_ip21 (ip21_server, list_of_tags_to_extract = [{'tag': None, 'a
       stop_timedelta_unit = 'day' - analogous to start_timedelta_unit. Set this parameter when
       declaring stop_time as a numeric value.
     
-    : param: ip21time_array = [] - keep this parameter as an empty list or set ip21time_array = None.
-      If you want to use the method to independently convert an array, you could pass this array
-      to the constructor to convert it.
+    : param: ip21time_array = [] - DEPRECATED: it is ignored, and kept only so the positional arguments
+      of the previous versions still work. To convert an array of IP21 times, set the attribute
+      ip21time_array of an IP21Extractor and call its method convert_ip21_timescale_array_to_timestamp.
     
     : param: previous_df_for_concatenation = None: keep it None or, if you want to append the fetched data
       to a pre-existing database, declare the object containing the pandas dataframe where it will
       be appended. Example: previous_df_for_concatenation = dataset.   
+    
+    : param: max_workers = 1: maximum number of simultaneous API calls. The tags (and the parts of
+      the time window, if window_length is not None) are fetched in parallel by max_workers threads,
+      each one reusing its own HTTP session (see ConcurrentIP21Extractor). Increase it carefully, since
+      too many simultaneous calls may lead to a blockage by the server.
+    : param: window_length = None: if not None, the time window of each tag is split in parts of this
+      length (pd.Timedelta or string like '30D'), fetched in parallel.
+    : param: max_retries = 3, backoff_factor = 0.5: each API call that fails with a connection error
+      or a temporary HTTP error (429, 500, 502, 503, 504) is repeated up to max_retries times, waiting
+      backoff_factor * 2^(i - 1) seconds before the i-th retry.
+    : param: timeout = 120: maximum time (s) waiting for each API call.
+    : param: use_ntlm = True: keep True for the IP21 NTLM authentication. Set False only for servers
+      without authentication, like idsw.datafetch.mock.MockIP21Server.
+    : param: parquet_directory = None: if not None, the pages are written to Parquet files as they arrive,
+      in one subdirectory per tag ('parquet_path' key of the returned dictionaries), instead of being
+      kept in memory. Read them with pd.read_parquet(parquet_path). Requires pyarrow.
+    : param: incremental_store_directory = None: if not None, the tags are kept in a local store in this
+      directory (see IncrementalExtractionStore). Only the data after the last timestamp stored for each
+      tag (the watermark) is fetched from IP21, and the requested window is read from the store. So
+      repeating the extraction every day only downloads the new data. Requires pyarrow.
+    : param: overlap = '1h': with incremental_store_directory, the data is fetched again from
+      (watermark - overlap), so the values registered late on IP21 replace the stored ones.
+    
+    Returns a list of dictionaries, one per tag, with the keys 'tag', 'actual_name', 'dataset' (the
+    extracted dataframe, None with parquet_directory) and 'failed_windows' (windows not extracted
+    after all the retries). With incremental_store_directory, key 'rows_fetched' has the number of
+    rows downloaded from IP21.
     """
 
-    try: # try accessing the connector, if it exists
-        if (Connectors.ip21_connector):
-            if Connectors.persistent:
-                # Run if there is a persistent connector  (if it is not None):
-                ip21_connector = Connectors.ip21_connector
-            else:
-                # Create the connector
-                ip21_connector = IP21Extractor(previous_df_for_concatenation)
-                ip21_connector = ip21_connector.get_credentials(ip21_server, data_source, username, password)
-            
-    except:
-        # Create the connector
-        ip21_connector = IP21Extractor(previous_df_for_concatenation)
-        ip21_connector = ip21_connector.get_credentials(ip21_server, data_source, username, password)
-
-    
     if (start_time is None):
         start_time = 'yesterday'
     
     if (stop_time is None):
         stop_time = 'today'
     
-    # Start a support list:
-    support_list = []
+    if ((ip21time_array is not None) and (len(ip21time_array) > 0)):
+        import warnings
+        warnings.warn("ip21time_array is deprecated and ignored by get_data_from_ip21.", DeprecationWarning, stacklevel = 2)
     
-    for tag_dict in list_of_tags_to_extract:
-        # If there is a tag name, append to support_list:
-        if (tag_dict['tag'] is not None):
-            support_list.append(tag_dict)
+    try: # try accessing the connector, if it exists
+        ip21_connector = Connectors.ip21_connector
+        # Only reuse a persistent connector with the same configuration. Credentials set to None
+        # reuse the ones of the connector, which are not requested again:
+        same_credentials = (((username is None) or (str(username).strip() == ip21_connector.username)) and ((password is None) or (str(password).strip() == ip21_connector.password)))
+        if ((not Connectors.persistent) | (ip21_connector.server != ip21_server) | (ip21_connector.data_source != data_source) | (ip21_connector.use_ntlm != use_ntlm) | (not same_credentials)):
+            ip21_connector = None
     
-    # Now, make support_list the list_of_tags_to_extract itself>
-    list_of_tags_to_extract = support_list
-    # Only non-empty dictionaries remained
+    except AttributeError:
+        ip21_connector = None
     
-    api_call_number = 1
-    # Start a list for storing the valid dataframes returned:
-    returned_dfs_list = []
+    if (ip21_connector is None):
+        # Create the connector
+        ip21_connector = ConcurrentIP21Extractor(ip21_server, data_source = data_source, username = username, password = password, max_workers = max_workers, max_retries = max_retries, backoff_factor = backoff_factor, timeout = timeout, use_ntlm = use_ntlm)
+    
+    else:
+        ip21_connector.max_workers = max_workers
+        ip21_connector.max_retries = max_retries
+        ip21_connector.backoff_factor = backoff_factor
+        ip21_connector.timeout = timeout
     
-    # Loop through the list of tags:
-    for tag_dict in list_of_tags_to_extract:
+    if (incremental_store_directory is not None):
         
-        tag_to_extract = tag_dict['tag']
-        actual_tag_name = tag_dict['actual_name']
-
-        ip21_connector = ip21_connector.set_query_parameters(tag_to_extract, actual_tag_name, start_time, stop_time, ip21time_array)
-        # Define the extracted time window:
-        ip21_connector = ip21_connector.set_extracted_time_window(start_timedelta_unit = start_timedelta_unit, stop_timedelta_unit = stop_timedelta_unit)
+        if ((parquet_directory is not None) or (previous_df_for_concatenation is not None)):
+            raise InvalidInputsError("parquet_directory and previous_df_for_concatenation cannot be used with incremental_store_directory.")
         
-        while (extractor.need_next_call == True):
+        store = IncrementalExtractionStore(incremental_store_directory, overlap = overlap)
+        returned_dfs_list = ip21_connector.extract_incremental(list_of_tags_to_extract, store, start_time = start_time, stop_time = stop_time, start_timedelta_unit = start_timedelta_unit, stop_timedelta_unit = stop_timedelta_unit, window_length = window_length)
+    
+    else:
+        returned_dfs_list = ip21_connector.extract(list_of_tags_to_extract, start_time = start_time, stop_time = stop_time, start_timedelta_unit = start_timedelta_unit, stop_timedelta_unit = stop_timedelta_unit, window_length = window_length, previous_df_for_concatenation = previous_df_for_concatenation, parquet_directory = parquet_directory)
+    
+    if ControlVars.show_results: 
+        for returned_data in returned_dfs_list:
+            if (returned_data['dataset'] is None):
+                continue
             
-            try:
-                print(f"API call {api_call_number}: fetching IP21 timestamps from {ip21_connector.start_ip21_scale} to {ip21_connector.stop_ip21_scale}.\n")
-                # Get Rest API URL:
-                ip21_connector = ip21_connector.get_rest_api_url()
-                # Fetch the Database:
-                ip21_connector = ip21_connector.fetch_database(request_type = 'get')
-                # Retrieve Pandas dataframe:
-                ip21_connector = ip21_connector.retrieve_pd_dataframe()
-                
-                # Go to the next call number:
+            print(f"Check the the dataframe returned from tag {returned_data['tag']} ('{returned_data['actual_name']}'):\n")
             
-            except:
-                print(f"Failed API call {api_call_number} with IP21 timestamps from {ip21_connector.start_ip21_scale} to {ip21_connector.stop_ip21_scale}.")
-                print("Returning the last valid dataframe extracted.\n")
-                # Force the modification of the attribute with vars function:
-                vars(ip21_connector)['need_next_call'] = False
-        
-            # Get the dataset:
-            extracted_df = ip21_connector.dataset
-
-            # Get a dictionary with the returned information:
-            returned_data = tag_dict
-            returned_data['dataset'] = extracted_df
-            
-            if ControlVars.show_results: 
-                if (actual_tag_name is not None):
-                    print(f"Check the the dataframe returned from tag {tag_to_extract} ('{actual_tag_name}') on API call {api_call_number}:\n")
-                
-                else:
-                    print(f"Check the the dataframe returned from tag {tag_to_extract} on API call {api_call_number}:\n")
-                
-                try:
-                    # only works in Jupyter Notebook:
-                    from IPython.display import display
-                    display(extracted_df)
-
-                except: # regular mode
-                    print(extracted_df)
+            try:
+                # only works in Jupyter Notebook:
+                from IPython.display import display
+                display(returned_data['dataset'])
             
-            api_call_number = api_call_number + 1
-        
-        # Save the last version of the dataset and go to next tag to query.
-        # For that, append the dictionary to returned_dfs_list:
-        returned_dfs_list.append(returned_data)
+            except: # regular mode
+                print(returned_data['dataset'])
     
-    # At this level, all tags were saved (finished 'for' loop)
+    # Store the connector, so the credentials are not requested again:
     Connectors.ip21_connector = ip21_connector
-
+    
     # Return all queried tags. If a single query was queried, there is only one dictionary in the list.
     return returned_dfs_list
 
 
-def manipulate_sqlite_db (file_path, table_name, action = 'fetch_table', pre_created_engine = None, df = None):
+def manipulate_sqlite_db (file_path, table_name, action = 'fetch_table', pre_created_engine = None, df = None, if_exists = 'replace', key_columns = None, index_columns = None, start_timestamp = None, stop_timestamp = None, timestamp_column = 'timestamp', columns = None):
     """
-    manipulate_sqlite_db (file_path, table_name, action = 'fetch_table', pre_created_engine = None, df = None)
+    manipulate_sqlite_db (file_path, table_name, action = 'fetch_table', pre_created_engine = None, df = None, if_exists = 'replace', key_columns = None, index_columns = None, start_timestamp = None, stop_timestamp = None, timestamp_column = 'timestamp', columns = None)
 
     : param: file_path: full path of the SQLite file. It may start with './' or '/', but with no more than 2 slashes.
       It is a string: input in quotes. Example: file_path = '/my_db.db'
@@ -2111,6 +2236,15 @@ def manipulate_sqlite_db (file_path, table_name, action = 'fetch_table', pre_cre
 
     : param: df = None - if a table is going to be updated, input here the new Pandas dataframe (object) correspondent to the table.
       Example: df = dataset.
+    
+    : param: if_exists = 'replace' - with action = 'update_table', 'replace' rewrites the table with df; 'append'
+      adds the rows of df to the table; 'upsert' replaces the rows with the same key_columns and adds the others.
+    : param: key_columns = None - list of columns identifying each row (e.g. ['timestamp', 'tag']), required by 'upsert'.
+    : param: index_columns = None - columns to index. If None, the key columns and the timestamp columns are indexed.
+    
+    : param: start_timestamp = None, stop_timestamp = None - with action = 'fetch_table', read only the rows with
+      timestamp_column (default 'timestamp') in this window, instead of the full table.
+    : param: columns = None - with action = 'fetch_table', list of columns to read (None reads all the columns).
     """
 
     
@@ -2130,14 +2264,14 @@ def manipulate_sqlite_db (file_path, table_name, action = 'fetch_table', pre_cre
 
     if (action == 'fetch_table'):
 
-            df, engine = sqlite_connector.fetch_table(table_name)
+            df, engine = sqlite_connector.fetch_table(table_name, start_timestamp = start_timestamp, stop_timestamp = stop_timestamp, timestamp_column = timestamp_column, columns = columns)
             Connectors.sqlite_connector = sqlite_connector
             
             return df, engine
         
     elif (action == 'update_table'):
 
-            df, engine = sqlite_connector.update_or_create_table(table_name)
+            df, engine = sqlite_connector.update_or_create_table(table_name, df = df, if_exists = if_exists, key_columns = key_columns, index_columns = index_columns)
             Connectors.sqlite_connector = sqlite_connector
 
             return df, engine
@@ -2155,7 +2289,9 @@ def bigquery_pipeline(project = '', dataset = '', already_authenticated = True,
                         old_value = None,
                         updated_value = None, comparative_column = None, value_to_search = None, 
                         string_column = '', str_or_substring_to_search = '',
-                        view_id = ''
+                        view_id = '',
+                        corrections = None, key_columns = None, update_columns = None, delete_column = None,
+                        staging_table = None
                         ):
     """
     Pipeline for fetching or updating data stored on Google Cloud Platform (GCP).
@@ -2207,6 +2343,13 @@ def bigquery_pipeline(project = '', dataset = '', already_authenticated = True,
             Notice that 'column', 'table', 'value_to_search', 'updated_value' or 'comparative_column' cannot be empty 
             strings or None objects for using this action.
         
+        - 'apply_batch_corrections': apply all the corrections in the dataframe 'corrections' to the table declared
+            in parameter 'table' with a single MERGE: the rows identified by 'key_columns' have the columns 
+            'update_columns' updated, or are deleted when the column 'delete_column' of the correction is True.
+            It runs 2 jobs (load of the staging table and MERGE) instead of one DML job per corrected value.
+            Notice that 'table', 'corrections' or 'key_columns' cannot be empty strings or None objects for
+            using this action.
+
         - 'create_new_view': given an ID defined as 'view_id', create a new view with this ID if it does not exists.
             The view is created following the instructions passed as 'query'.
             A view is a dynamic query that is automatically updated when data is modified or added. In SAP system,
@@ -2295,6 +2438,15 @@ def bigquery_pipeline(project = '', dataset = '', already_authenticated = True,
         column 'string_column'. When it is find, the value on 'column' will be updated.
 
     : param: view_id (str): The ID of the view to be created. If no ID is provided, a table is created
+
+    : param: corrections (pd.DataFrame): one row per correction, with the key columns and the new values.
+    : param: key_columns (list): columns that identify the rows to correct.
+    : param: update_columns: list of columns updated with the column of the same name in corrections, or
+        dictionary {column of table: column of corrections}. If None, all the columns of corrections that
+        are not key columns nor delete_column are updated.
+    : param: delete_column (str): boolean column of corrections indicating the rows to delete.
+    : param: staging_table (str): table that receives the corrections before the MERGE. If None, it is
+        '{table}_corrections_staging_{random suffix}'.
     """
     
     try: # try accessing the connector, if it exists
@@ -2357,6 +2509,11 @@ def bigquery_pipeline(project = '', dataset = '', already_authenticated = True,
         Connectors.gcp_connector = gcp_connector
         return df_table
     
+    elif (action == 'apply_batch_corrections'):
+        gcp_connector = gcp_connector.apply_batch_corrections(table, corrections, key_columns, update_columns, delete_column, staging_table)
+        Connectors.gcp_connector = gcp_connector
+        return gcp_connector
+    
     elif (action == 'create_new_view'):
         df = gcp_connector.create_new_view(view_id, query, show_table, export_csv, saving_directory_path)
         return df
@@ -2367,10 +2524,16 @@ def sqlserver_pipeline (server,
                   username = '', 
                   password = '',
                   system = 'windows',
+                  action = 'connect',
                   show_schema = True, export_csv = False, saving_directory_path = "",
                   query = '', show_table = True,
                   table = '',
-                  tag = '', variable_name = None,   
+                  tag = '', variable_name = None,
+                  start_timestamp = None, stop_timestamp = None,
+                  incremental_store_directory = None, overlap = '1h',
+                  chunksize = 100000, chunk_function = None,
+                  pre_created_engine = None,
+                  list_of_tags_to_extract = None, max_tags_per_query = 1000
                   ):
     """
     Pipeline for fetching or updating data stored on Microsoft SQL Server.
@@ -2399,11 +2562,23 @@ def sqlserver_pipeline (server,
 
         - 'get_full_table': run a query to return the full content from a table declared in parameter 'table'
             Notice that 'table' cannot be an empty string or None object for using this action.
+        
+        - 'stream_sql_query': returns a generator of dataframes with up to 'chunksize' rows of the result
+            of 'query' (or of the full 'table', if 'query' is empty), for results too large for the memory.
+        
+        - 'export_query_to_parquet': write the result of 'query' (or the full 'table', if 'query' is empty)
+            to the Parquet file in 'saving_directory_path', in chunks of 'chunksize' rows. Returns a dictionary
+            with the rows exported and the throughput. Requires pyarrow.
 
         - 'query_specific_tag_ip21sqlserver': if the IP21 plant information system (PIMS) is stored on SQL Server,
             use this action to query only a specific tag (variable or attribute). Notice that the parameter 'tag'
             cannot be empty string or None object for using this action. The parameter 'variable_name' is optional
             and can be used to modify the tag to a name of variable easier to understand.
+        
+        - 'query_multiple_tags_ip21sqlserver': batched version of 'query_specific_tag_ip21sqlserver', for the tags
+            in 'list_of_tags_to_extract'. The tags are queried together in a single query (up to 'max_tags_per_query'
+            tags per query), in the window from 'start_timestamp' to 'stop_timestamp', and returned as a wide
+            dataframe indexed by timestamp, with one column per tag.
     
     : param: show_schema (bool): if True, the schema of the tables on the SQL Server will be shown.
     : param: show_table (bool): keep as True to print the queried table, set False to hide it.
@@ -2417,6 +2592,25 @@ def sqlserver_pipeline (server,
     : param: variable_name (str): string containing a more readable name for the tag, that will be also shown.
         e.g. variable_name = 'Temperature in C'
     
+    : param: start_timestamp, stop_timestamp: time window of action 'query_specific_tag_ip21sqlserver'.
+        If None, all the values of the tag are queried.
+    : param: incremental_store_directory (str): if not None, the tag queried by action 'query_specific_tag_ip21sqlserver'
+        is kept in a local store in this directory (see IncrementalExtractionStore), and only the values after the
+        last timestamp stored (the watermark) are queried. The window is read from the store and returned.
+        Without start_timestamp, the first query takes all the values of the tag; without stop_timestamp,
+        the window ends now. Requires pyarrow.
+    : param: overlap: with incremental_store_directory, the values are queried again from (watermark - overlap),
+        so the values registered late replace the stored ones.
+    
+    : param: chunksize (int): maximum number of rows of each chunk of actions 'stream_sql_query' and 'export_query_to_parquet'.
+    : param: chunk_function: optional function applied to each chunk by action 'export_query_to_parquet' before writing it.
+    : param: pre_created_engine: if not None, the queries run on this SQLAlchemy engine or DBAPI connection,
+        instead of a new pyodbc connection (see SQLServerConnection).
+    
+    : param: list_of_tags_to_extract: list of dictionaries with keys 'tag' and 'actual_name', as in get_data_from_ip21,
+        for action 'query_multiple_tags_ip21sqlserver'. e.g. [{'tag': 'ABC00AA101-01', 'actual_name': 'temperature'}]
+    : param: max_tags_per_query (int): maximum number of tags in each query of action 'query_multiple_tags_ip21sqlserver'.
+    
     """
     
 
@@ -2427,11 +2621,11 @@ def sqlserver_pipeline (server,
                 sqlserver_connector = Connectors.sqlserver_connector
             else:
                 # Create the connector
-                sqlserver_connector = SQLServerConnection(server, database, username, password, system)
+                sqlserver_connector = SQLServerConnection(server, database, username, password, system, pre_created_engine)
             
     except:
         # Create the connector
-        sqlserver_connector = SQLServerConnection(server, database, username, password, system)
+        sqlserver_connector = SQLServerConnection(server, database, username, password, system, pre_created_engine)
     
 
     if (action == 'connect'):
@@ -2453,8 +2647,66 @@ def sqlserver_pipeline (server,
         Connectors.sqlserver_connector = sqlserver_connector
         return sqlserver_connector
     
+    elif (action == 'query_multiple_tags_ip21sqlserver'):
+        
+        if (list_of_tags_to_extract is None):
+            raise InvalidInputsError("Declare the list_of_tags_to_extract for action 'query_multiple_tags_ip21sqlserver'.")
+        
+        tags_df = sqlserver_connector.query_multiple_tags_ip21sqlserver(list_of_tags_to_extract, start_timestamp = start_timestamp, stop_timestamp = stop_timestamp, max_tags_per_query = max_tags_per_query, show_table = show_table, export_csv = export_csv, saving_directory_path = saving_directory_path)
+        Connectors.sqlserver_connector = sqlserver_connector
+        
+        return tags_df
+    
+    elif (action in ['stream_sql_query', 'export_query_to_parquet']):
+        
+        if ((query is None) or (query == '')):
+            if ((table is None) or (table == '')):
+                raise InvalidInputsError(f"Declare a query or a table for action '{action}'.")
+            query = "SELECT * FROM " + str(table)
+        
+        Connectors.sqlserver_connector = sqlserver_connector
+        
+        if (action == 'stream_sql_query'):
+            return sqlserver_connector.stream_sql_query(query, chunksize = chunksize)
+        
+        if ((saving_directory_path is None) or (saving_directory_path == '')):
+            saving_directory_path = "query.parquet"
+        
+        return sqlserver_connector.export_query_to_parquet(query, saving_directory_path, chunksize = chunksize, chunk_function = chunk_function)
+    
+    elif ((action == 'query_specific_tag_ip21sqlserver') and (incremental_store_directory is not None)):
+        
+        store = IncrementalExtractionStore(incremental_store_directory, overlap = overlap)
+        # Lowest timestamp of the IP21 timescale:
+        start_timestamp = pd.Timestamp(start_timestamp) if (start_timestamp is not None) else pd.Timestamp('1960-01-01')
+        stop_timestamp = pd.Timestamp(stop_timestamp) if (stop_timestamp is not None) else pd.Timestamp.now()
+        
+        def fetch_tag (fetch_start, fetch_stop):
+            return sqlserver_connector.query_specific_tag_ip21sqlserver(tag, variable_name, show_table = False, start_timestamp = fetch_start, stop_timestamp = fetch_stop)
+        
+        tag_df = store.refresh(tag, fetch_tag, start_timestamp, stop_timestamp)
+        
+        if ControlVars.show_results:
+            print(f"Served {store.refresh_summary[tag]['rows_served']} rows of tag {tag} from the local store, after querying {store.refresh_summary[tag]['rows_fetched']} new rows.\n")
+            if ((show_table) and (tag_df is not None)):
+                try:
+                    from IPython.display import display
+                    display(tag_df)
+                    
+                except:
+                    print(tag_df)
+        
+        if ((export_csv) and (tag_df is not None)):
+            if ((saving_directory_path is None) or (saving_directory_path == '')):
+                saving_directory_path = f"{tag}.csv"
+            
+            tag_df.to_csv(saving_directory_path)
+        
+        Connectors.sqlserver_connector = sqlserver_connector
+        return tag_df
+    
     elif (action == 'query_specific_tag_ip21sqlserver'):
-        sqlserver_connector = sqlserver_connector.query_specific_tag_ip21sqlserver(tag, variable_name, show_table, export_csv, saving_directory_path)
+        sqlserver_connector = sqlserver_connector.query_specific_tag_ip21sqlserver(tag, variable_name, show_table, export_csv, saving_directory_path, start_timestamp, stop_timestamp)
         Connectors.sqlserver_connector = sqlserver_connector
         return sqlserver_connector
     
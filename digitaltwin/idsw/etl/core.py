@@ -17,7 +17,7 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 
-from steelindustrysimulator.digitaltwin.idsw import (InvalidInputsError, ControlVars)
+from .. import (InvalidInputsError, ControlVars)
 from .utils import (EncodeDecode, mode_retrieval)
   
 
@@ -3,7 +3,7 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 
-from steelindustrysimulator.digitaltwin.idsw import (InvalidInputsError, ControlVars)
+from .. import (InvalidInputsError, ControlVars)
 
 
 def get_frequency_features (df, timestamp_tag_column, important_frequencies = [{'value': 1, 'unit': 'day'}, {'value':1, 'unit': 'year'}], x_axis_rotation = 70, y_axis_rotation = 0, grid = True, horizontal_axis_title = None, vertical_axis_title = None, plot_title = None, max_number_of_entries_to_plot = None, export_png = False, directory_to_save = None, file_name = None, png_resolution_dpi = 330):
@@ -30,7 +30,8 @@ def get_frequency_features (df, timestamp_tag_column, important_frequencies = [{
     DATASET = df.copy(deep = True)
     
     # Guarantee that the timestamp column has a datetime object, and not a string
-    DATASET[timestamp_tag_column] = DATASET[timestamp_tag_column].astype('datetime64[ns]')
+    # (time zone aware timestamps keep their time zone):
+    DATASET[timestamp_tag_column] = pd.to_datetime(DATASET[timestamp_tag_column])
     
     # Return POSIX timestamp as float
     # https://pandas.pydata.org/pandas-docs/stable/reference/api/pandas.Timestamp.html
@@ -39,7 +40,14 @@ def get_frequency_features (df, timestamp_tag_column, important_frequencies = [{
     # Pandas Timestamp.timestamp() function return the time expressed as the number of seconds that have passed.
     # https://www.geeksforgeeks.org/python-pandas-timestamp-timestamp/
     # since January 1, 1970. That zero moment is known as the epoch.
-    timestamp_s = DATASET[timestamp_tag_column].map(pd.Timestamp.timestamp)
+    # Vectorized: nanoseconds since the epoch (int64), converted to seconds, without one
+    # Python call per timestamp. Missing timestamps (NaT) result in NaN.
+    # Time zone aware timestamps are converted to UTC, as Timestamp.timestamp() does:
+    timestamps = DATASET[timestamp_tag_column]
+    if (timestamps.dt.tz is not None):
+        timestamps = timestamps.dt.tz_convert('UTC').dt.tz_localize(None)
+    timestamp_ns = timestamps.astype('datetime64[ns]').astype('int64')
+    timestamp_s = (timestamp_ns / 10**9).where(DATASET[timestamp_tag_column].notna())
     # the time in seconds is not a useful model input. 
     # It may have daily and yearly periodicity, for instance. 
     # To deal with periodicity, you can get usable signals by using sine and cosine transforms 
@@ -1,3 +1,4 @@
+import os
 import numpy as np
 import pandas as pd
 import tensorflow as tf
@@ -7,14 +8,31 @@ from .idsw.datafetch.pipes import import_export_model_list_dict
 from .idsw.modelling.preparetensors import separate_and_prepare_features_and_responses
 from .idsw.modelling.utils import make_model_predictions
 
-from .utils import (random_noise, correct_vals_out_of_bounds)
+from .utils import (random_noise, correct_vals_out_of_bounds, get_data_directory)
+from .profiling import profile_stage
 
 
-def load_models():
+# Standard scaling parameters of the response, obtained when training the encoder-decoder model:
+RESPONSE_SCALING_PARAMS = {
+  'usage_kwh': {'mu': 27.386892408675802, 'sigma': 31.352646806775816}
+}
+
+# Features of the encoder-decoder model, in the order of the input tensor (rows, 21, 1):
+MODEL_FEATURES_COLUMNS = ['lagging_current_reactive_power_kvarh_scaled',
+        'leading_current_reactive_power_kvarh_scaled', 'co2_tco2_scaled',
+        'weekstatus', 'day_of_week', 'load_type_Light_Load_OneHotEnc',
+        'load_type_Maximum_Load_OneHotEnc', 'load_type_Medium_Load_OneHotEnc',
+        'freq1_sin', 'freq1_cos', 'freq2_sin', 'freq2_cos', 'freq3_sin',
+        'freq3_cos', 'freq4_sin', 'freq4_cos', 'freq5_sin', 'freq5_cos',
+        'freq6_sin', 'freq6_cos', 'electric_cluster']
+
+
+def load_models(directory_path = None):
   """Load K-Means clustering and the TensorFlow encoder-decoder model.
-  Warning: this function will only work if the sequence of commands in the function
-  start_simulation() (__init__ module) properly run, assuring that the directories are
-  saved in the correct path.
+
+  : param: directory_path (str): directory containing kmeans_model.pkl and the subdirectory
+    encoder_decoder_tf_model/saved_model. If None, it is obtained from get_data_directory
+    (environment variable DIGITALTWIN_DATA_DIR or the 'data' directory of this package).
 
   Since Colab may impose user restrictions regarding to move or copy files, we could have
   problems on the step of decompressing the model. Thus, we copy the TensorFlow module
@@ -37,11 +55,13 @@ def load_models():
   shutil.copytree(src, dst)
   """
   
+  directory_path = get_data_directory(directory_path)
+
   # Shared variables
   ACTION = 'import'
   OBJECTS_MANIPULATED = 'model_only'
   DICTIONARY_OR_LIST_FILE_NAME = None
-  DIRECTORY_PATH = 'steelindustrysimulator/digitaltwin/data'
+  DIRECTORY_PATH = directory_path
   DICTIONARY_OR_LIST_FILE_NAME = None
   DICT_OR_LIST_TO_EXPORT = None
   MODEL_TO_EXPORT = None 
@@ -53,7 +73,7 @@ def load_models():
   kmeans_model = import_export_model_list_dict (action = ACTION, objects_manipulated = OBJECTS_MANIPULATED, model_file_name = MODEL_FILE_NAME, dictionary_or_list_file_name = DICTIONARY_OR_LIST_FILE_NAME, directory_path = DIRECTORY_PATH, model_type = MODEL_TYPE, dict_or_list_to_export = DICT_OR_LIST_TO_EXPORT, model_to_export = MODEL_TO_EXPORT, use_colab_memory = USE_COLAB_MEMORY) 
 
   # Deep learning encoder-decoder model:
-  model_path = "steelindustrysimulator/digitaltwin/data/encoder_decoder_tf_model/saved_model"
+  model_path = os.path.join(directory_path, "encoder_decoder_tf_model", "saved_model")
   encoder_decoder_tf_model = tf.keras.models.load_model(model_path)
   print(f"Keras/TensorFlow model successfully imported from {model_path}.")
 
@@ -102,13 +122,7 @@ def get_tensor_for_simulation(dataset):
   DATASET = dataset
   DATASET['dummy_response'] = 0
 
-  FEATURES_COLUMNS = ['lagging_current_reactive_power_kvarh_scaled',
-        'leading_current_reactive_power_kvarh_scaled', 'co2_tco2_scaled',
-        'weekstatus', 'day_of_week', 'load_type_Light_Load_OneHotEnc',
-        'load_type_Maximum_Load_OneHotEnc', 'load_type_Medium_Load_OneHotEnc',
-        'freq1_sin', 'freq1_cos', 'freq2_sin', 'freq2_cos', 'freq3_sin',
-        'freq3_cos', 'freq4_sin', 'freq4_cos', 'freq5_sin', 'freq5_cos',
-        'freq6_sin', 'freq6_cos', 'electric_cluster']
+  FEATURES_COLUMNS = MODEL_FEATURES_COLUMNS
   
   RESPONSE_COLUMNS = 'dummy_response'
   # For clustering, any variable can be input as response. Since we still do not have the
@@ -151,7 +165,9 @@ def rescale_response(predicted_values):
     'scaler_details': {'mu': 27.386892408675802, 'sigma': 31.352646806775816}}}
   """
 
-  usage_kwh_arr = (np.array(predicted_values))*(31.352646806775816) + (27.386892408675802)
+  mu = RESPONSE_SCALING_PARAMS['usage_kwh']['mu']
+  sigma = RESPONSE_SCALING_PARAMS['usage_kwh']['sigma']
+  usage_kwh_arr = (np.array(predicted_values))*(sigma) + (mu)
 
   return usage_kwh_arr
 
@@ -163,10 +179,13 @@ def prediction_pipeline(encoder_decoder_tf_model, model_df, df):
   ControlVars.show_results = False
   ControlVars.show_plots = False
 
-  X, RESPONSE_COLUMNS = get_tensor_for_simulation(model_df)
-  model_df = get_model_predictions(encoder_decoder_tf_model, X, RESPONSE_COLUMNS, model_df)
-  scaled_predictions = model_df['usage_kwh_scaled']
-  model_predictions = rescale_response(scaled_predictions)
+  with profile_stage('get_tensor_for_simulation', rows = len(model_df)):
+    X, RESPONSE_COLUMNS = get_tensor_for_simulation(model_df)
+  with profile_stage('tensorflow_predict', rows = len(model_df)):
+    model_df = get_model_predictions(encoder_decoder_tf_model, X, RESPONSE_COLUMNS, model_df)
+  with profile_stage('rescale_response', rows = len(model_df)):
+    scaled_predictions = model_df['usage_kwh_scaled']
+    model_predictions = rescale_response(scaled_predictions)
   # Add the predictions to the correct dataset:
   df['usage_kwh'] = model_predictions
 
@@ -0,0 +1,276 @@
+import os
+import json
+import time
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from collections import deque
+from dataclasses import (dataclass, field, asdict)
+import numpy as np
+import pandas as pd
+
+
+@dataclass
+class ProfilingVars:
+  """
+    Store the state of the opt-in profiling as Global variables.
+    While enabled = False (default), profile_stage and profile_simulation do nothing,
+    so the simulation pipeline runs without any overhead.
+  """
+  enabled = False
+  track_memory = False
+  # Finished simulation records (the oldest ones are discarded after max_records):
+  records = deque(maxlen = 1000)
+  # Counter used for identifying the records:
+  record_counter = 0
+  # Reference instant for the Chrome trace timestamps:
+  origin = time.perf_counter()
+
+
+@dataclass
+class StageRecord:
+  """Measurements of one stage of a simulation."""
+  stage: str
+  depth: int
+  start_s: float # since ProfilingVars.origin
+  wall_time_s: float = 0.0
+  cpu_time_s: float = 0.0
+  # Increase of the memory allocated by Python (tracemalloc) at the peak of the stage. None if not tracked.
+  peak_memory_bytes: int = None
+  rows: int = None
+  thread_id: int = 0
+
+
+@dataclass
+class SimulationProfile:
+  """Structured record with all the stages measured during one simulation."""
+  record_id: int
+  name: str
+  start_s: float
+  wall_time_s: float = 0.0
+  stages: list = field(default_factory = list)
+
+  def to_dict(self):
+    return asdict(self)
+
+  def to_dataframe(self):
+    """Return the stages as a dataframe, one row per stage."""
+    return pd.DataFrame([asdict(stage) for stage in self.stages])
+
+
+# Stack of active stages and current simulation record are kept per thread (the CPU time and
+# memory counters are not, see profile_stage):
+_local = threading.local()
+
+
+def enable_profiling(track_memory = True, max_records = 1000):
+  """Start recording the stages of the simulations.
+  : param: track_memory (bool): if True, tracemalloc is started for measuring the peak memory
+    of each stage. It makes the Python allocations slower, so disable it for measuring time only.
+  : param: max_records (int): maximum number of simulation records kept in memory.
+  """
+
+  ProfilingVars.enabled = True
+  ProfilingVars.track_memory = track_memory
+  ProfilingVars.records = deque(ProfilingVars.records, maxlen = max_records)
+
+  if (track_memory) and (not tracemalloc.is_tracing()):
+    tracemalloc.start()
+
+
+def disable_profiling():
+  """Stop recording the stages. The records already obtained are kept."""
+
+  ProfilingVars.enabled = False
+
+  if (ProfilingVars.track_memory) and (tracemalloc.is_tracing()):
+    tracemalloc.stop()
+
+  ProfilingVars.track_memory = False
+
+
+def reset_profiling():
+  """Remove all the records obtained so far."""
+
+  ProfilingVars.records.clear()
+  ProfilingVars.record_counter = 0
+  ProfilingVars.origin = time.perf_counter()
+
+
+def get_stack():
+  if not hasattr(_local, 'stack'):
+    _local.stack = []
+    _local.simulation = None
+
+  return _local.stack
+
+
+@contextmanager
+def profile_simulation(name = None):
+  """Group all the stages that run inside this context in a single SimulationProfile.
+  : param: name (str): identifier of the simulation in the records.
+  """
+
+  if ((not ProfilingVars.enabled) | (getattr(_local, 'simulation', None) is not None)):
+    # Profiling disabled, or nested simulation: stages are added to the current record.
+    yield None
+    return
+
+  get_stack()
+  ProfilingVars.record_counter = ProfilingVars.record_counter + 1
+  start = time.perf_counter()
+  simulation = SimulationProfile(record_id = ProfilingVars.record_counter, name = (name if name is not None else f"simulation_{ProfilingVars.record_counter}"), start_s = (start - ProfilingVars.origin))
+  _local.simulation = simulation
+
+  try:
+    yield simulation
+
+  finally:
+    simulation.wall_time_s = time.perf_counter() - start
+    _local.simulation = None
+    ProfilingVars.records.append(simulation)
+
+
+def start_stage(stage, rows = None):
+  """Start measuring a stage of the pipeline (see profile_stage). Returns the frame that must be
+  passed to end_stage, or None when the profiling is disabled.
+  If no simulation is being profiled (profile_simulation), a record named after the stage is
+  created, so the pipeline functions can be profiled when called directly.
+  """
+
+  if not ProfilingVars.enabled:
+    return None
+
+  stack = get_stack()
+  owns_simulation = False
+
+  if _local.simulation is None:
+    # Open a record for this stage only:
+    ProfilingVars.record_counter = ProfilingVars.record_counter + 1
+    _local.simulation = SimulationProfile(record_id = ProfilingVars.record_counter, name = stage, start_s = (time.perf_counter() - ProfilingVars.origin))
+    owns_simulation = True
+
+  track_memory = (ProfilingVars.track_memory) & (tracemalloc.is_tracing())
+  start = time.perf_counter()
+  record = StageRecord(stage = stage, depth = len(stack), start_s = (start - ProfilingVars.origin), rows = rows, thread_id = threading.get_ident())
+  frame = {'record': record, 'start': start, 'cpu_start': 0.0, 'track_memory': track_memory,
+          'children_peak': 0, 'memory_at_start': 0, 'owns_simulation': owns_simulation}
+
+  if (track_memory):
+    current, peak = tracemalloc.get_traced_memory()
+    if (len(stack) > 0):
+      # Keep the peak reached by the parent before this stage, since it is reset now:
+      stack[-1]['children_peak'] = max(stack[-1]['children_peak'], peak)
+    tracemalloc.reset_peak()
+    frame['memory_at_start'] = current
+
+  stack.append(frame)
+  frame['cpu_start'] = time.process_time()
+
+  return frame
+
+
+def end_stage(frame):
+  """Finish the stage started by start_stage, storing its StageRecord in the current simulation."""
+
+  if frame is None:
+    return
+
+  record = frame['record']
+  record.cpu_time_s = time.process_time() - frame['cpu_start']
+  record.wall_time_s = time.perf_counter() - frame['start']
+  stack = get_stack()
+  stack.pop()
+
+  if (frame['track_memory']):
+    current, peak = tracemalloc.get_traced_memory()
+    peak = max(peak, frame['children_peak'])
+    record.peak_memory_bytes = int(peak - frame['memory_at_start'])
+    if (len(stack) > 0):
+      stack[-1]['children_peak'] = max(stack[-1]['children_peak'], peak)
+
+  _local.simulation.stages.append(record)
+
+  if (frame['owns_simulation']):
+    _local.simulation.wall_time_s = record.wall_time_s
+    ProfilingVars.records.append(_local.simulation)
+    _local.simulation = None
+
+
+@contextmanager
+def profile_stage(stage, rows = None):
+  """Measure wall time, CPU time, peak memory and rows of a stage of the pipeline.
+  : param: stage (str): name of the stage.
+  : param: rows (int): number of rows processed. It can also be updated inside the context,
+    through the attribute rows of the yielded StageRecord (None when profiling is disabled).
+  Only the stack of stages and the current record are thread-local: time.process_time and the
+  tracemalloc peak (reset by tracemalloc.reset_peak) are process-wide, so when several threads
+  are simulating at the same time, the CPU time and peak memory of a stage include the work of
+  the other threads, and one thread may reset the peak measured by another.
+  """
+
+  frame = start_stage(stage, rows = rows)
+
+  try:
+    yield (frame['record'] if frame is not None else None)
+
+  finally:
+    end_stage(frame)
+
+
+def get_profiling_records():
+  """Return the list of SimulationProfile records, from the oldest to the newest."""
+
+  return list(ProfilingVars.records)
+
+
+def profiling_summary(percentiles = (50, 95)):
+  """Aggregate all the records kept in memory, returning one row per stage with the number
+  of calls and the percentiles of wall time, CPU time, peak memory and rows.
+  : param: percentiles (tuple): percentiles to calculate (default: p50 and p95).
+  """
+
+  stages = [asdict(stage) for simulation in ProfilingVars.records for stage in simulation.stages]
+  if (len(stages) == 0):
+    return pd.DataFrame()
+
+  stages_df = pd.DataFrame(stages)
+  summary = []
+
+  for stage, stage_df in stages_df.groupby('stage', sort = False):
+    row = {'stage': stage, 'depth': int(stage_df['depth'].min()), 'calls': len(stage_df)}
+
+    for column in ['wall_time_s', 'cpu_time_s', 'peak_memory_bytes', 'rows']:
+      values = pd.to_numeric(stage_df[column], errors = 'coerce').dropna()
+      for percentile in percentiles:
+        row[f"{column}_p{percentile}"] = np.percentile(values, percentile) if (len(values) > 0) else np.nan
+
+    summary.append(row)
+
+  return pd.DataFrame(summary)
+
+
+def export_chrome_trace(file_path):
+  """Save the records as a Chrome trace (JSON) file, which can be opened in chrome://tracing
+  or in https://ui.perfetto.dev. Each simulation and each stage is a complete ('X') event.
+  : param: file_path (str): path of the JSON file.
+  """
+
+  pid = os.getpid()
+  events = []
+
+  for simulation in ProfilingVars.records:
+    events.append({'name': simulation.name, 'cat': 'simulation', 'ph': 'X', 'pid': pid,
+                  'tid': (simulation.stages[0].thread_id if (len(simulation.stages) > 0) else 0),
+                  'ts': simulation.start_s*1e6, 'dur': simulation.wall_time_s*1e6,
+                  'args': {'record_id': simulation.record_id}})
+
+    for stage in simulation.stages:
+      events.append({'name': stage.stage, 'cat': 'stage', 'ph': 'X', 'pid': pid, 'tid': stage.thread_id,
+                    'ts': stage.start_s*1e6, 'dur': stage.wall_time_s*1e6,
+                    'args': {'cpu_time_s': stage.cpu_time_s, 'peak_memory_bytes': stage.peak_memory_bytes, 'rows': stage.rows}})
+
+  with open(file_path, 'w') as file:
+    json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, file)
+
+  return file_path
@@ -0,0 +1,127 @@
+import time
+import threading
+from contextlib import contextmanager
+from dataclasses import (dataclass, asdict)
+
+
+class SimulationCancelled(Exception):
+  """Raised inside a background task when it is cancelled (see background.BackgroundTask.cancel)."""
+  pass
+
+
+@dataclass
+class ProgressEvent:
+  """Progress of a background task, passed to the progress callbacks."""
+  task: str
+  stage: str
+  rows_done: int = 0
+  # None while the total is not known:
+  rows_total: int = None
+  elapsed_s: float = 0.0
+  # Estimated time to finish, extrapolated from the rows processed so far:
+  eta_s: float = None
+  fraction: float = None
+  done: bool = False
+
+  def to_dict(self):
+    return asdict(self)
+
+
+class ProgressReporter:
+  """Receive the progress reported by the simulation stages of one task, and forward it to a callback.
+
+  The pipeline functions call report_progress, which does nothing unless a reporter is active in
+  the current thread (see reporting). So the synchronous functions run without any overhead.
+  """
+
+  def __init__(self, task, callback = None, min_interval_s = 0.2):
+    """
+    : param: task (str): name of the task, stored in each ProgressEvent.
+    : param: callback: function called with a ProgressEvent. It runs in the thread of the task.
+    : param: min_interval_s (float): minimum interval between two calls of the callback for the
+      same stage. The first event of each stage and the final event are always sent.
+    """
+
+    self.task = task
+    self.callback = callback
+    self.min_interval_s = min_interval_s
+    self.cancel_event = threading.Event()
+    self.start_time = None
+    self.last_sent = 0.0
+    self.rows_total = None
+    self.latest = ProgressEvent(task = task, stage = 'queued')
+
+
+  def start(self):
+    self.start_time = time.perf_counter()
+
+
+  def check_cancelled(self):
+    """Raise SimulationCancelled if the task was cancelled."""
+
+    if self.cancel_event.is_set():
+      raise SimulationCancelled(f"Task '{self.task}' was cancelled.")
+
+
+  def report(self, stage, rows_done = None, rows_total = None, done = False):
+    """Update the progress and call the callback."""
+
+    now = time.perf_counter()
+    if self.start_time is None:
+      self.start_time = now
+
+    if rows_total is not None:
+      self.rows_total = int(rows_total)
+    if rows_done is None:
+      rows_done = self.latest.rows_done
+
+    elapsed = now - self.start_time
+    fraction, eta = None, None
+    if ((self.rows_total is not None) and (self.rows_total > 0)):
+      fraction = min(rows_done/self.rows_total, 1.0)
+      if (done):
+        fraction, eta = 1.0, 0.0
+      elif (rows_done > 0):
+        eta = elapsed*(self.rows_total - rows_done)/rows_done
+
+    new_stage = (stage != self.latest.stage)
+    self.latest = ProgressEvent(task = self.task, stage = stage, rows_done = int(rows_done), rows_total = self.rows_total, elapsed_s = elapsed, eta_s = eta, fraction = fraction, done = done)
+
+    if ((self.callback is not None) and ((new_stage) or (done) or ((now - self.last_sent) >= self.min_interval_s))):
+      self.last_sent = now
+      self.callback(self.latest)
+
+
+# Reporter of the task running in each thread:
+_local = threading.local()
+
+
+@contextmanager
+def reporting(reporter):
+  """Make reporter receive the progress reported in the current thread."""
+
+  previous = getattr(_local, 'reporter', None)
+  _local.reporter = reporter
+  reporter.start()
+
+  try:
+    yield reporter
+
+  finally:
+    _local.reporter = previous
+
+
+def report_progress(stage, rows_done = None, rows_total = None):
+  """Report the progress of the current stage, if a background task is running in this thread.
+  It is also the cancellation point: raises SimulationCancelled if the task was cancelled.
+  : param: stage (str): name of the stage.
+  : param: rows_done (int): rows processed so far. If None, the previous value is kept.
+  : param: rows_total (int): total rows of the task, when known.
+  """
+
+  reporter = getattr(_local, 'reporter', None)
+  if reporter is None:
+    return
+
+  reporter.check_cancelled()
+  reporter.report(stage, rows_done = rows_done, rows_total = rows_total)
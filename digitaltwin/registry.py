@@ -0,0 +1,287 @@
+import os
+import json
+import pickle
+import shutil
+import hashlib
+from datetime import datetime
+import pandas as pd
+
+from .idsw import (InvalidInputsError, ControlVars)
+
+from .core import (GlobalVars, start_global_vars, set_active_models)
+from .models import (load_models, MODEL_FEATURES_COLUMNS, RESPONSE_SCALING_PARAMS)
+from .transformvariables import FEATURE_SCALING_PARAMS
+from .clustering import CLUSTERING_FEATURES_COLUMNS
+from .utils import get_data_directory
+
+
+# Each version has the same layout of the data directory, so it can be read by models.load_models:
+KMEANS_FILE_NAME = 'kmeans_model.pkl'
+SAVED_MODEL_PATH = os.path.join('encoder_decoder_tf_model', 'saved_model')
+METADATA_FILE_NAME = 'metadata.json'
+ENCODER_DECODER_INPUT_SHAPE = [len(MODEL_FEATURES_COLUMNS), 1]
+
+
+def get_registry_directory(registry_path = None, directory_path = None):
+  """Return the directory of the model registry.
+  : param: registry_path (str): if not None, it is returned.
+  : param: directory_path (str): data directory (see utils.get_data_directory). The default
+    registry is its subdirectory 'registry'. If None, GlobalVars.directory_path is used, so all the
+    functions of this module read and write the same default registry.
+  """
+
+  if registry_path is not None:
+    return registry_path
+
+  if directory_path is None:
+    directory_path = GlobalVars.directory_path
+
+  return os.path.join(get_data_directory(directory_path), 'registry')
+
+
+def get_feature_schema(kmeans_model = None):
+  """Features and tensor shape expected by the models, stored in the metadata of each version."""
+
+  schema = {'model_features': list(MODEL_FEATURES_COLUMNS),
+            'input_shape': ENCODER_DECODER_INPUT_SHAPE,
+            'clustering_features': list(CLUSTERING_FEATURES_COLUMNS)}
+
+  if kmeans_model is not None:
+    schema['n_clusters'] = int(len(kmeans_model.cluster_centers_))
+
+  return schema
+
+
+def calculate_checksum(version_path):
+  """SHA-256 of all the files of a version (relative paths and contents), except the metadata."""
+
+  checksum = hashlib.sha256()
+  relative_paths = []
+  for root, directories, files in os.walk(version_path):
+    for file_name in files:
+      relative_paths.append(os.path.relpath(os.path.join(root, file_name), version_path))
+
+  for relative_path in sorted(relative_paths):
+    if (relative_path == METADATA_FILE_NAME):
+      continue
+    checksum.update(relative_path.replace(os.sep, '/').encode('utf-8'))
+    with open(os.path.join(version_path, relative_path), 'rb') as file:
+      for block in iter(lambda: file.read(1024*1024), b''):
+        checksum.update(block)
+
+  return checksum.hexdigest()
+
+
+def read_metadata(version_path):
+  """Read the metadata.json of a version."""
+
+  metadata_path = os.path.join(version_path, METADATA_FILE_NAME)
+  if not os.path.isfile(metadata_path):
+    raise InvalidInputsError(f"There is no registered model version in {version_path}.")
+
+  with open(metadata_path, 'r') as file:
+    return json.load(file)
+
+
+def list_model_versions(registry_path = None):
+  """Return a dataframe with one row per registered version, from the oldest to the newest.
+  Column 'active' indicates the version used by the simulator (GlobalVars.model_version)."""
+
+  registry_path = get_registry_directory(registry_path)
+  columns = ['version', 'created_at', 'description', 'source', 'checksum', 'size_bytes', 'active']
+
+  rows = []
+  if os.path.isdir(registry_path):
+    for version_name in os.listdir(registry_path):
+      version_path = os.path.join(registry_path, version_name)
+      if not os.path.isfile(os.path.join(version_path, METADATA_FILE_NAME)):
+        # Temporary directories of versions being registered are ignored:
+        continue
+      metadata = read_metadata(version_path)
+      rows.append({'version': metadata['version'],
+                  'created_at': metadata['created_at'],
+                  'description': metadata['description'],
+                  'source': metadata['source'],
+                  'checksum': metadata['checksum'],
+                  'size_bytes': sum(metadata['files'].values()),
+                  'active': (metadata['version'] == GlobalVars.model_version)})
+
+  versions_df = pd.DataFrame(rows, columns = columns)
+  versions_df = versions_df.sort_values(by = ['created_at', 'version']).reset_index(drop = True)
+
+  return versions_df
+
+
+def resolve_version_name(version_name = 'latest', registry_path = None):
+  """Return the name of a registered version. 'latest' is the most recently registered one."""
+
+  if (version_name != 'latest'):
+    return version_name
+
+  versions_df = list_model_versions(registry_path)
+  if (len(versions_df) == 0):
+    raise InvalidInputsError(f"There are no model versions registered in {get_registry_directory(registry_path)}.")
+
+  return versions_df['version'].iloc[-1]
+
+
+def register_model_version(version_name = None, kmeans_model = None, encoder_decoder_tf_model = None, source_directory = None, saved_model_path = None, registry_path = None, description = '', metrics = None):
+  """Register a new immutable version of the models.
+
+  The version directory has kmeans_model.pkl, encoder_decoder_tf_model/saved_model and
+  metadata.json with the feature schema, the scaling constants of the pipeline and the SHA-256
+  checksum of the files. It is written to a temporary directory and renamed at the end, so an
+  interrupted process never leaves an incomplete version.
+
+  : param: version_name (str): name of the version. If None, 'v<number>' is used.
+  : param: kmeans_model, encoder_decoder_tf_model: models to register. If None, they are copied
+    from source_directory.
+  : param: source_directory (str): data directory with kmeans_model.pkl and
+    encoder_decoder_tf_model/saved_model (see utils.get_data_directory).
+  : param: saved_model_path (str): SavedModel of the encoder-decoder to copy instead of the one from
+    source_directory, e.g., the 'saved_model' of a version from finetuning.save_finetuned_model.
+  : param: description (str): free text stored in the metadata.
+  : param: metrics (dict): metrics of the models (e.g., the report from finetuning), stored in the metadata.
+  : param: registry_path (str): directory of the model registry. If None, the default registry is
+    used (see get_registry_directory), whatever the source_directory.
+
+  Returns the metadata of the new version.
+  """
+
+  registry_path = get_registry_directory(registry_path)
+  os.makedirs(registry_path, exist_ok = True)
+
+  if version_name is None:
+    versions = [int(name[1:]) for name in os.listdir(registry_path) if ((name.startswith('v')) and (name[1:].isdigit()))]
+    version_name = f"v{(max(versions) + 1) if (len(versions) > 0) else 1:04d}"
+
+  if ((version_name == 'latest') | (version_name.startswith('.')) | (os.path.basename(version_name) != version_name)):
+    raise InvalidInputsError(f"'{version_name}' is not a valid version name.")
+
+  version_path = os.path.join(registry_path, version_name)
+  if os.path.exists(version_path):
+    raise InvalidInputsError(f"Version '{version_name}' is already registered. Registered versions cannot be replaced.")
+
+  source_directory = get_data_directory(source_directory)
+  temporary_path = os.path.join(registry_path, f".{version_name}.tmp{os.getpid()}")
+  os.makedirs(temporary_path)
+
+  try:
+    if kmeans_model is not None:
+      with open(os.path.join(temporary_path, KMEANS_FILE_NAME), 'wb') as file:
+        pickle.dump(kmeans_model, file)
+    else:
+      shutil.copy2(os.path.join(source_directory, KMEANS_FILE_NAME), os.path.join(temporary_path, KMEANS_FILE_NAME))
+      with open(os.path.join(temporary_path, KMEANS_FILE_NAME), 'rb') as file:
+        kmeans_model = pickle.load(file)
+
+    if encoder_decoder_tf_model is not None:
+      encoder_decoder_tf_model.save(os.path.join(temporary_path, SAVED_MODEL_PATH))
+      source = 'in-memory model'
+    else:
+      if saved_model_path is None:
+        saved_model_path = os.path.join(source_directory, SAVED_MODEL_PATH)
+      shutil.copytree(saved_model_path, os.path.join(temporary_path, SAVED_MODEL_PATH))
+      source = os.path.abspath(saved_model_path)
+
+    files = {}
+    for root, directories, file_names in os.walk(temporary_path):
+      for file_name in file_names:
+        file_path = os.path.join(root, file_name)
+        files[os.path.relpath(file_path, temporary_path).replace(os.sep, '/')] = os.path.getsize(file_path)
+
+    metadata = {'version': version_name,
+                'created_at': datetime.now().isoformat(),
+                'description': description,
+                'source': source,
+                'checksum': calculate_checksum(temporary_path),
+                'files': files,
+                'feature_schema': get_feature_schema(kmeans_model),
+                'scaling_params': {'features': FEATURE_SCALING_PARAMS, 'response': RESPONSE_SCALING_PARAMS},
+                'metrics': metrics}
+
+    with open(os.path.join(temporary_path, METADATA_FILE_NAME), 'w') as file:
+      json.dump(metadata, file, indent = 2, default = str)
+
+    os.rename(temporary_path, version_path)
+
+  except BaseException:
+    shutil.rmtree(temporary_path, ignore_errors = True)
+    raise
+
+  if ControlVars.show_results:
+    print(f"Models registered as version '{version_name}' in {version_path}.")
+
+  return metadata
+
+
+def verify_model_version(version_name = 'latest', registry_path = None):
+  """Check a registered version. Raises InvalidInputsError if its files do not match the checksum,
+  or if its feature schema or scaling constants differ from the ones used by the simulation pipeline
+  (the pipeline would silently produce wrong predictions with them). Returns the metadata."""
+
+  version_name = resolve_version_name(version_name, registry_path)
+  version_path = os.path.join(get_registry_directory(registry_path), version_name)
+  metadata = read_metadata(version_path)
+
+  if (calculate_checksum(version_path) != metadata['checksum']):
+    raise InvalidInputsError(f"The files of model version '{version_name}' do not match its checksum. The version may be corrupted.")
+
+  feature_schema = get_feature_schema()
+  for key, value in feature_schema.items():
+    if (metadata['feature_schema'].get(key) != value):
+      raise InvalidInputsError(f"Model version '{version_name}' expects {key} = {metadata['feature_schema'].get(key)}, but the simulation pipeline uses {value}.")
+
+  # Compare through JSON, as stored in the metadata:
+  scaling_params = json.loads(json.dumps({'features': FEATURE_SCALING_PARAMS, 'response': RESPONSE_SCALING_PARAMS}))
+  if (metadata['scaling_params'] != scaling_params):
+    raise InvalidInputsError(f"The scaling constants of model version '{version_name}' differ from the ones used by the simulation pipeline.")
+
+  return metadata
+
+
+def load_model_version(version_name = 'latest', registry_path = None, verify = True):
+  """Load the models of a registered version.
+  : param: version_name (str): name of the version, or 'latest'.
+  : param: verify (bool): if True, verify_model_version is run before loading.
+  Returns a tuple (kmeans_model, encoder_decoder_tf_model, metadata).
+  """
+
+  version_name = resolve_version_name(version_name, registry_path)
+  version_path = os.path.join(get_registry_directory(registry_path), version_name)
+
+  if (verify):
+    metadata = verify_model_version(version_name, registry_path)
+  else:
+    metadata = read_metadata(version_path)
+
+  kmeans_model, encoder_decoder_tf_model = load_models(version_path)
+
+  return kmeans_model, encoder_decoder_tf_model, metadata
+
+
+def activate_model_version(version_name = 'latest', registry_path = None, verify = True):
+  """Hot-swap the models used by the simulator to a registered version, without restarting it.
+
+  The new models are loaded while the current ones keep serving simulations. Then, the models and
+  the version name are replaced at once (core.set_active_models). Each simulation reads the models
+  once, when it starts (core.get_active_models), so the simulations already running finish with the
+  previous version, and the next ones use the new version. If the simulator was not started yet, it
+  is started with this version.
+
+  Returns the metadata of the activated version.
+  """
+
+  version_name = resolve_version_name(version_name, registry_path)
+
+  if GlobalVars.df is None:
+    start_global_vars(model_version = version_name, registry_path = registry_path)
+    return read_metadata(os.path.join(get_registry_directory(registry_path), version_name))
+
+  kmeans_model, encoder_decoder_tf_model, metadata = load_model_version(version_name, registry_path = registry_path, verify = verify)
+  previous_version = set_active_models(kmeans_model, encoder_decoder_tf_model, model_version = version_name)
+
+  if ControlVars.show_results:
+    print(f"Simulator models swapped from version '{previous_version}' to '{version_name}'.")
+
+  return metadata
@@ -0,0 +1,222 @@
+import time
+import numpy as np
+import pandas as pd
+
+from .idsw import (InvalidInputsError, ControlVars)
+
+from .batch import simulate_batch
+from .utils import (create_dayofweek_weekstatus, calculate_nsm, calculate_leading_current_power_factor, obtain_simulation_df)
+
+
+# Continuous inputs, varied uniformly over possible_ranges:
+CONTINUOUS_FACTORS = ['lagging_current_reactive_power_kvarh', 'leading_current_reactive_power_kvarh',
+                      'co2_tco2', 'lagging_current_power_factor']
+LOAD_TYPES = ['Light_Load', 'Medium_Load', 'Maximum_Load']
+
+
+def get_factors(include_calendar = True):
+  """Factors of the sensitivity analysis: the 4 continuous inputs, the load type and,
+  optionally, the timestamp (calendar features)."""
+
+  factors = CONTINUOUS_FACTORS + ['load_type']
+  if (include_calendar):
+    factors = factors + ['timestamp']
+
+  return factors
+
+
+def saltelli_sample(total_factors, base_samples, random_state = None):
+  """Generate the Saltelli sample matrix in the unit hypercube, without Python loops over the rows.
+
+  Two independent matrices A and B (base_samples x total_factors) are taken from a scrambled
+  Sobol sequence with 2*total_factors dimensions. For each factor i, the matrix AB_i is A with
+  the column i from B. The returned array has base_samples*(total_factors + 2) rows, stacked as
+  [A, B, AB_1, ..., AB_k].
+
+  : param: base_samples (int): rows of A and B. Since the Sobol sequence is balanced for powers
+    of 2, it is rounded up to the next power of 2.
+  """
+
+  from scipy.stats import qmc
+
+  base_samples = int(2**np.ceil(np.log2(max(base_samples, 2))))
+  sobol_sequence = qmc.Sobol(d = (2*total_factors), scramble = True, seed = random_state)
+  AB = sobol_sequence.random_base2(m = int(np.log2(base_samples)))
+  A, B = AB[:, :total_factors], AB[:, total_factors:]
+
+  # AB_i = A with column i from B, for all i at once, with shape (total_factors, base_samples, total_factors):
+  A_B = np.repeat(A[np.newaxis, :, :], total_factors, axis = 0)
+  A_B[np.arange(total_factors), :, np.arange(total_factors)] = B.T
+
+  return np.concatenate([A, B, A_B.reshape(-1, total_factors)])
+
+
+def unit_sample_to_simulation_df(unit_sample, factors, possible_ranges, calendar_start = '2024-01-01', calendar_days = 366):
+  """Map rows from the unit hypercube to simulation inputs.
+  - continuous factors: min + u*(max - min), with min and max from possible_ranges;
+  - load_type: Light, Medium or Maximum load, each one in one third of [0, 1);
+  - timestamp: hour of a calendar window of {calendar_days} days from calendar_start. If it is
+    not a factor, all rows use calendar_start.
+  The leading current power factor is calculated from the leading current reactive power by the
+  linear correlation, without the random noise, so the variance comes only from the factors.
+  """
+
+  total_rows = len(unit_sample)
+  columns = {factor: unit_sample[:, index] for index, factor in enumerate(factors)}
+
+  values = {}
+  for factor in CONTINUOUS_FACTORS:
+    values[factor] = possible_ranges[factor]['min'] + columns[factor]*(possible_ranges[factor]['max'] - possible_ranges[factor]['min'])
+
+  load_type_index = np.minimum((columns['load_type']*len(LOAD_TYPES)).astype(np.int64), (len(LOAD_TYPES) - 1))
+  load_type = np.array(LOAD_TYPES, dtype = object)[load_type_index]
+
+  if 'timestamp' in columns:
+    hours = np.minimum((columns['timestamp']*calendar_days*24).astype(np.int64), (calendar_days*24 - 1))
+  else:
+    hours = np.zeros(total_rows, dtype = np.int64)
+
+  timestamps = (pd.Timestamp(calendar_start) + pd.to_timedelta(hours, unit = 'h')).to_numpy()
+  day_of_week, weekstatus = create_dayofweek_weekstatus(timestamps)
+  nsm = calculate_nsm(calendar_start, timestamps)
+
+  sim_df = obtain_simulation_df(timestamps, values['lagging_current_reactive_power_kvarh'], values['leading_current_reactive_power_kvarh'], values['co2_tco2'], values['lagging_current_power_factor'], nsm, weekstatus, day_of_week, load_type)
+  sim_df['leading_current_power_factor'] = calculate_leading_current_power_factor(values['leading_current_reactive_power_kvarh'], possible_ranges, add_noise = False)
+
+  return sim_df
+
+
+def evaluate_sample(unit_sample, factors, possible_ranges, kmeans_model, encoder_decoder_tf_model, chunk_size = 50000, calendar_start = '2024-01-01', calendar_days = 366):
+  """Evaluate usage_kwh for each row of the unit sample with the batched engine
+  (batch.simulate_batch), {chunk_size} rows at a time, so the memory does not grow with the
+  sample size.
+  : param: encoder_decoder_tf_model: full model from load_models, or a surrogate.SurrogateModel.
+  """
+
+  responses = np.empty(len(unit_sample), dtype = np.float64)
+
+  for start in range(0, len(unit_sample), chunk_size):
+    sim_df = unit_sample_to_simulation_df(unit_sample[start:(start + chunk_size)], factors, possible_ranges, calendar_start = calendar_start, calendar_days = calendar_days)
+    results = simulate_batch([('sensitivity', sim_df)], possible_ranges, kmeans_model, encoder_decoder_tf_model, full_precision = True)
+    responses[start:(start + len(sim_df))] = np.array(results['usage_kwh'], dtype = np.float64)
+
+  return responses
+
+
+def sobol_indices(responses, total_factors, bootstrap_resamples = 100, confidence_level = 0.95, random_state = None):
+  """Calculate first-order and total Sobol indices from the responses to a Saltelli sample.
+
+  With f_A, f_B and f_AB_i the responses for the rows of A, B and AB_i (see saltelli_sample),
+  and V the variance of [f_A, f_B]:
+    first-order (Saltelli, 2010): S1_i = mean(f_B*(f_AB_i - f_A))/V
+    total (Jansen, 1999): ST_i = mean((f_A - f_AB_i)^2)/(2*V)
+
+  The confidence intervals are the percentiles of the indices recalculated for
+  {bootstrap_resamples} resamples (with replacement) of the base rows.
+
+  Returns a dictionary of arrays (one value per factor): S1, S1_conf_low, S1_conf_high,
+  ST, ST_conf_low, ST_conf_high.
+  """
+
+  responses = np.array(responses, dtype = np.float64)
+  base_samples = len(responses)//(total_factors + 2)
+
+  if (base_samples*(total_factors + 2) != len(responses)):
+    raise InvalidInputsError(f"The number of responses must be a multiple of total_factors + 2 = {total_factors + 2}.")
+
+  f_A = responses[:base_samples]
+  f_B = responses[base_samples:(2*base_samples)]
+  f_AB = responses[(2*base_samples):].reshape(total_factors, base_samples)
+
+  def calculate(f_A, f_B, f_AB):
+    # f_A and f_B with shape (..., base_samples); f_AB with shape (total_factors, ..., base_samples)
+    variance = np.concatenate([f_A, f_B], axis = -1).var(axis = -1)
+    first_order = (f_B*(f_AB - f_A)).mean(axis = -1)/variance
+    total = ((f_A - f_AB)**2).mean(axis = -1)/(2*variance)
+    return first_order, total
+
+  first_order, total = calculate(f_A, f_B, f_AB)
+
+  indices = {'S1': first_order, 'ST': total}
+
+  if (bootstrap_resamples > 0):
+    random_generator = np.random.default_rng(random_state)
+    # Resampled base rows, with shape (bootstrap_resamples, base_samples):
+    resampled = random_generator.integers(0, base_samples, size = (bootstrap_resamples, base_samples))
+    # Resample each factor at a time, limiting the memory to (bootstrap_resamples x base_samples):
+    bootstrap_first_order = np.empty((total_factors, bootstrap_resamples))
+    bootstrap_total = np.empty((total_factors, bootstrap_resamples))
+    f_A_resampled, f_B_resampled = f_A[resampled], f_B[resampled]
+    for i in range(total_factors):
+      bootstrap_first_order[i], bootstrap_total[i] = calculate(f_A_resampled, f_B_resampled, f_AB[i][resampled])
+
+    alpha = 100*(1 - confidence_level)/2
+    indices['S1_conf_low'], indices['S1_conf_high'] = np.percentile(bootstrap_first_order, [alpha, (100 - alpha)], axis = 1)
+    indices['ST_conf_low'], indices['ST_conf_high'] = np.percentile(bootstrap_total, [alpha, (100 - alpha)], axis = 1)
+
+  return indices
+
+
+def run_sensitivity_analysis(possible_ranges, kmeans_model, encoder_decoder_tf_model, base_samples = 8192, include_calendar = True, calendar_start = '2024-01-01', calendar_days = 366, chunk_size = 50000, bootstrap_resamples = 100, confidence_level = 0.95, random_state = None):
+  """Variance-based global sensitivity analysis (Sobol indices) of the usage_kwh simulated by the twin.
+
+  Unlike idsw.datafetch.pipes.generateSensitivityAnalysis_datasets, which varies one variable at a
+  time with the others at their mean values, all the factors vary at once, so the total indices also
+  account for the interactions between them.
+
+  : param: possible_ranges (dict): allowed ranges for each variable, from load_df_and_ranges.
+  : param: kmeans_model, encoder_decoder_tf_model: models from load_models. encoder_decoder_tf_model
+    may also be a surrogate.SurrogateModel, for large samples.
+  : param: base_samples (int): rows of the matrices A and B (rounded up to a power of 2). The model
+    is evaluated base_samples*(total_factors + 2) times: for 6 factors, base_samples = 131072
+    gives about 10^6 evaluations.
+  : param: include_calendar (bool): if True, the timestamp is a factor, sampled over {calendar_days}
+    days from calendar_start. If False, all evaluations use calendar_start.
+  : param: chunk_size (int): rows evaluated at once by the batched engine.
+  : param: bootstrap_resamples (int): resamples for the confidence intervals (0 for no intervals).
+  : param: confidence_level (float): level of the bootstrap confidence intervals.
+  : param: random_state (int): seed of the Sobol sequence scrambling and of the bootstrap.
+
+  Returns a tuple (indices_df, summary): indices_df has one row per factor with the first-order (S1)
+  and total (ST) indices and their confidence intervals; summary is a dictionary with the number of
+  evaluations, the times and the throughput.
+  """
+
+  if not (0 < confidence_level < 1):
+    raise InvalidInputsError("confidence_level must be between 0 and 1.")
+
+  factors = get_factors(include_calendar = include_calendar)
+
+  start_time = time.perf_counter()
+  unit_sample = saltelli_sample(len(factors), base_samples, random_state = random_state)
+  sampling_time = time.perf_counter() - start_time
+
+  show_results = ControlVars.show_results
+  start_time = time.perf_counter()
+  responses = evaluate_sample(unit_sample, factors, possible_ranges, kmeans_model, encoder_decoder_tf_model, chunk_size = chunk_size, calendar_start = calendar_start, calendar_days = calendar_days)
+  evaluation_time = time.perf_counter() - start_time
+  # simulation_pipeline sets show_results = True at the end:
+  ControlVars.show_results = show_results
+
+  start_time = time.perf_counter()
+  indices = sobol_indices(responses, len(factors), bootstrap_resamples = bootstrap_resamples, confidence_level = confidence_level, random_state = random_state)
+  indices_time = time.perf_counter() - start_time
+
+  indices_df = pd.DataFrame(dict({'factor': factors}, **indices))
+  # Rank the factors by the total index:
+  indices_df = indices_df.sort_values(by = 'ST', ascending = False).reset_index(drop = True)
+
+  summary = {'factors': factors,
+            'base_samples': len(unit_sample)//(len(factors) + 2),
+            'evaluations': len(unit_sample),
+            'response_mean_kwh': float(responses.mean()),
+            'response_variance_kwh2': float(responses.var()),
+            'sampling_time_s': sampling_time,
+            'evaluation_time_s': evaluation_time,
+            'indices_time_s': indices_time,
+            'evaluations_per_s': len(unit_sample)/evaluation_time}
+
+  if ControlVars.show_results:
+    print(f"Sobol indices obtained from {summary['evaluations']} evaluations in {evaluation_time:.1f} s ({summary['evaluations_per_s']:.0f} evaluations/s).")
+
+  return indices_df, summary
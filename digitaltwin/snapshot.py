@@ -0,0 +1,214 @@
+import os
+import pickle
+import shutil
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+
+from .idsw import (InvalidInputsError, ControlVars)
+
+from .core import (GlobalVars, start_global_vars, set_active_models)
+from .models import RESPONSE_SCALING_PARAMS
+from .transformvariables import FEATURE_SCALING_PARAMS
+from .registry import (KMEANS_FILE_NAME, SAVED_MODEL_PATH, calculate_checksum, get_registry_directory, resolve_version_name)
+from .utils import (get_cache_directory, get_data_directory, calculate_file_hash)
+
+
+# Number of features and time steps of the tensors consumed by the encoder-decoder model:
+ENCODER_DECODER_INPUT_SHAPE = (21, 1)
+
+# Attributes from GlobalVars with the default scenario, stored in the snapshot:
+DEFAULT_SCENARIO_ATTRIBUTES = ['start_date', 'total_days', 'total_hours', 'timestamps',
+                              'total_entries', 'day_of_week', 'weekstatus', 'nsm',
+                              'lagging_current_reactive_power', 'leading_current_reactive_power',
+                              'co2_tco2', 'lagging_current_power_factor', 'load_type', 'sim_df',
+                              'sim_time_step']
+
+
+class CentroidClusterer:
+  """K-Means cluster model restored from its centroids.
+
+  It assigns each electric state to the nearest centroid (Euclidean distance), exactly as
+  the predict method from sklearn.cluster.KMeans, but it does not require unpickling the
+  Scikit-learn model.
+  """
+
+  def __init__(self, cluster_centers):
+
+    self.cluster_centers_ = np.array(cluster_centers, dtype = np.float64)
+    self.n_clusters = len(self.cluster_centers_)
+
+
+  def predict(self, X):
+
+    X = np.array(X, dtype = np.float64)
+    # Squared distances between each row and each centroid, with shape (rows, clusters):
+    distances = ((X[:, np.newaxis, :] - self.cluster_centers_[np.newaxis, :, :])**2).sum(axis = 2)
+
+    return np.argmin(distances, axis = 1).astype(np.int32)
+
+
+class InferenceModel:
+  """Encoder-decoder model restored from the compiled inference artifact saved by save_snapshot.
+
+  The artifact is a TensorFlow SavedModel with a single concrete function (graph), so loading
+  it does not deserialize the Keras layers nor trace the model again. The predict method has
+  the same output format as the Keras model.
+  """
+
+  def __init__(self, saved_model_path):
+
+    self.saved_model_path = saved_model_path
+    self.loaded_module = tf.saved_model.load(saved_model_path)
+
+
+  def predict(self, X):
+
+    X = tf.cast(X, tf.float32)
+
+    return self.loaded_module.serve(X).numpy()
+
+
+def save_inference_artifact(encoder_decoder_tf_model, saved_model_path):
+  """Trace the encoder-decoder model once, for any number of rows, and save the graph as a SavedModel.
+  : param: encoder_decoder_tf_model: Keras model from models.load_models.
+  : param: saved_model_path (str): directory where the SavedModel is saved.
+  """
+
+  module = tf.Module()
+  module.model = encoder_decoder_tf_model
+  module.serve = tf.function(lambda X: module.model(X, training = False),
+                            input_signature = [tf.TensorSpec(shape = ((None,) + ENCODER_DECODER_INPUT_SHAPE), dtype = tf.float32)])
+
+  tf.saved_model.save(module, saved_model_path)
+
+
+def get_source_fingerprint(directory_path, model_version, registry_path = None):
+  """Checksums of the sources the simulator is started from, used for detecting stale snapshots:
+  raw_data_by_hour.csv, the models (kmeans_model.pkl and the SavedModel of directory_path or, for a
+  registered version, all its files) and the scaling constants of the pipeline.
+  : param: directory_path (str): data directory (see utils.get_data_directory).
+  : param: model_version (str): GlobalVars.model_version ('unregistered' for the models of directory_path).
+  : param: registry_path (str): directory of the model registry (see registry.get_registry_directory).
+  """
+
+  directory_path = get_data_directory(directory_path)
+
+  if (model_version == 'unregistered'):
+    models_checksum = calculate_file_hash(os.path.join(directory_path, KMEANS_FILE_NAME)) + calculate_checksum(os.path.join(directory_path, SAVED_MODEL_PATH))
+  else:
+    version_path = os.path.join(get_registry_directory(registry_path, directory_path), model_version)
+    models_checksum = (calculate_checksum(version_path) if os.path.isdir(version_path) else None)
+
+  return {'model_version': model_version,
+          'models': models_checksum,
+          'raw_data': calculate_file_hash(os.path.join(directory_path, 'raw_data_by_hour.csv')),
+          'scaling_params': {'features': FEATURE_SCALING_PARAMS, 'response': RESPONSE_SCALING_PARAMS}}
+
+
+def get_snapshot_directory(snapshot_path = None):
+  """Return the directory of the snapshot. If snapshot_path is None, the subdirectory
+  'snapshot' from the cache directory is used (see utils.get_cache_directory)."""
+
+  if snapshot_path is None:
+    snapshot_path = os.path.join(get_cache_directory(), 'snapshot')
+
+  return snapshot_path
+
+
+def save_snapshot(snapshot_path = None, registry_path = None):
+  """Serialize the fully initialized simulator, so a new process can restore it with restore_snapshot.
+  The simulator is started with start_global_vars if it was not started yet.
+
+  The snapshot is a directory containing:
+    - 'state.pkl': possible ranges, K-Means centroids, original dataframe, the default scenario
+      (random start and default 24 h simulation dataframe) and the fingerprint of the sources
+      (see get_source_fingerprint), checked by restore_snapshot;
+    - 'inference': compiled inference artifact of the encoder-decoder (see save_inference_artifact).
+
+  : param: snapshot_path (str): directory of the snapshot. If None, get_snapshot_directory is used.
+    If it already exists, it is replaced.
+  : param: registry_path (str): directory of the model registry, if the models are a registered version.
+  """
+
+  if GlobalVars.encoder_decoder_tf_model is None:
+    start_global_vars()
+
+  if (type(GlobalVars.encoder_decoder_tf_model) == InferenceModel):
+    raise InvalidInputsError("The simulator was restored from a snapshot. Start it with start_global_vars before saving a new snapshot.")
+
+  snapshot_path = get_snapshot_directory(snapshot_path)
+  # Save to a temporary directory first, so an existing snapshot is only replaced by a complete one:
+  temporary_path = snapshot_path + f".tmp{os.getpid()}"
+  shutil.rmtree(temporary_path, ignore_errors = True)
+  os.makedirs(temporary_path)
+
+  state = {'directory_path': GlobalVars.directory_path,
+          'possible_ranges': GlobalVars.possible_ranges,
+          'cluster_centers': np.array(GlobalVars.kmeans_model.cluster_centers_),
+          'model_version': GlobalVars.model_version,
+          'df': GlobalVars.df,
+          'default_scenario': {attribute: getattr(GlobalVars, attribute) for attribute in DEFAULT_SCENARIO_ATTRIBUTES},
+          'source_fingerprint': get_source_fingerprint(GlobalVars.directory_path, GlobalVars.model_version, registry_path),
+          'saved_at': pd.Timestamp(datetime.now())}
+
+  with open(os.path.join(temporary_path, 'state.pkl'), 'wb') as file:
+    pickle.dump(state, file, protocol = pickle.HIGHEST_PROTOCOL)
+
+  save_inference_artifact(GlobalVars.encoder_decoder_tf_model, os.path.join(temporary_path, 'inference'))
+
+  shutil.rmtree(snapshot_path, ignore_errors = True)
+  os.rename(temporary_path, snapshot_path)
+
+  if ControlVars.show_results:
+    print(f"Simulator snapshot saved in {snapshot_path}.")
+
+  return snapshot_path
+
+
+def restore_snapshot(snapshot_path = None, model_version = None, registry_path = None, check_freshness = True):
+  """Restore the simulator saved by save_snapshot, updating GlobalVars.
+  No CSV file is parsed and the Keras model is not loaded nor traced, so the first simulation
+  can be served right away.
+  : param: snapshot_path (str): directory of the snapshot. If None, get_snapshot_directory is used.
+  : param: model_version (str): version that must be served (a registered name or 'latest'). If None,
+    the version of the snapshot is restored.
+  : param: registry_path (str): directory of the model registry (see registry.get_registry_directory).
+  : param: check_freshness (bool): if True, InvalidInputsError is raised when the CSV, the models or
+    the scaling constants changed after the snapshot was saved (see get_source_fingerprint), so a
+    stale snapshot is never served. Save a new snapshot in this case.
+  """
+
+  snapshot_path = get_snapshot_directory(snapshot_path)
+
+  if not os.path.isdir(snapshot_path):
+    raise InvalidInputsError(f"There is no simulator snapshot in {snapshot_path}. Create it with save_snapshot.")
+
+  with open(os.path.join(snapshot_path, 'state.pkl'), 'rb') as file:
+    state = pickle.load(file)
+
+  snapshot_version = state.get('model_version', 'unregistered')
+  if (model_version is not None) and (resolve_version_name(model_version, registry_path) != snapshot_version):
+    raise InvalidInputsError(f"The snapshot in {snapshot_path} serves model version '{snapshot_version}', not '{resolve_version_name(model_version, registry_path)}'. Save a new snapshot.")
+
+  if (check_freshness):
+    if ('source_fingerprint' not in state):
+      raise InvalidInputsError(f"The snapshot in {snapshot_path} has no source fingerprint, so its freshness cannot be checked. Save a new snapshot.")
+    current_fingerprint = get_source_fingerprint(state['directory_path'], snapshot_version, registry_path)
+    changed_sources = [key for key, value in current_fingerprint.items() if (state['source_fingerprint'].get(key) != value)]
+    if (len(changed_sources) > 0):
+      raise InvalidInputsError(f"The snapshot in {snapshot_path} is stale: {changed_sources} changed after it was saved at {state['saved_at']}. Save a new snapshot.")
+
+  GlobalVars.directory_path = state['directory_path']
+  GlobalVars.possible_ranges = state['possible_ranges']
+  GlobalVars.df = state['df']
+  set_active_models(CentroidClusterer(state['cluster_centers']), InferenceModel(os.path.join(snapshot_path, 'inference')), model_version = snapshot_version)
+
+  for attribute, value in state['default_scenario'].items():
+    setattr(GlobalVars, attribute, value)
+
+  GlobalVars.server_start_time = pd.Timestamp(datetime.now())
+
+  if ControlVars.show_results:
+    print(f"Simulator restored from the snapshot saved in {snapshot_path} at {state['saved_at']}.")
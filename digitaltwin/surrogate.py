@@ -0,0 +1,343 @@
+import os
+import time
+import pickle
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+
+from .idsw import (InvalidInputsError, ControlVars)
+from .idsw.modelling.linear import ridge_linear_reg
+from .idsw.modelling.mlp import sklearn_ann
+from .idsw.modelling.trees import (random_forest, xgboost_model)
+
+from .models import (MODEL_FEATURES_COLUMNS, RESPONSE_SCALING_PARAMS)
+from .transformvariables import get_model_tensor
+from .utils import (create_dayofweek_weekstatus, calculate_nsm, calculate_leading_current_power_factor, obtain_simulation_df)
+
+
+SURROGATE_METHODS = ['polynomial', 'mlp', 'random_forest', 'gradient_boosting']
+
+# Continuous inputs sampled uniformly over possible_ranges:
+SAMPLED_VARIABLES = ['lagging_current_reactive_power_kvarh', 'leading_current_reactive_power_kvarh',
+                    'co2_tco2', 'lagging_current_power_factor']
+LOAD_TYPES = ['Light_Load', 'Medium_Load', 'Maximum_Load']
+
+# Positions of the load type (one-hot) and of the electric cluster in the model tensor.
+# They define the regions where the error of the surrogate is estimated:
+REGION_LOAD_TYPES = ['Light_Load', 'Maximum_Load', 'Medium_Load']
+LOAD_TYPE_FEATURES_INDICES = [MODEL_FEATURES_COLUMNS.index(f"load_type_{load_type}_OneHotEnc") for load_type in REGION_LOAD_TYPES]
+ELECTRIC_CLUSTER_FEATURE_INDEX = MODEL_FEATURES_COLUMNS.index('electric_cluster')
+
+
+def predict_scaled_response(model, X):
+  """Return the scaled usage_kwh predicted by the encoder-decoder model (or any model with the
+  same output format) as a 1-dimensional array. As in make_model_predictions, only the first
+  output of the model is used."""
+
+  if isinstance(model, tf.keras.Model):
+    # Do not show the Keras progress bar:
+    y_pred = model.predict(X, verbose = 0)
+  else:
+    y_pred = model.predict(X)
+
+  return np.array(y_pred)[:, 0].reshape(-1)
+
+
+def scaled_response_to_kwh(scaled_response):
+  """Reconvert scaled responses to kWh, as models.rescale_response."""
+
+  return np.array(scaled_response)*RESPONSE_SCALING_PARAMS['usage_kwh']['sigma'] + RESPONSE_SCALING_PARAMS['usage_kwh']['mu']
+
+
+def get_region_keys(X):
+  """Region of each row from the model tensor: load type and electric cluster.
+  The key is load_type_index*1000 + electric_cluster."""
+
+  X = np.array(X).reshape(len(X), -1)
+  load_type_index = np.argmax(X[:, LOAD_TYPE_FEATURES_INDICES], axis = 1)
+  electric_cluster = np.rint(X[:, ELECTRIC_CLUSTER_FEATURE_INDEX]).astype(np.int64)
+
+  return load_type_index*1000 + electric_cluster
+
+
+def sample_simulation_df(possible_ranges, total_samples, calendar_start = '2024-01-01', calendar_days = 366, random_generator = None):
+  """Sample simulation inputs uniformly over the allowed ranges and the calendar.
+  : param: possible_ranges (dict): allowed ranges for each variable, from load_df_and_ranges.
+  : param: total_samples (int): number of rows.
+  : param: calendar_start (str or timestamp): first date of the sampled calendar window.
+  : param: calendar_days (int): length of the window. The default covers one full year, so all
+    the frequency features of the model reach all their phases.
+  : param: random_generator (np.random.Generator): if None, a new unseeded generator is used.
+
+  Returns a dataframe with the format of utils.obtain_simulation_df, where the leading current
+  power factor is obtained from the linear correlation, as in the simulations.
+  """
+
+  if random_generator is None:
+    random_generator = np.random.default_rng()
+
+  hours = random_generator.integers(0, calendar_days*24, size = total_samples)
+  timestamps = (pd.Timestamp(calendar_start) + pd.to_timedelta(hours, unit = 'h')).to_numpy()
+  day_of_week, weekstatus = create_dayofweek_weekstatus(timestamps)
+  nsm = calculate_nsm(calendar_start, timestamps)
+
+  sampled = {var: random_generator.uniform(possible_ranges[var]['min'], possible_ranges[var]['max'], size = total_samples) for var in SAMPLED_VARIABLES}
+  load_type = np.array(LOAD_TYPES, dtype = object)[random_generator.integers(0, len(LOAD_TYPES), size = total_samples)]
+
+  sim_df = obtain_simulation_df(timestamps, sampled['lagging_current_reactive_power_kvarh'], sampled['leading_current_reactive_power_kvarh'], sampled['co2_tco2'], sampled['lagging_current_power_factor'], nsm, weekstatus, day_of_week, load_type)
+  sim_df['leading_current_power_factor'] = calculate_leading_current_power_factor(sim_df['leading_current_reactive_power_kvarh'], possible_ranges)
+
+  return sim_df
+
+
+def sample_full_model(possible_ranges, kmeans_model, encoder_decoder_tf_model, total_samples = 200000, batch_size = 50000, calendar_start = '2024-01-01', calendar_days = 366, random_state = None):
+  """Evaluate the full model on sampled inputs (see sample_simulation_df), in batches of
+  {batch_size} rows, so the pipeline and the encoder-decoder run once per batch.
+  Returns the tuple (X, y): model tensors (rows, 21, 1) and the scaled usage_kwh predicted by
+  the full model.
+  """
+
+  random_generator = np.random.default_rng(random_state)
+  list_of_X, list_of_y = [], []
+
+  for start in range(0, total_samples, batch_size):
+    sim_df = sample_simulation_df(possible_ranges, min(batch_size, (total_samples - start)), calendar_start = calendar_start, calendar_days = calendar_days, random_generator = random_generator)
+    X = get_model_tensor(sim_df, kmeans_model)
+    list_of_X.append(X)
+    list_of_y.append(predict_scaled_response(encoder_decoder_tf_model, X))
+
+  return np.concatenate(list_of_X), np.concatenate(list_of_y)
+
+
+def fit_estimator(X_train, y_train, method):
+  """Fit the lightweight model with the corresponding idsw.modelling function.
+  : param: method (str): 'polynomial' (degree 2 features + ridge regression), 'mlp'
+    (Scikit-learn neural network), 'random_forest' or 'gradient_boosting' (XGBoost, which
+    must be installed).
+  Returns an object with the predict method, taking a 2-dimensional array (rows, 21).
+  """
+
+  show_results, show_plots = ControlVars.show_results, ControlVars.show_plots
+  ControlVars.show_results = False
+  ControlVars.show_plots = False
+
+  try:
+    if (method == 'polynomial'):
+      from sklearn.pipeline import make_pipeline
+      from sklearn.preprocessing import PolynomialFeatures
+      polynomial_features = PolynomialFeatures(degree = 2, include_bias = False)
+      ridge_model, metrics_dict, feature_importance_df = ridge_linear_reg(polynomial_features.fit_transform(X_train), y_train, alpha_hyperparameter = 0.001)
+      estimator = make_pipeline(polynomial_features, ridge_model)
+
+    elif (method == 'mlp'):
+      estimator, metrics_dict, history = sklearn_ann(X_train, y_train, type_of_problem = 'regression', number_of_hidden_layers = 2, number_of_neurons_per_hidden_layer = 64, size_of_training_batch = 1000, maximum_of_allowed_iterations = 200)
+
+    elif (method == 'random_forest'):
+      estimator, summary_dict = random_forest(X_train, y_train, type_of_problem = 'regression', number_of_trees = 64, max_tree_depth = 16, use_out_of_bag_error = False)
+
+    elif (method == 'gradient_boosting'):
+      estimator, summary_dict = xgboost_model(X_train, y_train, type_of_problem = 'regression', number_of_trees = 256, max_tree_depth = 8)
+
+    else:
+      raise InvalidInputsError(f"method must be one of {SURROGATE_METHODS}, not '{method}'.")
+
+  finally:
+    ControlVars.show_results, ControlVars.show_plots = show_results, show_plots
+
+  return estimator
+
+
+class SurrogateModel:
+  """Lightweight model distilled from the encoder-decoder, with the same predict interface.
+
+  predict takes the model tensor (rows, 21, 1) and returns the scaled usage_kwh with shape
+  (rows, 1, 1), so it can replace the encoder-decoder model in simulation_pipeline,
+  run_batch_simulation or GlobalVars.encoder_decoder_tf_model.
+
+  When fallback_model (the full model) is set, the rows for which the surrogate is not trusted
+  are evaluated by the full model:
+    - rows outside the domain seen during the training (feature_min, feature_max);
+    - rows from regions (load type and electric cluster) whose validation RMSE is higher than
+      max_error_kwh, or that were not present in the validation set.
+  """
+
+  def __init__(self, estimator, method, feature_min, feature_max, region_errors, validation_metrics, fallback_model = None, max_error_kwh = None, domain_tolerance = 0.01):
+
+    self.estimator = estimator
+    self.method = method
+    self.feature_min = np.array(feature_min)
+    self.feature_max = np.array(feature_max)
+    # RMSE (kWh) on the validation set, indexed by the keys from get_region_keys:
+    self.region_errors = region_errors
+    self.validation_metrics = validation_metrics
+    self.fallback_model = fallback_model
+    self.max_error_kwh = max_error_kwh
+    # Fraction of the range of each feature accepted beyond the training limits:
+    self.domain_tolerance = domain_tolerance
+    # Rows evaluated by the surrogate and by the fallback model:
+    self.total_rows = 0
+    self.fallback_rows = 0
+
+
+  def estimate_error(self, X):
+    """Estimated error (validation RMSE in kWh of the region) for each row. Rows from regions
+    without validation data get infinite error, and rows outside the training domain get NaN."""
+
+    X = np.array(X).reshape(len(X), -1)
+    # Copy: with the pandas copy-on-write, to_numpy may return a read-only view of region_errors:
+    estimated_error = np.array(self.region_errors.reindex(get_region_keys(X)).to_numpy(dtype = np.float64, na_value = np.inf), dtype = np.float64, copy = True)
+
+    tolerance = self.domain_tolerance*(self.feature_max - self.feature_min)
+    out_of_domain = ((X < (self.feature_min - tolerance)) | (X > (self.feature_max + tolerance))).any(axis = 1)
+    estimated_error[out_of_domain] = np.nan
+
+    return estimated_error
+
+
+  def predict(self, X):
+
+    X = np.array(X, dtype = np.float32).reshape(len(X), -1, 1)
+    y_pred = np.array(self.estimator.predict(X.reshape(len(X), -1)), dtype = np.float32).reshape(-1)
+
+    if self.fallback_model is not None:
+      estimated_error = self.estimate_error(X)
+      use_fallback = np.isnan(estimated_error)
+      if self.max_error_kwh is not None:
+        use_fallback = use_fallback | (estimated_error > self.max_error_kwh)
+
+      if use_fallback.any():
+        y_pred[use_fallback] = predict_scaled_response(self.fallback_model, X[use_fallback])
+
+      self.fallback_rows = self.fallback_rows + int(use_fallback.sum())
+
+    self.total_rows = self.total_rows + len(X)
+
+    return y_pred.reshape(-1, 1, 1)
+
+
+  def __getstate__(self):
+    # The full model is not serialized with the surrogate (see save_surrogate):
+    state = self.__dict__.copy()
+    state['fallback_model'] = None
+
+    return state
+
+
+def error_metrics(y_true_kwh, y_pred_kwh):
+  """MAE, RMSE, maximum absolute error and R² between two arrays in kWh."""
+
+  errors = np.array(y_pred_kwh, dtype = np.float64) - np.array(y_true_kwh, dtype = np.float64)
+  total_sum_of_squares = ((y_true_kwh - np.mean(y_true_kwh))**2).sum()
+
+  return {'mae_kwh': float(np.abs(errors).mean()),
+          'rmse_kwh': float(np.sqrt((errors**2).mean())),
+          'max_abs_error_kwh': float(np.abs(errors).max()),
+          'r2': (float(1 - (errors**2).sum()/total_sum_of_squares) if (total_sum_of_squares > 0) else np.nan)}
+
+
+def train_surrogate(possible_ranges, kmeans_model, encoder_decoder_tf_model, method = 'polynomial', total_samples = 200000, batch_size = 50000, validation_fraction = 0.2, calendar_start = '2024-01-01', calendar_days = 366, max_error_kwh = None, use_fallback = True, random_state = None):
+  """Distill the encoder-decoder model into a lightweight surrogate for optimization loops.
+
+  The full model is evaluated on {total_samples} inputs sampled uniformly over possible_ranges,
+  load types and one calendar window (see sample_full_model). The surrogate is fitted on
+  (1 - validation_fraction) of them and compared with the full model on the others.
+
+  : param: possible_ranges (dict): allowed ranges for each variable, from load_df_and_ranges.
+  : param: kmeans_model, encoder_decoder_tf_model: models from load_models.
+  : param: method (str): one of SURROGATE_METHODS (see fit_estimator).
+  : param: batch_size (int): rows evaluated by the full model at once.
+  : param: max_error_kwh (float): maximum estimated error (validation RMSE of the region) accepted
+    for the surrogate. Rows above it are evaluated by the full model. If None, only the rows
+    outside the training domain use the full model.
+  : param: use_fallback (bool): if False, the surrogate never calls the full model.
+  : param: random_state (int): seed for the sampling and the train/validation split.
+
+  Returns a tuple (surrogate, report): surrogate is a SurrogateModel; report is a dictionary
+  with the error against the full model (overall and per region), the times and the throughput
+  of both models.
+  """
+
+  if method not in SURROGATE_METHODS:
+    raise InvalidInputsError(f"method must be one of {SURROGATE_METHODS}, not '{method}'.")
+
+  if not (0 < validation_fraction < 1):
+    raise InvalidInputsError("validation_fraction must be between 0 and 1.")
+
+  start_time = time.perf_counter()
+  X, y = sample_full_model(possible_ranges, kmeans_model, encoder_decoder_tf_model, total_samples = total_samples, batch_size = batch_size, calendar_start = calendar_start, calendar_days = calendar_days, random_state = random_state)
+  sampling_time = time.perf_counter() - start_time
+
+  X_flat = X.reshape(len(X), -1)
+  shuffled_indices = np.random.default_rng(random_state).permutation(len(X_flat))
+  total_validation = max(1, int(validation_fraction*len(X_flat)))
+  validation_indices, train_indices = shuffled_indices[:total_validation], shuffled_indices[total_validation:]
+
+  start_time = time.perf_counter()
+  estimator = fit_estimator(X_flat[train_indices], y[train_indices], method)
+  fitting_time = time.perf_counter() - start_time
+
+  # Compare with the full model on the validation set:
+  X_valid = X[validation_indices]
+  start_time = time.perf_counter()
+  y_surrogate = np.array(estimator.predict(X_valid.reshape(len(X_valid), -1))).reshape(-1)
+  surrogate_time = time.perf_counter() - start_time
+
+  start_time = time.perf_counter()
+  predict_scaled_response(encoder_decoder_tf_model, X_valid)
+  full_model_time = time.perf_counter() - start_time
+
+  y_true_kwh = scaled_response_to_kwh(y[validation_indices])
+  y_surrogate_kwh = scaled_response_to_kwh(y_surrogate)
+  validation_metrics = error_metrics(y_true_kwh, y_surrogate_kwh)
+
+  errors_df = pd.DataFrame({'region': get_region_keys(X_valid), 'squared_error': (y_surrogate_kwh - y_true_kwh)**2})
+  region_errors = np.sqrt(errors_df.groupby('region')['squared_error'].mean())
+
+  surrogate = SurrogateModel(estimator, method, X_flat[train_indices].min(axis = 0), X_flat[train_indices].max(axis = 0), region_errors, validation_metrics,
+                            fallback_model = (encoder_decoder_tf_model if use_fallback else None), max_error_kwh = max_error_kwh)
+
+  region_errors_df = pd.DataFrame({'load_type': [REGION_LOAD_TYPES[key//1000] for key in region_errors.index],
+                                  'electric_cluster': [key%1000 for key in region_errors.index],
+                                  'validation_rows': errors_df.groupby('region').size().to_numpy(),
+                                  'rmse_kwh': region_errors.to_numpy()})
+
+  report = dict({'method': method, 'train_rows': len(train_indices), 'validation_rows': len(validation_indices),
+                'sampling_time_s': sampling_time, 'fitting_time_s': fitting_time,
+                'full_model_rows_per_s': len(X_valid)/full_model_time,
+                'surrogate_rows_per_s': len(X_valid)/surrogate_time,
+                'speedup': full_model_time/surrogate_time},
+                **validation_metrics)
+  report['region_errors'] = region_errors_df
+
+  if ControlVars.show_results:
+    print(f"Surrogate '{method}' fitted with {len(train_indices)} samples: RMSE = {validation_metrics['rmse_kwh']:.4f} kWh, R² = {validation_metrics['r2']:.4f} on {len(validation_indices)} validation samples.")
+    print(f"Throughput: {report['surrogate_rows_per_s']:.0f} rows/s (full model: {report['full_model_rows_per_s']:.0f} rows/s, speedup {report['speedup']:.1f}x).")
+
+  return surrogate, report
+
+
+def save_surrogate(surrogate, file_path):
+  """Save the surrogate with pickle. The fallback model is not saved: set it again with
+  load_surrogate(file_path, fallback_model = encoder_decoder_tf_model)."""
+
+  directory = os.path.dirname(file_path)
+  if directory != '':
+    os.makedirs(directory, exist_ok = True)
+
+  with open(file_path, 'wb') as file:
+    pickle.dump(surrogate, file, protocol = pickle.HIGHEST_PROTOCOL)
+
+  return file_path
+
+
+def load_surrogate(file_path, fallback_model = None):
+  """Load a surrogate saved by save_surrogate.
+  : param: fallback_model: full model used when the surrogate is not trusted (see SurrogateModel).
+  """
+
+  with open(file_path, 'rb') as file:
+    surrogate = pickle.load(file)
+
+  surrogate.fallback_model = fallback_model
+
+  return surrogate
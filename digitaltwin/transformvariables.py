@@ -7,8 +7,19 @@ from .idsw.etl.transform import (get_frequency_features, feature_scaling)
 
 from .models import (
   create_clusters,
+  get_tensor_for_simulation,
   prediction_pipeline
 )
+from .profiling import profile_stage
+from .utils import (compact_simulation_df, expand_simulation_df, get_hour_groups, has_sub_hourly_step, aggregate_to_hourly)
+
+
+# Standard scaling parameters of the features, obtained when training the encoder-decoder model:
+FEATURE_SCALING_PARAMS = {
+  'lagging_current_reactive_power_kvarh': {'mu': 13.035383561643835, 'sigma': 14.524747793581406},
+  'leading_current_reactive_power_kvarh': {'mu': 3.8709486301369855, 'sigma': 6.729335287688414},
+  'co2_tco2': {'mu': 0.01152425799086758, 'sigma': 0.015072620173269598}
+}
 
 
 def encode_weekdays(dataset):
@@ -127,16 +138,9 @@ def scale_features(dataset):
 
   MODE = 'standard'
   SCALE_WITH_NEW_PARAMS = False
-  LIST_OF_SCALING_PARAMS = [{'column': 'lagging_current_reactive_power_kvarh',
-                'scaler': {'scaler_obj': None,
-                'scaler_details': {'mu': 13.035383561643835, 'sigma': 14.524747793581406}}},
-              {'column': 'leading_current_reactive_power_kvarh',
-                'scaler': {'scaler_obj': None,
-                'scaler_details': {'mu': 3.8709486301369855, 'sigma': 6.729335287688414}}},
-              {'column': 'co2_tco2',
+  LIST_OF_SCALING_PARAMS = [{'column': column,
                 'scaler': {'scaler_obj': None,
-                'scaler_details': {'mu': 0.01152425799086758,
-                  'sigma': 0.015072620173269598}}},]
+                'scaler_details': dict(scaler_details)}} for column, scaler_details in FEATURE_SCALING_PARAMS.items()]
   
   SUFFIX = '_scaled'
   dataset, scaling_list = feature_scaling (df = DATASET, subset_of_features_to_scale = SUBSET_OF_FEATURES_TO_SCALE, mode = MODE, scale_with_new_params = SCALE_WITH_NEW_PARAMS, list_of_scaling_params = LIST_OF_SCALING_PARAMS, suffix = SUFFIX)
@@ -144,25 +148,116 @@ def scale_features(dataset):
   return dataset
 
 
-def simulation_pipeline(dataset, possible_ranges, kmeans_model, encoder_decoder_tf_model):
-  """Run the full data transformation and simulation pipeline."""
+def prepare_model_df(df, kmeans_model):
+  """Associate the electric clusters and apply the feature transformations, returning the
+  dataframe with the features used by the encoder-decoder model (see models.get_tensor_for_simulation)."""
+
+  with profile_stage('create_clusters', rows = len(df)):
+    model_df = create_clusters(kmeans_model, df)
+  with profile_stage('feature_transforms', rows = len(df)):
+    model_df = encode_weekdays(model_df)
+    model_df = encode_weekstatus(model_df)
+    model_df = add_frequencies(model_df)
+    model_df = encode_loadtype(model_df)
+    model_df = scale_features(model_df)
+
+  return model_df
+
 
+def get_model_tensor(sim_df, kmeans_model):
+  """Apply the simulation pipeline transformations and return the tensor X (rows, 21, 1)
+  consumed by the encoder-decoder model."""
+
+  show_results, show_plots = ControlVars.show_results, ControlVars.show_plots
   ControlVars.show_results = False
   ControlVars.show_plots = False
 
-  # Create copy to manipulate without risks of losing data:
-  df = dataset.copy(deep = True)
+  try:
+    model_df = prepare_model_df(expand_simulation_df(sim_df.copy(deep = True)), kmeans_model)
+    X, RESPONSE_COLUMNS = get_tensor_for_simulation(model_df)
+
+  finally:
+    ControlVars.show_results, ControlVars.show_plots = show_results, show_plots
+
+  # Same shape used by make_model_predictions for the encoder-decoder architecture:
+  return np.array(X, dtype = np.float32).reshape(len(X), -1, 1)
+
+
+def reconcile_with_hourly(usage_kwh, hour_groups, hourly_usage_kwh):
+  """Rescale sub-hourly predictions so that, in each hour, their mean is equal to the prediction
+  for the hourly means of the inputs, keeping the profile within the hour.
+
+  The models were trained with raw_data_by_hour.csv, whose usage_kwh is the mean of the 15-minute
+  readings of each hour, so the hourly prediction is the reference. If the mean of the sub-hourly
+  predictions of an hour is not positive, all of them receive the hourly prediction.
+
+  : param: usage_kwh (array): sub-hourly predictions.
+  : param: hour_groups (array): hour of each sub-hourly prediction (see utils.get_hour_groups).
+  : param: hourly_usage_kwh (array): prediction for each hour, in the order of the groups.
+  """
+
+  usage_kwh = np.array(usage_kwh, dtype = np.float64)
+  hourly_usage_kwh = np.array(hourly_usage_kwh, dtype = np.float64)
+
+  group_means = np.bincount(hour_groups, weights = usage_kwh)/np.bincount(hour_groups)
+  positive_means = (group_means > 0)
+  factors = np.divide(hourly_usage_kwh, group_means, out = np.ones_like(group_means), where = positive_means)
+
+  return np.where(positive_means[hour_groups], (usage_kwh*factors[hour_groups]), hourly_usage_kwh[hour_groups])
+
+
+def simulation_pipeline(dataset, possible_ranges, kmeans_model, encoder_decoder_tf_model, full_precision = False, reconcile_hourly = True, scenarios = None):
+  """Run the full data transformation and simulation pipeline.
+  : param: full_precision (bool): if False (default), the returned dataframe is compacted by
+    utils.compact_simulation_df (categorical string columns and float32 physical quantities).
+    If True, the physical quantities are kept as float64.
+  : param: reconcile_hourly (bool): only used when the time step is shorter than one hour
+    (see utils.create_timestamp_array and utils.has_sub_hourly_step). If True (default), the
+    hourly means of the inputs (utils.aggregate_to_hourly) are predicted in the same pass, and the
+    sub-hourly usage_kwh is rescaled so that its mean in each hour matches them (see
+    reconcile_with_hourly). Hours with a single timestamp keep their prediction.
+  : param: scenarios (array): scenario of each row, when the dataset concatenates several
+    scenarios (batch.simulate_batch). The hours of different scenarios are never merged.
+  """
+
+  ControlVars.show_results = False
+  ControlVars.show_plots = False
+
+  # Create copy to manipulate without risks of losing data.
+  # Results from previous simulations may be compacted, so convert categories back to strings:
+  df = expand_simulation_df(dataset.copy(deep = True)).reset_index(drop = True)
+
+  timestamps = pd.DatetimeIndex(df['timestamp'])
+  sub_hourly = ((reconcile_hourly) and (has_sub_hourly_step(timestamps, scenarios = scenarios)))
+  if (sub_hourly):
+    total_rows = len(df)
+    hour_groups = get_hour_groups(timestamps, scenarios = scenarios)
+    # Only the hours with more than one timestamp are reconciled, so the hourly scenarios of
+    # a batch are predicted as if they were simulated alone:
+    reconciled_groups = (np.bincount(hour_groups) > 1)
+    reconciled_rows = reconciled_groups[hour_groups]
+    # The groups already separate the scenarios, so they are aggregated as scenarios:
+    hourly_df = aggregate_to_hourly(df.assign(scenario = hour_groups))[reconciled_groups].drop(columns = 'scenario')
+    # Append one row per hour, so both resolutions are predicted by a single model call:
+    df = pd.concat([df, hourly_df], ignore_index = True)
+
   # Run the functions:
   # Get the dataframe that will be used for feeding the model:
-  model_df = create_clusters(kmeans_model, df)
-  model_df = encode_weekdays(model_df)
-  model_df = encode_weekstatus(model_df)
-  model_df = add_frequencies(model_df)
-  model_df = encode_loadtype(model_df)
-  model_df = scale_features(model_df)
+  model_df = prepare_model_df(df, kmeans_model)
 
   # Predict model output and re-scale it to kWh:
-  df = prediction_pipeline(encoder_decoder_tf_model, model_df, df)
+  with profile_stage('prediction_pipeline', rows = len(df)):
+    df = prediction_pipeline(encoder_decoder_tf_model, model_df, df)
+
+  if (sub_hourly):
+    with profile_stage('reconcile_hourly', rows = total_rows):
+      usage_kwh = np.array(df['usage_kwh'], dtype = np.float64)
+      df = df.iloc[:total_rows].copy()
+      # Number the reconciled hours in the same order as the appended hourly rows:
+      reconciled_hour_groups = np.unique(hour_groups[reconciled_rows], return_inverse = True)[1]
+      sub_hourly_usage_kwh = usage_kwh[:total_rows]
+      sub_hourly_usage_kwh[reconciled_rows] = reconcile_with_hourly(sub_hourly_usage_kwh[reconciled_rows], reconciled_hour_groups, usage_kwh[total_rows:])
+      df['usage_kwh'] = sub_hourly_usage_kwh
   
   columns = ['timestamp',	'lagging_current_reactive_power_kvarh',	'leading_current_reactive_power_kvarh',	
             'co2_tco2',	'lagging_current_power_factor',	'leading_current_power_factor', 'nsm',
@@ -170,6 +265,8 @@ def simulation_pipeline(dataset, possible_ranges, kmeans_model, encoder_decoder_
   
   # Filter and re-order dataframe columns:
   df = df[columns]
+  # Reduce the memory of the results, which are stored for each simulation:
+  df = compact_simulation_df(df, full_precision = full_precision)
 
   ControlVars.show_results = True
   ControlVars.show_plots = True
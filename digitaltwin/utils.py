@@ -1,8 +1,15 @@
+import os
+import json
 import random
+import shutil
+import hashlib
+import warnings
 from datetime import datetime
 import numpy as np
 import pandas as pd
 
+from .idsw import InvalidInputsError
+
 
 def random_noise(array, std):
   """Create a random noise with uniform distribution to add to variables.
@@ -61,15 +68,74 @@ def correct_vals_out_of_bounds(array, var_min, var_max):
   return array
 
 
-def load_df_and_ranges():
-  """Load original dataframe used for modelling and ranges allowed for each input variable
-  Warning: this function will only work if the sequence of commands in the function
-  start_simulation() (__init__ module) properly run, assuring that the directories are
-  saved in the correct path.
+# Environment variables that override the default directories:
+DATA_DIRECTORY_ENV_VAR = 'DIGITALTWIN_DATA_DIR'
+CACHE_DIRECTORY_ENV_VAR = 'DIGITALTWIN_CACHE_DIR'
+
+
+def get_data_directory(directory_path = None):
+  """Return the directory with the models and the original dataset (the artifact root).
+  : param: directory_path (str): if provided, it is returned as it is.
+    Otherwise, the environment variable DIGITALTWIN_DATA_DIR is used, if defined.
+    If neither is defined, the 'data' directory of this package is used, so the simulator
+    works from any working directory.
   """
-  
-  # Read the Pandas dataframe used for training for retrieving operation ranges:
-  df = pd.read_csv('steelindustrysimulator/digitaltwin/data/raw_data_by_hour.csv')
+
+  if directory_path is None:
+    directory_path = os.environ.get(DATA_DIRECTORY_ENV_VAR)
+
+  if directory_path is None:
+    directory_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+  return directory_path
+
+
+def get_cache_directory(cache_directory = None, directory_path = None):
+  """Return the directory where the binary cache of the original dataset is stored.
+  : param: cache_directory (str): if provided, it is returned as it is.
+    Otherwise, the environment variable DIGITALTWIN_CACHE_DIR is used, if defined.
+    If neither is defined, the subdirectory 'cache' of the data directory is used.
+  : param: directory_path (str): data directory (see get_data_directory).
+  """
+
+  if cache_directory is None:
+    cache_directory = os.environ.get(CACHE_DIRECTORY_ENV_VAR)
+
+  if cache_directory is None:
+    cache_directory = os.path.join(get_data_directory(directory_path), 'cache')
+
+  return cache_directory
+
+
+def calculate_file_hash(file_path):
+  """Return the SHA-256 hexadecimal digest of a file, read in blocks of 1 MB."""
+
+  file_hash = hashlib.sha256()
+  with open(file_path, 'rb') as file:
+    for block in iter(lambda: file.read(1024*1024), b''):
+      file_hash.update(block)
+
+  return file_hash.hexdigest()
+
+
+# Columns from the plant dataset (raw_data_by_hour.csv format) and the correspondent simulation columns:
+RAW_COLUMNS_MAP = {'timestamp_grouped': 'timestamp',
+                  'Usage_kWh_mean': 'usage_kwh',
+                  'Lagging_Current_Reactive.Power_kVarh_mean': 'lagging_current_reactive_power_kvarh',
+                  'Leading_Current_Reactive_Power_kVarh_mean': 'leading_current_reactive_power_kvarh',
+                  'CO2(tCO2)_mean': 'co2_tco2',
+                  'Lagging_Current_Power_Factor_mean': 'lagging_current_power_factor',
+                  'Leading_Current_Power_Factor_mean': 'leading_current_power_factor',
+                  'NSM_mean': 'nsm',
+                  'WeekStatus_mode': 'weekstatus',
+                  'Day_of_week_mode': 'day_of_week',
+                  'Load_Type_mode': 'load_type'}
+
+PLANT_DATA_COLUMNS = list(RAW_COLUMNS_MAP.values())
+
+
+def calculate_possible_ranges(df):
+  """Calculate the ranges allowed for each input variable from the original dataframe."""
 
   possible_ranges = {
 
@@ -81,6 +147,119 @@ def load_df_and_ranges():
   
   }
 
+  return possible_ranges
+
+
+def save_df_and_ranges_cache(df, possible_ranges, cache_path):
+  """Save the original dataframe and the possible ranges as a binary cache.
+  Each column is saved as a NumPy .npy file, which can be memory-mapped when loaded.
+  Text columns are saved as fixed-width unicode arrays, with a mask of missing values when needed.
+  The files are written to a temporary directory, which is then renamed, so an interrupted
+  process never leaves an incomplete cache.
+  : param: cache_path (str): directory of the cache for this version of the CSV file.
+  """
+
+  temporary_path = cache_path + f".tmp{os.getpid()}"
+  os.makedirs(temporary_path, exist_ok = True)
+
+  columns = []
+  for index, column in enumerate(df.columns):
+    series = df[column]
+    file_name = f"col{index}.npy"
+    
+    if pd.api.types.is_numeric_dtype(series):
+      np.save(os.path.join(temporary_path, file_name), series.to_numpy())
+      kind = 'numeric'
+    
+    else:
+      missing = series.isna().to_numpy()
+      np.save(os.path.join(temporary_path, file_name), series.fillna('').to_numpy(dtype = str))
+      kind = 'text'
+      if missing.any():
+        np.save(os.path.join(temporary_path, f"col{index}_missing.npy"), missing)
+        kind = 'text_with_missing'
+    
+    columns.append({'name': column, 'file': file_name, 'kind': kind})
+
+  with open(os.path.join(temporary_path, 'columns.json'), 'w') as file:
+    json.dump(columns, file)
+
+  # Convert NumPy scalars to float, so they can be stored in JSON:
+  ranges_to_save = {variable: {key: float(value) for key, value in ranges.items()} for variable, ranges in possible_ranges.items()}
+  with open(os.path.join(temporary_path, 'possible_ranges.json'), 'w') as file:
+    json.dump(ranges_to_save, file)
+
+  try:
+    os.rename(temporary_path, cache_path)
+  except OSError:
+    # Another process created the cache first:
+    shutil.rmtree(temporary_path, ignore_errors = True)
+
+
+def load_df_and_ranges_cache(cache_path):
+  """Load the original dataframe and the possible ranges saved by save_df_and_ranges_cache.
+  Numeric columns are memory-mapped, so no text is parsed."""
+
+  with open(os.path.join(cache_path, 'columns.json'), 'r') as file:
+    columns = json.load(file)
+
+  with open(os.path.join(cache_path, 'possible_ranges.json'), 'r') as file:
+    possible_ranges = json.load(file)
+
+  data = {}
+  for index, column in enumerate(columns):
+    array = np.load(os.path.join(cache_path, column['file']), mmap_mode = 'r')
+
+    if (column['kind'] == 'numeric'):
+      data[column['name']] = array
+    
+    else:
+      series = pd.Series(array)
+      if (column['kind'] == 'text_with_missing'):
+        missing = np.load(os.path.join(cache_path, f"col{index}_missing.npy"))
+        series[missing] = np.nan
+      data[column['name']] = series
+
+  df = pd.DataFrame(data = data)
+
+  return df, possible_ranges
+
+
+def load_df_and_ranges(directory_path = None, use_cache = True, cache_directory = None):
+  """Load original dataframe used for modelling and ranges allowed for each input variable
+  
+  : param: directory_path (str): directory containing the file raw_data_by_hour.csv.
+    If None, it is obtained from get_data_directory (environment variable DIGITALTWIN_DATA_DIR
+    or the 'data' directory of this package).
+  : param: use_cache (bool): if True, the first load saves a binary cache of the dataframe
+    and of the possible ranges (see save_df_and_ranges_cache), keyed on the SHA-256 hash of the
+    CSV file. Later loads read this cache instead of parsing the CSV, as long as the file does
+    not change. If the cache cannot be written (e.g., read-only directory), the CSV is used.
+  : param: cache_directory (str): directory for the cache. If None, it is obtained from
+    get_cache_directory (environment variable DIGITALTWIN_CACHE_DIR or the subdirectory 'cache'
+    of the data directory).
+  """
+  
+  directory_path = get_data_directory(directory_path)
+  csv_path = os.path.join(directory_path, 'raw_data_by_hour.csv')
+
+  if (use_cache):
+    cache_path = os.path.join(get_cache_directory(cache_directory, directory_path), ('raw_data_by_hour_' + calculate_file_hash(csv_path)))
+    
+    if os.path.isdir(cache_path):
+      return load_df_and_ranges_cache(cache_path)
+
+  # Read the Pandas dataframe used for training for retrieving operation ranges:
+  df = pd.read_csv(csv_path)
+  possible_ranges = calculate_possible_ranges(df)
+
+  if (use_cache):
+    try:
+      os.makedirs(os.path.dirname(cache_path), exist_ok = True)
+      save_df_and_ranges_cache(df, possible_ranges, cache_path)
+    except OSError as error:
+      warnings.warn(f"Could not save the cache of the original dataframe in {cache_path}: {error}")
+
   return df, possible_ranges
 
 
@@ -122,15 +301,42 @@ def random_start(df):
   return lagging_current_reactive_power, leading_current_reactive_power, co2_tco2, lagging_current_power_factor, load_type
 
 
-def create_timestamp_array(start_date, total_days, total_hours):
-  """Create the array of simulation timestamps from the defined inputs."""
+# Default simulation step: the resolution of raw_data_by_hour.csv, used for training the models.
+DEFAULT_TIME_STEP = '1h'
+
+
+def get_time_step(time_step = DEFAULT_TIME_STEP):
+  """Convert the simulation time step to pd.Timedelta, checking if it is valid.
+  : param: time_step (str or timedelta): e.g., '1h' (default), '30min', '15min' (resolution of the
+    original 15-minute readings). It must divide one hour, so each hour has the same number of steps.
+  """
+
+  try:
+    step = pd.Timedelta(time_step)
+  except (ValueError, TypeError):
+    raise InvalidInputsError(f"Invalid time step '{time_step}'. Use a string such as '1h' or '15min'.")
+
+  if ((step <= pd.Timedelta(0)) or (step > pd.Timedelta(hours = 1)) or ((pd.Timedelta(hours = 1) % step) != pd.Timedelta(0))):
+    raise InvalidInputsError(f"The time step must divide one hour (e.g., '1h', '30min', '15min'), not '{time_step}'.")
+
+  return step
+
+
+def create_timestamp_array(start_date, total_days, total_hours, time_step = DEFAULT_TIME_STEP):
+  """Create the array of simulation timestamps from the defined inputs.
+  The timestamps are returned as a NumPy datetime64 array, so no Python object is created
+  for each timestamp.
+  : param: time_step (str): interval between consecutive timestamps (see get_time_step).
+    With '15min', each simulated hour has 4 timestamps.
+  """
   # Since one day has 24 hours, the simulation proceeds through {total_hours} = 
   total_hours = total_days*24 + total_hours
+  step = get_time_step(time_step)
+  total_steps = total_hours*(pd.Timedelta(hours = 1)//step)
 
-  # Create a list of timestamps for the simulation:
-  timestamps = np.array([(start_date + pd.Timedelta(i, 'h')) for i in range(0, (total_hours + 1))])
-  # Goes from 0 (no functioning) to the total_hours + 1 - 1 = total_hours.
-  # Each step sums a timedelta of i hours
+  # Create the timestamps for the simulation, summing i time steps to the start date.
+  # Goes from 0 (no functioning) to the total_steps + 1 - 1 = total_steps (i.e., total_hours).
+  timestamps = (pd.Timestamp(start_date) + pd.to_timedelta(np.arange(0, (total_steps + 1))*step.value, unit = 'ns')).to_numpy()
 
   total_entries = len(timestamps) # total of values that must be saved.
 
@@ -153,17 +359,17 @@ def create_dayofweek_weekstatus(timestamps):
   so it can be directly concatenated to the raw dataset. Also, the pipeline used for
   the simulation becomes the same used for treating data and training the model.
 
-  pd.Timestamp.dayofweek attribute returns an integer number representing the day of the week.
-  https://pandas.pydata.org/docs/reference/api/pandas.Timestamp.html
-  pd.Timestamp.day_name() method returns the name of the weekday, such as 'Wednesday'.
-  https://pandas.pydata.org/docs/reference/api/pandas.Timestamp.day_name.html#pandas.Timestamp.day_name
+  pd.DatetimeIndex.dayofweek attribute returns integer numbers representing the day of the week
+  (Monday = 0, ..., Sunday = 6).
+  pd.DatetimeIndex.day_name() method returns the names of the weekdays, such as 'Wednesday'.
+  https://pandas.pydata.org/docs/reference/api/pandas.DatetimeIndex.day_name.html
   """
   
+  timestamps = pd.DatetimeIndex(timestamps)
   # Get array of day names, called day_of_week:
-  day_of_week = np.array([time.day_name() for time in timestamps])
-  # Create a list mapping the check_weekstatus function to each day_of_week,
-  # i.e., apply the function to each element of the array. Then, convert to array:
-  weekstatus = np.array(list(map(check_weekstatus, day_of_week)))
+  day_of_week = np.array(timestamps.day_name(), dtype = object)
+  # Saturday (5) and Sunday (6) are weekend days, as in check_weekstatus:
+  weekstatus = np.where((np.array(timestamps.dayofweek) >= 5), 'Weekend', 'Weekday').astype(object)
 
   return day_of_week, weekstatus
 
@@ -173,21 +379,16 @@ def calculate_nsm(start_date, timestamps):
   
   NSM: Number of Seconds from midnight: continuous variable measured in s
 
-  Timestamp.normalize() method returns a Timestamp object at the same date, but at midnight.
-  # https://pandas.pydata.org/docs/reference/api/pandas.Timestamp.normalize.html#pandas.Timestamp.normalize
+  DatetimeIndex.normalize() method returns the same dates, but at midnight.
+  # https://pandas.pydata.org/docs/reference/api/pandas.DatetimeIndex.normalize.html
 
   So, the difference between a timestamp and this last one will be a timedelta in relation
   to midnight. In seconds, the value is the NSM.
-
-  pd.Timedelta.total_seconds() method returns the timedelta as equivalent number of total seconds:
-  https://pandas.pydata.org/docs/reference/api/pandas.Timedelta.total_seconds.html#pandas.Timedelta.total_seconds
   """
   
-  # get a list of timedeltas, subtracting each timestamp from midnight:
-  timedeltas = [(timestamp - timestamp.normalize()) for timestamp in timestamps]
-  # apply total_seconds method to each element and convert to np.ndarray.
-  # It could be a single step, but the syntax would be harder to read:
-  nsm = np.array([timedelta.total_seconds() for timedelta in timedeltas])
+  timestamps = pd.DatetimeIndex(timestamps)
+  # get the timedeltas, subtracting each timestamp from midnight, and convert to total seconds:
+  nsm = np.array((timestamps - timestamps.normalize()).total_seconds(), dtype = np.float64)
 
   return nsm
 
@@ -210,20 +411,24 @@ def convert_input_vars_to_arrays(total_entries, lagging_current_reactive_power,
   return lagging_current_reactive_power, leading_current_reactive_power, co2_tco2, lagging_current_power_factor, load_type
 
 
-def calculate_leading_current_power_factor(leading_current_reactive_power, possible_ranges):
+def calculate_leading_current_power_factor(leading_current_reactive_power, possible_ranges, add_noise = True):
   """Apply the internal linear correlation:
       'Leading_Current_Reactive_Power_kVarh_mean'
       Linear regression summary for Leading_Current_Power_Factor_mean:
 
       'y = -0.23*x + 23.09'
       'R²_lin_reg = 0.9071'
+
+  : param: add_noise (bool): if False, the random noise is not added, and only the
+    linear correlation is applied (deterministic simulations).
   """
   leading_current_reactive_power = np.array(leading_current_reactive_power)
   leading_current_power_factor = leading_current_reactive_power*(-0.23) + 23.09
 
-  # Add a random noise to this feature:
-  std = possible_ranges['leading_current_power_factor']['std']
-  leading_current_power_factor = random_noise(leading_current_power_factor, std)
+  if (add_noise):
+    # Add a random noise to this feature:
+    std = possible_ranges['leading_current_power_factor']['std']
+    leading_current_power_factor = random_noise(leading_current_power_factor, std)
 
   # Check if array contains a value above the max or below the minimum.
   var_max = possible_ranges['leading_current_power_factor']['max']
@@ -253,6 +458,128 @@ def obtain_simulation_df(timestamps, lagging_current_reactive_power, leading_cur
   return sim_df
 
 
+# Categories of the string columns from the simulation results:
+WEEKSTATUS_CATEGORIES = ['Weekday', 'Weekend']
+DAY_OF_WEEK_CATEGORIES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+LOAD_TYPE_CATEGORIES = ['Light_Load', 'Medium_Load', 'Maximum_Load']
+
+CATEGORICAL_COLUMNS = {'weekstatus': WEEKSTATUS_CATEGORIES,
+                      'day_of_week': DAY_OF_WEEK_CATEGORIES,
+                      'load_type': LOAD_TYPE_CATEGORIES}
+
+# Physical quantities stored as float32 in the compact results:
+FLOAT32_COLUMNS = ['lagging_current_reactive_power_kvarh', 'leading_current_reactive_power_kvarh',
+                  'co2_tco2', 'lagging_current_power_factor', 'leading_current_power_factor',
+                  'nsm', 'usage_kwh']
+
+
+def compact_simulation_df(dataset, full_precision = False):
+  """Reduce the memory used by a dataframe with simulation results, which is stored for each simulation.
+  - timestamp is stored as datetime64;
+  - weekstatus, day_of_week and load_type are stored as categorical columns with fixed categories
+    (so results from different simulations can be concatenated without losing the dtype);
+  - the physical quantities are stored as float32, unless full_precision = True.
+  : param: full_precision (bool): if True, numeric columns are kept as float64.
+  """
+
+  dataset = dataset.copy(deep = False)
+
+  if 'timestamp' in dataset.columns:
+    dataset['timestamp'] = pd.to_datetime(dataset['timestamp'])
+
+  for column, categories in CATEGORICAL_COLUMNS.items():
+    if column in dataset.columns:
+      dataset[column] = pd.Categorical(dataset[column], categories = categories)
+
+  float_dtype = np.float64 if (full_precision) else np.float32
+  for column in FLOAT32_COLUMNS:
+    if column in dataset.columns:
+      dataset[column] = dataset[column].astype(float_dtype)
+
+  return dataset
+
+
+def expand_simulation_df(dataset):
+  """Convert the columns from compact_simulation_df back to the types expected by the simulation
+  pipeline: strings for the categorical columns and float64 for the physical quantities."""
+
+  dataset = dataset.copy(deep = False)
+
+  for column in CATEGORICAL_COLUMNS.keys():
+    if ((column in dataset.columns) and (isinstance(dataset[column].dtype, pd.CategoricalDtype))):
+      dataset[column] = np.array(dataset[column], dtype = object)
+
+  for column in FLOAT32_COLUMNS:
+    if ((column in dataset.columns) and (dataset[column].dtype == np.float32)):
+      dataset[column] = dataset[column].astype(np.float64)
+
+  return dataset
+
+
+def get_hour_groups(timestamps, scenarios = None):
+  """Label each timestamp with the simulated hour it belongs to, without Python loops.
+  A new group starts when the hour changes, when the time does not increase or when the
+  scenario changes, so the same hour from consecutive scenarios (batch.simulate_batch) is
+  never merged.
+  : param: scenarios (array): scenario of each timestamp. If None, the scenarios are only
+    separated by the times that do not increase.
+  Returns an int64 array with the group of each timestamp (0, 1, 2, ...).
+  """
+
+  timestamps = pd.DatetimeIndex(timestamps)
+  hours = timestamps.floor('h').asi8
+  times = timestamps.asi8
+
+  new_group = np.ones(len(times), dtype = bool)
+  new_group[1:] = ((hours[1:] != hours[:-1]) | (times[1:] <= times[:-1]))
+
+  if (scenarios is not None):
+    scenarios = np.asarray(scenarios)
+    new_group[1:] |= (scenarios[1:] != scenarios[:-1])
+
+  return np.cumsum(new_group) - 1
+
+
+def has_sub_hourly_step(timestamps, scenarios = None):
+  """Check if the time step between consecutive timestamps of the same scenario is shorter
+  than one hour. It depends only on the step, so an hourly simulation starting at any minute
+  (e.g., the default start_date, now()) is not sub-hourly.
+  : param: scenarios (array): scenario of each timestamp (see get_hour_groups).
+  """
+
+  times = pd.DatetimeIndex(timestamps).asi8
+  steps = np.diff(times)
+  # Times that do not increase start another scenario:
+  same_scenario = (steps > 0)
+
+  if (scenarios is not None):
+    scenarios = np.asarray(scenarios)
+    same_scenario &= (scenarios[1:] == scenarios[:-1])
+
+  return bool((steps[same_scenario] < pd.Timedelta(hours = 1).value).any())
+
+
+def aggregate_to_hourly(dataset):
+  """Aggregate sub-hourly simulation results (or inputs) to one row per hour, in the same way
+  raw_data_by_hour.csv was obtained from the 15-minute readings: mean of the numeric columns
+  (e.g., usage_kwh is the mean of the 15-minute values) and first value of the others.
+  The timestamp of each row is the start of the hour. If there is a column 'scenario', each
+  scenario is aggregated separately.
+  """
+
+  dataset = dataset.reset_index(drop = True)
+  groups = get_hour_groups(dataset['timestamp'], scenarios = (dataset['scenario'] if ('scenario' in dataset.columns) else None))
+
+  numeric_columns = [column for column in dataset.columns if ((column != 'timestamp') and (pd.api.types.is_numeric_dtype(dataset[column])))]
+  other_columns = [column for column in dataset.columns if ((column != 'timestamp') and (column not in numeric_columns))]
+
+  grouped = dataset.groupby(groups, sort = False)
+  hourly_df = pd.concat([grouped[numeric_columns].mean(), grouped[other_columns].first()], axis = 1)
+  hourly_df.insert(0, 'timestamp', pd.DatetimeIndex(grouped['timestamp'].first()).floor('h'))
+
+  return hourly_df[list(dataset.columns)].reset_index(drop = True)
+
+
 def add_variation_to_features(dataset, possible_ranges):
   """ Add the random noise to each continous input to add a source
   of variation.
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The package imports TensorFlow (digitaltwin.models), which must use the Keras 2 API:
+os.environ.setdefault('TF_USE_LEGACY_KERAS', '1')
+os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '3')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
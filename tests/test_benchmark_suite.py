@@ -0,0 +1,33 @@
+import json
+
+from benchmarks.suite import compare_results, main
+
+
+def write_results(path, results):
+
+  with open(path, 'w') as file:
+    json.dump({'results': {name: {'median_s': median_s} for name, median_s in results.items()}}, file)
+  return str(path)
+
+
+def test_compare_results_flags_regressions():
+
+  comparison = compare_results({'results': {'a': {'median_s': 1.0}, 'b': {'median_s': 1.0}}},
+                               {'results': {'a': {'median_s': 1.5}, 'b': {'median_s': 0.5}}})
+  assert (list(comparison['status']) == ['REGRESSION', 'improvement'])
+
+
+def test_compare_results_without_common_benchmarks():
+
+  comparison = compare_results({'results': {'a': {'median_s': 1.0}}}, {'results': {'b': {'median_s': 1.0}}})
+  assert (len(comparison) == 0)
+  assert ('status' in comparison.columns)
+
+
+def test_compare_command_without_common_benchmarks(tmp_path, capsys):
+
+  baseline = write_results(tmp_path/'baseline.json', {'a': 1.0})
+  current = write_results(tmp_path/'current.json', {'b': 1.0})
+
+  assert (main(['compare', baseline, current]) == 2)
+  assert ('nothing to compare' in capsys.readouterr().out)
@@ -0,0 +1,128 @@
+import re
+import sys
+import types
+
+import pandas as pd
+import pytest
+
+from digitaltwin.idsw.datafetch.core import GCPBigQueryConnection
+
+
+class SchemaField:
+
+  def __init__(self, name, field_type):
+    self.name, self.field_type = name, field_type
+
+
+class LoadJobConfig:
+
+  def __init__(self, schema = None, write_disposition = None):
+    self.schema, self.write_disposition = schema, write_disposition
+
+
+class FakeJob:
+
+  def __init__(self, num_dml_affected_rows = None):
+    self.num_dml_affected_rows = num_dml_affected_rows
+
+  def result(self):
+    return self
+
+
+class FakeClient:
+  """Records the jobs that apply_batch_corrections sends to BigQuery."""
+
+  def __init__(self, schema):
+    self.table = types.SimpleNamespace(streaming_buffer = None, schema = schema)
+    self.loads, self.queries, self.deleted_tables = [], [], []
+
+  def get_table(self, table_id):
+    return self.table
+
+  def load_table_from_dataframe(self, dataframe, table_id, job_config = None):
+    self.loads.append((dataframe.copy(), table_id, job_config))
+    return FakeJob()
+
+  def query(self, query):
+    self.queries.append(query)
+    return FakeJob(num_dml_affected_rows = 3)
+
+  def delete_table(self, table_id, not_found_ok = False):
+    self.deleted_tables.append(table_id)
+
+
+@pytest.fixture
+def fake_bigquery(monkeypatch):
+  """google.cloud.bigquery with the classes used by apply_batch_corrections."""
+
+  bigquery = types.ModuleType('google.cloud.bigquery')
+  bigquery.SchemaField, bigquery.LoadJobConfig = SchemaField, LoadJobConfig
+  bigquery.WriteDisposition = types.SimpleNamespace(WRITE_TRUNCATE = 'WRITE_TRUNCATE')
+  cloud = types.ModuleType('google.cloud')
+  cloud.bigquery = bigquery
+  monkeypatch.setitem(sys.modules, 'google.cloud', cloud)
+  monkeypatch.setitem(sys.modules, 'google.cloud.bigquery', bigquery)
+
+  return bigquery
+
+
+@pytest.fixture
+def connector(fake_bigquery):
+
+  connector = GCPBigQueryConnection.__new__(GCPBigQueryConnection)
+  connector.project, connector.dataset = 'plant', 'historian'
+  connector.bqclient = FakeClient([SchemaField('tag', 'STRING'), SchemaField('timestamp', 'TIMESTAMP'), SchemaField('value', 'FLOAT')])
+
+  return connector
+
+
+def test_corrections_are_applied_with_one_merge(connector):
+
+  corrections = pd.DataFrame({'tag': ['TAG1', 'TAG1', 'TAG2', 'TAG3'],
+                              'timestamp': pd.to_datetime(['2024-01-01 00:00', '2024-01-01 00:00', '2024-01-01 01:00', '2024-01-01 02:00']),
+                              'value': [1.0, 2.0, 3.0, None],
+                              'remove': [False, False, False, True]})
+
+  connector.apply_batch_corrections('readings', corrections, key_columns = ['tag', 'timestamp'], update_columns = ['value'], delete_column = 'remove')
+  client = connector.bqclient
+
+  assert ((len(client.loads) == 1) and (len(client.queries) == 1))
+  staged_df, staging_table_id, job_config = client.loads[0]
+  assert re.fullmatch(r"plant\.historian\.readings_corrections_staging_[0-9a-f]{32}", staging_table_id)
+  # Only the last correction of each key is staged:
+  assert (staged_df['value'].tolist()[:2] == [2.0, 3.0])
+  assert (len(staged_df) == 3)
+  assert ([(field.name, field.field_type) for field in job_config.schema] == [('tag', 'STRING'), ('timestamp', 'TIMESTAMP'), ('value', 'FLOAT'), ('remove', 'BOOL')])
+  assert (job_config.write_disposition == 'WRITE_TRUNCATE')
+
+  merge_query = ' '.join(client.queries[0].split())
+  assert (merge_query == ("MERGE `plant.historian.readings` AS target "
+                          f"USING `{staging_table_id}` AS source "
+                          "ON target.`tag` = source.`tag` AND target.`timestamp` = source.`timestamp` "
+                          "WHEN MATCHED AND source.`remove` THEN DELETE "
+                          "WHEN MATCHED THEN UPDATE SET `value` = source.`value`"))
+  assert (client.deleted_tables == [staging_table_id])
+
+  summary = connector.batch_correction_summary
+  assert ((summary['corrections'] == 4) and (summary['staged_rows'] == 3) and (summary['jobs'] == 2) and (summary['affected_rows'] == 3))
+
+
+def test_default_staging_tables_are_unique(connector):
+
+  corrections = pd.DataFrame({'tag': ['TAG1'], 'timestamp': pd.to_datetime(['2024-01-01']), 'value': [1.0]})
+
+  for _ in range(2):
+    connector.apply_batch_corrections('readings', corrections, key_columns = ['tag', 'timestamp'])
+
+  staging_table_ids = [staging_table_id for _, staging_table_id, _ in connector.bqclient.loads]
+  assert (staging_table_ids[0] != staging_table_ids[1])
+
+
+def test_declared_staging_table_is_kept(connector):
+
+  corrections = pd.DataFrame({'tag': ['TAG1'], 'timestamp': pd.to_datetime(['2024-01-01']), 'value': [1.0]})
+
+  connector.apply_batch_corrections('readings', corrections, key_columns = ['tag', 'timestamp'], staging_table = 'staged', keep_staging_table = True)
+
+  assert (connector.bqclient.loads[0][1] == 'plant.historian.staged')
+  assert (connector.bqclient.deleted_tables == [])
@@ -0,0 +1,26 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from digitaltwin.cli import main
+
+pytest.importorskip('openpyxl')
+
+SCENARIO = {'start_date': '2024-01-01 10:00', 'lagging_current_reactive_power': 10, 'leading_current_reactive_power': 2,
+            'co2_tco2': 0.01, 'lagging_current_power_factor': 80, 'load_type': 'Light_Load'}
+
+
+@pytest.mark.parametrize('time_step, readings_per_step', [('15min', 1), ('1h', 4)])
+def test_aggregates_use_the_time_step(tmp_path, time_step, readings_per_step):
+  """A scenario with a single timestamp has no step between its timestamps, so the energy of the
+  aggregates depends on --time-step (usage_kwh is the energy of a 15-minute reading)."""
+
+  scenarios_path, results_path, aggregates_path = tmp_path/'scenarios.csv', tmp_path/'results.csv', tmp_path/'aggregates.xlsx'
+  pd.DataFrame([dict(SCENARIO, total_days = 0, total_hours = 0)]).to_csv(scenarios_path, index = False)
+
+  exit_code = main([str(scenarios_path), '--time-step', time_step, '--no-variation', '--output', str(results_path), '--aggregates', str(aggregates_path)])
+
+  assert (exit_code == 0)
+  usage_kwh = pd.read_csv(results_path)['usage_kwh'].sum()
+  summary = pd.read_excel(aggregates_path, sheet_name = 'summary')
+  np.testing.assert_allclose(summary['energy_kwh'].iloc[0], usage_kwh*readings_per_step, rtol = 1e-5)
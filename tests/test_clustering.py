@@ -0,0 +1,97 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from digitaltwin.idsw import InvalidInputsError
+from digitaltwin.clustering import (CLUSTERING_FEATURES_COLUMNS, OnlineElectricClusterer)
+
+CENTERS = np.array([[0, 0, 0, 0], [10, 0, 0, 0], [0, 10, 0, 0], [0, 0, 10, 0]], dtype = np.float64)
+
+
+def make_kmeans_model(training_readings = 100):
+
+  return SimpleNamespace(cluster_centers_ = CENTERS.copy(), labels_ = np.repeat(np.arange(len(CENTERS)), training_readings))
+
+
+def readings_near(center_index, rows, offset = 1.0):
+
+  return CENTERS[center_index] + offset + np.random.default_rng(center_index).normal(0, 0.01, size = (rows, CENTERS.shape[1]))
+
+
+def test_updates_with_fewer_readings_than_clusters():
+
+  clusterer = OnlineElectricClusterer(make_kmeans_model())
+
+  for reading in readings_near(1, 3):
+    clusterer.update(reading.reshape(1, -1))
+
+  assert (clusterer.samples_seen_ == 3)
+  assert (list(clusterer.counts_) == [0, 3, 0, 0])
+
+
+def test_centroids_move_as_a_weighted_running_mean():
+
+  clusterer = OnlineElectricClusterer(make_kmeans_model(training_readings = 100))
+  X = readings_near(1, 100)
+  clusterer.update(X)
+
+  # 100 training readings at the original centroid and 100 new readings around centroid + 1:
+  assert np.allclose(clusterer.cluster_centers_[1], (100*CENTERS[1] + X.sum(axis = 0))/200)
+  assert np.allclose(clusterer.cluster_centers_[[0, 2, 3]], CENTERS[[0, 2, 3]])
+  assert np.isclose(clusterer.drift_report()['drift_from_reference'].max(), 1.0, atol = 0.01)
+
+
+def test_prior_weight_without_training_labels():
+
+  with pytest.raises(InvalidInputsError):
+    OnlineElectricClusterer(SimpleNamespace(cluster_centers_ = CENTERS.copy()))
+
+  clusterer = OnlineElectricClusterer(SimpleNamespace(cluster_centers_ = CENTERS.copy()), prior_weight = 0)
+  X = readings_near(2, 10)
+  clusterer.update(X)
+
+  assert np.allclose(clusterer.cluster_centers_[2], X.mean(axis = 0))
+
+
+def test_labels_are_stable_after_updates():
+
+  clusterer = OnlineElectricClusterer(make_kmeans_model())
+  clusterer.update(np.concatenate([readings_near(i, 50, offset = 0.5) for i in range(len(CENTERS))]))
+
+  assert (list(clusterer.predict(CENTERS)) == list(range(len(CENTERS))))
+  assert (clusterer.drift_history_df()['relabeled_centers'] == 0).all()
+
+
+def test_match_centers_follows_the_previous_centroids():
+
+  clusterer = OnlineElectricClusterer(make_kmeans_model())
+  permutation = np.array([2, 0, 3, 1])
+
+  # new_centers[permutation[label]] is the centroid of each label:
+  new_centers = np.empty_like(CENTERS)
+  new_centers[permutation] = CENTERS + 0.1
+
+  assert (list(clusterer.match_centers(new_centers)) == list(permutation))
+
+
+def test_drift_history_is_bounded():
+
+  clusterer = OnlineElectricClusterer(make_kmeans_model(), batch_size = 2, max_history = 5)
+  clusterer.update(readings_near(0, 30))
+
+  history_df = clusterer.drift_history_df()
+  assert (clusterer.total_updates == 15)
+  assert (len(history_df) == 5)
+  assert (list(history_df['update']) == list(range(11, 16)))
+
+
+def test_dataframe_readings_need_the_clustering_columns():
+
+  clusterer = OnlineElectricClusterer(make_kmeans_model())
+  clusterer.update(pd.DataFrame(readings_near(3, 4), columns = CLUSTERING_FEATURES_COLUMNS))
+  assert (clusterer.counts_[3] == 4)
+
+  with pytest.raises(InvalidInputsError):
+    clusterer.update(pd.DataFrame({'usage_kwh': [1.0]}))
@@ -0,0 +1,90 @@
+import io
+import contextlib
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from digitaltwin.core import (GlobalVars, memory_report)
+from digitaltwin.models import load_models
+from digitaltwin.batch import build_scenario_df
+from digitaltwin.transformvariables import simulation_pipeline
+from digitaltwin.utils import (load_df_and_ranges, compact_simulation_df, expand_simulation_df, CATEGORICAL_COLUMNS, FLOAT32_COLUMNS)
+
+SCENARIO = {'start_date': '2024-01-05 10:00', 'total_days': 0, 'total_hours': 47, 'lagging_current_reactive_power': 10,
+            'leading_current_reactive_power': 2, 'co2_tco2': 0.01, 'lagging_current_power_factor': 80, 'load_type': 'Light_Load'}
+
+
+@pytest.fixture(scope = 'module')
+def simulator():
+  """Models and ranges of the package, loaded once for the module."""
+
+  with contextlib.redirect_stdout(io.StringIO()):
+    kmeans_model, encoder_decoder_tf_model = load_models()
+    df, possible_ranges = load_df_and_ranges(use_cache = False)
+
+  return possible_ranges, kmeans_model, encoder_decoder_tf_model
+
+
+def run_scenario(simulator, full_precision):
+
+  possible_ranges, kmeans_model, encoder_decoder_tf_model = simulator
+  sim_df = build_scenario_df(SCENARIO, possible_ranges, add_variation = False)
+
+  return simulation_pipeline(sim_df, possible_ranges, kmeans_model, encoder_decoder_tf_model, full_precision = full_precision)
+
+
+def test_results_are_compact(simulator):
+
+  sim_df = run_scenario(simulator, full_precision = False)
+
+  assert (sim_df['timestamp'].dtype.kind == 'M')
+  for column, categories in CATEGORICAL_COLUMNS.items():
+    assert isinstance(sim_df[column].dtype, pd.CategoricalDtype)
+    assert (list(sim_df[column].cat.categories) == categories)
+  for column in FLOAT32_COLUMNS:
+    assert (sim_df[column].dtype == np.float32)
+
+  # Both weekdays and the weekend are simulated:
+  assert (set(sim_df['weekstatus']) == {'Weekday', 'Weekend'})
+
+
+def test_full_precision_keeps_float64(simulator):
+
+  compact_df = run_scenario(simulator, full_precision = False)
+  full_df = run_scenario(simulator, full_precision = True)
+
+  for column in FLOAT32_COLUMNS:
+    assert (full_df[column].dtype == np.float64)
+  assert np.allclose(full_df['usage_kwh'], compact_df['usage_kwh'], rtol = 1e-5)
+
+
+def test_compact_results_can_be_simulated_again(simulator):
+
+  possible_ranges, kmeans_model, encoder_decoder_tf_model = simulator
+  compact_df = run_scenario(simulator, full_precision = True)
+
+  expanded_df = expand_simulation_df(compact_simulation_df(compact_df))
+  assert not isinstance(expanded_df['load_type'].dtype, pd.CategoricalDtype)
+  assert (expanded_df['usage_kwh'].dtype == np.float64)
+
+  sim_df = simulation_pipeline(compact_simulation_df(compact_df), possible_ranges, kmeans_model, encoder_decoder_tf_model, full_precision = True)
+  assert np.allclose(sim_df['usage_kwh'], compact_df['usage_kwh'], rtol = 1e-4)
+
+
+def test_memory_report(monkeypatch):
+
+  sim_df = compact_simulation_df(pd.DataFrame({'timestamp': pd.date_range('2024-01-01', periods = 10, freq = 'h'), 'load_type': 'Light_Load', 'usage_kwh': np.arange(10.0)}))
+  report_df = pd.DataFrame({'SIMULATION_REPORT': ['IDENTIFIER'], 'USER_INPUT': ['SIMULATION #1']})
+  monkeypatch.setattr(GlobalVars, 'exported_tables', [{'dataframe_obj_to_be_exported': sim_df, 'excel_sheet_name': 'sim1_0'},
+                                                      {'dataframe_obj_to_be_exported': report_df, 'excel_sheet_name': 'REP_sim1_0'},
+                                                      {'dataframe_obj_to_be_exported': sim_df, 'excel_sheet_name': 'sim2_0'}])
+
+  memory_df = memory_report()
+
+  assert (list(memory_df['simulation']) == ['sim1_0', 'sim2_0', 'TOTAL'])
+  assert (list(memory_df['rows']) == [10, 10, 20])
+  assert (memory_df['simulation_bytes'].iloc[0] == sim_df.memory_usage(index = True, deep = True).sum())
+  assert (memory_df['report_bytes'].iloc[0] > 0) & (memory_df['report_bytes'].iloc[1] == 0)
+  assert (memory_df['total_bytes'].iloc[-1] == memory_df['total_bytes'].iloc[:-1].sum())
+  assert np.isclose(memory_df['bytes_per_row'].iloc[1], memory_df['total_bytes'].iloc[1]/10)
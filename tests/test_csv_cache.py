@@ -0,0 +1,58 @@
+import os
+
+import pandas as pd
+import pytest
+
+from digitaltwin.idsw import ControlVars
+from digitaltwin.idsw.datafetch.pipes import load_pandas_dataframe
+
+pytest.importorskip('pyarrow')
+
+
+@pytest.fixture
+def quiet_control_vars():
+
+  show_results = ControlVars.show_results
+  ControlVars.show_results = False
+  yield
+  ControlVars.show_results = show_results
+
+
+@pytest.fixture
+def csv_directory(tmp_path):
+
+  pd.DataFrame({'timestamp': pd.date_range('2024-01-01', periods = 25, freq = 'min').astype(str),
+                'tag': [f"TAG{i % 3}" for i in range(25)],
+                'value': [i/4 for i in range(25)]}).to_csv(tmp_path/'with_header.csv', index = False)
+  (tmp_path/'without_header.csv').write_text((tmp_path/'with_header.csv').read_text().split('\n', 1)[1])
+
+  return str(tmp_path)
+
+
+@pytest.mark.parametrize('file_name, has_header', [('with_header.csv', True), ('without_header.csv', False)])
+def test_parquet_cache_round_trip(quiet_control_vars, csv_directory, file_name, has_header):
+
+  options = {'has_header': has_header, 'dtype': {'tag' if has_header else 1: 'category'}}
+  uncached = load_pandas_dataframe(csv_directory, file_name, use_parquet_cache = False, **options)
+
+  first_load = load_pandas_dataframe(csv_directory, file_name, **options)
+  assert os.path.isfile(os.path.join(csv_directory, file_name + '.cache.parquet'))
+  cached = load_pandas_dataframe(csv_directory, file_name, **options)
+  chunks = list(load_pandas_dataframe(csv_directory, file_name, chunksize = 10, **options))
+
+  for dataset in [first_load, cached, pd.concat(chunks)]:
+    assert (dataset.columns.tolist() == uncached.columns.tolist())
+    assert (dataset.dtypes.tolist() == uncached.dtypes.tolist())
+    pd.testing.assert_frame_equal(dataset, uncached)
+
+  assert ([len(chunk) for chunk in chunks] == [10, 10, 5])
+  assert (chunks[-1].index.tolist() == list(range(20, 25)))
+
+
+def test_modified_file_is_parsed_again(quiet_control_vars, csv_directory):
+
+  load_pandas_dataframe(csv_directory, 'with_header.csv')
+  with open(os.path.join(csv_directory, 'with_header.csv'), 'a') as file:
+    file.write('2024-01-01 00:25:00,TAG1,6.25\n')
+
+  assert (len(load_pandas_dataframe(csv_directory, 'with_header.csv')) == 26)
@@ -0,0 +1,75 @@
+import io
+import os
+import contextlib
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from digitaltwin.idsw import (InvalidInputsError, ControlVars)
+from digitaltwin.models import load_models
+from digitaltwin.finetuning import (finetune_encoder_decoder, get_split_boundaries)
+from digitaltwin.registry import (register_model_version, load_model_version)
+from digitaltwin.surrogate import predict_scaled_response
+from digitaltwin.utils import get_data_directory
+
+
+@pytest.fixture(scope = 'module')
+def models():
+
+  with contextlib.redirect_stdout(io.StringIO()):
+    return load_models()
+
+
+@pytest.fixture
+def plant_data(monkeypatch):
+  """Last 600 hours of raw_data_by_hour.csv, as newly collected plant data."""
+
+  monkeypatch.setattr(ControlVars, 'show_results', False)
+
+  return pd.read_csv(os.path.join(get_data_directory(), 'raw_data_by_hour.csv')).tail(600).reset_index(drop = True)
+
+
+def test_split_boundaries_are_chronological(plant_data):
+
+  validation_start, holdout_start = get_split_boundaries(plant_data.sample(frac = 1, random_state = 0), validation_fraction = 0.1, holdout_fraction = 0.2)
+  timestamps = np.sort(pd.to_datetime(plant_data['timestamp_grouped']).to_numpy())
+
+  assert (validation_start == timestamps[420])
+  assert (holdout_start == timestamps[480])
+
+
+def test_finetune_save_and_register(models, plant_data, tmp_path):
+
+  kmeans_model, encoder_decoder_tf_model = models
+  original_weights = [weights.copy() for weights in encoder_decoder_tf_model.get_weights()]
+
+  # min_improvement = -1 saves any fine-tuned model whose RMSE is lower than twice the current one:
+  finetuned_model, report = finetune_encoder_decoder(plant_data, kmeans_model, encoder_decoder_tf_model, directory_path = str(tmp_path/'data'),
+                                                     epochs = 2, batch_size = 64, min_improvement = -1.0)
+
+  assert report['improved']
+  assert (os.path.basename(report['version_path']) == 'v0001')
+  assert os.path.isfile(os.path.join(report['version_path'], 'metrics.json'))
+  assert (report['finetuned_model']['rows'] == 120)
+  # The model in use is not modified:
+  assert all(np.array_equal(weights, original) for weights, original in zip(encoder_decoder_tf_model.get_weights(), original_weights))
+
+  metadata = register_model_version('v_finetuned', kmeans_model = kmeans_model, saved_model_path = os.path.join(report['version_path'], 'saved_model'),
+                                    registry_path = str(tmp_path/'registry'), metrics = report)
+  assert (metadata['source'] == os.path.abspath(os.path.join(report['version_path'], 'saved_model')))
+
+  with contextlib.redirect_stdout(io.StringIO()):
+    loaded_kmeans_model, loaded_model, loaded_metadata = load_model_version('latest', registry_path = str(tmp_path/'registry'))
+
+  X = np.random.default_rng(0).normal(size = (8, 21, 1)).astype(np.float32)
+  assert (loaded_metadata['version'] == 'v_finetuned')
+  assert np.allclose(predict_scaled_response(loaded_model, X), predict_scaled_response(finetuned_model, X), atol = 1e-5)
+
+
+def test_finetuning_requires_the_keras_model(models, plant_data):
+
+  kmeans_model, encoder_decoder_tf_model = models
+
+  with pytest.raises(InvalidInputsError):
+    finetune_encoder_decoder(plant_data, kmeans_model, object())
@@ -0,0 +1,50 @@
+import pandas as pd
+import pytest
+
+from digitaltwin.idsw import ControlVars
+from digitaltwin.idsw.datafetch import get_data_from_ip21
+from digitaltwin.idsw.datafetch.core import Connectors
+from digitaltwin.idsw.datafetch.mock import MockIP21Server
+
+TAGS = [{'tag': 'TAG001.PV', 'actual_name': 'temperature'}]
+WINDOW = {'start_time': pd.Timestamp('2024-01-01 00:00:00'), 'stop_time': pd.Timestamp('2024-01-01 02:00:00')}
+
+
+@pytest.fixture
+def ip21_server(monkeypatch):
+
+  monkeypatch.setattr(ControlVars, 'show_results', False)
+  monkeypatch.setattr(Connectors, 'persistent', True)
+  monkeypatch.setattr(Connectors, 'ip21_connector', None, raising = False)
+
+  with MockIP21Server() as server:
+    yield server
+
+
+def test_persistent_connector_is_reused_only_with_the_same_credentials(ip21_server):
+
+  get_data_from_ip21(ip21_server.address, TAGS, username = 'alice', password = 'secret', use_ntlm = False, **WINDOW)
+  first_connector = Connectors.ip21_connector
+
+  get_data_from_ip21(ip21_server.address, TAGS, username = 'alice', password = 'secret', use_ntlm = False, **WINDOW)
+  assert (Connectors.ip21_connector is first_connector)
+
+  # Credentials not declared reuse the ones of the connector:
+  get_data_from_ip21(ip21_server.address, TAGS, use_ntlm = False, **WINDOW)
+  assert (Connectors.ip21_connector is first_connector)
+
+  get_data_from_ip21(ip21_server.address, TAGS, username = 'bob', password = 'secret', use_ntlm = False, **WINDOW)
+  assert (Connectors.ip21_connector is not first_connector)
+  assert (Connectors.ip21_connector.username == 'bob')
+
+  second_connector = Connectors.ip21_connector
+  get_data_from_ip21(ip21_server.address, TAGS, username = 'bob', password = 'other', use_ntlm = False, **WINDOW)
+  assert (Connectors.ip21_connector is not second_connector)
+
+
+def test_ip21time_array_is_deprecated(ip21_server):
+
+  with pytest.warns(DeprecationWarning):
+    returned_dfs_list = get_data_from_ip21(ip21_server.address, TAGS, use_ntlm = False, ip21time_array = [1, 2, 3], **WINDOW)
+
+  assert (len(returned_dfs_list[0]['dataset']) > 0)
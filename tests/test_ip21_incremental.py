@@ -0,0 +1,95 @@
+import pandas as pd
+import pytest
+
+from digitaltwin.idsw import ControlVars
+from digitaltwin.idsw.datafetch.core import (ConcurrentIP21Extractor, IncrementalExtractionStore)
+from digitaltwin.idsw.datafetch.mock import MockIP21Server
+
+pytest.importorskip('pyarrow')
+
+TAGS = [{'tag': 'TAG001.PV', 'actual_name': 'temperature'}, {'tag': 'TAG002.PV', 'actual_name': 'pressure'}]
+
+
+@pytest.fixture
+def ip21_server(monkeypatch):
+
+  monkeypatch.setattr(ControlVars, 'show_results', False)
+
+  with MockIP21Server() as server:
+    yield server
+
+
+@pytest.fixture
+def extractor(ip21_server, monkeypatch):
+  """Extractor of the mock server, recording the tasks of each pool."""
+
+  extractor = ConcurrentIP21Extractor(ip21_server.address, use_ntlm = False, max_retries = 0, backoff_factor = 0)
+  extractor.pools = []
+  run_tasks = extractor.run_tasks
+
+  def record_pool(tasks):
+    extractor.pools.append(tasks)
+    return run_tasks(tasks)
+
+  monkeypatch.setattr(extractor, 'run_tasks', record_pool)
+
+  return extractor
+
+
+def refresh(extractor, store, tags, start_time, stop_time):
+
+  return extractor.extract_incremental(tags, store, start_time = pd.Timestamp(start_time), stop_time = pd.Timestamp(stop_time))
+
+
+def test_tags_with_different_watermarks_are_fetched_in_one_pool(extractor, tmp_path):
+
+  store = IncrementalExtractionStore(str(tmp_path), overlap = '10min')
+  refresh(extractor, store, TAGS[:1], '2024-01-01 00:00', '2024-01-01 01:00')
+  refresh(extractor, store, TAGS[1:], '2024-01-01 00:00', '2024-01-01 02:00')
+
+  extractor.pools = []
+  returned_dfs_list = refresh(extractor, store, TAGS, '2024-01-01 00:00', '2024-01-01 03:00')
+
+  assert (len(extractor.pools) == 1)
+  assert (len(extractor.pools[0]) == 2)
+  # Only the data after (watermark - overlap) is fetched:
+  assert ([tag_dict['rows_fetched'] for tag_dict in returned_dfs_list] == [131, 71])
+
+  for tag_dict in returned_dfs_list:
+    dataset = tag_dict['dataset']
+    # One sample per minute, without the repeated samples of the overlap:
+    assert (len(dataset) == 181)
+    assert dataset['timestamp'].is_unique
+    assert (tag_dict['failed_windows'] == [])
+
+
+def test_backfill_before_the_extracted_period(extractor, tmp_path):
+
+  store = IncrementalExtractionStore(str(tmp_path), overlap = '10min')
+  refresh(extractor, store, TAGS, '2024-01-01 00:00', '2024-01-01 01:00')
+
+  returned_dfs_list = refresh(extractor, store, TAGS, '2023-12-31 23:00', '2024-01-01 01:00')
+
+  assert ([tag_dict['rows_fetched'] for tag_dict in returned_dfs_list] == [61, 61])
+  assert ([len(tag_dict['dataset']) for tag_dict in returned_dfs_list] == [121, 121])
+  assert (store.read_manifest('temperature')['covered_start'] == pd.Timestamp('2023-12-31 23:00'))
+
+
+def test_failed_window_leaves_the_store_untouched(extractor, ip21_server, tmp_path):
+
+  store = IncrementalExtractionStore(str(tmp_path), overlap = '10min')
+  refresh(extractor, store, TAGS, '2024-01-01 00:00', '2024-01-01 01:00')
+  manifests = [store.read_manifest(tag_dict['actual_name']) for tag_dict in TAGS]
+
+  ip21_server.failure_rate = 1.0
+  returned_dfs_list = refresh(extractor, store, TAGS, '2024-01-01 00:00', '2024-01-01 02:00')
+
+  assert all((len(tag_dict['failed_windows']) == 1) for tag_dict in returned_dfs_list)
+  assert ([store.read_manifest(tag_dict['actual_name']) for tag_dict in TAGS] == manifests)
+  # The data already stored is still served:
+  assert ([len(tag_dict['dataset']) for tag_dict in returned_dfs_list] == [61, 61])
+
+  # The failed window is fetched again in the next refresh:
+  ip21_server.failure_rate = 0.0
+  returned_dfs_list = refresh(extractor, store, TAGS, '2024-01-01 00:00', '2024-01-01 02:00')
+  assert ([len(tag_dict['dataset']) for tag_dict in returned_dfs_list] == [121, 121])
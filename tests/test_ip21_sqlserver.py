@@ -0,0 +1,99 @@
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from digitaltwin.idsw import (ControlVars, InvalidInputsError)
+from digitaltwin.idsw.datafetch import SQLServerConnection
+
+sqlalchemy = pytest.importorskip('sqlalchemy')
+
+TAGS = [f"TAG{i:03d}.PV" for i in range(12)]
+TIMESTAMPS = pd.date_range('2023-01-01', periods = 60, freq = '10min').strftime('%Y-%m-%d %H:%M:%S.000')
+
+
+@pytest.fixture
+def quiet_control_vars():
+
+  show_results = ControlVars.show_results
+  ControlVars.show_results = False
+  yield
+  ControlVars.show_results = show_results
+
+
+@pytest.fixture
+def database_path(tmp_path):
+  """IP21 SQL Server tables: the history of each tag (with gaps) and its latest value."""
+
+  database_path = str(tmp_path/'ip21.db')
+  random_generator = np.random.default_rng(1)
+  history = pd.DataFrame({'ValueTime': np.tile(TIMESTAMPS[:-1], len(TAGS)),
+                          'TagConfigID': np.repeat(np.arange(len(TAGS)), len(TIMESTAMPS) - 1),
+                          'Value': random_generator.random(len(TAGS)*(len(TIMESTAMPS) - 1))})
+
+  with sqlite3.connect(database_path) as connection:
+    pd.DataFrame({'ID': range(len(TAGS)), 'TagName': TAGS}).to_sql('IP21PublishConfig', connection, index = False)
+    history.sample(frac = 0.9, random_state = 0).to_sql('IP21DataNumeric', connection, index = False)
+    pd.DataFrame({'ValueTime': TIMESTAMPS[-1], 'TagName': TAGS, 'Value': random_generator.random(len(TAGS))}).to_sql('LatestIP21TagDataNumeric', connection, index = False)
+
+  return database_path
+
+
+@pytest.fixture(params = ['engine', 'dbapi'])
+def connector(request, database_path):
+
+  if (request.param == 'engine'):
+    connection = sqlalchemy.create_engine('sqlite:///' + database_path)
+  else:
+    connection = sqlite3.connect(database_path)
+
+  yield SQLServerConnection('localhost', 'ip21', pre_created_engine = connection)
+
+  if (request.param == 'engine'):
+    connection.dispose()
+  else:
+    connection.close()
+
+
+def test_batched_query_matches_one_query_per_tag(quiet_control_vars, connector):
+
+  list_of_tags = [{'tag': tag, 'actual_name': f"var_{i}"} for i, tag in enumerate(TAGS)]
+  window = {'start_timestamp': '2023-01-01 01:00', 'stop_timestamp': '2023-01-01 09:50'}
+
+  per_tag = [connector.query_specific_tag_ip21sqlserver(tag_dict['tag'], tag_dict['actual_name'], show_table = False, **window) for tag_dict in list_of_tags]
+  expected = pd.concat(per_tag).pivot(index = 'timestamp', columns = 'variable', values = 'value')
+  expected.index = pd.to_datetime(expected.index)
+  expected = expected[[tag_dict['actual_name'] for tag_dict in list_of_tags]]
+  expected.columns.name = None
+
+  wide = connector.query_multiple_tags_ip21sqlserver(list_of_tags, max_tags_per_query = 5, show_table = False, **window)
+
+  pd.testing.assert_frame_equal(wide, expected, check_index_type = False, check_freq = False)
+  assert (connector.batch_query_summary['round_trips'] == 3)
+  assert (connector.batch_query_summary['round_trips_saved'] == len(TAGS) - 3)
+
+
+def test_long_table_and_tags_without_data(quiet_control_vars, connector):
+
+  list_of_tags = [{'tag': TAGS[0], 'actual_name': 'temperature'}, {'tag': 'MISSING.PV', 'actual_name': None}]
+
+  long_df = connector.query_multiple_tags_ip21sqlserver(list_of_tags, pivot = False, show_table = False)
+  wide = connector.query_multiple_tags_ip21sqlserver(list_of_tags, show_table = False)
+
+  assert (long_df.columns.tolist() == ['timestamp', 'tag', 'variable', 'value'])
+  assert (set(long_df['variable']) == {'temperature'})
+  assert (wide.columns.tolist() == ['temperature', 'MISSING.PV'])
+  assert wide['MISSING.PV'].isna().all()
+  assert (wide.index[-1] == pd.Timestamp(TIMESTAMPS[-1]))
+
+
+def test_duplicated_actual_names_are_rejected(quiet_control_vars, connector):
+
+  list_of_tags = [{'tag': TAGS[0], 'actual_name': 'temperature'}, {'tag': TAGS[1], 'actual_name': 'temperature'}]
+
+  with pytest.raises(InvalidInputsError):
+    connector.query_multiple_tags_ip21sqlserver(list_of_tags, show_table = False)
+
+  long_df = connector.query_multiple_tags_ip21sqlserver(list_of_tags, pivot = False, show_table = False)
+  assert (set(long_df['tag']) == {TAGS[0], TAGS[1]})
@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from digitaltwin.idsw.datafetch.core import IP21Extractor
+
+
+def convert_with_previous_loop(ip21time_array):
+  """Frozen copy of the conversion before it was vectorized (one pd.Timedelta per value), with
+  the reference timestamps written in the code, as they were."""
+
+  ip21time_window = pd.Series(ip21time_array).sort_values(ascending = True)
+  # Label 0 is the first element of the input array:
+  start_ip21_scale = ip21time_window[0]
+
+  if (start_ip21_scale >= 1655780400001):
+    reference, reference_ip21 = pd.Timestamp('06-21-2022 0:00:00.001', unit = 'ns'), 1655780400001
+  elif (start_ip21_scale >= 1655780400000):
+    reference, reference_ip21 = pd.Timestamp('06-21-2022', unit = 'd'), 1655780400000
+  elif (start_ip21_scale >= 1655694000000):
+    reference, reference_ip21 = pd.Timestamp('06-20-2022', unit = 'd'), 1655694000000
+  elif (start_ip21_scale >= 1514772000000):
+    reference, reference_ip21 = pd.Timestamp('01-01-2018', unit = 'd'), 1514772000000
+  elif (start_ip21_scale >= 946692000000):
+    reference, reference_ip21 = pd.Timestamp('01-01-2000', unit = 'd'), 946692000000
+  elif (start_ip21_scale >= 10800000):
+    reference, reference_ip21 = pd.Timestamp('01-01-1970', unit = 'd'), 10800000
+  else:
+    reference, reference_ip21 = pd.Timestamp('01-01-1960', unit = 'd'), -315608400000
+
+  new_timestamps = [(reference + pd.Timedelta(ip21time_timedelta, 'ms')) for ip21time_timedelta in (ip21time_window - reference_ip21)]
+
+  return pd.Series(new_timestamps).rename("timestamps")
+
+
+# One start value for each reference timestamp, from the latest to the earliest:
+BRANCH_STARTS = [1655780400001 + 5, 1655780400000, 1655694000000 + 7, 1514772000000 + 3, 946692000000 + 11, 10800000 + 1, -400000000000]
+
+
+def get_ip21_arrays(start):
+
+  return {'int_sorted': start + np.arange(0, 60000*50, 60000, dtype = np.int64),
+          'int_unsorted': np.array([start + 3000, start, start + 1000], dtype = np.int64),
+          'float_with_nan': np.array([float(start), start + 0.5, np.nan, start + 2000.25])}
+
+
+@pytest.mark.parametrize('start', BRANCH_STARTS)
+@pytest.mark.parametrize('array_kind', ['int_sorted', 'int_unsorted', 'float_with_nan'])
+def test_conversion_matches_previous_loop(start, array_kind):
+
+  ip21time_array = get_ip21_arrays(start)[array_kind]
+  extractor = IP21Extractor(previous_df_for_concatenation = None)
+  extractor.ip21time_array = ip21time_array
+
+  timestamp_series = extractor.convert_ip21_timescale_array_to_timestamp().timestamp_series
+  expected_series = convert_with_previous_loop(ip21time_array)
+
+  assert (timestamp_series.name == "timestamps")
+  pd.testing.assert_index_equal(timestamp_series.index, expected_series.index)
+  pd.testing.assert_series_equal(timestamp_series.dt.as_unit('ns'), expected_series.dt.as_unit('ns'))
+
+
+def test_integer_conversion_returns_nanoseconds():
+
+  extractor = IP21Extractor(previous_df_for_concatenation = None)
+  extractor.ip21time_array = get_ip21_arrays(BRANCH_STARTS[3])['int_sorted']
+
+  assert (extractor.convert_ip21_timescale_array_to_timestamp().timestamp_series.dtype == 'datetime64[ns]')
@@ -0,0 +1,105 @@
+import io
+import json
+import contextlib
+from collections import deque
+
+import numpy as np
+import pytest
+
+from digitaltwin.profiling import (ProfilingVars, StageRecord, SimulationProfile, enable_profiling, disable_profiling, profile_simulation, profile_stage,
+                                   get_profiling_records, profiling_summary, export_chrome_trace)
+
+PIPELINE_STAGES = ['create_clusters', 'feature_transforms', 'get_tensor_for_simulation', 'tensorflow_predict', 'rescale_response', 'prediction_pipeline']
+
+
+@pytest.fixture
+def profiling(monkeypatch):
+  """Profiling enabled with empty records; the previous state is restored after the test."""
+
+  monkeypatch.setattr(ProfilingVars, 'records', deque(maxlen = 1000))
+  monkeypatch.setattr(ProfilingVars, 'record_counter', 0)
+  monkeypatch.setattr(ProfilingVars, 'enabled', False)
+  monkeypatch.setattr(ProfilingVars, 'track_memory', False)
+
+  enable_profiling(track_memory = False)
+  yield
+  disable_profiling()
+
+
+def test_disabled_profiling_records_nothing(monkeypatch):
+
+  monkeypatch.setattr(ProfilingVars, 'enabled', False)
+  monkeypatch.setattr(ProfilingVars, 'records', deque(maxlen = 1000))
+
+  with profile_simulation('simulation') as simulation:
+    with profile_stage('stage') as stage:
+      pass
+
+  assert (simulation is None) & (stage is None)
+  assert (get_profiling_records() == [])
+
+
+def test_stages_are_grouped_by_simulation(profiling):
+
+  with profile_simulation('simulation'):
+    with profile_stage('outer', rows = 10):
+      with profile_stage('inner') as stage:
+        stage.rows = 5
+  # A stage outside profile_simulation has its own record:
+  with profile_stage('alone'):
+    pass
+
+  records = get_profiling_records()
+  assert ([record.name for record in records] == ['simulation', 'alone'])
+  # Stages are stored when they finish:
+  assert ([(stage.stage, stage.depth, stage.rows) for stage in records[0].stages] == [('inner', 1, 5), ('outer', 0, 10)])
+  assert (records[0].wall_time_s >= records[0].stages[1].wall_time_s >= records[0].stages[0].wall_time_s)
+
+
+def test_stage_is_recorded_when_it_raises(profiling):
+
+  with pytest.raises(ValueError):
+    with profile_stage('failing'):
+      raise ValueError()
+
+  assert ([record.stages[0].stage for record in get_profiling_records()] == ['failing'])
+
+
+def test_summary_percentiles(profiling):
+
+  wall_times = np.arange(1.0, 101.0)
+  ProfilingVars.records.append(SimulationProfile(record_id = 1, name = 'simulation', start_s = 0.0,
+                                                 stages = [StageRecord(stage = 'stage', depth = 0, start_s = 0.0, wall_time_s = wall_time, rows = 10) for wall_time in wall_times]))
+
+  summary_df = profiling_summary()
+
+  assert (summary_df['calls'].tolist() == [100])
+  assert np.isclose(summary_df['wall_time_s_p50'].iloc[0], np.percentile(wall_times, 50))
+  assert np.isclose(summary_df['wall_time_s_p95'].iloc[0], np.percentile(wall_times, 95))
+  assert (summary_df['rows_p95'].iloc[0] == 10)
+  assert np.isnan(summary_df['peak_memory_bytes_p50'].iloc[0])
+
+
+def test_simulation_pipeline_stages(profiling, tmp_path):
+
+  from digitaltwin.models import load_models
+  from digitaltwin.batch import build_scenario_df
+  from digitaltwin.transformvariables import simulation_pipeline
+  from digitaltwin.utils import load_df_and_ranges
+
+  with contextlib.redirect_stdout(io.StringIO()):
+    kmeans_model, encoder_decoder_tf_model = load_models()
+    df, possible_ranges = load_df_and_ranges(use_cache = False)
+    sim_df = build_scenario_df({'start_date': '2024-01-01 00:00', 'total_days': 1, 'total_hours': 0, 'lagging_current_reactive_power': 10, 'leading_current_reactive_power': 2,
+                                'co2_tco2': 0.01, 'lagging_current_power_factor': 80, 'load_type': 'Light_Load'}, possible_ranges)
+
+    with profile_simulation('simulation'):
+      simulation_pipeline(sim_df, possible_ranges, kmeans_model, encoder_decoder_tf_model)
+
+  record = get_profiling_records()[-1]
+  assert ([stage.stage for stage in record.stages] == PIPELINE_STAGES)
+  assert all((stage.rows == len(sim_df)) for stage in record.stages)
+
+  with open(export_chrome_trace(str(tmp_path/'trace.json')), 'r') as file:
+    events = json.load(file)['traceEvents']
+  assert ([event['name'] for event in events] == ['simulation'] + PIPELINE_STAGES)
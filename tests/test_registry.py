@@ -0,0 +1,53 @@
+import os
+import shutil
+
+import pytest
+
+from digitaltwin.core import GlobalVars
+from digitaltwin.idsw import ControlVars
+from digitaltwin.utils import get_data_directory
+from digitaltwin.registry import (get_registry_directory, register_model_version, list_model_versions, load_model_version, activate_model_version)
+
+
+@pytest.fixture
+def data_directory(tmp_path, monkeypatch):
+  """Data directory of the simulator (GlobalVars.directory_path) in tmp_path, and a directory
+  with a copy of the models of the package, used as source_directory."""
+
+  source_directory = tmp_path/'source'
+  source_directory.mkdir()
+  shutil.copy2(os.path.join(get_data_directory(), 'kmeans_model.pkl'), source_directory)
+  shutil.copytree(os.path.join(get_data_directory(), 'encoder_decoder_tf_model'), source_directory/'encoder_decoder_tf_model')
+
+  monkeypatch.setattr(GlobalVars, 'directory_path', str(tmp_path/'data'))
+  monkeypatch.setattr(ControlVars, 'show_results', False)
+
+  return str(source_directory)
+
+
+def test_all_functions_use_the_same_default_registry(data_directory):
+
+  metadata = register_model_version('v_test', source_directory = data_directory)
+
+  assert (get_registry_directory() == os.path.join(GlobalVars.directory_path, 'registry'))
+  assert os.path.isdir(os.path.join(GlobalVars.directory_path, 'registry', 'v_test'))
+  assert not os.path.exists(os.path.join(data_directory, 'registry'))
+  assert (list_model_versions()['version'].tolist() == ['v_test'])
+
+  kmeans_model, encoder_decoder_tf_model, loaded_metadata = load_model_version('latest')
+  assert (loaded_metadata['checksum'] == metadata['checksum'])
+
+
+def test_activation_is_silent_without_show_results(data_directory, monkeypatch, capsys):
+
+  register_model_version('v_test', source_directory = data_directory)
+  # The simulator is already running, so the models are swapped:
+  for attribute in ['df', 'kmeans_model', 'encoder_decoder_tf_model', 'model_version']:
+    monkeypatch.setattr(GlobalVars, attribute, getattr(GlobalVars, attribute))
+  monkeypatch.setattr(GlobalVars, 'df', object())
+  capsys.readouterr()
+
+  activate_model_version('v_test')
+
+  assert (GlobalVars.model_version == 'v_test')
+  assert ('swapped' not in capsys.readouterr().out)
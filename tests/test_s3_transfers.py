@@ -0,0 +1,109 @@
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip('boto3')
+moto = pytest.importorskip('moto', minversion = '5')
+
+from digitaltwin.idsw.datafetch.core import AWSS3Connection
+
+BUCKET_NAME = 'digitaltwin-tests'
+MEGABYTE = 1024*1024
+
+
+@pytest.fixture
+def s3_client(tmp_path, monkeypatch):
+  """Mocked S3, with the workspace in tmp_path: AWSS3Connection removes the initial slash of the
+  workspace paths, so they are relative to the current directory."""
+
+  import boto3
+
+  for variable in ['AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY', 'AWS_SESSION_TOKEN']:
+    monkeypatch.setenv(variable, 'testing')
+  monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+  monkeypatch.chdir(tmp_path)
+
+  with moto.mock_aws():
+    client = boto3.client('s3')
+    client.create_bucket(Bucket = BUCKET_NAME)
+    yield client
+
+
+def get_connector(s3_obj_prefix, path_to_store_imported_s3_bucket = 'download'):
+
+  connector = AWSS3Connection(path_to_store_imported_s3_bucket, BUCKET_NAME, s3_obj_prefix)
+  connector.ACCESS_KEY, connector.SECRET_KEY = 'testing', 'testing'
+
+  return connector.get_bucket_info().connect_to_s3().connect_to_bucket()
+
+
+def read_file(file_path):
+
+  with open(file_path, 'rb') as file:
+    return file.read()
+
+
+def test_files_keep_their_paths_relative_to_the_prefix(s3_client):
+
+  for key in ['data/a/values.csv', 'data/b/values.csv', 'data/values.csv', 'other/values.csv']:
+    s3_client.put_object(Bucket = BUCKET_NAME, Key = key, Body = key.encode('utf-8'))
+
+  connector = get_connector('data/').map_bucket_contents().copy_bucket_files()
+
+  assert (sorted(connector.fetched_objects) == ['a/values.csv', 'b/values.csv', 'values.csv'])
+  for key in ['data/a/values.csv', 'data/b/values.csv', 'data/values.csv']:
+    assert (read_file(os.path.join('download', *key.split('/')[1:])) == key.encode('utf-8'))
+
+
+@pytest.mark.parametrize('s3_obj_prefix, s3_key, relative_path', [
+  (None, 'data/a/values.csv', 'data/a/values.csv'),
+  ('data', 'data/a/values.csv', 'a/values.csv'),
+  ('data/', 'data/a/values.csv', 'a/values.csv'),
+  ('data/val', 'data/values.csv', 'values.csv'),
+  ('data/values.csv', 'data/values.csv', 'values.csv')])
+def test_relative_object_path(s3_client, s3_obj_prefix, s3_key, relative_path):
+
+  assert (get_connector(s3_obj_prefix).get_relative_object_path(s3_key) == relative_path)
+
+
+def test_unchanged_files_are_skipped(s3_client):
+
+  for key in ['data/first.bin', 'data/second.bin']:
+    s3_client.put_object(Bucket = BUCKET_NAME, Key = key, Body = os.urandom(1024))
+
+  connector = get_connector('data/').map_bucket_contents().copy_bucket_files()
+  assert (connector.transfer_summary['transferred_files'] == 2)
+
+  connector = connector.copy_bucket_files()
+  assert ((connector.transfer_summary['transferred_files'] == 0) and (connector.transfer_summary['skipped_files'] == 2))
+
+  # Same size, another content:
+  with open(os.path.join('download', 'first.bin'), 'r+b') as file:
+    file.write(b'modified')
+
+  connector = connector.copy_bucket_files()
+  assert ((connector.transfer_summary['transferred_files'] == 1) and (connector.transfer_summary['skipped_files'] == 1))
+
+
+def test_multipart_etags_are_matched(s3_client):
+
+  os.makedirs('upload')
+  with open(os.path.join('upload', 'large.bin'), 'wb') as file:
+    file.write(np.random.default_rng(0).bytes(12*MEGABYTE))
+
+  # Uploaded in 2 parts of 6 MB:
+  connector = get_connector('data/').set_directory_to_export('upload').set_files_to_export(['large.bin'])
+  connector = connector.export_files(multipart_threshold_mb = 5, multipart_chunksize_mb = 6)
+  assert s3_client.head_object(Bucket = BUCKET_NAME, Key = 'data/large.bin')['ETag'].strip('"').endswith('-2')
+
+  connector = connector.export_files(multipart_threshold_mb = 5, multipart_chunksize_mb = 6)
+  assert (connector.transfer_summary['skipped_files'] == 1)
+
+  # The connection uses parts of 16 MB, so the part size of the ETag (6 MB) has to be found:
+  connector = get_connector('data/').map_bucket_contents().copy_bucket_files()
+  assert (connector.transfer_summary['transferred_files'] == 1)
+  assert (read_file(os.path.join('download', 'large.bin')) == read_file(os.path.join('upload', 'large.bin')))
+
+  connector = connector.copy_bucket_files()
+  assert (connector.transfer_summary['skipped_files'] == 1)
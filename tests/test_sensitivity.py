@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from digitaltwin.idsw import InvalidInputsError
+from digitaltwin.sensitivity import (saltelli_sample, sobol_indices)
+
+pytest.importorskip('scipy')
+
+
+def ishigami(X, a = 7.0, b = 0.1):
+
+  return np.sin(X[:, 0]) + a*np.sin(X[:, 1])**2 + b*(X[:, 2]**4)*np.sin(X[:, 0])
+
+
+def ishigami_indices(a = 7.0, b = 0.1):
+  """Analytic first-order and total indices of the Ishigami function."""
+
+  V1 = 0.5*(1 + b*np.pi**4/5)**2
+  V2 = a**2/8
+  V13 = b**2*np.pi**8*(1/18 - 1/50)
+  variance = V1 + V2 + V13
+
+  return np.array([V1, V2, 0])/variance, np.array([(V1 + V13), V2, V13])/variance
+
+
+def test_saltelli_sample_structure():
+
+  unit_sample = saltelli_sample(3, 100, random_state = 0)
+  # base_samples is rounded up to 128:
+  assert (unit_sample.shape == (128*5, 3))
+
+  A, B, A_B = unit_sample[:128], unit_sample[128:256], unit_sample[256:].reshape(3, 128, 3)
+  for i in range(3):
+    other_columns = [column for column in range(3) if (column != i)]
+    assert np.array_equal(A_B[i][:, i], B[:, i])
+    assert np.array_equal(A_B[i][:, other_columns], A[:, other_columns])
+
+
+def test_sobol_indices_of_the_ishigami_function():
+
+  unit_sample = saltelli_sample(3, 2**14, random_state = 0)
+  responses = ishigami(-np.pi + 2*np.pi*unit_sample)
+
+  indices = sobol_indices(responses, 3, bootstrap_resamples = 50, random_state = 0)
+  first_order, total = ishigami_indices()
+
+  assert np.allclose(indices['S1'], first_order, atol = 0.03)
+  assert np.allclose(indices['ST'], total, atol = 0.03)
+  assert np.all(indices['S1_conf_low'] <= indices['S1']) & np.all(indices['S1'] <= indices['S1_conf_high'])
+  assert np.all(indices['ST_conf_low'] <= indices['ST']) & np.all(indices['ST'] <= indices['ST_conf_high'])
+
+
+def test_sobol_indices_require_a_complete_sample():
+
+  with pytest.raises(InvalidInputsError):
+    sobol_indices(np.zeros(11), 3)
@@ -0,0 +1,74 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from digitaltwin.core import (GlobalVars, start_global_vars, get_active_models)
+from digitaltwin.idsw import (InvalidInputsError, ControlVars)
+from digitaltwin.snapshot import (DEFAULT_SCENARIO_ATTRIBUTES, InferenceModel, save_snapshot, restore_snapshot)
+from digitaltwin.transformvariables import (FEATURE_SCALING_PARAMS, simulation_pipeline)
+from digitaltwin.utils import get_data_directory
+
+
+@pytest.fixture
+def data_directory(tmp_path, monkeypatch):
+  """Copy of the models and of raw_data_by_hour.csv in tmp_path. GlobalVars is restored after the test."""
+
+  directory_path = tmp_path/'data'
+  directory_path.mkdir()
+  for file_name in ['kmeans_model.pkl', 'raw_data_by_hour.csv']:
+    shutil.copy2(os.path.join(get_data_directory(), file_name), directory_path)
+  shutil.copytree(os.path.join(get_data_directory(), 'encoder_decoder_tf_model'), directory_path/'encoder_decoder_tf_model')
+
+  for attribute in (DEFAULT_SCENARIO_ATTRIBUTES + ['directory_path', 'df', 'possible_ranges', 'kmeans_model', 'encoder_decoder_tf_model', 'model_version', 'server_start_time']):
+    monkeypatch.setattr(GlobalVars, attribute, getattr(GlobalVars, attribute, None), raising = False)
+  monkeypatch.setattr(ControlVars, 'show_results', False)
+
+  return str(directory_path)
+
+
+def simulate_default_scenario():
+
+  model_version, kmeans_model, encoder_decoder_tf_model = get_active_models()
+  sim_df = simulation_pipeline(GlobalVars.sim_df.copy(), GlobalVars.possible_ranges, kmeans_model, encoder_decoder_tf_model)
+
+  return sim_df['usage_kwh'].to_numpy()
+
+
+def test_save_restore_and_simulate(data_directory, tmp_path):
+
+  start_global_vars(directory_path = data_directory)
+  expected_usage = simulate_default_scenario()
+  snapshot_path = save_snapshot(str(tmp_path/'snapshot'))
+
+  GlobalVars.encoder_decoder_tf_model = None
+  restore_snapshot(snapshot_path)
+
+  assert isinstance(GlobalVars.encoder_decoder_tf_model, InferenceModel)
+  assert (GlobalVars.model_version == 'unregistered')
+  assert np.allclose(simulate_default_scenario(), expected_usage, atol = 1e-4)
+
+
+def test_stale_snapshot_is_not_restored(data_directory, tmp_path):
+
+  start_global_vars(directory_path = data_directory)
+  snapshot_path = save_snapshot(str(tmp_path/'snapshot'))
+
+  # The scaling constants of the pipeline changed after the snapshot was saved:
+  FEATURE_SCALING_PARAMS['nsm'] = {'mu': 0.0, 'sigma': 1.0}
+  try:
+    with pytest.raises(InvalidInputsError, match = 'scaling_params'):
+      restore_snapshot(snapshot_path)
+  finally:
+    del FEATURE_SCALING_PARAMS['nsm']
+
+  # The K-Means model was replaced:
+  with open(os.path.join(data_directory, 'kmeans_model.pkl'), 'ab') as file:
+    file.write(b'\0')
+  with pytest.raises(InvalidInputsError, match = 'models'):
+    restore_snapshot(snapshot_path)
+
+  # A snapshot of the unregistered models does not serve a registered version:
+  with pytest.raises(InvalidInputsError, match = 'model version'):
+    restore_snapshot(snapshot_path, model_version = 'v1', check_freshness = False)
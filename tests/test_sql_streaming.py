@@ -0,0 +1,105 @@
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from digitaltwin.idsw import ControlVars
+from digitaltwin.idsw.datafetch import SQLServerConnection
+
+sqlalchemy = pytest.importorskip('sqlalchemy')
+pytest.importorskip('pyarrow')
+
+ROWS = 2500
+
+
+@pytest.fixture
+def quiet_control_vars():
+
+  show_results = ControlVars.show_results
+  ControlVars.show_results = False
+  yield
+  ControlVars.show_results = show_results
+
+
+@pytest.fixture
+def database_path(tmp_path):
+
+  database_path = str(tmp_path/'historian.db')
+  random_generator = np.random.default_rng(0)
+  with sqlite3.connect(database_path) as connection:
+    pd.DataFrame({'ValueTime': pd.date_range('2024-01-01', periods = ROWS, freq = 'min').strftime('%Y-%m-%d %H:%M:%S'),
+                  'TagConfigID': random_generator.integers(0, 5, ROWS),
+                  'Value': random_generator.random(ROWS)}).to_sql('IP21DataNumeric', connection, index = False)
+
+  return database_path
+
+
+@pytest.fixture
+def sqlite_engine(database_path):
+
+  engine = sqlalchemy.create_engine('sqlite:///' + database_path)
+  yield engine
+  engine.dispose()
+
+
+def test_stream_sql_query_chunk_sizes(quiet_control_vars, sqlite_engine):
+
+  connector = SQLServerConnection('localhost', 'historian', pre_created_engine = sqlite_engine)
+  chunks = list(connector.stream_full_table('IP21DataNumeric', chunksize = 1000))
+
+  assert ([len(chunk) for chunk in chunks] == [1000, 1000, 500])
+  pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index = True), pd.read_sql('SELECT * FROM IP21DataNumeric', sqlite_engine))
+  assert (sqlite_engine.pool.checkedout() == 0)
+
+
+def test_stream_sql_query_releases_connection_on_early_close(quiet_control_vars, sqlite_engine):
+
+  connector = SQLServerConnection('localhost', 'historian', pre_created_engine = sqlite_engine)
+  chunks = connector.stream_sql_query('SELECT * FROM IP21DataNumeric', chunksize = 10)
+
+  assert (len(next(chunks)) == 10)
+  assert (sqlite_engine.pool.checkedout() == 1)
+  chunks.close()
+  assert (sqlite_engine.pool.checkedout() == 0)
+
+
+def test_stream_sql_query_rejects_invalid_chunksize(quiet_control_vars, sqlite_engine):
+
+  from digitaltwin.idsw import InvalidInputsError
+
+  connector = SQLServerConnection('localhost', 'historian', pre_created_engine = sqlite_engine)
+  with pytest.raises(InvalidInputsError):
+    next(connector.stream_sql_query('SELECT * FROM IP21DataNumeric', chunksize = 0))
+
+
+@pytest.mark.parametrize('use_engine', [True, False])
+def test_export_query_to_parquet(quiet_control_vars, tmp_path, database_path, sqlite_engine, use_engine):
+
+  import pyarrow.parquet as pq
+
+  connection = sqlite_engine if (use_engine) else sqlite3.connect(database_path)
+  connector = SQLServerConnection('localhost', 'historian', pre_created_engine = connection)
+  file_path = str(tmp_path/'export'/'historian.parquet')
+
+  summary = connector.export_query_to_parquet('SELECT * FROM IP21DataNumeric', file_path, chunksize = 700)
+
+  assert (summary['rows'] == ROWS)
+  assert (summary['chunks'] == 4)
+  assert (pq.ParquetFile(file_path).num_row_groups == 4)
+  pd.testing.assert_frame_equal(pd.read_parquet(file_path), pd.read_sql('SELECT * FROM IP21DataNumeric', sqlite_engine))
+  assert (sqlite_engine.pool.checkedout() == 0)
+
+  if not (use_engine):
+    connection.close()
+
+
+def test_export_query_to_parquet_without_rows(quiet_control_vars, tmp_path, sqlite_engine):
+
+  connector = SQLServerConnection('localhost', 'historian', pre_created_engine = sqlite_engine)
+  file_path = str(tmp_path/'empty.parquet')
+
+  summary = connector.export_query_to_parquet('SELECT * FROM IP21DataNumeric WHERE TagConfigID < 0', file_path)
+
+  assert ((summary['rows'] == 0) and (summary['file_path'] is None))
+  assert not (tmp_path/'empty.parquet').exists()
@@ -0,0 +1,116 @@
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from digitaltwin.idsw import (ControlVars, InvalidInputsError)
+from digitaltwin.idsw.datafetch import (SQLiteConnection, manipulate_sqlite_db)
+
+sqlalchemy = pytest.importorskip('sqlalchemy')
+
+
+@pytest.fixture
+def quiet_control_vars():
+
+  show_results = ControlVars.show_results
+  ControlVars.show_results = False
+  yield
+  ControlVars.show_results = show_results
+
+
+@pytest.fixture
+def database_path(tmp_path):
+
+  return str(tmp_path/'history.db')
+
+
+def get_connector(database_path):
+
+  return SQLiteConnection(database_path, pre_created_engine = sqlalchemy.create_engine('sqlite:///' + database_path))
+
+
+def make_history(start, periods, value = 0.0, tags = ('TAG001', 'TAG002')):
+
+  timestamps = pd.date_range(start, periods = periods, freq = 'h')
+  return pd.DataFrame({'timestamp': np.repeat(timestamps, len(tags)), 'tag': np.tile(list(tags), periods),
+                       'value': value + np.arange(periods*len(tags), dtype = np.float64)})
+
+
+def read_table(database_path, table_name = 'history'):
+
+  with sqlite3.connect(database_path) as connection:
+    return pd.read_sql(f"SELECT * FROM {table_name} ORDER BY timestamp, tag", connection, parse_dates = ['timestamp'])
+
+
+def test_upsert_replaces_the_rows_with_the_same_keys(quiet_control_vars, database_path):
+
+  connector = get_connector(database_path)
+  connector.update_or_create_table('history', df = make_history('2024-01-01', 48), if_exists = 'upsert', key_columns = ['timestamp', 'tag'])
+
+  # The last 24 hours are written again with new values, with 24 new hours:
+  connector.update_or_create_table('history', df = make_history('2024-01-02', 48, value = 1000.0), if_exists = 'upsert', key_columns = ['timestamp', 'tag'])
+
+  df = read_table(database_path)
+  assert (len(df) == 72*2)
+  assert not df.duplicated(subset = ['timestamp', 'tag']).any()
+  assert (df['value'].iloc[:48] == np.arange(48.0)).all()
+  assert (df['value'].iloc[48:] == 1000 + np.arange(96.0)).all()
+  assert (connector.write_summary['mode'] == 'upsert') & (connector.write_summary['rows'] == 96)
+
+  with sqlite3.connect(database_path) as connection:
+    assert (connection.execute("PRAGMA journal_mode").fetchone()[0] == 'wal')
+    indexes = [row[1] for row in connection.execute("PRAGMA index_list('history')")]
+  assert ('ux_history_timestamp_tag' in indexes)
+
+
+def test_append_with_duplicated_keys_fails_and_keeps_the_table(quiet_control_vars, database_path):
+
+  connector = get_connector(database_path)
+  connector.update_or_create_table('history', df = make_history('2024-01-01', 24), if_exists = 'append', key_columns = ['timestamp', 'tag'])
+  connector.update_or_create_table('history', df = make_history('2024-01-02', 24), if_exists = 'append', key_columns = ['timestamp', 'tag'])
+  assert (len(read_table(database_path)) == 96)
+
+  with pytest.raises(InvalidInputsError):
+    connector.update_or_create_table('history', df = make_history('2024-01-02 12:00', 24), if_exists = 'append', key_columns = ['timestamp', 'tag'])
+
+  # The failed append runs in a single transaction, so no row was added:
+  assert (len(read_table(database_path)) == 96)
+
+
+def test_append_without_keys_adds_all_the_rows(quiet_control_vars, database_path):
+
+  connector = get_connector(database_path)
+  connector.update_or_create_table('history', df = make_history('2024-01-01', 24), if_exists = 'append')
+  connector.update_or_create_table('history', df = make_history('2024-01-01', 24), if_exists = 'append')
+
+  assert (len(read_table(database_path)) == 96)
+
+
+def test_upsert_requires_key_columns(quiet_control_vars, database_path):
+
+  with pytest.raises(InvalidInputsError):
+    get_connector(database_path).update_or_create_table('history', df = make_history('2024-01-01', 2), if_exists = 'upsert')
+
+
+def test_windowed_reads(quiet_control_vars, database_path):
+
+  history_df = make_history('2024-01-01', 240)
+  get_connector(database_path).update_or_create_table('history', df = history_df, if_exists = 'replace')
+
+  # The window is read by a range search on the index of the timestamp:
+  with sqlite3.connect(database_path) as connection:
+    query_plan = connection.execute("EXPLAIN QUERY PLAN SELECT * FROM history WHERE timestamp >= ? AND timestamp <= ?", ('2024-01-03', '2024-01-04')).fetchall()
+  assert any(('ix_history_timestamp' in str(row[-1])) for row in query_plan)
+
+  df, engine = get_connector(database_path).fetch_table('history', start_timestamp = '2024-01-03 00:00', stop_timestamp = '2024-01-03 05:00', columns = ['timestamp', 'value'])
+
+  expected_df = history_df[(history_df['timestamp'] >= '2024-01-03 00:00') & (history_df['timestamp'] <= '2024-01-03 05:00')]
+  assert (list(df.columns) == ['timestamp', 'value'])
+  assert (df['timestamp'].dtype.kind == 'M')
+  assert (df['timestamp'].tolist() == expected_df['timestamp'].tolist())
+  assert np.allclose(df['value'], expected_df['value'])
+
+  # Full read, through manipulate_sqlite_db:
+  df, engine = manipulate_sqlite_db(database_path, 'history', action = 'fetch_table', pre_created_engine = sqlalchemy.create_engine('sqlite:///' + database_path))
+  assert (len(df) == len(history_df))
@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+
+from digitaltwin.models import MODEL_FEATURES_COLUMNS
+from digitaltwin.surrogate import (SurrogateModel, get_region_keys)
+
+
+class ConstantModel:
+  """Stand-in for a fitted estimator or for the full model, predicting one value for all rows."""
+
+  def __init__(self, value, output_shape = (-1,)):
+    self.value = value
+    self.output_shape = output_shape
+    self.calls = 0
+
+  def predict(self, X):
+    self.calls = self.calls + 1
+    return np.full(len(X), self.value, dtype = np.float32).reshape(self.output_shape)
+
+
+def make_surrogate(X_train, fallback_model, max_error_kwh = None):
+
+  X_flat = X_train.reshape(len(X_train), -1)
+  region_errors = pd.Series(0.5, index = np.unique(get_region_keys(X_flat)))
+
+  return SurrogateModel(ConstantModel(1.0), 'polynomial', X_flat.min(axis = 0), X_flat.max(axis = 0), region_errors, {},
+                        fallback_model = fallback_model, max_error_kwh = max_error_kwh)
+
+
+def make_tensor(rows):
+
+  X = np.random.default_rng(0).uniform(0, 1, size = (rows, len(MODEL_FEATURES_COLUMNS), 1)).astype(np.float32)
+  X[:, MODEL_FEATURES_COLUMNS.index('electric_cluster'), 0] = 3
+  return X
+
+
+def test_predict_with_fallback_in_domain():
+
+  X = make_tensor(20)
+  fallback_model = ConstantModel(-1.0, output_shape = (-1, 1, 1))
+  surrogate = make_surrogate(X, fallback_model)
+
+  y_pred = surrogate.predict(X)
+
+  assert (y_pred.shape == (20, 1, 1))
+  assert np.all(y_pred == 1.0)
+  assert (fallback_model.calls == 0)
+  assert ((surrogate.total_rows, surrogate.fallback_rows) == (20, 0))
+
+
+def test_predict_with_fallback_out_of_domain():
+
+  X = make_tensor(20)
+  fallback_model = ConstantModel(-1.0, output_shape = (-1, 1, 1))
+  surrogate = make_surrogate(X, fallback_model)
+
+  X_new = X.copy()
+  X_new[:5, 0, 0] = 10
+  y_pred = surrogate.predict(X_new).reshape(-1)
+
+  assert np.all(y_pred[:5] == -1.0)
+  assert np.all(y_pred[5:] == 1.0)
+  assert (surrogate.fallback_rows == 5)
+
+
+def test_predict_with_fallback_above_the_maximum_error():
+
+  X = make_tensor(10)
+  surrogate = make_surrogate(X, ConstantModel(-1.0, output_shape = (-1, 1, 1)), max_error_kwh = 0.1)
+
+  assert np.all(surrogate.predict(X) == -1.0)
+  assert np.all(surrogate.estimate_error(X) == 0.5)
@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from digitaltwin.idsw import ControlVars
+from digitaltwin.idsw.etl.transform import get_frequency_features
+
+
+@pytest.fixture
+def quiet_control_vars():
+
+  show_results, show_plots = ControlVars.show_results, ControlVars.show_plots
+  ControlVars.show_results, ControlVars.show_plots = False, False
+  yield
+  ControlVars.show_results, ControlVars.show_plots = show_results, show_plots
+
+
+def get_expected_signal(timestamps):
+  """Daily sine signal from Timestamp.timestamp(), the conversion used before the vectorized one."""
+
+  timestamp_s = pd.Series([(timestamp.timestamp() if pd.notna(timestamp) else np.nan) for timestamp in timestamps])
+  return np.sin(timestamp_s*(2*np.pi/(60*60*24)))
+
+
+@pytest.mark.parametrize('tz', [None, 'UTC', 'America/Sao_Paulo'])
+def test_frequency_features_match_timestamp_seconds(quiet_control_vars, tz):
+
+  timestamps = pd.Series(pd.date_range('2024-03-09 22:00', periods = 6, freq = '7h', tz = tz))
+  timestamps.iloc[2] = pd.NaT
+
+  dataset, _ = get_frequency_features(pd.DataFrame({'timestamp': timestamps}), 'timestamp', important_frequencies = [{'value': 1, 'unit': 'day'}])
+
+  np.testing.assert_allclose(dataset['1.0_day_sin'], get_expected_signal(timestamps))
+  assert pd.isna(dataset['1.0_day_sin'].iloc[2])
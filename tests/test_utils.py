@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+
+from digitaltwin.utils import (create_timestamp_array, get_hour_groups, has_sub_hourly_step, aggregate_to_hourly)
+
+
+def test_hourly_step_starting_at_any_minute_is_not_sub_hourly():
+
+  timestamps, _ = create_timestamp_array('2024-01-01 10:37:12', 1, 0, time_step = '1h')
+
+  assert (not has_sub_hourly_step(timestamps))
+
+
+def test_sub_hourly_step_is_detected():
+
+  timestamps, _ = create_timestamp_array('2024-01-01 10:37:12', 0, 3, time_step = '15min')
+
+  assert has_sub_hourly_step(timestamps)
+
+
+def test_scenario_boundaries_are_not_steps():
+
+  first, _ = create_timestamp_array('2024-01-01 10:30', 0, 2, time_step = '1h')
+  # Starts 30 minutes after the end of the first scenario:
+  second, _ = create_timestamp_array('2024-01-01 13:00', 0, 2, time_step = '1h')
+  timestamps = np.concatenate([first, second])
+  scenarios = np.repeat(['first', 'second'], [len(first), len(second)])
+
+  assert has_sub_hourly_step(timestamps)
+  assert (not has_sub_hourly_step(timestamps, scenarios = scenarios))
+
+
+def test_hour_groups_split_by_scenario():
+
+  timestamps = pd.to_datetime(['2024-01-01 10:00', '2024-01-01 10:15', '2024-01-01 10:30', '2024-01-01 10:45'])
+  scenarios = np.array(['a', 'a', 'b', 'b'])
+
+  assert (get_hour_groups(timestamps).tolist() == [0, 0, 0, 0])
+  assert (get_hour_groups(timestamps, scenarios = scenarios).tolist() == [0, 0, 1, 1])
+
+
+def test_aggregate_to_hourly_by_scenario():
+
+  dataset = pd.DataFrame({'timestamp': pd.to_datetime(['2024-01-01 10:00', '2024-01-01 10:30', '2024-01-01 10:45', '2024-01-01 11:00']),
+                          'scenario': ['a', 'a', 'b', 'b'],
+                          'usage_kwh': [1.0, 3.0, 5.0, 7.0]})
+
+  hourly_df = aggregate_to_hourly(dataset)
+
+  assert (hourly_df['scenario'].tolist() == ['a', 'b', 'b'])
+  assert (hourly_df['usage_kwh'].tolist() == [2.0, 5.0, 7.0])
+  assert (hourly_df['timestamp'].tolist() == list(pd.to_datetime(['2024-01-01 10:00', '2024-01-01 10:00', '2024-01-01 11:00'])))